@@ -34,6 +34,7 @@ export interface MCPStatus {
     tools: string[];
     error?: string;
     transport_type?: string;
+    state?: string;
   };
 }
 
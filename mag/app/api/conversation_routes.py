@@ -1,9 +1,11 @@
 import logging
 from datetime import datetime
-from typing import Dict, Any
-from fastapi import APIRouter, HTTPException, status, Depends
+from typing import Dict, Any, List, Optional
+from fastapi import APIRouter, HTTPException, status, Depends, Query
 from app.infrastructure.database.mongodb import mongodb_client
+from app.infrastructure.database.mongodb.repositories import ConversationRepository
 from app.infrastructure.storage.object_storage.conversation_image_manager import conversation_image_manager
+from app.infrastructure.storage.object_storage.tool_output_manager import tool_output_manager
 from app.models.conversation_schema import (
     ConversationListItem, ConversationListResponse, ConversationDetailResponse,
     UpdateConversationTitleRequest, UpdateConversationTagsRequest,
@@ -19,17 +21,41 @@ router = APIRouter(tags=["conversations"])
 
 
 @router.get("/conversations", response_model=ConversationListResponse)
-async def get_conversations_list(current_user: CurrentUser = Depends(get_current_user)):
-    """获取对话列表（返回所有类型的对话）"""
+async def get_conversations_list(
+        limit: int = Query(200, ge=1, le=500, description="每页数量"),
+        cursor: Optional[str] = Query(None, description="分页游标（取自上一页的 next_cursor）"),
+        conversation_type: Optional[str] = Query(None, alias="type", description="对话类型筛选：agent / graph"),
+        tag: Optional[str] = Query(None, description="标签筛选"),
+        project_id: Optional[str] = Query(None, description="Project ID筛选"),
+        status_filter: Optional[str] = Query(None, alias="status", description="状态筛选：active / deleted / favorite"),
+        current_user: CurrentUser = Depends(get_current_user)
+):
+    """获取对话列表（按更新时间倒序，支持游标分页和筛选）"""
     try:
+        after = None
+        if cursor:
+            try:
+                after = ConversationRepository.decode_list_cursor(cursor)
+            except ValueError as e:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
         user_id = current_user.user_id
         conversations = await mongodb_client.list_conversations(
             user_id=user_id,
-            conversation_type=None,
-            limit=200,
-            skip=0
+            conversation_type=conversation_type,
+            limit=limit + 1,
+            project_id=project_id,
+            after=after,
+            tag=tag,
+            status=status_filter,
+            lean=True
         )
 
+        # 多取一条用于判断是否还有下一页
+        has_more = len(conversations) > limit
+        conversations = conversations[:limit]
+        next_cursor = ConversationRepository.encode_list_cursor(conversations[-1]) if has_more else None
+
         # 转换为完整格式
         conversation_items = []
         for conv in conversations:
@@ -71,9 +97,13 @@ async def get_conversations_list(current_user: CurrentUser = Depends(get_current
 
         return ConversationListResponse(
             conversations=conversation_items,
-            total_count=len(conversation_items)
+            total_count=len(conversation_items),
+            next_cursor=next_cursor,
+            has_more=has_more
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取对话列表出错: {str(e)}")
         raise HTTPException(
@@ -86,12 +116,22 @@ async def get_conversations_list(current_user: CurrentUser = Depends(get_current
             response_model_exclude_none=True)
 async def get_conversation_detail(
         conversation_id: str,
+        before: Optional[int] = Query(None, ge=1, description="分页游标：只返回序号小于该值的轮次（取自上一页的 next_cursor）"),
+        limit: Optional[int] = Query(None, ge=1, le=500, description="每页轮次数量，从最新轮次向前分页；为空时返回全部轮次"),
+        include_tools: bool = Query(True, description="是否返回轮次的工具 schema"),
+        include_tasks: bool = Query(True, description="是否返回 Sub Agent 任务及其轮次（分页时只返回本页工具调用关联的任务）"),
+        max_tool_result_length: Optional[int] = Query(None, ge=0, description="工具结果的最大长度，超出部分截断"),
         current_user: CurrentUser = Depends(get_current_user)
 ):
-    """获取对话完整内容（支持所有类型的对话）"""
+    """获取对话内容（支持所有类型的对话，支持从最新轮次向前分页和字段裁剪）"""
     try:
-        # 直接调用mongodb_client的get_conversation_with_messages方法
-        conversation = await mongodb_client.get_conversation_with_messages(conversation_id)
+        conversation = await mongodb_client.get_conversation_rounds_page(
+            conversation_id,
+            before_round=before,
+            limit=limit,
+            exclude_round_fields=None if include_tools else ["tools"],
+            include_tasks=include_tasks
+        )
 
         if not conversation:
             raise HTTPException(
@@ -109,6 +149,12 @@ async def get_conversation_detail(
         # 处理轮次数据 - 转换为OpenAI格式
         rounds = conversation.get("rounds", [])
         conversation_type = conversation.get("type", "agent")
+        tasks = conversation.get("tasks", [])
+
+        if max_tool_result_length is not None:
+            _truncate_tool_results(rounds, max_tool_result_length)
+            for task in tasks:
+                _truncate_tool_results(task.get("rounds", []), max_tool_result_length)
 
         # 准备响应数据
         response_data = {
@@ -116,7 +162,8 @@ async def get_conversation_detail(
             "title": conversation.get("title", "新对话"),
             "rounds": rounds,
             "type": conversation_type,
-            "project_id": conversation.get("project_id")
+            "project_id": conversation.get("project_id"),
+            "pagination": conversation.get("pagination")
         }
 
         # 添加文档/文件信息（如果存在）
@@ -132,11 +179,13 @@ async def get_conversation_detail(
             # 图执行对话，添加 execution_chain、final_result 和 tasks
             response_data["execution_chain"] = conversation.get("execution_chain")
             response_data["final_result"] = conversation.get("final_result")
-            response_data["tasks"] = conversation.get("tasks", [])
+            if include_tasks:
+                response_data["tasks"] = tasks
         
         elif conversation_type == "agent":
             # Agent 对话，添加 tasks 数据
-            response_data["tasks"] = conversation.get("tasks", [])
+            if include_tasks:
+                response_data["tasks"] = tasks
 
         return ConversationDetailResponse(**response_data)
 
@@ -150,6 +199,17 @@ async def get_conversation_detail(
         )
 
 
+def _truncate_tool_results(rounds: List[Dict[str, Any]], max_length: int) -> None:
+    """截断轮次中过长的工具结果，并标记原始长度"""
+    for round_data in rounds:
+        for message in round_data.get("messages", []):
+            content = message.get("content")
+            if message.get("role") == "tool" and isinstance(content, str) and len(content) > max_length:
+                message["content"] = content[:max_length]
+                message["content_truncated"] = True
+                message["content_length"] = len(content)
+
+
 @router.put("/conversations/{conversation_id}/status")
 async def update_conversation_status(
         conversation_id: str,
@@ -615,4 +675,61 @@ async def get_conversation_image(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"获取图片失败: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.get("/conversations/{conversation_id}/tool-output/{tool_call_id}")
+async def get_conversation_tool_output(
+    conversation_id: str,
+    tool_call_id: str,
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    获取会话中被转存的工具完整输出（按需加载）
+
+    Args:
+        conversation_id: 会话ID
+        tool_call_id: 工具调用ID
+        current_user: 当前用户
+
+    Returns:
+        Dict: {"tool_call_id": "...", "content": "...", "total_chars": 123456}
+    """
+    try:
+        # 验证对话所有权
+        conversation = await mongodb_client.get_conversation(conversation_id)
+        if not conversation:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"找不到对话 '{conversation_id}'"
+            )
+
+        # 验证所有权（管理员可以访问所有对话）
+        if not current_user.is_admin() and conversation.get("user_id") != current_user.user_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="无权限访问此对话"
+            )
+
+        content = await tool_output_manager.get_output(
+            conversation.get("user_id"), conversation_id, tool_call_id
+        )
+        if content is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"找不到工具输出: {tool_call_id}"
+            )
+
+        return {
+            "tool_call_id": tool_call_id,
+            "content": content,
+            "total_chars": len(content)
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"获取工具输出失败 (会话: {conversation_id}, 工具调用: {tool_call_id}): {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"获取工具输出失败: {str(e)}"
+        )
@@ -11,6 +11,7 @@ from fastapi.responses import FileResponse
 from typing import Dict, Any
 from app.infrastructure.database.mongodb import mongodb_client
 from app.services.mcp.mcp_service import mcp_service
+from app.services.mcp.tool_env_provisioner import tool_env_provisioner
 from app.core.config import settings
 from app.infrastructure.storage.file_storage import FileManager
 from app.services.model.model_service import model_service
@@ -254,6 +255,10 @@ async def import_graph_package(data: GraphFilePath, current_user: CurrentUser =
                             shutil.copytree(tool_dir, target_tool_dir)
                             logger.info(f"已复制完整的MCP工具环境: {tool_name}")
 
+                            # 使用共享环境的工具包内不含虚拟环境，导入后在后台准备
+                            if FileManager.get_mcp_tool_env_ref(tool_name):
+                                tool_env_provisioner.provision(tool_name, on_ready=mcp_service.connect_server)
+
                         except Exception as e:
                             logger.error(f"导入MCP工具 {tool_name} 时出错: {str(e)}")
                             try:
@@ -459,7 +464,7 @@ async def export_graph(graph_name: str, background_tasks: BackgroundTasks, curre
 
                     if tool_source_dir.exists():
                         shutil.copytree(tool_source_dir, tool_target_dir)
-                        logger.info(f"已完整打包AI生成的MCP工具（含虚拟环境）: {tool_name}")
+                        logger.info(f"已完整打包AI生成的MCP工具: {tool_name}")
 
             zip_filename = f"{graph_name}.zip"
             zip_path = temp_path / zip_filename
@@ -5,6 +5,7 @@ from fastapi import APIRouter, HTTPException, status, Depends
 from typing import Dict, List, Any
 from app.infrastructure.storage.file_storage import FileManager
 from app.services.mcp.mcp_service import mcp_service
+from app.services.mcp.tool_env_provisioner import tool_env_provisioner
 from app.infrastructure.database.mongodb import mongodb_client
 from app.models.mcp_schema import (
     MCPToolRegistration, MCPToolTestRequest, MCPToolTestResponse,
@@ -564,6 +565,19 @@ async def get_mcp_tools(current_user: CurrentUser = Depends(get_current_user)):
         )
 
 
+@router.get("/mcp/metrics", response_model=Dict[str, Any])
+async def get_mcp_metrics(current_user: CurrentUser = Depends(get_current_user)):
+    """获取MCP工具调用指标（调用数、错误率、耗时分位数、会话槽位等待与在途调用数）"""
+    try:
+        return await mcp_service.get_metrics()
+    except Exception as e:
+        logger.error(f"获取MCP工具调用指标时出错: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"获取MCP工具调用指标时出错: {str(e)}"
+        )
+
+
 @router.post("/mcp/register-tool", response_model=Dict[str, Any])
 async def register_mcp_tool(request: MCPToolRegistration, current_user: CurrentUser = Depends(get_current_user)):
     """注册MCP工具到系统"""
@@ -599,9 +613,13 @@ async def register_mcp_tool(request: MCPToolRegistration, current_user: CurrentU
                 detail="注册MCP工具到配置失败"
             )
 
+        # 后台准备运行环境，就绪后自动连接
+        env_status = tool_env_provisioner.provision(request.folder_name, on_ready=mcp_service.connect_server)
+
         return {
             "status": "success",
-            "message": f"MCP工具 '{request.folder_name}' 注册成功"
+            "message": f"MCP工具 '{request.folder_name}' 注册成功",
+            "env_status": env_status.get("status")
         }
 
     except HTTPException:
@@ -613,6 +631,28 @@ async def register_mcp_tool(request: MCPToolRegistration, current_user: CurrentU
             detail=f"注册MCP工具时出错: {str(e)}"
         )
 
+@router.get("/mcp/ai-tools/{tool_name}/env", response_model=Dict[str, Any])
+async def get_ai_mcp_tool_env(tool_name: str, current_user: CurrentUser = Depends(get_current_user)):
+    """获取AI生成的MCP工具运行环境状态"""
+    if not FileManager.mcp_tool_exists(tool_name):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"MCP工具 '{tool_name}' 不存在"
+        )
+    return tool_env_provisioner.get_status(tool_name)
+
+
+@router.post("/mcp/ai-tools/{tool_name}/env", response_model=Dict[str, Any])
+async def provision_ai_mcp_tool_env(tool_name: str, current_user: CurrentUser = Depends(get_current_user)):
+    """重新准备AI生成的MCP工具运行环境（准备失败或中断时使用）"""
+    if not FileManager.mcp_tool_exists(tool_name):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"MCP工具 '{tool_name}' 不存在"
+        )
+    return tool_env_provisioner.provision(tool_name, on_ready=mcp_service.connect_server)
+
+
 @router.get("/mcp/ai-tools", response_model=List[str])
 async def list_ai_mcp_tools(current_user: CurrentUser = Depends(get_current_user)):
     """列出所有AI生成的MCP工具"""
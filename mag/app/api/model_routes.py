@@ -25,6 +25,18 @@ async def get_models(current_user: CurrentUser = Depends(get_current_user)):
             detail=f"获取模型列表时出错: {str(e)}"
         )
 
+@router.get("/models/token-estimation/stats", response_model=Dict[str, Any])
+async def get_token_estimation_stats(current_user: CurrentUser = Depends(get_current_user)):
+    """获取本地token估算与实际用量的对比统计"""
+    try:
+        return {"status": "success", "data": model_service.get_token_estimation_stats()}
+    except Exception as e:
+        logger.error(f"获取token估算统计时出错: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"获取token估算统计时出错: {str(e)}"
+        )
+
 @router.get("/models/{model_name:path}", response_model=Dict[str, Any])
 async def get_model_for_edit(model_name: str, current_user: CurrentUser = Depends(get_current_user)):
     """获取特定模型的配置（用于编辑）"""
@@ -3,6 +3,7 @@ from fastapi import APIRouter, HTTPException, status, Depends
 
 from app.auth.dependencies import get_current_user
 from app.models.auth_schema import MessageResponse
+from app.models.agent_schema import RunBudgetConfig
 from app.infrastructure.database.mongodb import mongodb_client
 from app.services.model.model_service import model_service
 
@@ -133,4 +134,70 @@ async def set_user_language(language: str, current_user = Depends(get_current_us
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"设置失败: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+@router.get("/run-budget")
+async def get_run_budget(current_user = Depends(get_current_user)):
+    """
+    获取用户运行预算设置及生效预算
+
+    effective_budget 为单次运行的限制（全局默认值与运行时间上限），
+    user_daily_budget 为该用户当日所有运行累计的限制，user_daily_usage 为当日已用量
+    """
+    try:
+        from app.services.agent.run_budget import get_budget_window, split_user_budget_limits
+
+        user_id = current_user.user_id
+        run_budget = await mongodb_client.user_repository.get_run_budget(user_id)
+        effective_budget, user_daily_budget = split_user_budget_limits(run_budget)
+        user_daily_usage = await mongodb_client.user_repository.get_budget_usage(user_id, get_budget_window())
+
+        return {
+            "run_budget": run_budget,
+            "effective_budget": effective_budget,
+            "user_daily_budget": user_daily_budget,
+            "user_daily_usage": user_daily_usage
+        }
+
+    except Exception as e:
+        logger.error(f"获取用户运行预算失败: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"获取运行预算失败: {str(e)}"
+        )
+
+
+@router.post("/run-budget", response_model=MessageResponse)
+async def set_run_budget(run_budget: RunBudgetConfig, current_user = Depends(get_current_user)):
+    """
+    设置用户运行预算：token总量、模型调用次数、工具调用次数为该用户每日所有运行的累计上限，
+    运行时间上限作用于每次 Agent / Graph 运行
+
+    Args:
+        run_budget: 预算配置（未设置的项表示不限制）
+    """
+    try:
+        user_id = current_user.user_id
+
+        success = await mongodb_client.user_repository.set_run_budget(
+            user_id, run_budget.dict(exclude_none=True)
+        )
+
+        if not success:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="设置运行预算失败"
+            )
+
+        logger.info(f"用户 {user_id} 设置运行预算: {run_budget}")
+        return MessageResponse(message="运行预算已更新")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"设置运行预算失败: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"设置失败: {str(e)}"
+        )
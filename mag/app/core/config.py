@@ -47,6 +47,32 @@ class Settings:
     MINIO_SECURE: bool = os.getenv("MINIO_SECURE", "false").lower() == "true"
     MINIO_BUCKET_NAME: str = os.getenv("MINIO_BUCKET_NAME", "mag")
 
+    # 运行预算默认值（作用于每个用户的单次运行，0 表示不限制）
+    RUN_BUDGET_MAX_TOTAL_TOKENS: int = int(os.getenv("RUN_BUDGET_MAX_TOTAL_TOKENS", "0"))
+    RUN_BUDGET_MAX_LLM_CALLS: int = int(os.getenv("RUN_BUDGET_MAX_LLM_CALLS", "0"))
+    RUN_BUDGET_MAX_TOOL_CALLS: int = int(os.getenv("RUN_BUDGET_MAX_TOOL_CALLS", "0"))
+    RUN_BUDGET_MAX_WALL_TIME_SECONDS: int = int(os.getenv("RUN_BUDGET_MAX_WALL_TIME_SECONDS", "0"))
+
+    # 工具输出超过该字符数时完整内容转存到对象存储，消息中只保留预览（0 表示不转存）
+    TOOL_OUTPUT_SPILL_THRESHOLD: int = int(os.getenv("TOOL_OUTPUT_SPILL_THRESHOLD", "50000"))
+    TOOL_OUTPUT_PREVIEW_CHARS: int = int(os.getenv("TOOL_OUTPUT_PREVIEW_CHARS", "4000"))
+
+    # AI生成MCP工具安装依赖时使用的 uv 缓存目录（为空时使用 uv 默认的全局缓存）
+    MCP_TOOL_UV_CACHE_DIR: str = os.getenv("MCP_TOOL_UV_CACHE_DIR", "")
+
+    # MCP Client 工作进程数（MCP 服务器按一致性哈希分配到各进程）与起始端口
+    MCP_CLIENT_WORKERS: int = int(os.getenv("MCP_CLIENT_WORKERS", "1"))
+    MCP_CLIENT_BASE_PORT: int = int(os.getenv("MCP_CLIENT_BASE_PORT", "8765"))
+
+    # MCP 服务器健康检查与空闲回收（MCP Client 进程使用）
+    MCP_HEALTH_CHECK_INTERVAL: int = int(os.getenv("MCP_HEALTH_CHECK_INTERVAL", "30"))
+    MCP_HEALTH_CHECK_TIMEOUT: int = int(os.getenv("MCP_HEALTH_CHECK_TIMEOUT", "10"))
+    MCP_RECONNECT_BASE_DELAY: int = int(os.getenv("MCP_RECONNECT_BASE_DELAY", "2"))
+    MCP_RECONNECT_MAX_DELAY: int = int(os.getenv("MCP_RECONNECT_MAX_DELAY", "300"))
+    MCP_RECONNECT_MAX_ATTEMPTS: int = int(os.getenv("MCP_RECONNECT_MAX_ATTEMPTS", "10"))
+    # stdio 服务器空闲多久后关闭进程（秒，0 表示不关闭），下次调用时自动冷启动
+    MCP_IDLE_SHUTDOWN_SECONDS: int = int(os.getenv("MCP_IDLE_SHUTDOWN_SECONDS", "1800"))
+
     # 根据操作系统确定配置目录
     @property
     def MAG_DIR(self) -> Path:
@@ -75,11 +101,17 @@ class Settings:
         """获取AI生成的MCP工具存储目录"""
         return self.MAG_DIR / "mcp"
 
+    @property
+    def MCP_TOOL_ENVS_DIR(self) -> Path:
+        """获取AI生成的MCP工具共享虚拟环境目录（依赖相同的工具共用一个环境）"""
+        return self.MAG_DIR / "mcp_envs"
+
     def ensure_directories(self) -> None:
         """确保所有必要的目录存在"""
         self.MAG_DIR.mkdir(exist_ok=True)
         self.EXPORTS_DIR.mkdir(exist_ok=True)
         self.MCP_TOOLS_DIR.mkdir(exist_ok=True)
+        self.MCP_TOOL_ENVS_DIR.mkdir(exist_ok=True)
 
     def get_mcp_tool_dir(self, tool_name: str) -> Path:
         """获取指定MCP工具的目录路径"""
@@ -1,12 +1,14 @@
+import asyncio
 import logging
-from typing import Dict, List, Any, Optional
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.infrastructure.database.mongodb.repositories import (
     ConversationRepository, GraphRunRepository,
     TaskRepository, GraphConfigRepository, PromptRepository, ModelConfigRepository,
     MCPConfigRepository, PreviewRepository, UserRepository, InviteCodeRepository,
     TeamSettingsRepository, RefreshTokenRepository, AgentRepository,
-    AgentRunRepository, MemoryRepository, ShareRepository, ProjectRepository
+    AgentRunRepository, RunRoundRepository, MemoryRepository, ShareRepository, ProjectRepository
 )
 
 logger = logging.getLogger(__name__)
@@ -33,11 +35,15 @@ class MongoDBClient:
         self.refresh_tokens_collection = None
         self.agents_collection = None
         self.agent_run_collection = None
+        self.run_rounds_collection = None
         self.memories_collection = None
+        self.memory_items_collection = None
         self.conversation_shares_collection = None
         self.projects_collection = None
 
         self.is_connected = False
+        self._rounds_migration_task: Optional[asyncio.Task] = None
+        self._memory_migration_task: Optional[asyncio.Task] = None
 
         self.conversation_repository = None
         self.graph_run_repository = None
@@ -53,6 +59,7 @@ class MongoDBClient:
         self.refresh_token_repository = None
         self.agent_repository = None
         self.agent_run_repository = None
+        self.run_round_repository = None
         self.memory_repository = None
         self.share_repository = None
         self.project_repository = None
@@ -83,7 +90,9 @@ class MongoDBClient:
             self.refresh_tokens_collection = self.db.refresh_tokens
             self.agents_collection = self.db.agents
             self.agent_run_collection = self.db.agent_run
+            self.run_rounds_collection = self.db.run_rounds
             self.memories_collection = self.db.memories
+            self.memory_items_collection = self.db.memory_items
             self.conversation_shares_collection = self.db.conversation_shares
             self.projects_collection = self.db.projects
 
@@ -93,6 +102,11 @@ class MongoDBClient:
 
             self._initialize_managers()
 
+            # 后台在线迁移旧格式（内嵌 rounds）的运行文档
+            self._rounds_migration_task = asyncio.create_task(self._migrate_embedded_rounds())
+            # 后台在线迁移旧格式（内嵌 items）的记忆文档
+            self._memory_migration_task = asyncio.create_task(self.memory_repository.migrate_collection())
+
             self.is_connected = True
             logger.info("MongoDB连接成功建立")
 
@@ -108,10 +122,16 @@ class MongoDBClient:
             self.conversations_collection
         )
 
+        self.run_round_repository = RunRoundRepository(
+            self.db,
+            self.run_rounds_collection
+        )
+
         self.graph_run_repository = GraphRunRepository(
             self.db,
             self.graph_run_messages_collection,
-            self.conversation_repository
+            self.conversation_repository,
+            self.run_round_repository
         )
 
         self.task_repository = TaskRepository(self.db)
@@ -168,12 +188,14 @@ class MongoDBClient:
 
         self.agent_run_repository = AgentRunRepository(
             self.db,
-            self.agent_run_collection
+            self.agent_run_collection,
+            self.run_round_repository
         )
 
         self.memory_repository = MemoryRepository(
             self.db,
-            self.memories_collection
+            self.memories_collection,
+            self.memory_items_collection
         )
 
         self.share_repository = ShareRepository(
@@ -192,8 +214,18 @@ class MongoDBClient:
             await self.conversations_collection.create_index([("user_id", 1), ("type", 1), ("created_at", -1)])
             await self.conversations_collection.create_index([("status", 1)])
             await self.conversations_collection.create_index([("updated_at", -1)])
-            await self.conversations_collection.create_index([("project_id", 1, "updated_at", -1)])
+            await self.conversations_collection.create_index([("project_id", 1), ("updated_at", -1)])
             await self.conversations_collection.create_index([("user_id", 1), ("project_id", 1)])
+            # 对话列表键集分页：(updated_at, _id) 倒序
+            await self.conversations_collection.create_index([("user_id", 1), ("updated_at", -1), ("_id", -1)])
+            await self.conversations_collection.create_index(
+                [("user_id", 1), ("type", 1), ("updated_at", -1), ("_id", -1)])
+            await self.conversations_collection.create_index(
+                [("user_id", 1), ("status", 1), ("updated_at", -1), ("_id", -1)])
+            await self.conversations_collection.create_index(
+                [("user_id", 1), ("project_id", 1), ("updated_at", -1), ("_id", -1)])
+            await self.conversations_collection.create_index(
+                [("user_id", 1), ("tags", 1), ("updated_at", -1), ("_id", -1)])
 
 
 
@@ -251,14 +283,23 @@ class MongoDBClient:
             await self.agents_collection.create_index([("created_at", -1)])
 
             await self.agent_run_collection.create_index([("conversation_id", 1)])
-            await self.agent_run_collection.create_index([("rounds.agent_name", 1)])
             await self.agent_run_collection.create_index([("tasks.task_id", 1)])
 
+            await self.run_rounds_collection.create_index([("conversation_id", 1), ("task_id", 1), ("seq", 1)],
+                                                          unique=True)
+            await self.run_rounds_collection.create_index([("conversation_id", 1), ("tool_call_id", 1)])
+
             await self.memories_collection.create_index([("user_id", 1), ("owner_type", 1), ("owner_id", 1)],
                                                         unique=True)
             await self.memories_collection.create_index([("user_id", 1)])
             await self.memories_collection.create_index([("updated_at", -1)])
 
+            await self.memory_items_collection.create_index(
+                [("user_id", 1), ("owner_type", 1), ("owner_id", 1), ("category", 1), ("item_id", 1)],
+                unique=True)
+            await self.memory_items_collection.create_index(
+                [("user_id", 1), ("owner_type", 1), ("owner_id", 1), ("category", 1), ("updated_at", -1), ("_id", 1)])
+
             await self.conversation_shares_collection.create_index([("share_id", 1)], unique=True)
             await self.conversation_shares_collection.create_index([("conversation_id", 1)], unique=True)
             await self.conversation_shares_collection.create_index([("user_id", 1)])
@@ -272,6 +313,11 @@ class MongoDBClient:
         except Exception as e:
             logger.error(f"创建MongoDB索引失败: {str(e)}")
 
+    async def _migrate_embedded_rounds(self):
+        """将 agent_run / graph_run 中内嵌的 rounds 迁移到 run_rounds 集合（读取时也会按需迁移）"""
+        await self.run_round_repository.migrate_collection(self.agent_run_collection, counter_field="round_count")
+        await self.run_round_repository.migrate_collection(self.graph_run_messages_collection)
+
     async def disconnect(self):
         """断开MongoDB连接"""
         if self.client:
@@ -335,10 +381,101 @@ class MongoDBClient:
             logger.error(f"获取完整对话数据失败: {str(e)}")
             return None
 
+    async def get_conversation_rounds_page(self, conversation_id: str, before_round: Optional[int] = None,
+                                           limit: Optional[int] = None,
+                                           exclude_round_fields: Optional[List[str]] = None,
+                                           include_tasks: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        分页获取对话内容（从最新轮次向前翻页，支持 agent 和 graph 类型）
+
+        Args:
+            conversation_id: 对话ID
+            before_round: 游标，只返回序号小于该值的轮次（为空时从最新轮次开始）
+            limit: 每页轮次数量（为空时返回全部轮次）
+            exclude_round_fields: 不需要返回的轮次字段（如 ["tools"]）
+            include_tasks: 是否返回任务及其轮次（分页时只返回本页工具调用关联的任务轮次）
+
+        Returns:
+            对话数据，包含本页 rounds、tasks 和分页信息 pagination（round_count/total_size 仅第一页返回），不存在返回None
+        """
+        try:
+            conversation = await self.conversation_repository.get_conversation(conversation_id)
+            if not conversation:
+                return None
+
+            conversation_type = conversation.get("type")
+            if conversation_type == "graph":
+                run_doc = await self.graph_run_repository.get_graph_run_info(conversation_id)
+            elif conversation_type == "agent":
+                run_doc = await self.agent_run_repository.get_agent_run_info(conversation_id)
+            else:
+                logger.warning(f"未知的对话类型: {conversation_type}")
+                conversation_type = "agent"
+                run_doc = None
+            conversation["type"] = conversation_type
+
+            if not run_doc:
+                conversation["rounds"] = []
+                conversation["pagination"] = {"round_count": 0, "total_size": 0, "next_cursor": None, "has_more": False}
+                return conversation
+
+            page = await self.run_round_repository.get_rounds_page(
+                conversation_id, before_seq=before_round, limit=limit, exclude_fields=exclude_round_fields
+            )
+            # 统计需要扫描全部主线程轮次，只在第一页计算
+            stats = await self.run_round_repository.get_round_stats(conversation_id) if before_round is None else None
+            conversation["rounds"] = page["rounds"]
+            conversation["pagination"] = {
+                "round_count": stats["round_count"] if stats else None,
+                "total_size": stats["total_size"] if stats else None,
+                "next_cursor": page["next_cursor"],
+                "has_more": page["has_more"]
+            }
+
+            if include_tasks:
+                tasks = run_doc.get("tasks", [])
+                if tasks:
+                    # 分页时只返回本页工具调用关联的任务及其轮次
+                    tool_call_ids = self._collect_tool_call_ids(page["rounds"]) if limit is not None else None
+                    rounds_by_task = await self.run_round_repository.get_all_rounds(
+                        conversation_id, tasks_only=True, exclude_fields=exclude_round_fields,
+                        tool_call_ids=tool_call_ids
+                    )
+                    if tool_call_ids is not None:
+                        tasks = [task for task in tasks if task.get("task_id") in rounds_by_task]
+                    for task in tasks:
+                        task["rounds"] = rounds_by_task.get(task.get("task_id"), [])
+                conversation["tasks"] = tasks
+
+            if conversation_type == "graph":
+                conversation["execution_chain"] = run_doc.get("execution_chain", [])
+                conversation["final_result"] = run_doc.get("final_result", "")
+
+            return conversation
+
+        except Exception as e:
+            logger.error(f"分页获取对话数据失败: {str(e)}")
+            return None
+
+    @staticmethod
+    def _collect_tool_call_ids(rounds: List[Dict[str, Any]]) -> List[str]:
+        """收集轮次中 assistant 消息发起的工具调用 ID"""
+        tool_call_ids = []
+        for round_data in rounds:
+            for message in round_data.get("messages", []):
+                for tool_call in message.get("tool_calls") or []:
+                    if tool_call.get("id"):
+                        tool_call_ids.append(tool_call["id"])
+        return tool_call_ids
+
     async def list_conversations(self, user_id: str = "default_user", conversation_type: str = None,
-                                 limit: int = 200, skip: int = 0, project_id: Optional[str] = None) -> List[Dict[str, Any]]:
+                                 limit: int = 200, skip: int = 0, project_id: Optional[str] = None,
+                                 after: Optional[Tuple[datetime, str]] = None, tag: Optional[str] = None,
+                                 status: Optional[str] = None, lean: bool = False) -> List[Dict[str, Any]]:
         """获取用户的对话列表（支持 agent 和 graph 类型）"""
-        return await self.conversation_repository.list_conversations(user_id, conversation_type, limit, skip, project_id)
+        return await self.conversation_repository.list_conversations(
+            user_id, conversation_type, limit, skip, project_id, after, tag, status, lean
+        )
 
     async def update_conversation_status(self, conversation_id: str, status: str,
                                          user_id: str = "default_user") -> bool:
@@ -379,11 +516,13 @@ class MongoDBClient:
             # 1. 删除分享记录（级联删除）
             await self.share_repository.delete_shares_by_conversation(conversation_id)
 
-            # 2. 删除 MinIO 中的所有文件（文档和图片）
+            # 2. 删除 MinIO 中的所有文件（文档、图片和工具输出）
             from app.infrastructure.storage.object_storage.conversation_document_manager import conversation_document_manager
             from app.infrastructure.storage.object_storage.conversation_image_manager import conversation_image_manager
             await conversation_document_manager.delete_all_conversation_files(user_id, conversation_id)
+            from app.infrastructure.storage.object_storage.tool_output_manager import tool_output_manager
             await conversation_image_manager.delete_all_conversation_images(user_id, conversation_id)
+            await tool_output_manager.delete_all_conversation_outputs(user_id, conversation_id)
 
             # 3. 删除消息数据
             if conversation_type == "graph":
@@ -411,6 +550,11 @@ class MongoDBClient:
         """获取图配置"""
         return await self.graph_config_repository.get_graph(graph_name, user_id)
 
+    async def get_graph_config_update_times(self, graph_names: List[str],
+                                            user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """批量获取图配置的最后更新时间"""
+        return await self.graph_config_repository.get_graph_update_times(graph_names, user_id)
+
     async def update_graph_config(self, graph_name: str, graph_config: Dict[str, Any],
                                   user_id: Optional[str] = None) -> bool:
         """更新图配置"""
@@ -476,12 +620,17 @@ class MongoDBClient:
         return await self.graph_run_repository.update_graph_run_data(conversation_id, update_data)
 
     async def add_round_to_graph_run(self, conversation_id: str, round_data: Dict[str, Any],
-                                     tools_schema: Optional[List[Dict[str, Any]]] = None) -> bool:
+                                     tools_schema: Optional[List[Dict[str, Any]]] = None,
+                                     seq: Optional[int] = None) -> bool:
         """向图运行对话添加新的轮次"""
         return await self.graph_run_repository.add_round_to_graph_run(
-            conversation_id, round_data, tools_schema
+            conversation_id, round_data, tools_schema, seq
         )
 
+    async def truncate_graph_run_rounds(self, conversation_id: str, keep_count: int) -> bool:
+        """截断图运行主线程轮次，只保留前 keep_count 个轮次"""
+        return await self.graph_run_repository.truncate_rounds(conversation_id, keep_count)
+
     async def update_graph_run_global_outputs(self, conversation_id: str, node_name: str, output: str) -> bool:
         """更新图运行全局输出"""
         return await self.graph_run_repository.update_global_outputs(conversation_id, node_name, output)
@@ -495,6 +644,17 @@ class MongoDBClient:
         """更新图运行执行链"""
         return await self.graph_run_repository.update_execution_chain(conversation_id, execution_chain)
 
+    async def save_graph_run_node_completion(self, conversation_id: str, round_data: Dict[str, Any],
+                                             seq: Optional[int] = None,
+                                             tools_schema: Optional[List[Dict[str, Any]]] = None,
+                                             global_output: Optional[Tuple[str, str]] = None,
+                                             set_fields: Optional[Dict[str, Any]] = None,
+                                             token_usage: Optional[Dict[str, int]] = None) -> bool:
+        """保存一次图节点执行的全部结果"""
+        return await self.graph_run_repository.save_node_completion(
+            conversation_id, round_data, seq, tools_schema, global_output, set_fields, token_usage
+        )
+
     async def update_graph_run_final_result(self, conversation_id: str, final_result: str) -> bool:
         """更新图运行最终结果"""
         return await self.graph_run_repository.update_final_result(conversation_id, final_result)
@@ -12,6 +12,7 @@ from .team_settings_repository import TeamSettingsRepository
 from .refresh_token_repository import RefreshTokenRepository
 from .agent_repository import AgentRepository
 from .agent_run_repository import AgentRunRepository
+from .run_round_repository import RunRoundRepository
 from .memory_repository import MemoryRepository
 from .share_repository import ShareRepository
 from .project_repository import ProjectRepository
@@ -31,6 +32,7 @@ __all__ = [
     'RefreshTokenRepository',
     'AgentRepository',
     'AgentRunRepository',
+    'RunRoundRepository',
     'MemoryRepository',
     'ShareRepository',
     'ProjectRepository'
@@ -72,6 +72,31 @@ class AgentRepository:
             logger.error(f"获取 Agent 失败 ({agent_name}): {str(e)}")
             return None
 
+    async def get_agents_by_names(self, agent_names: List[str], user_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        批量获取 Agent 配置（一次 $in 查询）
+
+        Args:
+            agent_names: Agent 名称列表
+            user_id: 用户 ID
+
+        Returns:
+            {agent_name: agent_config}，不存在的 Agent 不包含在结果中；查询失败返回 None
+        """
+        if not agent_names:
+            return {}
+
+        try:
+            cursor = self.agents_collection.find(
+                {"user_id": user_id, "name": {"$in": list(set(agent_names))}},
+                {"_id": 0, "name": 1, "agent_config": 1}
+            )
+            return {agent["name"]: agent.get("agent_config", {}) async for agent in cursor}
+
+        except Exception as e:
+            logger.error(f"批量获取 Agent 失败 ({agent_names}): {str(e)}")
+            return None
+
     async def get_agent_by_id(self, agent_id: str) -> Optional[Dict[str, Any]]:
         """
         获取 Agent（通过 _id）
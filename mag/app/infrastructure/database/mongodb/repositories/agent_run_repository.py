@@ -1,16 +1,34 @@
 import logging
 from typing import Dict, List, Any, Optional
 
+from .run_round_repository import RunRoundRepository
+
 logger = logging.getLogger(__name__)
 
 
 class AgentRunRepository:
-    """Agent Run Repository - 负责 agent_run 集合的操作"""
+    """Agent Run Repository - 负责 agent_run 集合的操作
+
+    agent_run 文档只保存对话级数据和任务列表，主线程轮次和任务轮次存储在 run_rounds 集合中。
+    """
 
-    def __init__(self, db, agent_run_collection):
+    def __init__(self, db, agent_run_collection, run_round_repository: Optional[RunRoundRepository] = None):
         """初始化 Agent Run Repository"""
         self.db = db
         self.agent_run_collection = agent_run_collection
+        self.run_round_repository = run_round_repository or RunRoundRepository(db, db.run_rounds)
+
+    async def _find_agent_run(self, conversation_id: str, projection: Optional[Dict[str, Any]] = None
+                              ) -> Optional[Dict[str, Any]]:
+        """获取 agent_run 文档（不含轮次），旧格式文档在读取时迁移"""
+        agent_run = await self.agent_run_collection.find_one({"_id": conversation_id}, projection=projection)
+        if agent_run and self.run_round_repository.has_embedded_rounds(agent_run):
+            if projection is not None:
+                agent_run = await self.agent_run_collection.find_one({"_id": conversation_id})
+            agent_run = await self.run_round_repository.migrate_embedded_rounds(
+                self.agent_run_collection, agent_run, counter_field="round_count"
+            )
+        return agent_run
 
     async def create_agent_run(self, conversation_id: str) -> bool:
         """
@@ -26,7 +44,7 @@ class AgentRunRepository:
             agent_run_doc = {
                 "_id": conversation_id,
                 "conversation_id": conversation_id,
-                "rounds": [],
+                "round_count": 0,
                 "tasks": []
             }
 
@@ -42,7 +60,7 @@ class AgentRunRepository:
 
     async def get_agent_run(self, conversation_id: str) -> Optional[Dict[str, Any]]:
         """
-        获取 agent_run 文档
+        获取 agent_run 文档（包含主线程 rounds 和各任务的 rounds）
 
         Args:
             conversation_id: 对话 ID
@@ -51,13 +69,37 @@ class AgentRunRepository:
             agent_run 文档，不存在返回 None
         """
         try:
-            agent_run = await self.agent_run_collection.find_one({"_id": conversation_id})
+            agent_run = await self._find_agent_run(conversation_id)
+            if not agent_run:
+                return None
+
+            rounds_by_task = await self.run_round_repository.get_all_rounds(conversation_id)
+            agent_run["rounds"] = rounds_by_task.get(None, [])
+            for task in agent_run.get("tasks", []):
+                task["rounds"] = rounds_by_task.get(task.get("task_id"), [])
             return agent_run
 
         except Exception as e:
             logger.error(f"获取 agent_run 文档失败: {str(e)}")
             return None
 
+    async def get_agent_run_info(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取 agent_run 文档（不含 rounds，任务只包含任务信息）
+
+        Args:
+            conversation_id: 对话 ID
+
+        Returns:
+            agent_run 文档，不存在返回 None
+        """
+        try:
+            return await self._find_agent_run(conversation_id)
+
+        except Exception as e:
+            logger.error(f"获取 agent_run 文档失败: {str(e)}")
+            return None
+
     async def add_round_to_main(
         self,
         conversation_id: str,
@@ -67,7 +109,8 @@ class AgentRunRepository:
         tools: Optional[List[Dict[str, Any]]] = None,
         model: Optional[str] = None,
         prompt_tokens: Optional[int] = None,
-        completion_tokens: Optional[int] = None
+        completion_tokens: Optional[int] = None,
+        termination: Optional[Dict[str, Any]] = None
     ) -> bool:
         """
         添加主线程 round
@@ -81,42 +124,132 @@ class AgentRunRepository:
             model: 模型名称（可选）
             prompt_tokens: 提示词 token 数量（可选）
             completion_tokens: 完成 token 数量（可选）
+            termination: 提前终止状态（可选，如预算超限）
 
         Returns:
             添加成功返回 True，失败返回 False
         """
         try:
-            round_doc = {
-                "round": round_number,
-                "agent_name": agent_name,
-                "messages": messages
-            }
+            round_doc = self._build_main_round_doc(
+                round_number, agent_name, messages, tools, model,
+                prompt_tokens, completion_tokens, termination
+            )
 
-            if tools is not None:
-                round_doc["tools"] = tools
-            if model is not None:
-                round_doc["model"] = model
-            if prompt_tokens is not None:
-                round_doc["prompt_tokens"] = prompt_tokens
-            if completion_tokens is not None:
-                round_doc["completion_tokens"] = completion_tokens
+            seq = await self.run_round_repository.append_round(conversation_id, round_doc, seq=round_number)
+            if seq is None:
+                logger.warning(f"添加主线程 round 失败: {conversation_id}, round {round_number}")
+                return False
 
-            result = await self.agent_run_collection.update_one(
+            # 保持轮次计数器不小于已写入的轮次编号
+            await self.agent_run_collection.update_one(
                 {"_id": conversation_id},
-                {"$push": {"rounds": round_doc}}
+                {"$max": {"round_count": round_number}}
             )
-
-            if result.modified_count > 0:
-                logger.debug(f"添加主线程 round 成功: {conversation_id}, round {round_number}")
-                return True
-            else:
-                logger.warning(f"添加主线程 round 失败: 文档未找到或未修改")
-                return False
+            logger.debug(f"添加主线程 round 成功: {conversation_id}, round {round_number}")
+            return True
 
         except Exception as e:
             logger.error(f"添加主线程 round 失败: {str(e)}")
             return False
 
+    @staticmethod
+    def _build_main_round_doc(
+        round_number: Optional[int],
+        agent_name: str,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        model: Optional[str] = None,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None,
+        termination: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """构建主线程 round 文档"""
+        round_doc = {
+            "round": round_number,
+            "agent_name": agent_name,
+            "messages": messages
+        }
+
+        if tools is not None:
+            round_doc["tools"] = tools
+        if model is not None:
+            round_doc["model"] = model
+        if prompt_tokens is not None:
+            round_doc["prompt_tokens"] = prompt_tokens
+        if completion_tokens is not None:
+            round_doc["completion_tokens"] = completion_tokens
+        if termination is not None:
+            round_doc["termination"] = termination
+
+        return round_doc
+
+    async def append_main_round(
+        self,
+        conversation_id: str,
+        agent_name: str,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        model: Optional[str] = None,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None,
+        termination: Optional[Dict[str, Any]] = None
+    ) -> Optional[int]:
+        """
+        追加主线程 round（不需要预先读取）
+
+        轮次编号由 agent_run 文档中的 round_count 计数器原子递增生成（文档不存在时自动创建），
+        轮次写入 run_rounds 集合。
+
+        Args:
+            conversation_id: 对话 ID
+            agent_name: Agent 名称
+            messages: 消息列表
+            tools: 工具 schema 列表（可选）
+            model: 模型名称（可选）
+            prompt_tokens: 提示词 token 数量（可选）
+            completion_tokens: 完成 token 数量（可选）
+            termination: 提前终止状态（可选，如预算超限）
+
+        Returns:
+            新 round 的编号，失败返回 None
+        """
+        try:
+            round_doc = self._build_main_round_doc(
+                None, agent_name, messages, tools, model,
+                prompt_tokens, completion_tokens, termination
+            )
+
+            # 聚合管道更新：递增计数器作为轮次编号，文档不存在时自动创建
+            # （旧格式文档没有计数器时以内嵌 rounds 数量为起点）
+            result = await self.agent_run_collection.find_one_and_update(
+                {"_id": conversation_id},
+                [
+                    {"$set": {
+                        "conversation_id": {"$literal": conversation_id},
+                        "tasks": {"$ifNull": ["$tasks", []]},
+                        "round_count": {"$add": [
+                            {"$ifNull": ["$round_count", {"$size": {"$ifNull": ["$rounds", []]}}]},
+                            1
+                        ]}
+                    }}
+                ],
+                projection={"round_count": 1},
+                upsert=True,
+                return_document=True
+            )
+            round_number = result["round_count"]
+            round_doc["round"] = round_number
+
+            if await self.run_round_repository.append_round(conversation_id, round_doc, seq=round_number) is None:
+                return None
+
+            logger.debug(f"追加主线程 round 成功: {conversation_id}, round {round_number}")
+            return round_number
+
+        except Exception as e:
+            logger.error(f"追加主线程 round 失败: {str(e)}")
+            return None
+
     async def add_task(
         self,
         conversation_id: str,
@@ -137,8 +270,7 @@ class AgentRunRepository:
         try:
             task_doc = {
                 "task_id": task_id,
-                "agent_name": agent_name,
-                "rounds": []
+                "agent_name": agent_name
             }
 
             result = await self.agent_run_collection.update_one(
@@ -173,14 +305,15 @@ class AgentRunRepository:
             任务文档，不存在返回 None
         """
         try:
-            agent_run = await self.get_agent_run(conversation_id)
-
-            if not agent_run:
-                return None
+            agent_run = await self._find_agent_run(
+                conversation_id,
+                projection={"tasks": {"$elemMatch": {"task_id": task_id}}}
+            )
 
-            # 在 tasks 数组中查找指定 task_id
-            for task in agent_run.get("tasks", []):
+            # 只取出指定 task_id 的任务，rounds 从 run_rounds 集合按序读取
+            for task in (agent_run or {}).get("tasks", []):
                 if task.get("task_id") == task_id:
+                    task["rounds"] = await self.run_round_repository.get_rounds(conversation_id, task_id)
                     return task
 
             return None
@@ -227,19 +360,13 @@ class AgentRunRepository:
             if tool_call_id is not None:
                 round_doc["tool_call_id"] = tool_call_id
 
-            result = await self.agent_run_collection.update_one(
-                {
-                    "_id": conversation_id,
-                    "tasks.task_id": task_id
-                },
-                {"$push": {"tasks.$.rounds": round_doc}}
-            )
+            seq = await self.run_round_repository.append_round(conversation_id, round_doc, task_id=task_id)
 
-            if result.modified_count > 0:
+            if seq is not None:
                 logger.debug(f"添加任务 round 成功: task_id {task_id}, round {round_number}, tool_call_id {tool_call_id}")
                 return True
             else:
-                logger.warning(f"添加任务 round 失败: task 未找到或未修改")
+                logger.warning(f"添加任务 round 失败: {conversation_id}, task_id {task_id}")
                 return False
 
         except Exception as e:
@@ -262,14 +389,16 @@ class AgentRunRepository:
             消息列表
         """
         try:
-            task = await self.get_task(conversation_id, task_id)
-
-            if not task:
-                return []
+            rounds = await self.run_round_repository.get_rounds(conversation_id, task_id, projection=["messages"])
+            if not rounds:
+                # 旧格式文档尚未迁移时先迁移
+                if not await self.get_task(conversation_id, task_id):
+                    return []
+                rounds = await self.run_round_repository.get_rounds(conversation_id, task_id, projection=["messages"])
 
             # 合并所有 rounds 的 messages
             messages = []
-            for round_doc in task.get("rounds", []):
+            for round_doc in rounds:
                 messages.extend(round_doc.get("messages", []))
 
             return messages
@@ -278,23 +407,33 @@ class AgentRunRepository:
             logger.error(f"获取任务历史失败 ({task_id}): {str(e)}")
             return []
 
-    async def get_main_rounds(self, conversation_id: str) -> List[Dict[str, Any]]:
+    async def get_main_rounds(
+        self,
+        conversation_id: str,
+        start_round: Optional[int] = None,
+        end_round: Optional[int] = None,
+        projection: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
         """
-        获取主线程的所有 rounds
+        获取主线程的 rounds（支持按轮次范围和字段投影读取）
 
         Args:
             conversation_id: 对话 ID
+            start_round: 起始轮次（包含，可选）
+            end_round: 结束轮次（包含，可选）
+            projection: 需要返回的字段（可选，如 ["messages"]）
 
         Returns:
             rounds 列表
         """
         try:
-            agent_run = await self.get_agent_run(conversation_id)
-
-            if not agent_run:
+            # 旧格式文档在读取时迁移
+            if not await self._find_agent_run(conversation_id, projection={"_id": 1, "rounds": {"$slice": 0}}):
                 return []
 
-            return agent_run.get("rounds", [])
+            return await self.run_round_repository.get_rounds(
+                conversation_id, start_seq=start_round, end_seq=end_round, projection=projection
+            )
 
         except Exception as e:
             logger.error(f"获取主线程 rounds 失败: {str(e)}")
@@ -324,6 +463,7 @@ class AgentRunRepository:
         """
         try:
             result = await self.agent_run_collection.delete_one({"_id": conversation_id})
+            await self.run_round_repository.delete_rounds(conversation_id)
 
             if result.deleted_count > 0:
                 logger.info(f"删除 agent_run 文档成功: {conversation_id}")
@@ -347,12 +487,14 @@ class AgentRunRepository:
             round 数量
         """
         try:
-            agent_run = await self.get_agent_run(conversation_id)
+            agent_run = await self._find_agent_run(conversation_id, projection={"round_count": 1, "rounds": {"$slice": 0}})
 
             if not agent_run:
                 return 0
 
-            return len(agent_run.get("rounds", []))
+            if "round_count" in agent_run:
+                return agent_run["round_count"]
+            return await self.run_round_repository.count_rounds(conversation_id)
 
         except Exception as e:
             logger.error(f"获取 round 数量失败: {str(e)}")
@@ -369,12 +511,15 @@ class AgentRunRepository:
             任务数量
         """
         try:
-            agent_run = await self.get_agent_run(conversation_id)
+            agent_run = await self.agent_run_collection.find_one(
+                {"_id": conversation_id},
+                projection={"task_count": {"$size": {"$ifNull": ["$tasks", []]}}}
+            )
 
             if not agent_run:
                 return 0
 
-            return len(agent_run.get("tasks", []))
+            return agent_run["task_count"]
 
         except Exception as e:
             logger.error(f"获取任务数量失败: {str(e)}")
@@ -1,10 +1,25 @@
+import base64
 import logging
-from typing import Dict, List, Any, Optional, Callable
+from typing import Dict, List, Any, Optional, Callable, Tuple
 from datetime import datetime
 from bson import ObjectId
 
 logger = logging.getLogger(__name__)
 
+# 对话列表（侧边栏）只需要的字段
+CONVERSATION_LIST_PROJECTION = {
+    "user_id": 1,
+    "type": 1,
+    "title": 1,
+    "created_at": 1,
+    "updated_at": 1,
+    "round_count": 1,
+    "total_token_usage": 1,
+    "status": 1,
+    "tags": 1,
+    "project_id": 1
+}
+
 
 class ConversationRepository:
     """对话管理器 - 负责conversations集合的通用操作（所有类型对话的基础信息）"""
@@ -14,6 +29,34 @@ class ConversationRepository:
         self.db = db
         self.conversations_collection = conversations_collection
 
+    @staticmethod
+    def _build_conversation_doc(conversation_id: str, conversation_type: str, user_id: str, title: str,
+                                tags: Optional[List[str]] = None, project_id: Optional[str] = None) -> Dict[str, Any]:
+        """构建新对话文档"""
+        now = datetime.now()
+        return {
+            "_id": conversation_id,
+            "user_id": user_id,
+            "type": conversation_type,
+            "title": title,
+            "created_at": now,
+            "updated_at": now,
+            "round_count": 0,
+            "total_token_usage": {
+                "total_tokens": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0
+            },
+            "status": "active",
+            "tags": tags or [],
+            "project_id": project_id,
+            # 初始化 documents 字段
+            "documents": {
+                "total_count": 0,
+                "files": []
+            }
+        }
+
     async def create_conversation(self, conversation_id: str, conversation_type: str = "agent",
                                   user_id: str = "default_user", title: str = "",
                                   tags: List[str] = None, project_id: Optional[str] = None) -> bool:
@@ -28,29 +71,9 @@ class ConversationRepository:
                 logger.error(f"不支持的对话类型: {conversation_type}，仅支持 'agent' 或 'graph'")
                 return False
 
-            now = datetime.now()
-            conversation_doc = {
-                "_id": conversation_id,
-                "user_id": user_id,
-                "type": conversation_type,
-                "title": title,
-                "created_at": now,
-                "updated_at": now,
-                "round_count": 0,
-                "total_token_usage": {
-                    "total_tokens": 0,
-                    "prompt_tokens": 0,
-                    "completion_tokens": 0
-                },
-                "status": "active",
-                "tags": tags or [],
-                "project_id": project_id,
-                # 初始化 documents 字段
-                "documents": {
-                    "total_count": 0,
-                    "files": []
-                }
-            }
+            conversation_doc = self._build_conversation_doc(
+                conversation_id, conversation_type, user_id, title, tags, project_id
+            )
 
             await self.conversations_collection.insert_one(conversation_doc)
             logger.info(f"创建对话成功: {conversation_id}, 类型: {conversation_type}")
@@ -328,17 +351,86 @@ class ConversationRepository:
             logger.error(f"更新token使用量失败: {str(e)}")
             return False
 
+    async def update_conversation_round_stats(self, conversation_id: str, round_increment: int = 1,
+                                              prompt_tokens: int = 0, completion_tokens: int = 0,
+                                              create_if_missing: Optional[Dict[str, Any]] = None) -> bool:
+        """一次更新对话的轮次计数和token使用量
+
+        Args:
+            create_if_missing: 对话不存在时用于创建对话的参数（conversation_type, user_id, title, tags），
+                为空时不创建
+        """
+        try:
+            increments = {"round_count": round_increment}
+            total_tokens = prompt_tokens + completion_tokens
+            if total_tokens > 0:
+                increments.update({
+                    "total_token_usage.total_tokens": total_tokens,
+                    "total_token_usage.prompt_tokens": prompt_tokens,
+                    "total_token_usage.completion_tokens": completion_tokens
+                })
+
+            update = {
+                "$inc": increments,
+                "$set": {"updated_at": datetime.now()}
+            }
+            if create_if_missing:
+                # 不存在时按新对话文档插入，计数和token字段由 $inc 初始化
+                insert_doc = self._build_conversation_doc(conversation_id, **create_if_missing)
+                for key in ("_id", "updated_at", "round_count", "total_token_usage"):
+                    insert_doc.pop(key)
+                update["$setOnInsert"] = insert_doc
+                if total_tokens <= 0:
+                    update["$setOnInsert"]["total_token_usage"] = {
+                        "total_tokens": 0, "prompt_tokens": 0, "completion_tokens": 0
+                    }
+
+            result = await self.conversations_collection.update_one(
+                {"_id": conversation_id},
+                update,
+                upsert=bool(create_if_missing)
+            )
+            return result.modified_count > 0 or result.upserted_id is not None
+        except Exception as e:
+            logger.error(f"更新对话轮次统计失败: {str(e)}")
+            return False
+
+    @staticmethod
+    def encode_list_cursor(conversation: Dict[str, Any]) -> str:
+        """根据列表中最后一个对话生成分页游标（updated_at, _id）"""
+        updated_at = conversation["updated_at"]
+        if isinstance(updated_at, datetime):
+            updated_at = updated_at.isoformat()
+        raw = f"{updated_at}|{conversation['_id']}"
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def decode_list_cursor(cursor: str) -> Tuple[datetime, str]:
+        """解析分页游标，格式无效时抛出 ValueError"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+            updated_at, conversation_id = raw.split("|", 1)
+            return datetime.fromisoformat(updated_at), conversation_id
+        except Exception as e:
+            raise ValueError(f"无效的分页游标: {cursor}") from e
+
     async def list_conversations(self, user_id: str = "default_user", conversation_type: str = None,
-                                 limit: int = 200, skip: int = 0, project_id: Optional[str] = None) -> List[Dict[str, Any]]:
+                                 limit: int = 200, skip: int = 0, project_id: Optional[str] = None,
+                                 after: Optional[Tuple[datetime, str]] = None, tag: Optional[str] = None,
+                                 status: Optional[str] = None, lean: bool = False) -> List[Dict[str, Any]]:
         """
-        获取用户的对话列表
+        获取用户的对话列表（按 updated_at, _id 倒序）
 
         Args:
             user_id: 用户ID
             conversation_type: 对话类型过滤（"agent" 或 "graph"），None 表示所有类型
             limit: 返回数量限制
-            skip: 跳过数量
+            skip: 跳过数量（建议使用 after 游标分页）
             project_id: Project ID筛选（可选，None表示不筛选）
+            after: 游标 (updated_at, _id)，只返回排在该对话之后的对话（可选）
+            tag: 标签筛选（可选）
+            status: 状态筛选（可选，如 "favorite"）
+            lean: 是否只返回列表展示需要的字段
         """
         try:
             # 构建查询条件
@@ -352,8 +444,26 @@ class ConversationRepository:
 
             if project_id is not None:
                 query["project_id"] = project_id
+            if tag:
+                query["tags"] = tag
+            if status:
+                query["status"] = status
+
+            if after:
+                # 键集分页：(updated_at, _id) 严格小于游标
+                updated_at, conversation_id = after
+                query["$or"] = [
+                    {"updated_at": {"$lt": updated_at}},
+                    {"updated_at": updated_at, "_id": {"$lt": conversation_id}}
+                ]
 
-            cursor = self.conversations_collection.find(query).sort("updated_at", -1).skip(skip).limit(limit)
+            cursor = self.conversations_collection.find(
+                query,
+                projection=CONVERSATION_LIST_PROJECTION if lean else None
+            ).sort([("updated_at", -1), ("_id", -1)])
+            if skip:
+                cursor = cursor.skip(skip)
+            cursor = cursor.limit(limit)
 
             conversations = []
             async for conversation in cursor:
@@ -793,12 +903,7 @@ class ConversationRepository:
                 )
 
             # 更新数据库
-            update_result = await self.db.agent_run.update_one(
-                {"conversation_id": conversation_id},
-                {"$set": {"rounds": compacted_rounds}}
-            )
-
-            if update_result.modified_count == 0:
+            if not await agent_run_repo.run_round_repository.replace_rounds(conversation_id, compacted_rounds):
                 return {"status": "error", "error": "更新对话消息失败"}
 
             # 计算压缩后统计
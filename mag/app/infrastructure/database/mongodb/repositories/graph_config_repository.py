@@ -63,6 +63,32 @@ class GraphConfigRepository:
             logger.error(f"获取图配置失败: {str(e)}")
             return None
 
+    async def get_graph_update_times(self, graph_names: List[str],
+                                     user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        批量获取图配置的最后更新时间（一次 $in 查询，用作图配置的版本标识）
+
+        Args:
+            graph_names: 图名称列表
+            user_id: 用户ID（必需，用于定位用户的图）
+
+        Returns:
+            {图名称: updated_at}，不存在的图不包含在结果中；查询失败返回None
+        """
+        try:
+            if user_id is None:
+                logger.warning("get_graph_update_times called without user_id")
+                return None
+
+            cursor = self.collection.find(
+                {"name": {"$in": list(set(graph_names))}, "user_id": user_id},
+                {"_id": 0, "name": 1, "updated_at": 1}
+            )
+            return {doc["name"]: doc.get("updated_at") async for doc in cursor}
+        except Exception as e:
+            logger.error(f"批量获取图配置更新时间失败: {str(e)}")
+            return None
+
     async def update_graph(self, graph_name: str, graph_config: Dict[str, Any],
                           user_id: Optional[str] = None) -> bool:
         """
@@ -1,19 +1,50 @@
 import logging
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
 from bson import ObjectId
 
+from .run_round_repository import RunRoundRepository
+
 logger = logging.getLogger(__name__)
 
 
 class GraphRunRepository:
-    """图运行管理器 - 负责mcp-agent-graph-messages集合的运行数据管理"""
+    """图运行管理器 - 负责mcp-agent-graph-messages集合的运行数据管理
+
+    运行文档只保存图级数据和任务列表，节点轮次和任务轮次存储在 run_rounds 集合中。
+    """
 
-    def __init__(self, db, graph_run_messages_collection, conversation_manager):
+    def __init__(self, db, graph_run_messages_collection, conversation_manager,
+                 run_round_repository: Optional[RunRoundRepository] = None):
         """初始化图运行管理器"""
         self.db = db
         self.graph_run_messages_collection = graph_run_messages_collection
         self.conversation_manager = conversation_manager
+        self.run_round_repository = run_round_repository or RunRoundRepository(db, db.run_rounds)
+
+    async def _find_run_doc(self, conversation_id: str, projection: Optional[Dict[str, Any]] = None
+                            ) -> Optional[Dict[str, Any]]:
+        """获取运行文档（不含轮次），旧格式文档在读取时迁移"""
+        run_doc = await self.graph_run_messages_collection.find_one(
+            {"conversation_id": conversation_id}, projection=projection
+        )
+        if run_doc and self.run_round_repository.has_embedded_rounds(run_doc):
+            if projection is not None:
+                run_doc = await self.graph_run_messages_collection.find_one({"conversation_id": conversation_id})
+            run_doc = await self.run_round_repository.migrate_embedded_rounds(self.graph_run_messages_collection, run_doc)
+        return run_doc
+
+    async def _load_run_doc_with_rounds(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """获取运行文档，并附加主线程 rounds 和各任务的 rounds"""
+        run_doc = await self._find_run_doc(conversation_id)
+        if not run_doc:
+            return None
+
+        rounds_by_task = await self.run_round_repository.get_all_rounds(conversation_id)
+        run_doc["rounds"] = rounds_by_task.get(None, [])
+        for task in run_doc.get("tasks", []):
+            task["rounds"] = rounds_by_task.get(task.get("task_id"), [])
+        return self._convert_objectid_to_str(run_doc)
 
     async def create_graph_run_conversation(self, conversation_id: str, graph_name: str,
                                             graph_config: Dict[str, Any], user_id: str = "default_user") -> bool:
@@ -38,7 +69,6 @@ class GraphRunRepository:
                 "conversation_id": conversation_id,
                 "graph_name": graph_name,
                 "graph_config": graph_config,
-                "rounds": [],
                 "tasks": [],
                 "input": "",
                 "global_outputs": {},
@@ -63,17 +93,32 @@ class GraphRunRepository:
     async def get_graph_run_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
         """获取图运行对话数据"""
         try:
-            run_doc = await self.graph_run_messages_collection.find_one({"conversation_id": conversation_id})
+            return await self._load_run_doc_with_rounds(conversation_id)
+        except Exception as e:
+            logger.error(f"获取图运行对话失败: {str(e)}")
+            return None
+
+    async def get_graph_run_info(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """获取图运行数据（不含 rounds，任务只包含任务信息）"""
+        try:
+            run_doc = await self._find_run_doc(conversation_id)
             if run_doc:
                 return self._convert_objectid_to_str(run_doc)
             return None
         except Exception as e:
-            logger.error(f"获取图运行对话失败: {str(e)}")
+            logger.error(f"获取图运行数据失败: {str(e)}")
             return None
 
     async def update_graph_run_data(self, conversation_id: str, update_data: Dict[str, Any]) -> bool:
-        """更新图运行数据"""
+        """更新图运行数据
+
+        只更新运行文档：rounds 由节点执行结果逐个追加到 run_rounds 集合，tasks 由任务接口单独维护，均不随整体更新写入。
+        """
         try:
+            update_data = dict(update_data)
+            update_data.pop("rounds", None)
+            update_data.pop("tasks", None)
+
             # 添加更新时间
             update_data["updated_at"] = datetime.now().isoformat()
 
@@ -93,7 +138,8 @@ class GraphRunRepository:
             return False
 
     async def add_round_to_graph_run(self, conversation_id: str, round_data: Dict[str, Any],
-                                     tools_schema: Optional[List[Dict[str, Any]]] = None) -> bool:
+                                     tools_schema: Optional[List[Dict[str, Any]]] = None,
+                                     seq: Optional[int] = None) -> bool:
         """
         向图运行对话添加新的轮次
 
@@ -101,6 +147,7 @@ class GraphRunRepository:
             conversation_id: 对话ID
             round_data: 轮次数据，应包含round编号和messages列表
             tools_schema: 本轮使用的工具schema列表（可选，默认为空数组）
+            seq: 轮次在会话 rounds 中的序号（从1开始，为空时追加到最后）
 
         Returns:
             bool: 是否添加成功
@@ -113,26 +160,36 @@ class GraphRunRepository:
             else:
                 logger.debug(f"向图运行轮次添加了空工具列表")
 
-            result = await self.graph_run_messages_collection.update_one(
-                {"conversation_id": conversation_id},
-                {
-                    "$push": {"rounds": round_data},
-                    "$set": {"updated_at": datetime.now().isoformat()}
-                }
-            )
-
-            if result.modified_count > 0:
-                await self.conversation_manager.update_conversation_round_count(conversation_id, 1)
-                logger.info(f"向图运行对话添加轮次成功: {conversation_id}, round: {round_data.get('round', 'unknown')}")
-                return True
-            else:
+            seq = await self.run_round_repository.append_round(conversation_id, round_data, seq=seq)
+            if seq is None:
                 logger.error(f"向图运行对话添加轮次失败: {conversation_id}")
                 return False
 
+            await self.graph_run_messages_collection.update_one(
+                {"conversation_id": conversation_id},
+                {"$set": {"updated_at": datetime.now().isoformat()}}
+            )
+            await self.conversation_manager.update_conversation_round_count(conversation_id, 1)
+            logger.info(f"向图运行对话添加轮次成功: {conversation_id}, round: {round_data.get('round', 'unknown')}")
+            return True
+
         except Exception as e:
             logger.error(f"添加图运行轮次失败: {str(e)}")
             return False
 
+    async def truncate_rounds(self, conversation_id: str, keep_count: int) -> bool:
+        """
+        截断主线程轮次，只保留前 keep_count 个轮次（用于新输入继续会话时重置运行状态）
+
+        Args:
+            conversation_id: 对话ID
+            keep_count: 保留的轮次数量
+
+        Returns:
+            bool: 是否截断成功
+        """
+        return await self.run_round_repository.delete_rounds_after(conversation_id, keep_count)
+
     async def update_global_outputs(self, conversation_id: str, node_name: str, output: str) -> bool:
         """更新全局输出"""
         try:
@@ -183,6 +240,73 @@ class GraphRunRepository:
             logger.error(f"更新执行链失败: {str(e)}")
             return False
 
+    async def save_node_completion(self, conversation_id: str, round_data: Dict[str, Any],
+                                   seq: Optional[int] = None,
+                                   tools_schema: Optional[List[Dict[str, Any]]] = None,
+                                   global_output: Optional[Tuple[str, str]] = None,
+                                   set_fields: Optional[Dict[str, Any]] = None,
+                                   token_usage: Optional[Dict[str, int]] = None) -> bool:
+        """
+        保存一次节点执行的全部结果：先写入轮次，成功后运行数据一次原子更新（失败时删除已写入的轮次），最后更新对话统计
+
+        Args:
+            conversation_id: 对话ID
+            round_data: 轮次数据
+            seq: 轮次在会话 rounds 中的序号（从1开始，为空时追加到最后）
+            tools_schema: 本轮使用的工具schema列表
+            global_output: (节点名称, 输出内容)，为空表示不追加全局输出
+            set_fields: 需要同时写入的其他字段（执行链增量、handoffs状态、终止状态等）
+            token_usage: 本轮token使用量 {"prompt_tokens": ..., "completion_tokens": ...}
+
+        Returns:
+            bool: 是否保存成功
+        """
+        try:
+            round_data["tools"] = tools_schema if tools_schema is not None else []
+
+            update = {}
+            if global_output:
+                node_name, output = global_output
+                update["$push"] = {f"global_outputs.{node_name}": output}
+
+            update_fields = dict(set_fields or {})
+            update_fields["updated_at"] = datetime.now().isoformat()
+            update["$set"] = update_fields
+
+            # 先写入轮次，成功后再更新运行数据，避免出现缺少全局输出或执行链的轮次
+            saved_seq = await self.run_round_repository.append_round(conversation_id, round_data, seq=seq)
+            if saved_seq is None:
+                logger.error(f"保存节点执行结果失败: 轮次写入失败 {conversation_id}, round: {round_data.get('round', 'unknown')}")
+                return False
+
+            try:
+                result = await self.graph_run_messages_collection.update_one({"conversation_id": conversation_id}, update)
+                run_updated = result.modified_count > 0
+            except Exception as e:
+                logger.error(f"更新图运行数据失败: {str(e)}")
+                run_updated = False
+
+            if not run_updated:
+                # 补偿：删除已写入的轮次，保持轮次与运行数据一致
+                await self.run_round_repository.delete_round(conversation_id, saved_seq)
+                logger.error(f"保存节点执行结果失败: 运行数据更新失败，已回滚轮次 {conversation_id}, "
+                             f"round: {round_data.get('round', 'unknown')}")
+                return False
+
+            token_usage = token_usage or {}
+            await self.conversation_manager.update_conversation_round_stats(
+                conversation_id,
+                round_increment=1,
+                prompt_tokens=token_usage.get("prompt_tokens", 0),
+                completion_tokens=token_usage.get("completion_tokens", 0)
+            )
+            logger.info(f"保存节点执行结果成功: {conversation_id}, round: {round_data.get('round', 'unknown')}")
+            return True
+
+        except Exception as e:
+            logger.error(f"保存节点执行结果失败: {str(e)}")
+            return False
+
     async def update_final_result(self, conversation_id: str, final_result: str) -> bool:
         """更新最终结果"""
         try:
@@ -205,6 +329,7 @@ class GraphRunRepository:
         """删除图运行消息"""
         try:
             result = await self.graph_run_messages_collection.delete_one({"conversation_id": conversation_id})
+            await self.run_round_repository.delete_rounds(conversation_id)
             if result.deleted_count > 0:
                 logger.info(f"图运行消息 {conversation_id} 已删除")
                 return True
@@ -218,10 +343,7 @@ class GraphRunRepository:
     async def get_graph_run_messages_only(self, conversation_id: str) -> Optional[Dict[str, Any]]:
         """仅获取图运行的消息部分（不包含基本信息）"""
         try:
-            run_doc = await self.graph_run_messages_collection.find_one({"conversation_id": conversation_id})
-            if run_doc:
-                return self._convert_objectid_to_str(run_doc)
-            return None
+            return await self._load_run_doc_with_rounds(conversation_id)
         except Exception as e:
             logger.error(f"获取图运行消息失败: {str(e)}")
             return None
@@ -246,8 +368,7 @@ class GraphRunRepository:
         try:
             task_doc = {
                 "task_id": task_id,
-                "agent_name": agent_name,
-                "rounds": []
+                "agent_name": agent_name
             }
 
             result = await self.graph_run_messages_collection.update_one(
@@ -282,14 +403,15 @@ class GraphRunRepository:
             任务文档，不存在返回 None
         """
         try:
-            graph_run = await self.get_graph_run_conversation(conversation_id)
-
-            if not graph_run:
-                return None
+            graph_run = await self._find_run_doc(
+                conversation_id,
+                projection={"tasks": {"$elemMatch": {"task_id": task_id}}}
+            )
 
-            # 在 tasks 数组中查找指定 task_id
-            for task in graph_run.get("tasks", []):
+            # 只取出指定 task_id 的任务，rounds 从 run_rounds 集合按序读取
+            for task in (graph_run or {}).get("tasks", []):
                 if task.get("task_id") == task_id:
+                    task["rounds"] = await self.run_round_repository.get_rounds(conversation_id, task_id)
                     return task
 
             return None
@@ -336,19 +458,13 @@ class GraphRunRepository:
             if tool_call_id is not None:
                 round_doc["tool_call_id"] = tool_call_id
 
-            result = await self.graph_run_messages_collection.update_one(
-                {
-                    "conversation_id": conversation_id,
-                    "tasks.task_id": task_id
-                },
-                {"$push": {"tasks.$.rounds": round_doc}}
-            )
+            seq = await self.run_round_repository.append_round(conversation_id, round_doc, task_id=task_id)
 
-            if result.modified_count > 0:
+            if seq is not None:
                 logger.debug(f"添加任务 round 成功: task_id {task_id}, round {round_number}, tool_call_id {tool_call_id}")
                 return True
             else:
-                logger.warning(f"添加任务 round 失败: task 未找到或未修改")
+                logger.warning(f"添加任务 round 失败: {conversation_id}, task_id {task_id}")
                 return False
 
         except Exception as e:
@@ -371,14 +487,16 @@ class GraphRunRepository:
             消息列表
         """
         try:
-            task = await self.get_task(conversation_id, task_id)
-
-            if not task:
-                return []
+            rounds = await self.run_round_repository.get_rounds(conversation_id, task_id, projection=["messages"])
+            if not rounds:
+                # 旧格式文档尚未迁移时先迁移
+                if not await self.get_task(conversation_id, task_id):
+                    return []
+                rounds = await self.run_round_repository.get_rounds(conversation_id, task_id, projection=["messages"])
 
             # 合并所有 rounds 的 messages
             messages = []
-            for round_doc in task.get("rounds", []):
+            for round_doc in rounds:
                 messages.extend(round_doc.get("messages", []))
 
             return messages
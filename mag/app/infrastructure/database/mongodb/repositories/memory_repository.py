@@ -1,53 +1,195 @@
 """
 Memory Repository - MongoDB版本
 负责记忆的MongoDB存储、检索、更新和删除操作
+
+每个 owner 在 memories 集合中有一个文档，只保存分类元数据（memories.{category}.updated_at）；
+记忆条目以独立文档存储在 memory_items 集合中，按 (user_id, owner_type, owner_id, category, item_id) 唯一索引，
+读取时由数据库按 updated_at 排序并限制数量。
 """
+import asyncio
 import logging
 import random
 import string
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 
 logger = logging.getLogger(__name__)
 
+# 记忆条目返回给调用方的字段
+ITEM_FIELDS = {"_id": 0, "item_id": 1, "content": 1, "updated_at": 1}
+
+# 按更新时间降序排列，同一天的条目保持写入顺序
+ITEM_SORT = [("updated_at", -1), ("_id", 1)]
+
 
 class MemoryRepository:
     """Memory管理器类 - MongoDB版本"""
 
-    def __init__(self, db, collection):
+    def __init__(self, db, collection, items_collection=None):
         """
         初始化MemoryRepository
 
         Args:
             db: MongoDB数据库实例
-            collection: memories集合
+            collection: memories集合（owner 文档及分类元数据）
+            items_collection: memory_items集合（记忆条目，默认 db.memory_items）
         """
         self.db = db
         self.collection = collection
+        self.items_collection = items_collection if items_collection is not None else db.memory_items
 
-    def _generate_item_id(self) -> str:
+    def _generate_item_id(self, suffix_length: int = 4) -> str:
         """生成唯一的 item_id: YYYYMMDD_xxxx"""
         date_part = datetime.now().strftime("%Y%m%d")
         random_suffix = ''.join(random.choices(
             string.ascii_lowercase + string.digits,
-            k=4
+            k=suffix_length
         ))
         return f"{date_part}_{random_suffix}"
 
     def _ensure_unique_item_id(self, existing_ids: set) -> str:
-        """确保生成的 item_id 在当前分类中唯一"""
+        """确保生成的 item_id 在本批次中唯一（与已存储条目的冲突由唯一索引检测）"""
         max_attempts = 10
         for _ in range(max_attempts):
             item_id = self._generate_item_id()
             if item_id not in existing_ids:
                 return item_id
         # 如果 10 次都冲突（极低概率），使用更长的随机后缀
-        date_part = datetime.now().strftime("%Y%m%d")
-        random_suffix = ''.join(random.choices(
-            string.ascii_lowercase + string.digits,
-            k=8
-        ))
-        return f"{date_part}_{random_suffix}"
+        return self._generate_item_id(suffix_length=8)
+
+    @staticmethod
+    def _resolve_owner(owner: str, user_id: str, agent_id: str = None) -> Optional[Tuple[str, str]]:
+        """将 owner（user / self）解析为 (owner_type, owner_id)，无效的 owner 返回 None"""
+        if owner == "user":
+            return "user", user_id
+        if owner == "self":
+            # self 表示 agent
+            return "agent", agent_id if agent_id else "default_agent"
+        return None
+
+    @staticmethod
+    def _owner_filter(user_id: str, owner_type: str, owner_id: str) -> Dict[str, Any]:
+        return {"user_id": user_id, "owner_type": owner_type, "owner_id": owner_id}
+
+    # ========== 旧格式迁移 ==========
+
+    @staticmethod
+    def has_embedded_items(doc: Optional[Dict[str, Any]]) -> bool:
+        """owner 文档是否仍为内嵌 memories.{category}.items 的旧格式"""
+        if not doc:
+            return False
+        return any(isinstance(data, dict) and "items" in data for data in (doc.get("memories") or {}).values())
+
+    async def migrate_embedded_items(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        将旧格式 owner 文档中内嵌的记忆条目迁移到 memory_items 集合（在线迁移，可重复执行）
+
+        先按唯一键幂等写入条目，再从 owner 文档中移除内嵌的 items，只保留分类元数据。
+
+        Args:
+            doc: owner 文档
+
+        Returns:
+            移除内嵌 items 后的 owner 文档
+        """
+        owner_filter = self._owner_filter(doc["user_id"], doc["owner_type"], doc["owner_id"])
+        memories = doc.get("memories") or {}
+
+        operations = []
+        for category, data in memories.items():
+            if not isinstance(data, dict):
+                continue
+            for item in data.get("items") or []:
+                if not item.get("item_id"):
+                    continue
+                operations.append(UpdateOne(
+                    {**owner_filter, "category": category, "item_id": item["item_id"]},
+                    {"$setOnInsert": {
+                        **owner_filter,
+                        "category": category,
+                        "item_id": item["item_id"],
+                        "content": item.get("content"),
+                        "updated_at": item.get("updated_at", "")
+                    }},
+                    upsert=True
+                ))
+
+        if operations:
+            try:
+                # 按原数组顺序写入，保证同一天的条目读取顺序不变
+                await self.items_collection.bulk_write(operations, ordered=True)
+            except BulkWriteError as e:
+                # 并发迁移同一文档时的唯一索引冲突可以忽略
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+                # 有序写入在冲突处停止，剩余条目改为无序幂等写入
+                await self.items_collection.bulk_write(operations, ordered=False)
+
+        unset_fields = {
+            f"memories.{category}.items": ""
+            for category, data in memories.items()
+            if isinstance(data, dict) and "items" in data
+        }
+        if unset_fields:
+            await self.collection.update_one({"_id": doc["_id"]}, {"$unset": unset_fields})
+
+        for data in memories.values():
+            if isinstance(data, dict):
+                data.pop("items", None)
+
+        logger.info(f"迁移内嵌记忆成功: {doc['owner_type']}/{doc['owner_id']} (user: {doc['user_id']}), "
+                    f"{len(operations)} 条记忆")
+        return doc
+
+    async def migrate_collection(self) -> int:
+        """
+        迁移 memories 集合中所有旧格式的 owner 文档（启动时后台执行）
+
+        Returns:
+            迁移的文档数量
+        """
+        migrated = 0
+        try:
+            cursor = self.collection.find({"$expr": {"$anyElementTrue": [{
+                "$map": {
+                    "input": {"$objectToArray": {"$ifNull": ["$memories", {}]}},
+                    "in": {"$ne": [{"$type": "$$this.v.items"}, "missing"]}
+                }
+            }]}})
+            async for doc in cursor:
+                try:
+                    await self.migrate_embedded_items(doc)
+                    migrated += 1
+                except Exception as e:
+                    logger.error(f"迁移记忆文档失败 ({doc.get('_id')}): {str(e)}")
+
+            if migrated:
+                logger.info(f"memories 集合内嵌记忆迁移完成: {migrated} 个文档")
+        except Exception as e:
+            logger.error(f"迁移 memories 集合失败: {str(e)}")
+        return migrated
+
+    async def _find_owner_doc(self, user_id: str, owner_type: str, owner_id: str) -> Optional[Dict[str, Any]]:
+        """获取 owner 文档，旧格式文档会先迁移"""
+        doc = await self.collection.find_one(self._owner_filter(user_id, owner_type, owner_id))
+        if self.has_embedded_items(doc):
+            doc = await self.migrate_embedded_items(doc)
+        return doc
+
+    async def _migrate_owners(self, user_id: str, owners: List[Tuple[str, str]]) -> bool:
+        """迁移指定 owner 中仍为旧格式的文档，返回是否有文档被迁移"""
+        migrated = False
+        for owner_type, owner_id in set(owners):
+            doc = await self.collection.find_one(self._owner_filter(user_id, owner_type, owner_id))
+            if self.has_embedded_items(doc):
+                await self.migrate_embedded_items(doc)
+                migrated = True
+        return migrated
+
+    # ========== 记忆工具接口 ==========
 
     async def list_categories(self, user_id: str, owners: List[str], agent_id: str = None) -> Dict[str, Any]:
         """
@@ -65,32 +207,22 @@ class MemoryRepository:
             result = {"success": True, "data": {}}
 
             for owner in owners:
-                if owner == "user":
-                    owner_type = "user"
-                    owner_id = user_id
-                elif owner == "self":
-                    # self 表示 agent
-                    owner_type = "agent"
-                    owner_id = agent_id if agent_id else "default_agent"
-                else:
+                resolved = self._resolve_owner(owner, user_id, agent_id)
+                if not resolved:
                     continue
+                owner_type, owner_id = resolved
 
-                doc = await self.collection.find_one({
-                    "user_id": user_id,
-                    "owner_type": owner_type,
-                    "owner_id": owner_id
-                })
+                doc = await self._find_owner_doc(user_id, owner_type, owner_id)
 
                 if doc and "memories" in doc:
+                    counts = await self._count_items_by_category(user_id, owner_type, owner_id)
+
                     # 构建包含记忆数量的分类列表
-                    categories_with_count = []
-                    for category_name, category_data in doc["memories"].items():
-                        item_count = len(category_data.get("items", []))
-                        categories_with_count.append({
-                            "name": category_name,
-                            "count": item_count
-                        })
-                    
+                    categories_with_count = [
+                        {"name": category_name, "count": counts.get(category_name, 0)}
+                        for category_name in doc["memories"]
+                    ]
+
                     result["data"][owner] = {
                         "categories": categories_with_count,
                         "total": len(categories_with_count)
@@ -110,13 +242,40 @@ class MemoryRepository:
                 "error": f"列出记忆分类失败: {str(e)}"
             }
 
+    async def _count_items_by_category(self, user_id: str, owner_type: str, owner_id: str) -> Dict[str, int]:
+        """统计 owner 各分类的记忆条目数量"""
+        pipeline = [
+            {"$match": self._owner_filter(user_id, owner_type, owner_id)},
+            {"$group": {"_id": "$category", "count": {"$sum": 1}}}
+        ]
+        return {
+            group["_id"]: group["count"]
+            async for group in self.items_collection.aggregate(pipeline)
+        }
+
+    async def _get_category_items(self, user_id: str, owner_type: str, owner_id: str, category: str,
+                                  limit: Optional[int] = None) -> Dict[str, Any]:
+        """按 updated_at 降序获取分类下的记忆条目（排序和数量限制在数据库中完成）"""
+        query = {**self._owner_filter(user_id, owner_type, owner_id), "category": category}
+        cursor = self.items_collection.find(query, projection=ITEM_FIELDS).sort(ITEM_SORT)
+        if limit:
+            items, total = await asyncio.gather(
+                cursor.limit(limit).to_list(length=None),
+                self.items_collection.count_documents(query)
+            )
+        else:
+            items = await cursor.to_list(length=None)
+            total = len(items)
+        return {"items": items, "total": total}
+
     async def get_memory(self, user_id: str, queries: List[Dict[str, Any]], agent_id: str = None) -> Dict[str, Any]:
         """
         获取记忆内容
 
         Args:
             user_id: 用户ID
-            queries: 查询列表，例如 [{"owner": "user", "categories": ["code_preference"]}]
+            queries: 查询列表，例如 [{"owner": "user", "categories": ["code_preference"], "limit": 20}]，
+                     limit 为每个分类返回的最大条目数（可选）
             agent_id: Agent ID（当 owner 为 "self" 时使用）
 
         Returns:
@@ -129,36 +288,30 @@ class MemoryRepository:
             for query in queries:
                 owner = query.get("owner")
                 categories = query.get("categories", [])
+                limit = query.get("limit")
 
-                if owner == "user":
-                    owner_type = "user"
-                    owner_id = user_id
-                elif owner == "self":
-                    owner_type = "agent"
-                    owner_id = agent_id if agent_id else "default_agent"
-                else:
+                resolved = self._resolve_owner(owner, user_id, agent_id)
+                if not resolved:
                     continue
+                owner_type, owner_id = resolved
 
-                doc = await self.collection.find_one({
-                    "user_id": user_id,
-                    "owner_type": owner_type,
-                    "owner_id": owner_id
-                })
+                doc = await self._find_owner_doc(user_id, owner_type, owner_id)
 
                 if owner not in result["data"]:
                     result["data"][owner] = {}
 
-                for category in categories:
-                    if doc and "memories" in doc and category in doc["memories"]:
-                        items = doc["memories"][category].get("items", [])
-                        # 按 updated_at 降序排序
-                        sorted_items = sorted(items, key=lambda x: x.get("updated_at", ""), reverse=True)
-                        result["data"][owner][category] = {
-                            "items": sorted_items,
-                            "total": len(sorted_items)
-                        }
-                    else:
-                        not_found_categories[owner].append(category)
+                existing_categories = (doc.get("memories") or {}) if doc else {}
+                found = [category for category in categories if category in existing_categories]
+                not_found_categories[owner].extend(
+                    category for category in categories if category not in existing_categories
+                )
+
+                # 各分类并发查询，按 updated_at 降序排序
+                category_results = await asyncio.gather(*(
+                    self._get_category_items(user_id, owner_type, owner_id, category, limit)
+                    for category in found
+                ))
+                result["data"][owner].update(zip(found, category_results))
 
             # 检查是否有未找到的分类
             has_not_found = any(cats for cats in not_found_categories.values())
@@ -178,9 +331,29 @@ class MemoryRepository:
                 "error": f"获取记忆失败: {str(e)}"
             }
 
+    async def _insert_items(self, item_docs: List[Dict[str, Any]]) -> int:
+        """批量写入记忆条目，item_id 与已存储条目冲突时使用更长的后缀重试一次"""
+        try:
+            await self.items_collection.insert_many(item_docs, ordered=False)
+            return len(item_docs)
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in write_errors):
+                raise
+
+            retry_docs = []
+            for error in write_errors:
+                item_doc = item_docs[error["index"]]
+                item_doc.pop("_id", None)
+                item_doc["item_id"] = self._generate_item_id(suffix_length=8)
+                retry_docs.append(item_doc)
+
+            await self.items_collection.insert_many(retry_docs, ordered=False)
+            return len(item_docs)
+
     async def add_memory(self, user_id: str, additions: List[Dict[str, Any]], agent_id: str = None) -> Dict[str, Any]:
         """
-        添加记忆条目
+        添加记忆条目（条目一次批量写入，每个 owner 一次分类元数据 upsert，不预先读取）
 
         Args:
             user_id: 用户ID
@@ -191,85 +364,69 @@ class MemoryRepository:
             Dict[str, Any]: 操作结果
         """
         try:
-            total_added = 0
+            current_date = datetime.now().strftime("%Y-%m-%d")
+            item_docs = []
+            owner_categories: Dict[Tuple[str, str], set] = {}
+            generated_ids = set()
 
             for addition in additions:
-                owner = addition.get("owner")
                 category = addition.get("category")
-                items = addition.get("items", [])
-
-                if owner == "user":
-                    owner_type = "user"
-                    owner_id = user_id
-                elif owner == "self":
-                    owner_type = "agent"
-                    owner_id = agent_id if agent_id else "default_agent"
-                else:
+                resolved = self._resolve_owner(addition.get("owner"), user_id, agent_id)
+                if not resolved:
                     continue
-
-                # 获取现有文档以检查已存在的 item_id
-                doc = await self.collection.find_one({
-                    "user_id": user_id,
-                    "owner_type": owner_type,
-                    "owner_id": owner_id
-                })
-
-                existing_ids = set()
-                if doc and "memories" in doc and category in doc["memories"]:
-                    existing_ids = {item["item_id"] for item in doc["memories"][category].get("items", [])}
+                owner_type, owner_id = resolved
 
                 # 为每个内容创建记忆条目
-                new_items = []
-                for content in items:
+                for content in addition.get("items", []):
                     if not content:
                         continue
 
-                    item_id = self._ensure_unique_item_id(existing_ids)
-                    existing_ids.add(item_id)
+                    item_id = self._ensure_unique_item_id(generated_ids)
+                    generated_ids.add(item_id)
 
-                    new_items.append({
+                    item_docs.append({
+                        **self._owner_filter(user_id, owner_type, owner_id),
+                        "category": category,
                         "item_id": item_id,
                         "content": content,
-                        "updated_at": datetime.now().strftime("%Y-%m-%d")
+                        "updated_at": current_date
                     })
+                    owner_categories.setdefault((owner_type, owner_id), set()).add(category)
 
-                if not new_items:
-                    continue
+            if not item_docs:
+                return {
+                    "success": False,
+                    "error": "No items added"
+                }
 
-                # 使用 upsert 操作添加记忆
-                current_date = datetime.now().strftime("%Y-%m-%d")
-                result = await self.collection.update_one(
+            # 使用 upsert 登记分类，返回更新前的文档以便发现需要迁移的旧格式文档
+            now = datetime.now()
+            owner_updates = [
+                self.collection.find_one_and_update(
+                    self._owner_filter(user_id, owner_type, owner_id),
                     {
-                        "user_id": user_id,
-                        "owner_type": owner_type,
-                        "owner_id": owner_id
-                    },
-                    {
-                        "$push": {f"memories.{category}.items": {"$each": new_items}},
                         "$set": {
-                            f"memories.{category}.updated_at": current_date,
-                            "updated_at": datetime.now()
+                            **{f"memories.{category}.updated_at": current_date for category in categories},
+                            "updated_at": now
                         },
-                        "$setOnInsert": {
-                            "created_at": datetime.now()
-                        }
+                        "$setOnInsert": {"created_at": now}
                     },
-                    upsert=True
+                    upsert=True,
+                    return_document=ReturnDocument.BEFORE
                 )
+                for (owner_type, owner_id), categories in owner_categories.items()
+            ]
+            total_added, *previous_docs = await asyncio.gather(self._insert_items(item_docs), *owner_updates)
 
-                total_added += len(new_items)
+            for previous_doc in previous_docs:
+                if self.has_embedded_items(previous_doc):
+                    await self.migrate_embedded_items(previous_doc)
 
-            if total_added > 0:
-                logger.info(f"成功添加 {total_added} 条记忆 (user: {user_id})")
-                return {
-                    "success": True,
-                    "message": f"Successfully added {total_added} items"
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": "No items added"
-                }
+            logger.info(f"成功添加 {total_added} 条记忆 (user: {user_id})")
+            return {
+                "success": True,
+                "message": f"Successfully added {total_added} items"
+            }
 
         except Exception as e:
             logger.error(f"添加记忆失败 (user: {user_id}): {e}")
@@ -278,9 +435,53 @@ class MemoryRepository:
                 "error": f"添加记忆失败: {str(e)}"
             }
 
+    @staticmethod
+    def _items_filter(user_id: str, keys: List[Tuple[str, str, str, str]]) -> Dict[str, Any]:
+        """根据 (owner_type, owner_id, category, item_id) 列表构建条目查询条件"""
+        return {"user_id": user_id, "$or": [
+            {"owner_type": owner_type, "owner_id": owner_id, "category": category, "item_id": item_id}
+            for owner_type, owner_id, category, item_id in keys
+        ]}
+
+    async def _find_existing_items(self, user_id: str, keys: List[Tuple[str, str, str, str]]) -> set:
+        """一次查询返回已存在的 (owner_type, owner_id, category, item_id)"""
+        if not keys:
+            return set()
+        cursor = self.items_collection.find(
+            self._items_filter(user_id, keys),
+            projection={"_id": 0, "owner_type": 1, "owner_id": 1, "category": 1, "item_id": 1}
+        )
+        return {
+            (doc["owner_type"], doc["owner_id"], doc["category"], doc["item_id"])
+            async for doc in cursor
+        }
+
+    async def _resolve_existing_items(self, user_id: str, keys: List[Tuple[str, str, str, str]]) -> set:
+        """查询已存在的条目；有条目未找到时先迁移相关 owner 的旧格式文档再查询一次"""
+        existing = await self._find_existing_items(user_id, keys)
+        missing_owners = [(key[0], key[1]) for key in keys if key not in existing]
+        if missing_owners and await self._migrate_owners(user_id, missing_owners):
+            existing = await self._find_existing_items(user_id, keys)
+        return existing
+
+    async def _touch_categories(self, user_id: str, owner_categories: Dict[Tuple[str, str], set],
+                                current_date: str):
+        """更新 owner 文档中分类和文档的更新时间"""
+        now = datetime.now()
+        await asyncio.gather(*(
+            self.collection.update_one(
+                self._owner_filter(user_id, owner_type, owner_id),
+                {"$set": {
+                    **{f"memories.{category}.updated_at": current_date for category in categories},
+                    "updated_at": now
+                }}
+            )
+            for (owner_type, owner_id), categories in owner_categories.items()
+        ))
+
     async def update_memory(self, user_id: str, updates: List[Dict[str, Any]], agent_id: str = None) -> Dict[str, Any]:
         """
-        更新记忆条目
+        更新记忆条目（一次查询确认条目存在，一次批量更新）
 
         Args:
             user_id: 用户ID
@@ -291,47 +492,39 @@ class MemoryRepository:
             Dict[str, Any]: 操作结果
         """
         try:
-            total_updated = 0
-            failed_ids = []
-
+            current_date = datetime.now().strftime("%Y-%m-%d")
+            requested = []
             for update in updates:
-                owner = update.get("owner")
-                category = update.get("category")
-                item_id = update.get("item_id")
-                content = update.get("content")
-
-                if owner == "user":
-                    owner_type = "user"
-                    owner_id = user_id
-                elif owner == "self":
-                    owner_type = "agent"
-                    owner_id = agent_id if agent_id else "default_agent"
-                else:
+                resolved = self._resolve_owner(update.get("owner"), user_id, agent_id)
+                if not resolved:
                     continue
+                owner_type, owner_id = resolved
+                key = (owner_type, owner_id, update.get("category"), update.get("item_id"))
+                requested.append((key, update.get("content")))
 
-                # 更新记忆条目
-                current_date = datetime.now().strftime("%Y-%m-%d")
-                result = await self.collection.update_one(
-                    {
-                        "user_id": user_id,
-                        "owner_type": owner_type,
-                        "owner_id": owner_id,
-                        f"memories.{category}.items.item_id": item_id
-                    },
-                    {
-                        "$set": {
-                            f"memories.{category}.items.$.content": content,
-                            f"memories.{category}.items.$.updated_at": current_date,
-                            f"memories.{category}.updated_at": current_date,
-                            "updated_at": datetime.now()
-                        }
-                    }
-                )
+            existing = await self._resolve_existing_items(user_id, [key for key, _ in requested])
 
-                if result.modified_count > 0:
-                    total_updated += 1
-                else:
+            operations = []
+            failed_ids = []
+            owner_categories: Dict[Tuple[str, str], set] = {}
+            for key, content in requested:
+                owner_type, owner_id, category, item_id = key
+                if key not in existing:
                     failed_ids.append(item_id)
+                    continue
+                operations.append(UpdateOne(
+                    {**self._owner_filter(user_id, owner_type, owner_id), "category": category, "item_id": item_id},
+                    {"$set": {"content": content, "updated_at": current_date}}
+                ))
+                owner_categories.setdefault((owner_type, owner_id), set()).add(category)
+
+            total_updated = 0
+            if operations:
+                result, _ = await asyncio.gather(
+                    self.items_collection.bulk_write(operations, ordered=False),
+                    self._touch_categories(user_id, owner_categories, current_date)
+                )
+                total_updated = result.matched_count
 
             if total_updated > 0 and not failed_ids:
                 logger.info(f"成功更新 {total_updated} 条记忆 (user: {user_id})")
@@ -369,7 +562,7 @@ class MemoryRepository:
 
     async def delete_memory(self, user_id: str, deletions: List[Dict[str, Any]], agent_id: str = None) -> Dict[str, Any]:
         """
-        删除记忆条目
+        删除记忆条目（一次查询确认条目存在，一次批量删除）
 
         Args:
             user_id: 用户ID
@@ -380,57 +573,33 @@ class MemoryRepository:
             Dict[str, Any]: 操作结果
         """
         try:
-            total_deleted = 0
-            failed_ids = []
-
+            current_date = datetime.now().strftime("%Y-%m-%d")
+            requested = []
             for deletion in deletions:
-                owner = deletion.get("owner")
-                category = deletion.get("category")
-                item_ids = deletion.get("item_ids", [])
-
-                if owner == "user":
-                    owner_type = "user"
-                    owner_id = user_id
-                elif owner == "self":
-                    owner_type = "agent"
-                    owner_id = agent_id if agent_id else "default_agent"
-                else:
+                resolved = self._resolve_owner(deletion.get("owner"), user_id, agent_id)
+                if not resolved:
                     continue
-
-                # 删除记忆条目
-                current_date = datetime.now().strftime("%Y-%m-%d")
-                result = await self.collection.update_one(
-                    {
-                        "user_id": user_id,
-                        "owner_type": owner_type,
-                        "owner_id": owner_id
-                    },
-                    {
-                        "$pull": {
-                            f"memories.{category}.items": {"item_id": {"$in": item_ids}}
-                        },
-                        "$set": {
-                            f"memories.{category}.updated_at": current_date,
-                            "updated_at": datetime.now()
-                        }
-                    }
+                owner_type, owner_id = resolved
+                requested.extend(
+                    (owner_type, owner_id, deletion.get("category"), item_id)
+                    for item_id in deletion.get("item_ids", [])
                 )
 
-                if result.modified_count > 0:
-                    # 检查实际删除了多少条
-                    doc = await self.collection.find_one({
-                        "user_id": user_id,
-                        "owner_type": owner_type,
-                        "owner_id": owner_id
-                    })
-                    
-                    if doc and "memories" in doc and category in doc["memories"]:
-                        remaining_ids = {item["item_id"] for item in doc["memories"][category].get("items", [])}
-                        deleted_count = len([iid for iid in item_ids if iid not in remaining_ids])
-                        total_deleted += deleted_count
-                        failed_ids.extend([iid for iid in item_ids if iid in remaining_ids])
-                    else:
-                        total_deleted += len(item_ids)
+            existing = await self._resolve_existing_items(user_id, requested)
+            to_delete = [key for key in requested if key in existing]
+            failed_ids = [key[3] for key in requested if key not in existing]
+
+            total_deleted = 0
+            if to_delete:
+                owner_categories: Dict[Tuple[str, str], set] = {}
+                for owner_type, owner_id, category, _ in to_delete:
+                    owner_categories.setdefault((owner_type, owner_id), set()).add(category)
+
+                result, _ = await asyncio.gather(
+                    self.items_collection.delete_many(self._items_filter(user_id, to_delete)),
+                    self._touch_categories(user_id, owner_categories, current_date)
+                )
+                total_deleted = result.deleted_count
 
             if total_deleted > 0 and not failed_ids:
                 logger.info(f"成功删除 {total_deleted} 条记忆 (user: {user_id})")
@@ -460,3 +629,109 @@ class MemoryRepository:
                 "success": False,
                 "error": f"删除记忆失败: {str(e)}"
             }
+
+    # ========== 记忆管理接口 ==========
+
+    async def get_owner_summaries(self, user_id: str) -> List[Dict[str, Any]]:
+        """
+        获取用户所有 owner 的记忆统计
+
+        Returns:
+            列表，每项包含 owner_type、owner_id、categories_count、total_items、created_at、updated_at
+        """
+        docs = await self.collection.find({"user_id": user_id}).to_list(length=None)
+        for index, doc in enumerate(docs):
+            if self.has_embedded_items(doc):
+                docs[index] = await self.migrate_embedded_items(doc)
+
+        pipeline = [
+            {"$match": {"user_id": user_id}},
+            {"$group": {"_id": {"owner_type": "$owner_type", "owner_id": "$owner_id"}, "count": {"$sum": 1}}}
+        ]
+        item_counts = {
+            (group["_id"]["owner_type"], group["_id"]["owner_id"]): group["count"]
+            async for group in self.items_collection.aggregate(pipeline)
+        }
+
+        return [
+            {
+                "owner_type": doc.get("owner_type"),
+                "owner_id": doc.get("owner_id"),
+                "categories_count": len(doc.get("memories") or {}),
+                "total_items": item_counts.get((doc.get("owner_type"), doc.get("owner_id")), 0),
+                "created_at": doc.get("created_at"),
+                "updated_at": doc.get("updated_at")
+            }
+            for doc in docs
+        ]
+
+    async def get_owner_memories(self, user_id: str, owner_type: str, owner_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取 owner 的完整记忆
+
+        memories 还原为 {category: {"items": [...], "updated_at": ...}} 结构，条目按写入顺序排列。
+
+        Returns:
+            owner 文档，不存在时返回 None
+        """
+        doc = await self._find_owner_doc(user_id, owner_type, owner_id)
+        if not doc:
+            return None
+
+        memories = {
+            category: {**(data if isinstance(data, dict) else {}), "items": []}
+            for category, data in (doc.get("memories") or {}).items()
+        }
+        cursor = self.items_collection.find(
+            self._owner_filter(user_id, owner_type, owner_id),
+            projection={**ITEM_FIELDS, "category": 1}
+        ).sort("_id", 1)
+        async for item in cursor:
+            category = item.pop("category")
+            if category in memories:
+                memories[category]["items"].append(item)
+
+        doc["memories"] = memories
+        return doc
+
+    async def delete_categories(self, user_id: str, owner_type: str, owner_id: str,
+                                categories: List[str]) -> Dict[str, List[str]]:
+        """
+        删除 owner 的分类及其所有记忆条目
+
+        Returns:
+            {"deleted": 已删除的分类, "not_found": 不存在的分类}
+        """
+        owner_filter = self._owner_filter(user_id, owner_type, owner_id)
+        previous_doc, _ = await asyncio.gather(
+            self.collection.find_one_and_update(
+                owner_filter,
+                {
+                    "$unset": {f"memories.{category}": "" for category in categories},
+                    "$set": {"updated_at": datetime.now()}
+                },
+                projection={"memories": 1},
+                return_document=ReturnDocument.BEFORE
+            ),
+            self.items_collection.delete_many({**owner_filter, "category": {"$in": categories}})
+        )
+
+        existing_categories = (previous_doc or {}).get("memories") or {}
+        return {
+            "deleted": [category for category in categories if category in existing_categories],
+            "not_found": [category for category in categories if category not in existing_categories]
+        }
+
+    async def delete_owner(self, user_id: str, owner_type: str, owner_id: str) -> bool:
+        """
+        删除 owner 文档及其所有记忆条目
+
+        Returns:
+            owner 文档存在并被删除返回 True，否则返回 False
+        """
+        owner_filter = self._owner_filter(user_id, owner_type, owner_id)
+        result, _ = await asyncio.gather(
+            self.collection.delete_one(owner_filter),
+            self.items_collection.delete_many(owner_filter)
+        )
+        return result.deleted_count > 0
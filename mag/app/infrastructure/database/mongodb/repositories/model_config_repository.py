@@ -73,6 +73,7 @@ class ModelConfigRepository:
                 "extra_headers": model_config.get("extra_headers"),
                 "timeout": model_config.get("timeout"),
                 "extra_body": model_config.get("extra_body"),
+                "context_window": model_config.get("context_window"),
                 # 元数据
                 "created_at": datetime.now(),
                 "updated_at": datetime.now()
@@ -195,6 +196,7 @@ class ModelConfigRepository:
                 "extra_headers": model_config.get("extra_headers"),
                 "timeout": model_config.get("timeout"),
                 "extra_body": model_config.get("extra_body"),
+                "context_window": model_config.get("context_window"),
                 "updated_at": datetime.now()
             }
 
@@ -130,6 +130,31 @@ class PromptRepository:
             logger.error(f"获取提示词失败 {name} (user: {user_id}): {e}")
             return None
 
+    async def get_prompt_contents(self, names: List[str], user_id: str = "default_user") -> Optional[Dict[str, str]]:
+        """
+        批量获取提示词内容（一次 $in 查询）
+
+        Args:
+            names: 提示词名称列表
+            user_id: 用户ID
+
+        Returns:
+            Optional[Dict[str, str]]: {提示词名称: 内容}，不存在的提示词不包含在结果中；查询失败时返回 None
+        """
+        if not names:
+            return {}
+
+        try:
+            cursor = self.collection.find(
+                {"user_id": user_id, "name": {"$in": list(set(names))}},
+                {"_id": 0, "name": 1, "content": 1}
+            )
+            return {doc["name"]: doc["content"] async for doc in cursor}
+
+        except Exception as e:
+            logger.error(f"批量获取提示词失败 {names} (user: {user_id}): {e}")
+            return None
+
     async def update_prompt(self, name: str, update_data: PromptUpdate, user_id: str = "default_user") -> Dict[str, Any]:
         """
         更新指定提示词
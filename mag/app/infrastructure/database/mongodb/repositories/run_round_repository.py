@@ -0,0 +1,373 @@
+import logging
+from typing import Dict, List, Any, Optional
+
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# 轮次文档中用于定位的字段，读取时从轮次数据中去除
+ROUND_KEY_FIELDS = ("_id", "conversation_id", "task_id", "seq")
+
+
+class RunRoundRepository:
+    """运行轮次 Repository - 负责 run_rounds 集合的操作
+
+    agent_run / graph_run 的主线程轮次和任务轮次均以独立文档存储，
+    按 (conversation_id, task_id, seq) 唯一索引，主线程轮次的 task_id 为 None，
+    seq 为轮次在主线程或任务中的顺序位置（从 1 开始）。
+    """
+
+    def __init__(self, db, run_rounds_collection):
+        """初始化运行轮次 Repository"""
+        self.db = db
+        self.run_rounds_collection = run_rounds_collection
+
+    @staticmethod
+    def _build_round_doc(conversation_id: str, task_id: Optional[str], seq: int,
+                         round_data: Dict[str, Any]) -> Dict[str, Any]:
+        """构建轮次文档"""
+        round_doc = {k: v for k, v in round_data.items() if k not in ROUND_KEY_FIELDS}
+        round_doc.update({"conversation_id": conversation_id, "task_id": task_id, "seq": seq})
+        return round_doc
+
+    @staticmethod
+    def _strip_round_doc(round_doc: Dict[str, Any]) -> Dict[str, Any]:
+        """去除定位字段，还原为轮次数据"""
+        return {k: v for k, v in round_doc.items() if k not in ROUND_KEY_FIELDS}
+
+    async def get_last_seq(self, conversation_id: str, task_id: Optional[str] = None) -> int:
+        """获取主线程或任务的最后一个轮次序号，没有轮次返回 0"""
+        last = await self.run_rounds_collection.find_one(
+            {"conversation_id": conversation_id, "task_id": task_id},
+            projection={"seq": 1},
+            sort=[("seq", -1)]
+        )
+        return last["seq"] if last else 0
+
+    async def append_round(self, conversation_id: str, round_data: Dict[str, Any],
+                           task_id: Optional[str] = None, seq: Optional[int] = None) -> Optional[int]:
+        """
+        追加一个轮次
+
+        Args:
+            conversation_id: 对话 ID
+            round_data: 轮次数据
+            task_id: 任务 ID（None 表示主线程）
+            seq: 轮次序号（为空时追加到最后一个轮次之后）
+
+        Returns:
+            轮次序号，失败返回 None
+        """
+        try:
+            if seq is None:
+                seq = await self.get_last_seq(conversation_id, task_id) + 1
+
+            await self.run_rounds_collection.insert_one(
+                self._build_round_doc(conversation_id, task_id, seq, round_data)
+            )
+            return seq
+
+        except DuplicateKeyError:
+            logger.error(f"追加轮次失败: 轮次序号已存在 ({conversation_id}, task_id={task_id}, seq={seq})")
+            return None
+        except Exception as e:
+            logger.error(f"追加轮次失败: {str(e)}")
+            return None
+
+    async def replace_rounds(self, conversation_id: str, rounds: List[Dict[str, Any]],
+                             task_id: Optional[str] = None) -> bool:
+        """
+        整体替换主线程或任务的轮次（用于对话压缩）
+
+        按序号逐个覆盖写入新轮次后再删除多余的旧轮次，中途失败不会丢失整个历史。
+
+        Args:
+            conversation_id: 对话 ID
+            rounds: 新的轮次列表，序号按列表顺序重新编号
+            task_id: 任务 ID（None 表示主线程）
+
+        Returns:
+            替换成功返回 True，失败返回 False
+        """
+        try:
+            if rounds:
+                await self.run_rounds_collection.bulk_write([
+                    ReplaceOne(
+                        {"conversation_id": conversation_id, "task_id": task_id, "seq": seq},
+                        self._build_round_doc(conversation_id, task_id, seq, round_data),
+                        upsert=True
+                    )
+                    for seq, round_data in enumerate(rounds, start=1)
+                ])
+            return await self.delete_rounds_after(conversation_id, len(rounds), task_id)
+
+        except Exception as e:
+            logger.error(f"替换轮次失败: {str(e)}")
+            return False
+
+    async def delete_rounds_after(self, conversation_id: str, seq: int, task_id: Optional[str] = None) -> bool:
+        """
+        删除主线程或任务中序号大于 seq 的轮次（用于运行状态重置，保留前 seq 个轮次）
+
+        Returns:
+            删除成功返回 True，失败返回 False
+        """
+        try:
+            await self.run_rounds_collection.delete_many(
+                {"conversation_id": conversation_id, "task_id": task_id, "seq": {"$gt": seq}}
+            )
+            return True
+
+        except Exception as e:
+            logger.error(f"删除轮次失败: {str(e)}")
+            return False
+
+    async def delete_round(self, conversation_id: str, seq: int, task_id: Optional[str] = None) -> bool:
+        """删除指定序号的轮次（用于写入失败后的补偿）"""
+        try:
+            await self.run_rounds_collection.delete_one(
+                {"conversation_id": conversation_id, "task_id": task_id, "seq": seq}
+            )
+            return True
+
+        except Exception as e:
+            logger.error(f"删除轮次失败: {str(e)}")
+            return False
+
+    async def get_rounds(self, conversation_id: str, task_id: Optional[str] = None,
+                         start_seq: Optional[int] = None, end_seq: Optional[int] = None,
+                         projection: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        按序号范围获取主线程或任务的轮次
+
+        Args:
+            conversation_id: 对话 ID
+            task_id: 任务 ID（None 表示主线程）
+            start_seq: 起始序号（包含，可选）
+            end_seq: 结束序号（包含，可选）
+            projection: 需要返回的轮次字段（可选，默认返回全部字段）
+
+        Returns:
+            按序号排序的轮次列表
+        """
+        try:
+            query = {"conversation_id": conversation_id, "task_id": task_id}
+            seq_range = {}
+            if start_seq is not None:
+                seq_range["$gte"] = start_seq
+            if end_seq is not None:
+                seq_range["$lte"] = end_seq
+            if seq_range:
+                query["seq"] = seq_range
+
+            fields = {field: 1 for field in projection} if projection else None
+            cursor = self.run_rounds_collection.find(query, projection=fields).sort("seq", 1)
+            return [self._strip_round_doc(round_doc) async for round_doc in cursor]
+
+        except Exception as e:
+            logger.error(f"获取轮次失败: {str(e)}")
+            return []
+
+    async def get_rounds_page(self, conversation_id: str, task_id: Optional[str] = None,
+                              before_seq: Optional[int] = None, limit: Optional[int] = None,
+                              exclude_fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        从最新的轮次向前分页获取轮次（游标为本页最早轮次的序号）
+
+        Args:
+            conversation_id: 对话 ID
+            task_id: 任务 ID（None 表示主线程）
+            before_seq: 只返回序号小于该值的轮次（可选，为空时从最新轮次开始）
+            limit: 每页轮次数量（可选，为空时返回全部）
+            exclude_fields: 不需要返回的轮次字段（可选，如 ["tools"]）
+
+        Returns:
+            {"rounds": 按序号升序的轮次列表, "next_cursor": 下一页游标, "has_more": 是否还有更早的轮次}
+        """
+        try:
+            query = {"conversation_id": conversation_id, "task_id": task_id}
+            if before_seq is not None:
+                query["seq"] = {"$lt": before_seq}
+
+            fields = {field: 0 for field in exclude_fields} if exclude_fields else None
+            cursor = self.run_rounds_collection.find(query, projection=fields).sort("seq", -1)
+            if limit is not None:
+                # 多取一条用于判断是否还有更早的轮次
+                cursor = cursor.limit(limit + 1)
+
+            round_docs = [round_doc async for round_doc in cursor]
+            has_more = limit is not None and len(round_docs) > limit
+            if has_more:
+                round_docs = round_docs[:limit]
+            round_docs.reverse()
+
+            return {
+                "rounds": [self._strip_round_doc(round_doc) for round_doc in round_docs],
+                "next_cursor": round_docs[0]["seq"] if has_more else None,
+                "has_more": has_more
+            }
+
+        except Exception as e:
+            logger.error(f"分页获取轮次失败: {str(e)}")
+            return {"rounds": [], "next_cursor": None, "has_more": False}
+
+    async def get_round_stats(self, conversation_id: str, task_id: Optional[str] = None) -> Dict[str, int]:
+        """
+        获取主线程或任务的轮次数量和存储大小（字节）
+
+        Returns:
+            {"round_count": int, "total_size": int}
+        """
+        try:
+            pipeline = [
+                {"$match": {"conversation_id": conversation_id, "task_id": task_id}},
+                {"$group": {
+                    "_id": None,
+                    "round_count": {"$sum": 1},
+                    "total_size": {"$sum": {"$bsonSize": "$$ROOT"}}
+                }}
+            ]
+            result = await self.run_rounds_collection.aggregate(pipeline).to_list(length=1)
+            if not result:
+                return {"round_count": 0, "total_size": 0}
+            return {"round_count": result[0]["round_count"], "total_size": result[0]["total_size"]}
+
+        except Exception as e:
+            logger.error(f"获取轮次统计失败: {str(e)}")
+            return {"round_count": 0, "total_size": 0}
+
+    async def get_all_rounds(self, conversation_id: str, tasks_only: bool = False,
+                             exclude_fields: Optional[List[str]] = None,
+                             tool_call_ids: Optional[List[str]] = None) -> Dict[Optional[str], List[Dict[str, Any]]]:
+        """
+        一次查询获取对话的主线程轮次和所有任务轮次
+
+        Args:
+            conversation_id: 对话 ID
+            tasks_only: 是否只获取任务轮次
+            exclude_fields: 不需要返回的轮次字段（可选）
+            tool_call_ids: 只获取关联这些主线程工具调用的任务轮次（可选，用于按页获取任务轮次）
+
+        Returns:
+            {task_id: 轮次列表}，主线程轮次的键为 None
+        """
+        try:
+            query = {"conversation_id": conversation_id}
+            if tasks_only:
+                query["task_id"] = {"$ne": None}
+            if tool_call_ids is not None:
+                query["tool_call_id"] = {"$in": tool_call_ids}
+
+            fields = {field: 0 for field in exclude_fields} if exclude_fields else None
+            cursor = self.run_rounds_collection.find(query, projection=fields).sort([("task_id", 1), ("seq", 1)])
+
+            rounds_by_task: Dict[Optional[str], List[Dict[str, Any]]] = {}
+            async for round_doc in cursor:
+                rounds_by_task.setdefault(round_doc.get("task_id"), []).append(self._strip_round_doc(round_doc))
+            return rounds_by_task
+
+        except Exception as e:
+            logger.error(f"获取对话轮次失败: {str(e)}")
+            return {}
+
+    async def count_rounds(self, conversation_id: str, task_id: Optional[str] = None) -> int:
+        """获取主线程或任务的轮次数量"""
+        try:
+            return await self.run_rounds_collection.count_documents(
+                {"conversation_id": conversation_id, "task_id": task_id}
+            )
+        except Exception as e:
+            logger.error(f"获取轮次数量失败: {str(e)}")
+            return 0
+
+    async def delete_rounds(self, conversation_id: str) -> bool:
+        """删除对话的所有轮次"""
+        try:
+            await self.run_rounds_collection.delete_many({"conversation_id": conversation_id})
+            return True
+        except Exception as e:
+            logger.error(f"删除轮次失败: {str(e)}")
+            return False
+
+    @staticmethod
+    def has_embedded_rounds(run_doc: Dict[str, Any]) -> bool:
+        """运行文档是否仍为内嵌 rounds 的旧格式"""
+        return "rounds" in run_doc or any("rounds" in task for task in run_doc.get("tasks") or [])
+
+    async def migrate_embedded_rounds(self, run_collection, run_doc: Dict[str, Any],
+                                      counter_field: Optional[str] = None) -> Dict[str, Any]:
+        """
+        将旧格式运行文档中内嵌的 rounds 迁移到 run_rounds 集合（在线迁移，可重复执行）
+
+        先按 (conversation_id, task_id, seq) 幂等写入轮次，再从运行文档中移除内嵌的 rounds。
+
+        Args:
+            run_collection: 运行文档所在集合（agent_run / graph_run）
+            run_doc: 运行文档
+            counter_field: 主线程轮次计数器字段（可选），迁移时保证其不小于已迁移的轮次数量
+
+        Returns:
+            移除内嵌 rounds 后的运行文档
+        """
+        conversation_id = run_doc.get("conversation_id") or run_doc["_id"]
+
+        operations = []
+        embedded = [(None, run_doc.get("rounds") or [])]
+        embedded.extend((task.get("task_id"), task.get("rounds") or []) for task in run_doc.get("tasks") or [])
+        for task_id, rounds in embedded:
+            for seq, round_data in enumerate(rounds, start=1):
+                operations.append(UpdateOne(
+                    {"conversation_id": conversation_id, "task_id": task_id, "seq": seq},
+                    {"$setOnInsert": self._build_round_doc(conversation_id, task_id, seq, round_data)},
+                    upsert=True
+                ))
+
+        if operations:
+            try:
+                await self.run_rounds_collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                # 并发迁移同一文档时的唯一索引冲突可以忽略
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+
+        unset_fields = {"rounds": ""}
+        if isinstance(run_doc.get("tasks"), list):
+            unset_fields["tasks.$[].rounds"] = ""
+        update = {"$unset": unset_fields}
+        if counter_field:
+            update["$max"] = {counter_field: len(run_doc.get("rounds") or [])}
+        await run_collection.update_one({"_id": run_doc["_id"]}, update)
+
+        run_doc.pop("rounds", None)
+        for task in run_doc.get("tasks") or []:
+            task.pop("rounds", None)
+
+        logger.info(f"迁移内嵌轮次成功: {conversation_id}, {len(operations)} 个轮次")
+        return run_doc
+
+    async def migrate_collection(self, run_collection, counter_field: Optional[str] = None) -> int:
+        """
+        迁移集合中所有旧格式的运行文档（启动时后台执行）
+
+        Returns:
+            迁移的文档数量
+        """
+        migrated = 0
+        try:
+            cursor = run_collection.find({"$or": [
+                {"rounds": {"$exists": True}},
+                {"tasks.rounds": {"$exists": True}}
+            ]})
+            async for run_doc in cursor:
+                try:
+                    await self.migrate_embedded_rounds(run_collection, run_doc, counter_field)
+                    migrated += 1
+                except Exception as e:
+                    logger.error(f"迁移运行文档失败 ({run_doc.get('_id')}): {str(e)}")
+
+            if migrated:
+                logger.info(f"{run_collection.name} 集合内嵌轮次迁移完成: {migrated} 个文档")
+        except Exception as e:
+            logger.error(f"迁移 {run_collection.name} 集合失败: {str(e)}")
+        return migrated
@@ -7,9 +7,13 @@ import logging
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument
 
 logger = logging.getLogger(__name__)
 
+# 用户预算周期内累计的用量字段
+BUDGET_USAGE_FIELDS = ("total_tokens", "llm_calls", "tool_calls")
+
 
 class UserRepository:
     """用户Repository - 负责users集合的操作"""
@@ -281,6 +285,126 @@ class UserRepository:
             logger.error(f"设置用户语言失败: {str(e)}")
             return False
 
+    async def get_run_budget(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取用户运行预算设置
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            Optional[Dict[str, Any]]: 预算配置，未设置返回 None
+        """
+        try:
+            user = await self.collection.find_one(
+                {"user_id": user_id},
+                {"run_budget": 1}
+            )
+            return user.get("run_budget") if user else None
+
+        except Exception as e:
+            logger.error(f"获取用户运行预算失败: {str(e)}")
+            return None
+
+    async def set_run_budget(self, user_id: str, run_budget: Optional[Dict[str, Any]]) -> bool:
+        """
+        设置用户运行预算
+
+        Args:
+            user_id: 用户ID
+            run_budget: 预算配置（None 表示清除）
+
+        Returns:
+            bool: 是否设置成功
+        """
+        try:
+            result = await self.collection.update_one(
+                {"user_id": user_id},
+                {
+                    "$set": {
+                        "run_budget": run_budget,
+                        "updated_at": datetime.now()
+                    }
+                }
+            )
+
+            if result.matched_count > 0:
+                logger.info(f"用户 {user_id} 的运行预算已设置为: {run_budget}")
+                return True
+            else:
+                logger.warning(f"未找到用户: {user_id}")
+                return False
+
+        except Exception as e:
+            logger.error(f"设置用户运行预算失败: {str(e)}")
+            return False
+
+    async def get_budget_usage(self, user_id: str, window: str) -> Dict[str, int]:
+        """
+        获取用户在指定预算周期内的累计用量
+
+        Args:
+            user_id: 用户ID
+            window: 预算周期标识（如日期 "2026-01-01"）
+
+        Returns:
+            Dict[str, int]: {"total_tokens", "llm_calls", "tool_calls"}，周期不匹配时用量为 0
+        """
+        usage = dict.fromkeys(BUDGET_USAGE_FIELDS, 0)
+        try:
+            user = await self.collection.find_one(
+                {"user_id": user_id},
+                {"budget_usage": 1}
+            )
+            stored = (user or {}).get("budget_usage") or {}
+            if stored.get("window") == window:
+                usage.update({field: stored.get(field, 0) for field in BUDGET_USAGE_FIELDS})
+            return usage
+
+        except Exception as e:
+            logger.error(f"获取用户预算用量失败: {str(e)}")
+            return usage
+
+    async def increment_budget_usage(self, user_id: str, window: str,
+                                     increments: Dict[str, int]) -> Optional[Dict[str, int]]:
+        """
+        原子累加用户在指定预算周期内的用量，周期变化时从 0 重新累计
+
+        Args:
+            user_id: 用户ID
+            window: 预算周期标识
+            increments: 各用量的增量 {"total_tokens": ..., "llm_calls": ..., "tool_calls": ...}
+
+        Returns:
+            Optional[Dict[str, int]]: 累加后的周期用量，失败返回 None
+        """
+        increments = {field: int(increments.get(field, 0)) for field in BUDGET_USAGE_FIELDS}
+        projection = {"budget_usage": 1}
+        try:
+            for _ in range(2):
+                user = await self.collection.find_one_and_update(
+                    {"user_id": user_id, "budget_usage.window": window},
+                    {"$inc": {f"budget_usage.{field}": value for field, value in increments.items()}},
+                    projection=projection,
+                    return_document=ReturnDocument.AFTER
+                )
+                if user is None:
+                    # 新的预算周期：仅在周期不匹配时重置，并发重置冲突时重试累加
+                    user = await self.collection.find_one_and_update(
+                        {"user_id": user_id, "budget_usage.window": {"$ne": window}},
+                        {"$set": {"budget_usage": {"window": window, **increments}}},
+                        projection=projection,
+                        return_document=ReturnDocument.AFTER
+                    )
+                if user is not None:
+                    stored = user["budget_usage"]
+                    return {field: stored.get(field, 0) for field in BUDGET_USAGE_FIELDS}
+            return None
+
+        except Exception as e:
+            logger.error(f"累加用户预算用量失败: {str(e)}")
+            return None
+
     async def deactivate_user(self, user_id: str) -> bool:
         """
         停用用户（软删除）
@@ -1,10 +1,11 @@
 import json
 import shutil
+import hashlib
 import platform
+from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 import logging
-import subprocess
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
@@ -13,6 +14,10 @@ logger = logging.getLogger(__name__)
 class FileManager:
     """处理MAG系统的文件操作"""
 
+    # 工具目录中记录所用共享环境的文件 / 共享环境目录中记录准备状态的文件
+    MCP_TOOL_ENV_REF_FILE = "mcp_env.json"
+    MCP_TOOL_ENV_STATUS_FILE = "env_status.json"
+
     @staticmethod
     def initialize() -> None:
         """初始化文件系统，确保必要的目录和文件存在"""
@@ -62,7 +67,11 @@ class FileManager:
     @staticmethod
     def create_mcp_tool(tool_name: str, script_files: Dict[str, str],
                         readme: str, dependencies: str) -> bool:
-        """创建MCP工具目录和文件"""
+        """创建MCP工具目录和文件
+
+        只写入脚本和依赖声明，不安装依赖；虚拟环境由 ToolEnvProvisioner 在后台准备，
+        依赖集合相同的工具共用同一个环境。
+        """
         try:
             tool_dir = settings.get_mcp_tool_dir(tool_name)
             tool_dir.mkdir(parents=True, exist_ok=True)
@@ -81,37 +90,13 @@ class FileManager:
             with open(readme_path, 'w', encoding='utf-8') as f:
                 f.write(readme)
 
-            # 创建虚拟环境和安装依赖
-            if dependencies.strip():
-                # 1. 初始化uv项目（创建pyproject.toml）
-                result = subprocess.run([
-                    "uv", "init", "--bare"
-                ], capture_output=True, text=True, cwd=str(tool_dir))
-
-                if result.returncode != 0:
-                    logger.error(f"初始化uv项目失败: {result.stderr}")
-                    return False
-
-                # 2. 创建虚拟环境
-                result = subprocess.run([
-                    "uv", "venv", str(tool_dir / ".venv")
-                ], capture_output=True, text=True, cwd=str(tool_dir))
-
-                if result.returncode != 0:
-                    logger.error(f"创建虚拟环境失败: {result.stderr}")
+            # 记录工具使用的共享环境
+            deps = FileManager.normalize_dependencies(dependencies)
+            if deps:
+                env_ref = {"env_id": FileManager.get_mcp_tool_env_id(deps), "dependencies": deps}
+                if not FileManager.save_json(tool_dir / FileManager.MCP_TOOL_ENV_REF_FILE, env_ref):
                     return False
 
-                # 3. 安装依赖
-                deps = [dep.strip() for dep in dependencies.split() if dep.strip()]
-                if deps:
-                    result = subprocess.run([
-                                                "uv", "add"
-                                            ] + deps, capture_output=True, text=True, cwd=str(tool_dir))
-
-                    if result.returncode != 0:
-                        logger.error(f"安装依赖失败: {result.stderr}")
-                        return False
-
             logger.info(f"成功创建MCP工具: {tool_name}")
             return True
 
@@ -127,6 +112,7 @@ class FileManager:
             if tool_dir.exists():
                 shutil.rmtree(tool_dir)
                 logger.info(f"已删除MCP工具目录: {tool_dir}")
+                FileManager.remove_unused_mcp_tool_envs()
                 return True
             else:
                 logger.warning(f"MCP工具目录不存在: {tool_dir}")
@@ -162,19 +148,120 @@ class FileManager:
         return None
 
     @staticmethod
-    def get_mcp_tool_venv_python(tool_name: str) -> Optional[Path]:
-        """获取MCP工具虚拟环境的Python解释器路径"""
-        tool_dir = settings.get_mcp_tool_dir(tool_name)
-        venv_dir = tool_dir / ".venv"
+    def get_mcp_tool_venv_python(tool_name: str, must_exist: bool = True) -> Optional[Path]:
+        """获取MCP工具虚拟环境的Python解释器路径
+
+        Args:
+            tool_name: 工具名称
+            must_exist: 是否要求解释器已存在；为 False 时返回共享环境准备完成后的解释器路径
+        """
+        env_ref = FileManager.get_mcp_tool_env_ref(tool_name)
+        if env_ref:
+            env_dir = FileManager.get_mcp_tool_env_dir(env_ref["env_id"])
+            python_path = FileManager.get_venv_python(env_dir / ".venv")
+            if not must_exist:
+                return python_path
+            status = FileManager.get_mcp_tool_env_status_by_id(env_ref["env_id"])
+            return python_path if status.get("status") == "ready" and python_path.exists() else None
+
+        # 旧版工具：虚拟环境位于工具目录内
+        python_path = FileManager.get_venv_python(settings.get_mcp_tool_dir(tool_name) / ".venv")
+        return python_path if python_path.exists() else None
+
+    @staticmethod
+    def get_venv_python(venv_dir: Path) -> Path:
+        """根据操作系统确定虚拟环境中的Python解释器路径"""
+        if platform.system() == "Windows":
+            return venv_dir / "Scripts" / "python.exe"
+        return venv_dir / "bin" / "python"
+
+    # ===== MCP 工具共享环境 =====
+    @staticmethod
+    def normalize_dependencies(dependencies: str) -> List[str]:
+        """规范化依赖声明（去空白、去重、排序），作为共享环境的键"""
+        deps = {dep.strip() for dep in (dependencies or "").split() if dep.strip()}
+        return sorted(deps, key=str.lower)
+
+    @staticmethod
+    def get_mcp_tool_env_id(deps: List[str]) -> str:
+        """根据规范化的依赖列表计算共享环境ID"""
+        key = "\n".join(dep.lower() for dep in deps)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def get_mcp_tool_env_dir(env_id: str) -> Path:
+        """获取共享环境目录"""
+        return settings.MCP_TOOL_ENVS_DIR / env_id
 
-        if not venv_dir.exists():
+    @staticmethod
+    def get_mcp_tool_env_ref(tool_name: str) -> Optional[Dict[str, Any]]:
+        """获取工具使用的共享环境信息 {"env_id", "dependencies"}，旧版工具或无依赖时返回 None"""
+        ref_path = settings.get_mcp_tool_dir(tool_name) / FileManager.MCP_TOOL_ENV_REF_FILE
+        if not ref_path.exists():
             return None
+        env_ref = FileManager.load_json(ref_path)
+        return env_ref if env_ref.get("env_id") else None
+
+    @staticmethod
+    def get_mcp_tool_env_status_by_id(env_id: str) -> Dict[str, Any]:
+        """读取共享环境状态（pending / provisioning / ready / failed）"""
+        status_path = FileManager.get_mcp_tool_env_dir(env_id) / FileManager.MCP_TOOL_ENV_STATUS_FILE
+        status = FileManager.load_json(status_path)
+        return status if status.get("status") else {"status": "pending"}
+
+    @staticmethod
+    def set_mcp_tool_env_status(env_id: str, status: str, error: Optional[str] = None,
+                                **extra) -> bool:
+        """写入共享环境状态（MCP Client 进程通过该文件判断环境是否就绪）"""
+        data = {"status": status, "updated_at": datetime.now().isoformat(), **extra}
+        if error:
+            data["error"] = error
+        status_path = FileManager.get_mcp_tool_env_dir(env_id) / FileManager.MCP_TOOL_ENV_STATUS_FILE
+        return FileManager.save_json(status_path, data)
 
-        # 根据操作系统确定Python解释器路径
-        system = platform.system()
-        if system == "Windows":
-            python_path = venv_dir / "Scripts" / "python.exe"
-        else:
-            python_path = venv_dir / "bin" / "python"
+    @staticmethod
+    def get_mcp_tool_env_status(tool_name: str) -> Dict[str, Any]:
+        """获取工具运行环境状态
+
+        Returns:
+            {"status": "ready" | "pending" | "provisioning" | "failed" | "none", ...}
+            none 表示工具没有声明依赖且没有独立虚拟环境
+        """
+        env_ref = FileManager.get_mcp_tool_env_ref(tool_name)
+        if env_ref:
+            return {
+                **FileManager.get_mcp_tool_env_status_by_id(env_ref["env_id"]),
+                "env_id": env_ref["env_id"],
+                "dependencies": env_ref.get("dependencies", [])
+            }
+        if FileManager.get_mcp_tool_venv_python(tool_name):
+            return {"status": "ready", "env_id": None}
+        return {"status": "none", "env_id": None}
+
+    @staticmethod
+    def remove_unused_mcp_tool_envs() -> List[str]:
+        """删除不再被任何工具引用的已就绪共享环境（准备中的环境不删除）"""
+        removed = []
+        try:
+            if not settings.MCP_TOOL_ENVS_DIR.exists():
+                return removed
+
+            used = set()
+            for tool_name in FileManager.list_mcp_tools():
+                env_ref = FileManager.get_mcp_tool_env_ref(tool_name)
+                if env_ref:
+                    used.add(env_ref["env_id"])
 
-        return python_path if python_path.exists() else None
\ No newline at end of file
+            for env_dir in settings.MCP_TOOL_ENVS_DIR.iterdir():
+                if not env_dir.is_dir() or env_dir.name in used:
+                    continue
+                if FileManager.get_mcp_tool_env_status_by_id(env_dir.name).get("status") in ("pending", "provisioning"):
+                    continue
+                shutil.rmtree(env_dir, ignore_errors=True)
+                removed.append(env_dir.name)
+
+            if removed:
+                logger.info(f"已删除未使用的MCP工具共享环境: {removed}")
+        except Exception as e:
+            logger.error(f"清理MCP工具共享环境时出错: {str(e)}")
+        return removed
\ No newline at end of file
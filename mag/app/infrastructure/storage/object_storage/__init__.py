@@ -1,6 +1,7 @@
 from .minio_client import MinIOClient, minio_client
 from .conversation_document_manager import ConversationDocumentManager, conversation_document_manager
 from .project_document_manager import ProjectDocumentManager, project_document_manager
+from .tool_output_manager import ToolOutputManager, tool_output_manager
 
 __all__ = [
     'MinIOClient',
@@ -9,4 +10,6 @@ __all__ = [
     'conversation_document_manager',
     'ProjectDocumentManager',
     'project_document_manager',
+    'ToolOutputManager',
+    'tool_output_manager',
 ]
@@ -0,0 +1,149 @@
+"""
+工具输出管理器 - 基于 MinIO 存储
+职责：保存超过阈值的工具完整输出，消息中只保留预览与引用
+支持多用户隔离
+"""
+import asyncio
+import logging
+import re
+from typing import Optional
+from io import BytesIO
+from app.core.config import settings
+from app.infrastructure.storage.object_storage.minio_client import minio_client
+
+logger = logging.getLogger(__name__)
+
+
+class ToolOutputManager:
+    """工具输出管理器 - 负责大体积工具输出在 MinIO 中的存储"""
+
+    STORAGE_PREFIX = "tool_output"
+
+    def _get_object_name(self, user_id: str, conversation_id: str, tool_call_id: str) -> str:
+        """
+        构建工具输出对象名称
+
+        Args:
+            user_id: 用户ID
+            conversation_id: 会话ID
+            tool_call_id: 工具调用ID
+
+        Returns:
+            str: MinIO对象路径 (格式: tool_output/{user_id}/{conversation_id}/{tool_call_id}.txt)
+        """
+        safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", tool_call_id)
+        return f"{self.STORAGE_PREFIX}/{user_id}/{conversation_id}/{safe_id}.txt"
+
+    async def save_output(self, user_id: str, conversation_id: str, tool_call_id: str,
+                          content: str) -> bool:
+        """
+        保存工具完整输出
+
+        Args:
+            user_id: 用户ID
+            conversation_id: 会话ID
+            tool_call_id: 工具调用ID
+            content: 完整输出内容
+
+        Returns:
+            bool: 保存是否成功
+        """
+        object_name = self._get_object_name(user_id, conversation_id, tool_call_id)
+        try:
+            content_bytes = content.encode('utf-8')
+            await asyncio.to_thread(
+                minio_client._client.put_object,
+                bucket_name=settings.MINIO_BUCKET_NAME,
+                object_name=object_name,
+                data=BytesIO(content_bytes),
+                length=len(content_bytes),
+                content_type="text/plain; charset=utf-8"
+            )
+
+            logger.info(f"✓ 保存工具输出成功: {object_name} ({len(content_bytes)} 字节)")
+            return True
+
+        except Exception as e:
+            logger.error(f"保存工具输出失败 ({object_name}): {e}")
+            return False
+
+    async def get_output(self, user_id: str, conversation_id: str, tool_call_id: str) -> Optional[str]:
+        """
+        读取工具完整输出
+
+        Args:
+            user_id: 用户ID
+            conversation_id: 会话ID
+            tool_call_id: 工具调用ID
+
+        Returns:
+            Optional[str]: 完整输出内容，不存在或失败返回 None
+        """
+        object_name = self._get_object_name(user_id, conversation_id, tool_call_id)
+
+        def _read() -> str:
+            response = minio_client._client.get_object(
+                bucket_name=settings.MINIO_BUCKET_NAME,
+                object_name=object_name
+            )
+            try:
+                return response.read().decode('utf-8')
+            finally:
+                response.close()
+                response.release_conn()
+
+        try:
+            return await asyncio.to_thread(_read)
+        except Exception as e:
+            logger.error(f"读取工具输出失败 ({object_name}): {e}")
+            return None
+
+    async def delete_all_conversation_outputs(self, user_id: str, conversation_id: str) -> bool:
+        """
+        删除会话所有工具输出（删除会话时调用）
+
+        Args:
+            user_id: 用户ID
+            conversation_id: 会话ID
+
+        Returns:
+            bool: 是否全部删除成功
+        """
+        prefix = f"{self.STORAGE_PREFIX}/{user_id}/{conversation_id}/"
+
+        def _delete_all():
+            objects = minio_client._client.list_objects(
+                bucket_name=settings.MINIO_BUCKET_NAME,
+                prefix=prefix,
+                recursive=True
+            )
+
+            success = True
+            count = 0
+            for obj in objects:
+                try:
+                    minio_client._client.remove_object(
+                        bucket_name=settings.MINIO_BUCKET_NAME,
+                        object_name=obj.object_name
+                    )
+                    count += 1
+                except Exception as e:
+                    logger.error(f"删除工具输出失败 (用户: {user_id}, 会话: {conversation_id}): {obj.object_name}, 错误: {e}")
+                    success = False
+            return success, count
+
+        try:
+            success, count = await asyncio.to_thread(_delete_all)
+
+            if success and count:
+                logger.info(f"✓ 删除会话所有工具输出: {conversation_id} (用户: {user_id}), 删除数量: {count}")
+
+            return success
+
+        except Exception as e:
+            logger.error(f"删除会话所有工具输出失败 (用户: {user_id}, 会话: {conversation_id}): {e}")
+            return False
+
+
+# 全局实例
+tool_output_manager = ToolOutputManager()
@@ -1,6 +1,22 @@
 from typing import Dict, List, Optional, Any
 from pydantic import BaseModel, Field, field_validator
 
+
+class RunBudgetConfig(BaseModel):
+    """运行预算配置（未设置的项表示不限制）"""
+    max_total_tokens: Optional[int] = Field(default=None, description="单次运行允许消耗的最大token总量")
+    max_llm_calls: Optional[int] = Field(default=None, description="单次运行允许的最大模型调用次数")
+    max_tool_calls: Optional[int] = Field(default=None, description="单次运行允许的最大工具调用次数")
+    max_wall_time_seconds: Optional[int] = Field(default=None, description="单次运行允许的最大墙钟时间（秒）")
+
+    @field_validator('max_total_tokens', 'max_llm_calls', 'max_tool_calls', 'max_wall_time_seconds')
+    @classmethod
+    def validate_positive(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError('预算限制必须大于0')
+        return v
+
+
 class AgentConfig(BaseModel):
     """Agent配置数据模型（嵌套对象）"""
     name: str = Field(..., description="Agent唯一名称")
@@ -12,6 +28,7 @@ class AgentConfig(BaseModel):
     system_tools: List[str] = Field(default_factory=list, description="可用的系统内置工具列表")
     category: str = Field(..., description="Agent分类，如coding, analysis, writing等")
     tags: List[str] = Field(default_factory=list, description="Agent标签列表")
+    budget: Optional[RunBudgetConfig] = Field(default=None, description="运行预算，超出后提前终止")
 
     @field_validator('name')
     @classmethod
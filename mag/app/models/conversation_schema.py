@@ -33,7 +33,9 @@ class ConversationListItem(BaseModel):
 class ConversationListResponse(BaseModel):
     """对话列表响应"""
     conversations: List[ConversationListItem] = Field(..., description="对话列表")
-    total_count: int = Field(..., description="总数量")
+    total_count: int = Field(..., description="本页数量")
+    next_cursor: Optional[str] = Field(None, description="下一页游标，没有更多时为空")
+    has_more: bool = Field(False, description="是否还有更多对话")
 
 
 class InputConfig(BaseModel):
@@ -53,6 +55,14 @@ class InputConfig(BaseModel):
         return v
 
 
+class ConversationRoundsPagination(BaseModel):
+    """对话详情的轮次分页信息"""
+    round_count: Optional[int] = Field(None, description="主线程总轮次数（仅第一页返回）")
+    total_size: Optional[int] = Field(None, description="主线程全部轮次的存储大小（字节，仅第一页返回）")
+    next_cursor: Optional[int] = Field(None, description="下一页（更早轮次）的游标，没有更多时为空")
+    has_more: bool = Field(..., description="是否还有更早的轮次")
+
+
 class ConversationDetailResponse(BaseModel):
     """对话详情响应（完整内容，支持所有类型）"""
     conversation_id: str = Field(..., description="对话ID")
@@ -77,6 +87,9 @@ class ConversationDetailResponse(BaseModel):
     # 输入配置（用户在对话中使用的配置）
     input_config: Optional[InputConfig] = Field(None, description="用户输入配置")
 
+    # 轮次分页信息
+    pagination: Optional[ConversationRoundsPagination] = Field(None, description="轮次分页信息")
+
 
 class UpdateConversationTitleRequest(BaseModel):
     """更新对话标题请求"""
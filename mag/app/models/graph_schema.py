@@ -1,5 +1,6 @@
 from typing import Dict, List, Optional, Any
 from pydantic import BaseModel, Field, validator
+from app.models.agent_schema import RunBudgetConfig
 
 class AgentNode(BaseModel):
     """Graph节点配置，支持Agent调用与参数覆盖"""
@@ -86,6 +87,7 @@ class GraphConfig(BaseModel):
     nodes: List[AgentNode] = Field(default_factory=list, description="节点列表")
     end_template: Optional[str] = Field(default=None, description="终止节点输出模板")
     readme: Optional[str] = Field(default=None, description="图的README文档")
+    budget: Optional[RunBudgetConfig] = Field(default=None, description="整个图运行共享的预算，超出后提前终止")
 
     @validator('name')
     def name_must_be_valid(cls, v):
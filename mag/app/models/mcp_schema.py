@@ -1,6 +1,24 @@
 from typing import Dict, List, Optional, Any
 from pydantic import BaseModel, Field, root_validator
 
+class MCPToolCacheConfig(BaseModel):
+    """MCP工具结果缓存配置（仅对声明的幂等工具生效）"""
+    tools: List[str] = Field(default_factory=list, description="启用缓存的工具名称列表，\"*\" 表示全部工具")
+    ttl: int = Field(default=300, description="缓存有效期（秒）")
+    maxEntries: int = Field(default=256, description="最多缓存的结果条数")
+    scope: str = Field(default="run", description="缓存范围：run（同一会话）/ user（同一用户）/ global（所有用户）")
+
+    @root_validator(skip_on_failure=True)
+    def validate_cache(cls, values):
+        if values.get('scope') not in ('run', 'user', 'global'):
+            raise ValueError('cache.scope 必须是 run、user 或 global')
+        if values.get('ttl', 0) <= 0:
+            raise ValueError('cache.ttl 必须大于0')
+        if not 1 <= values.get('maxEntries', 0) <= 10000:
+            raise ValueError('cache.maxEntries 必须在 1-10000 范围内')
+        return values
+
+
 class MCPServerConfig(BaseModel):
     """MCP服务器配置"""
     autoApprove: List[str] = Field(default_factory=list, description="自动批准的工具列表")
@@ -12,6 +30,10 @@ class MCPServerConfig(BaseModel):
     url: Optional[str] = Field(None, description="SSE服务器URL")
     type: Optional[str] = Field(None, description="服务器类型，会自动转换为transportType")
     env: Optional[Dict[str, str]] = Field(None, description="环境变量")
+    poolSize: Optional[int] = Field(None, description="会话池大小（stdio为进程数，HTTP类为连接数），默认1")
+    sessionConcurrency: Optional[int] = Field(None, description="单个会话允许的并发调用数，默认1")
+    idleTimeout: Optional[int] = Field(None, description="stdio服务器空闲关闭时间（秒），0表示不关闭，默认使用全局配置")
+    cache: Optional[MCPToolCacheConfig] = Field(None, description="工具结果缓存配置，未配置时不缓存")
 
     # 团队共享字段
     provider_user_id: Optional[str] = Field(None, description="提供者用户ID")
@@ -39,6 +61,16 @@ class MCPServerConfig(BaseModel):
             elif values.get('command'):
                 values['transportType'] = 'stdio'
 
+        pool_size = values.get('poolSize')
+        if pool_size is not None and not 1 <= pool_size <= 16:
+            raise ValueError('poolSize 必须在 1-16 范围内')
+        session_concurrency = values.get('sessionConcurrency')
+        if session_concurrency is not None and not 1 <= session_concurrency <= 64:
+            raise ValueError('sessionConcurrency 必须在 1-64 范围内')
+        idle_timeout = values.get('idleTimeout')
+        if idle_timeout is not None and idle_timeout < 0:
+            raise ValueError('idleTimeout 不能为负数')
+
         transport_type = values.get('transportType', 'stdio')
         if transport_type in ['sse', 'streamable_http'] and not values.get('url'):
             raise ValueError(f'{transport_type}传输类型必须提供url字段')
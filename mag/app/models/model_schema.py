@@ -39,6 +39,7 @@ class ModelConfig(BaseModel):
     extra_body: Optional[Dict[str, Any]] = Field(default=None, description="额外的请求体参数")
     extra_headers: Optional[Dict[str, str]] = Field(default=None, description="额外的请求头")
     timeout: Optional[float] = Field(default=None, description="请求超时时间（秒）")
+    context_window: Optional[int] = Field(default=None, description="模型上下文窗口大小（token），为空时按模型标识推断")
 
     @validator('provider')
     def validate_provider(cls, v):
@@ -102,6 +103,12 @@ class ModelConfig(BaseModel):
             raise ValueError('top_logprobs参数必须在0到20之间')
         return v
 
+    @validator('context_window')
+    def validate_context_window(cls, v):
+        if v is not None and v < 1:
+            raise ValueError('context_window参数必须大于0')
+        return v
+
     @validator('timeout')
     def validate_timeout(cls, v):
         if v is not None and v <= 0:
@@ -0,0 +1,176 @@
+"""
+Agent 配置快照
+
+图运行开始时通过一次 $in 查询加载图中引用的所有 Agent 配置，冻结为只读快照，
+本次运行的所有节点执行（包括 handoffs 重复进入的节点）共享该快照：
+- 不再每个节点执行都查询一次数据库
+- 运行中途编辑 Agent 不影响正在进行的运行，保证一次运行内配置一致
+"""
+import logging
+from types import MappingProxyType
+from typing import Dict, List, Any, Optional, Mapping
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ITERATIONS = 50
+
+
+def freeze(value: Any) -> Any:
+    """递归冻结配置：dict -> MappingProxyType，list -> tuple"""
+    if isinstance(value, Mapping):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """冻结配置还原为普通 dict / list"""
+    if isinstance(value, Mapping):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return value
+
+
+def merge_effective_config(
+        agent_name: Optional[str],
+        agent_config: Optional[Mapping[str, Any]],
+        model_name: Optional[str] = None,
+        system_prompt: Optional[str] = None,
+        mcp_servers: Optional[List[str]] = None,
+        system_tools: Optional[List[str]] = None,
+        max_iterations: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    合并 Agent 配置与节点/调用参数（智能合并策略）
+
+    策略：
+    - 无 Agent：直接使用用户参数
+    - 仅 Agent：使用 Agent 完整配置
+    - Agent + 参数：
+      - 覆盖：model_name, system_prompt, max_iterations
+      - 添加（去重）：mcp_servers, system_tools
+
+    Args:
+        agent_name: Agent 名称（为空表示手动配置）
+        agent_config: Agent 配置（agent_name 不为空时必需）
+
+    Returns:
+        有效配置，缺少必需信息时返回 None
+    """
+    config = {
+        "agent_name": "manual",
+        "model_name": None,
+        "system_prompt": "",
+        "mcp_servers": [],
+        "system_tools": [],
+        "max_iterations": DEFAULT_MAX_ITERATIONS,
+        "budget": None
+    }
+
+    # === 场景1：无 Agent，纯手动配置 ===
+    if not agent_name:
+        config["model_name"] = model_name
+        config["system_prompt"] = system_prompt or ""
+        config["mcp_servers"] = list(mcp_servers or [])
+        config["system_tools"] = list(system_tools or [])
+        config["max_iterations"] = max_iterations or DEFAULT_MAX_ITERATIONS
+
+        if not config["model_name"]:
+            logger.error("手动配置模式缺少 model_name")
+            return None
+        return config
+
+    # === 场景2/3：使用 Agent（可能带覆盖参数）===
+    if agent_config is None:
+        logger.error(f"Agent 不存在: {agent_name}")
+        return None
+
+    config["agent_name"] = agent_name
+    config["model_name"] = agent_config.get("model")
+    config["system_prompt"] = agent_config.get("instruction", "")
+    config["mcp_servers"] = list(agent_config.get("mcp", []))
+    config["system_tools"] = list(agent_config.get("system_tools", []))
+    config["max_iterations"] = agent_config.get("max_actions", DEFAULT_MAX_ITERATIONS)
+    config["budget"] = thaw(agent_config.get("budget"))
+
+    # 应用覆盖参数
+    if model_name:
+        config["model_name"] = model_name
+    if system_prompt:
+        config["system_prompt"] = system_prompt
+    if max_iterations:
+        config["max_iterations"] = max_iterations
+
+    # 添加工具（去重）
+    if mcp_servers:
+        config["mcp_servers"] = list(set(config["mcp_servers"] + list(mcp_servers)))
+    if system_tools:
+        config["system_tools"] = list(set(config["system_tools"] + list(system_tools)))
+
+    return config
+
+
+class AgentConfigSnapshot:
+    """一次图运行的只读 Agent 配置快照"""
+
+    def __init__(self, user_id: str, agent_configs: Dict[str, Dict[str, Any]]):
+        self.user_id = user_id
+        self._agents: Mapping[str, Mapping[str, Any]] = freeze(agent_configs)
+        # 节点名 -> 合并后的有效配置（节点配置在一次运行内不变）
+        self._resolved: Dict[str, Optional[Mapping[str, Any]]] = {}
+
+    @classmethod
+    async def load(cls, graph_config: Dict[str, Any], user_id: str) -> Optional["AgentConfigSnapshot"]:
+        """
+        一次查询加载图中所有节点引用的 Agent 配置
+
+        Returns:
+            快照；查询失败时返回 None（调用方回退为逐节点加载）
+        """
+        from app.infrastructure.database.mongodb.client import mongodb_client
+
+        agent_names = sorted({
+            node["agent_name"] for node in graph_config.get("nodes", []) if node.get("agent_name")
+        })
+        agent_configs = await mongodb_client.agent_repository.get_agents_by_names(agent_names, user_id)
+        if agent_configs is None:
+            return None
+
+        missing = [name for name in agent_names if name not in agent_configs]
+        if missing:
+            logger.warning(f"图中引用的 Agent 不存在: {missing}")
+        logger.info(f"已加载运行配置快照: {len(agent_configs)} 个 Agent")
+        return cls(user_id, agent_configs)
+
+    def contains(self, agent_name: str) -> bool:
+        return agent_name in self._agents
+
+    def get_agent_config(self, agent_name: str) -> Optional[Mapping[str, Any]]:
+        """获取只读的 Agent 配置"""
+        return self._agents.get(agent_name)
+
+    def resolve(self, node: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        获取节点的有效配置（同一节点只合并一次）
+
+        Returns:
+            有效配置的副本，调用方可以自由修改；无法解析时返回 None
+        """
+        node_name = node.get("name")
+        if node_name not in self._resolved:
+            agent_name = node.get("agent_name")
+            config = merge_effective_config(
+                agent_name=agent_name,
+                agent_config=self._agents.get(agent_name) if agent_name else None,
+                model_name=node.get("model_name"),
+                system_prompt=node.get("system_prompt"),
+                mcp_servers=node.get("mcp_servers"),
+                system_tools=node.get("system_tools"),
+                max_iterations=node.get("max_iterations")
+            )
+            self._resolved[node_name] = freeze(config) if config else None
+
+        resolved = self._resolved[node_name]
+        return thaw(resolved) if resolved is not None else None
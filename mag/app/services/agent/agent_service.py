@@ -165,12 +165,8 @@ class AgentService:
             if success:
                 # 删除对应的 memory 文档
                 try:
-                    delete_result = await mongodb_client.memories_collection.delete_one({
-                        "user_id": user_id,
-                        "owner_type": "agent",
-                        "owner_id": agent_name
-                    })
-                    if delete_result.deleted_count > 0:
+                    deleted = await mongodb_client.memory_repository.delete_owner(user_id, "agent", agent_name)
+                    if deleted:
                         logger.info(f"删除 Agent 的 memory 文档成功: {agent_name}")
                     else:
                         logger.warning(f"未找到 Agent 的 memory 文档: {agent_name}")
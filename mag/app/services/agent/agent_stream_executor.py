@@ -10,6 +10,13 @@ from typing import Dict, List, Any, Optional, AsyncGenerator
 from app.services.model.model_service import model_service
 from app.services.tool_execution import ToolExecutor
 from app.services.system_tools import get_system_tools_by_names
+from app.services.agent.run_budget import (
+    RunBudget,
+    get_current_run_budget,
+    load_user_budget,
+    merge_budget_limits,
+    release_user_budget
+)
 
 logger = logging.getLogger(__name__)
 
@@ -112,24 +119,33 @@ class AgentStreamExecutor:
                 conversation_id=conversation_id
             )
 
+            # 运行预算：单次运行限制与 Agent 预算取最严格者，用量同时累计到用户每日预算
+            run_limits, user_budget = await load_user_budget(user_id)
+            budget_limits = merge_budget_limits(run_limits, effective_config.get("budget"))
+
             # 执行完整流程
             final_result = None
-            async for item in self.run_agent_loop(
-                    agent_name=effective_config["agent_name"],
-                    model_name=effective_config["model_name"],
-                    messages=messages,
-                    tools=tools,
-                    mcp_servers=effective_config["mcp_servers"],
-                    max_iterations=effective_config["max_iterations"],
-                    user_id=user_id,
-                    conversation_id=conversation_id
-            ):
-                if isinstance(item, str):
-                    # SSE 字符串，直接转发给客户端
-                    yield item
-                else:
-                    # Dict 结果，保存但不转发到客户端
-                    final_result = item
+            try:
+                async for item in self.run_agent_loop(
+                        agent_name=effective_config["agent_name"],
+                        model_name=effective_config["model_name"],
+                        messages=messages,
+                        tools=tools,
+                        mcp_servers=effective_config["mcp_servers"],
+                        max_iterations=effective_config["max_iterations"],
+                        user_id=user_id,
+                        conversation_id=conversation_id,
+                        budget_limits=budget_limits,
+                        parent_budget=user_budget
+                ):
+                    if isinstance(item, str):
+                        # SSE 字符串，直接转发给客户端
+                        yield item
+                    else:
+                        # Dict 结果，保存但不转发到客户端
+                        final_result = item
+            finally:
+                release_user_budget(user_id, user_budget)
 
             # 保存执行结果到数据库（is_graph_node 默认为 False）
             if final_result:
@@ -187,14 +203,14 @@ class AgentStreamExecutor:
                 })
 
             # 2. 获取并添加历史消息
-            agent_run_doc = await mongodb_client.agent_run_repository.get_agent_run(
-                conversation_id
+            history_rounds = await mongodb_client.agent_run_repository.get_main_rounds(
+                conversation_id, projection=["messages"]
             )
 
-            if agent_run_doc and agent_run_doc.get("rounds"):
-                logger.debug(f"加载历史消息: {len(agent_run_doc['rounds'])} 轮")
+            if history_rounds:
+                logger.debug(f"加载历史消息: {len(history_rounds)} 轮")
 
-                for round_data in agent_run_doc["rounds"]:
+                for round_data in history_rounds:
                     round_messages = round_data.get("messages", [])
                     for msg in round_messages:
                         # 跳过历史中的 system 消息（已在开头添加）
@@ -326,80 +342,30 @@ class AgentStreamExecutor:
                 "system_prompt": str,
                 "mcp_servers": List[str],
                 "system_tools": List[str],
-                "max_iterations": int
+                "max_iterations": int,
+                "budget": Optional[Dict[str, Any]]
             }
         """
         from app.infrastructure.database.mongodb.client import mongodb_client
-
-        config = {
-            "agent_name": "manual",
-            "model_name": None,
-            "system_prompt": "",
-            "mcp_servers": [],
-            "system_tools": [],
-            "max_iterations": 50
-        }
-
-        # === 场景1：无 Agent，纯手动配置 ===
-        if not agent_name:
-            config["model_name"] = model_name
-            config["system_prompt"] = system_prompt or ""
-            config["mcp_servers"] = mcp_servers or []
-            config["system_tools"] = system_tools or []
-            config["max_iterations"] = max_iterations or 50
-
-            if not config["model_name"]:
-                logger.error("手动配置模式缺少 model_name")
-                return None
-
-            logger.info(f"✓ 使用手动配置: model={config['model_name']}")
-            return config
-
-        # === 场景2/3：使用 Agent（可能带覆盖参数）===
-        agent = await mongodb_client.agent_repository.get_agent(agent_name, user_id)
-        if not agent:
-            logger.error(f"Agent 不存在: {agent_name}")
-            return None
-
-        agent_config = agent.get("agent_config", {})
-
-        # 加载 Agent 基础配置
-        config["agent_name"] = agent_name
-        config["model_name"] = agent_config.get("model")
-        config["system_prompt"] = agent_config.get("instruction", "")
-        config["mcp_servers"] = agent_config.get("mcp", []).copy()
-        config["system_tools"] = agent_config.get("system_tools", []).copy()
-        config["max_iterations"] = agent_config.get("max_actions", 50)
-
-        # 应用覆盖参数
-        if model_name:
-            config["model_name"] = model_name
-            logger.info(f"覆盖模型: {model_name}")
-
-        if system_prompt:
-            config["system_prompt"] = system_prompt
-            logger.info(f"覆盖系统提示词")
-
-        if max_iterations:
-            config["max_iterations"] = max_iterations
-            logger.info(f"覆盖最大迭代次数: {max_iterations}")
-
-        # 添加工具（去重）
-        if mcp_servers:
-            original_count = len(config["mcp_servers"])
-            config["mcp_servers"] = list(set(config["mcp_servers"] + mcp_servers))
-            added = len(config["mcp_servers"]) - original_count
-            if added > 0:
-                logger.info(f"添加 MCP 服务器: {added} 个")
-
-        if system_tools:
-            original_count = len(config["system_tools"])
-            config["system_tools"] = list(set(config["system_tools"] + system_tools))
-            added = len(config["system_tools"]) - original_count
-            if added > 0:
-                logger.info(f"添加系统工具: {added} 个")
-
-        logger.info(f"✓ 加载配置完成: agent={agent_name}, model={config['model_name']}")
+        from app.services.agent.agent_config_snapshot import merge_effective_config
+
+        agent_config = None
+        if agent_name:
+            agent = await mongodb_client.agent_repository.get_agent(agent_name, user_id)
+            if agent:
+                agent_config = agent.get("agent_config", {})
+
+        config = merge_effective_config(
+            agent_name=agent_name,
+            agent_config=agent_config,
+            model_name=model_name,
+            system_prompt=system_prompt,
+            mcp_servers=mcp_servers,
+            system_tools=system_tools,
+            max_iterations=max_iterations
+        )
+        if config:
+            logger.info(f"✓ 加载配置完成: agent={config['agent_name']}, model={config['model_name']}")
         return config
 
     async def run_agent_loop(
@@ -413,7 +379,9 @@ class AgentStreamExecutor:
             user_id: str,
             conversation_id: str,
             task_id: Optional[str] = None,
-            is_graph_node: bool = False
+            is_graph_node: bool = False,
+            budget_limits: Optional[Dict[str, Any]] = None,
+            parent_budget: Optional[RunBudget] = None
     ) -> AsyncGenerator[str | Dict[str, Any], None]:
         """
         运行 Agent 循环（含工具调用循环）
@@ -429,10 +397,12 @@ class AgentStreamExecutor:
             conversation_id: 对话 ID
             task_id: 任务 ID（Sub Agent 时提供）
             is_graph_node: 是否为 Graph 节点调用（默认 False）
+            budget_limits: 本次运行的预算限制（可选）
+            parent_budget: 父预算（可选，默认使用当前上下文中的预算，如图运行预算或上层 Agent 预算）
 
         Yields:
             - 中间 yield: SSE 格式字符串 "data: {...}\\n\\n"
-            - 最后 yield: 完整结果字典
+            - 最后 yield: 完整结果字典（预算超限时包含 termination）
         """
         current_messages = messages.copy()
         iteration = 0
@@ -446,12 +416,24 @@ class AgentStreamExecutor:
         # 标识是否为 Sub Agent
         is_sub_agent = task_id is not None
 
+        # 运行预算（用量同时累计到父预算），嵌套的 Sub Agent 通过上下文共享
+        budget = RunBudget(budget_limits, parent=parent_budget or get_current_run_budget())
+        budget_token = budget.activate()
+        termination = None
+
         # 记录 Graph 节点调用
         if is_graph_node:
             logger.debug(f"Graph 节点调用 Agent: {agent_name}, conversation_id={conversation_id}")
 
         try:
             while iteration < max_iterations:
+                # 调用模型前检查预算
+                if budget.check():
+                    termination = budget.termination_info()
+                    logger.warning(f"Agent {agent_name} - {termination['message']}")
+                    yield self._budget_exceeded_event(termination, task_id)
+                    break
+
                 iteration += 1
                 logger.info(f"Agent {agent_name} - 第 {iteration} 轮执行 (task_id={task_id})")
 
@@ -504,6 +486,9 @@ class AgentStreamExecutor:
                     round_token_usage["total_tokens"] += api_usage["total_tokens"]
                     round_token_usage["prompt_tokens"] += api_usage["prompt_tokens"]
                     round_token_usage["completion_tokens"] += api_usage["completion_tokens"]
+                    budget.record_llm_call(api_usage["total_tokens"])
+                else:
+                    budget.record_llm_call(accumulated_result.get("estimated_prompt_tokens", 0))
 
                 # 构建 assistant 消息
                 assistant_message = {
@@ -535,6 +520,24 @@ class AgentStreamExecutor:
                     logger.info(f"Agent {agent_name} - 第 {iteration} 轮无工具调用，执行完成")
                     break
 
+                # 执行工具前检查工具调用预算，超限时为每个调用补充结果消息以保持消息结构完整
+                if budget.would_exceed_tool_calls(len(current_tool_calls)):
+                    termination = budget.termination_info()
+                    logger.warning(f"Agent {agent_name} - {termination['message']}")
+                    for tool_call in current_tool_calls:
+                        tool_message = {
+                            "role": "tool",
+                            "tool_call_id": tool_call.get("id"),
+                            "content": termination["message"]
+                        }
+                        current_messages.append(tool_message)
+                        round_messages.append(tool_message)
+                        if is_sub_agent:
+                            tool_message["task_id"] = task_id
+                        yield f"data: {json.dumps(tool_message)}\n\n"
+                    yield self._budget_exceeded_event(termination, task_id)
+                    break
+
                 # 执行工具调用
                 logger.info(f"Agent {agent_name} - 执行 {len(current_tool_calls)} 个工具调用")
 
@@ -557,32 +560,26 @@ class AgentStreamExecutor:
                     ):
                         if isinstance(item, str):
                             # SSE 事件，直接转发
-                            if is_sub_agent:
-                                # 如果当前也是 Sub Agent，添加 task_id
-                                if item.startswith("data: ") and not item.startswith("data: [DONE]"):
-                                    try:
-                                        data_str = item[6:].strip()
-                                        data = json.loads(data_str)
-                                        data["task_id"] = task_id
-                                        yield f"data: {json.dumps(data)}\n\n"
-                                    except:
-                                        yield item
-                                else:
-                                    yield item
-                            else:
-                                yield item
+                            yield self._tag_sub_agent_event(item, task_id) if is_sub_agent else item
                         else:
                             # 工具结果
                             tool_results.append(item)
                 else:
-                    # 普通工具调用，使用非流式执行
-                    tool_results = await self.tool_executor.execute_tools_batch(
+                    # 普通工具调用，并发执行，执行期间转发 MCP 工具进度
+                    tool_results = []
+                    async for item in self.tool_executor.execute_tools_batch_with_progress(
                         tool_calls=current_tool_calls,
                         mcp_servers=mcp_servers,
                         user_id=user_id,
                         conversation_id=conversation_id,
                         agent_id=agent_name
-                    )
+                    ):
+                        if isinstance(item, str):
+                            yield self._tag_sub_agent_event(item, task_id) if is_sub_agent else item
+                        else:
+                            tool_results = item
+
+                budget.record_tool_calls(len(current_tool_calls))
 
                 # 添加工具结果到消息列表并实时发送
                 for tool_result in tool_results:
@@ -594,10 +591,15 @@ class AgentStreamExecutor:
                     current_messages.append(tool_message)
                     round_messages.append(tool_message)
 
-                    # 发送工具结果 SSE
+                    # 发送工具结果 SSE（缓存命中与输出转存仅在事件中标记，不写入消息）
                     if is_sub_agent:
                         tool_message["task_id"] = task_id
-                    yield f"data: {json.dumps(tool_message)}\n\n"
+                    event = tool_message
+                    if tool_result.get("cached"):
+                        event = {**event, "cached": True}
+                    if tool_result.get("spilled"):
+                        event = {**event, "spilled": tool_result["spilled"]}
+                    yield f"data: {json.dumps(event)}\n\n"
 
             if iteration >= max_iterations:
                 logger.warning(f"Agent {agent_name} - 达到最大迭代次数 {max_iterations}")
@@ -607,9 +609,13 @@ class AgentStreamExecutor:
                 "round_messages": round_messages,
                 "round_token_usage": round_token_usage,
                 "iteration_count": iteration,
-                "agent_name": agent_name
+                "agent_name": agent_name,
+                "budget_usage": budget.snapshot()
             }
 
+            if termination:
+                result["termination"] = termination
+
             if is_sub_agent:
                 result["task_id"] = task_id
 
@@ -618,6 +624,33 @@ class AgentStreamExecutor:
         except Exception as e:
             logger.error(f"run_agent_loop 失败 ({agent_name}): {str(e)}")
             raise
+        finally:
+            RunBudget.deactivate(budget_token)
+
+    @staticmethod
+    def _tag_sub_agent_event(item: str, task_id: str) -> str:
+        """为 Sub Agent 转发的 SSE 事件添加 task_id"""
+        if item.startswith("data: ") and not item.startswith("data: [DONE]"):
+            try:
+                data_str = item[6:].strip()
+                data = json.loads(data_str)
+                data["task_id"] = task_id
+                return f"data: {json.dumps(data)}\n\n"
+            except:
+                return item
+        return item
+
+    @staticmethod
+    def _budget_exceeded_event(termination: Dict[str, Any], task_id: Optional[str] = None) -> str:
+        """构建预算超限 SSE 事件"""
+        data = {
+            "type": "budget_exceeded",
+            "message": termination["message"],
+            "budget": termination["budget"]
+        }
+        if task_id:
+            data["task_id"] = task_id
+        return f"data: {json.dumps(data)}\n\n"
 
     async def _prepare_agent_tools(
             self,
@@ -693,28 +726,6 @@ class AgentStreamExecutor:
         try:
             from app.infrastructure.database.mongodb.client import mongodb_client
 
-            # 确保 conversations 元数据存在
-            conversation = await mongodb_client.conversation_repository.get_conversation(conversation_id)
-            if not conversation:
-                await mongodb_client.conversation_repository.create_conversation(
-                    conversation_id=conversation_id,
-                    conversation_type="agent",
-                    user_id=user_id,
-                    title=f"{agent_name} 对话" if agent_name != "manual" else "新对话",
-                    tags=[]
-                )
-
-            # 确保 agent_run 文档存在
-            agent_run = await mongodb_client.agent_run_repository.get_agent_run(conversation_id)
-            if not agent_run:
-                await mongodb_client.agent_run_repository.create_agent_run(conversation_id)
-
-            # 获取当前主线程的 round 数量
-            current_round_count = await mongodb_client.agent_run_repository.get_round_count(
-                conversation_id
-            )
-            next_round_number = current_round_count + 1
-
             # 提取 token 使用量
             token_usage = result.get("round_token_usage", {})
             prompt_tokens = token_usage.get("prompt_tokens", 0)
@@ -741,39 +752,39 @@ class AgentStreamExecutor:
                     # 其他消息保持不变
                     processed_messages.append(msg)
 
-            # 保存轮次数据到 agent_run 集合的主线程 rounds
-            success = await mongodb_client.agent_run_repository.add_round_to_main(
-                conversation_id=conversation_id,
-                round_number=next_round_number,
-                agent_name=agent_name,
-                messages=processed_messages,
-                tools=tools,
-                model=model_name,
-                prompt_tokens=prompt_tokens,
-                completion_tokens=completion_tokens
+            # 主线程 round 与对话统计各一次原子更新，并发写入（文档不存在时自动创建，无需预先读取）
+            round_number, _ = await asyncio.gather(
+                mongodb_client.agent_run_repository.append_main_round(
+                    conversation_id=conversation_id,
+                    agent_name=agent_name,
+                    messages=processed_messages,
+                    tools=tools,
+                    model=model_name,
+                    prompt_tokens=prompt_tokens,
+                    completion_tokens=completion_tokens,
+                    termination=result.get("termination")
+                ),
+                mongodb_client.conversation_repository.update_conversation_round_stats(
+                    conversation_id=conversation_id,
+                    round_increment=1,
+                    prompt_tokens=prompt_tokens,
+                    completion_tokens=completion_tokens,
+                    create_if_missing={
+                        "conversation_type": "agent",
+                        "user_id": user_id,
+                        "title": f"{agent_name} 对话" if agent_name != "manual" else "新对话",
+                        "tags": []
+                    }
+                )
             )
 
-            logger.info(f"✓ 保存主线程 round 成功: conversation_id={conversation_id}, round={next_round_number}")
-
-            if not success:
+            if round_number is None:
                 logger.error(f"保存主线程 round 失败: {conversation_id}")
                 return None
 
-            # 更新 conversation 的 round_count
-            await mongodb_client.conversation_repository.update_conversation_round_count(
-                conversation_id=conversation_id,
-                increment=1
-            )
-
-            # 更新 conversation 的 token 使用量
-            if token_usage:
-                await mongodb_client.conversation_repository.update_conversation_token_usage(
-                    conversation_id=conversation_id,
-                    prompt_tokens=prompt_tokens,
-                    completion_tokens=completion_tokens
-                )
+            logger.info(f"✓ 保存主线程 round 成功: conversation_id={conversation_id}, round={round_number}")
 
-            logger.debug(f"Agent {agent_name} 执行结果已保存到数据库: {conversation_id}, round {next_round_number}")
+            logger.debug(f"Agent {agent_name} 执行结果已保存到数据库: {conversation_id}, round {round_number}")
 
             return None
 
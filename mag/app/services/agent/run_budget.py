@@ -0,0 +1,368 @@
+"""
+运行预算
+限制单次 Agent / Graph 运行的 token 总量、模型调用次数、工具调用次数与墙钟时间，
+以及同一用户每日所有运行累计的用量上限，超出任一限制时由执行循环提前终止并记录终止状态
+"""
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 预算限制项
+BUDGET_LIMIT_KEYS = (
+    "max_total_tokens",
+    "max_llm_calls",
+    "max_tool_calls",
+    "max_wall_time_seconds",
+)
+
+# 用户级上限（同一用户当日所有运行的用量累计，持久化到用户文档），运行时间上限仍对每次运行分别生效
+USER_LIMIT_KEYS = (
+    "max_total_tokens",
+    "max_llm_calls",
+    "max_tool_calls",
+)
+
+# 终止原因
+TERMINATION_BUDGET_EXCEEDED = "budget_exceeded"
+
+_LIMIT_LABELS = {
+    "max_total_tokens": "token总量",
+    "max_llm_calls": "模型调用次数",
+    "max_tool_calls": "工具调用次数",
+    "max_wall_time_seconds": "运行时间",
+}
+
+# 当前执行上下文中的预算（供嵌套的 Sub Agent 共享上层预算）
+_current_run_budget: ContextVar[Optional["RunBudget"]] = ContextVar("current_run_budget", default=None)
+
+# 用户级预算计量器（进程内同一用户的并发运行共享）：user_id -> 用户预算 / 占用该预算的运行数量
+_user_budgets: Dict[str, "UserBudget"] = {}
+_user_budget_holders: Dict[str, int] = {}
+# 尚未完成的用量写入任务（保持引用，避免任务被回收）
+_pending_usage_writes: set = set()
+
+
+def merge_budget_limits(*sources: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    合并多个预算来源，逐项取最严格（最小）的限制
+
+    Args:
+        sources: 预算配置字典，None 或缺失/非正数的项视为不限制
+
+    Returns:
+        仅包含生效限制项的字典
+    """
+    merged: Dict[str, Any] = {}
+    for source in sources:
+        if not source:
+            continue
+        for key in BUDGET_LIMIT_KEYS:
+            value = source.get(key)
+            if value is None:
+                continue
+            try:
+                value = float(value) if key == "max_wall_time_seconds" else int(value)
+            except (TypeError, ValueError):
+                logger.warning(f"忽略无效的预算限制: {key}={value}")
+                continue
+            if value <= 0:
+                continue
+            if key not in merged or value < merged[key]:
+                merged[key] = value
+    return merged
+
+
+def get_default_budget_limits() -> Dict[str, Any]:
+    """获取环境配置中的全局默认预算"""
+    return merge_budget_limits({
+        "max_total_tokens": settings.RUN_BUDGET_MAX_TOTAL_TOKENS,
+        "max_llm_calls": settings.RUN_BUDGET_MAX_LLM_CALLS,
+        "max_tool_calls": settings.RUN_BUDGET_MAX_TOOL_CALLS,
+        "max_wall_time_seconds": settings.RUN_BUDGET_MAX_WALL_TIME_SECONDS,
+    })
+
+
+def get_budget_window() -> str:
+    """当前用户预算周期（按自然日累计）"""
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+async def load_user_budget(user_id: str) -> Tuple[Dict[str, Any], Optional["UserBudget"]]:
+    """
+    获取用户预算并占用用户级预算
+
+    用户设置中的 token总量、模型调用次数、工具调用次数为用户每日上限，该用户所有运行的用量按日累计并持久化，
+    运行开始时载入当日已用量；运行时间上限与全局默认值一起作为单次运行的限制。
+
+    Args:
+        user_id: 用户 ID
+
+    Returns:
+        (单次运行的预算限制, 用户预算)，用户预算需在运行结束后通过 release_user_budget 释放
+    """
+    from app.infrastructure.database.mongodb import mongodb_client
+
+    user_setting = await mongodb_client.user_repository.get_run_budget(user_id)
+    run_limits, user_limits = split_user_budget_limits(user_setting)
+    return run_limits, await acquire_user_budget(user_id, user_limits)
+
+
+def split_user_budget_limits(user_setting: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    将用户预算设置拆分为单次运行限制（含全局默认值）和用户每日限制
+
+    Returns:
+        (单次运行的预算限制, 用户每日的预算限制)
+    """
+    user_setting = user_setting or {}
+    run_limits = merge_budget_limits(
+        get_default_budget_limits(),
+        {"max_wall_time_seconds": user_setting.get("max_wall_time_seconds")}
+    )
+    user_limits = merge_budget_limits({key: user_setting.get(key) for key in USER_LIMIT_KEYS})
+    return run_limits, user_limits
+
+
+async def acquire_user_budget(user_id: str, limits: Dict[str, Any]) -> Optional["UserBudget"]:
+    """
+    占用用户级预算，用户已有运行中的预算时共享同一个计量器（使用最新的限制），
+    否则载入当日已持久化的用量创建计量器
+
+    Returns:
+        用户预算，没有用户级限制时返回 None
+    """
+    if not limits:
+        return None
+
+    budget = _user_budgets.get(user_id)
+    if budget is None or budget.window != get_budget_window():
+        from app.infrastructure.database.mongodb import mongodb_client
+
+        window = get_budget_window()
+        usage = await mongodb_client.user_repository.get_budget_usage(user_id, window)
+        # 载入用量期间其他运行可能已创建计量器
+        budget = _user_budgets.get(user_id)
+        if budget is None or budget.window != window:
+            budget = UserBudget(user_id, limits, window, usage)
+            _user_budgets[user_id] = budget
+            _user_budget_holders[user_id] = 0
+    budget.limits = merge_budget_limits(limits)
+    _user_budget_holders[user_id] += 1
+    return budget
+
+
+def release_user_budget(user_id: str, budget: Optional["UserBudget"]) -> None:
+    """释放用户级预算，没有运行占用时丢弃计量器（之后的运行重新从数据库载入用量）"""
+    if budget is None or _user_budgets.get(user_id) is not budget:
+        return
+    _user_budget_holders[user_id] -= 1
+    if _user_budget_holders[user_id] <= 0:
+        _user_budgets.pop(user_id, None)
+        _user_budget_holders.pop(user_id, None)
+
+
+def get_current_run_budget() -> Optional["RunBudget"]:
+    """获取当前执行上下文中的预算"""
+    return _current_run_budget.get()
+
+
+class RunBudget:
+    """
+    单次运行的预算计量器
+
+    子预算（如图中某个节点的 Agent 预算）会把用量同时累计到父预算，
+    检查时任一层级超限即视为超限。
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Any]] = None,
+                 parent: Optional["RunBudget"] = None, scope: str = "agent"):
+        """
+        Args:
+            limits: 预算限制
+            parent: 父预算（共享上限）
+            scope: 预算作用域（agent / graph）
+        """
+        self.limits = merge_budget_limits(limits)
+        self.parent = parent
+        self.scope = scope
+        self.total_tokens = 0
+        self.llm_calls = 0
+        self.tool_calls = 0
+        self.started_at = time.monotonic()
+        self.exceeded_limit: Optional[str] = None
+
+    @property
+    def elapsed_seconds(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def record_llm_call(self, total_tokens: int = 0) -> None:
+        """记录一次模型调用及其 token 消耗"""
+        self.llm_calls += 1
+        self.total_tokens += max(int(total_tokens or 0), 0)
+        if self.parent:
+            self.parent.record_llm_call(total_tokens)
+
+    def record_tool_calls(self, count: int) -> None:
+        """记录工具调用次数"""
+        self.tool_calls += count
+        if self.parent:
+            self.parent.record_tool_calls(count)
+
+    def would_exceed_tool_calls(self, count: int) -> bool:
+        """
+        预判执行 count 个工具调用是否会超出工具调用上限（超出时标记超限）
+
+        Args:
+            count: 即将执行的工具调用数量
+        """
+        exceeded = False
+        limit = self.limits.get("max_tool_calls")
+        if limit is not None and self.tool_calls + count > limit:
+            exceeded = True
+        if self.parent and self.parent.would_exceed_tool_calls(count):
+            exceeded = True
+        if exceeded and not self.exceeded_limit:
+            self.exceeded_limit = "max_tool_calls"
+            logger.warning(f"运行预算超限({self.scope}): 工具调用次数 {self.tool_calls} + {count}")
+        return exceeded
+
+    def check(self) -> Optional[str]:
+        """
+        检查是否超出预算（超限状态一经确定不再恢复）
+
+        Returns:
+            超出的限制项名称，未超出返回 None
+        """
+        if self.exceeded_limit:
+            return self.exceeded_limit
+
+        # 工具调用上限在执行工具前通过 would_exceed_tool_calls 预判
+        usage = {
+            "max_total_tokens": self.total_tokens,
+            "max_llm_calls": self.llm_calls,
+            "max_wall_time_seconds": self.elapsed_seconds,
+        }
+        for key, used in usage.items():
+            limit = self.limits.get(key)
+            if limit is not None and used >= limit:
+                self.exceeded_limit = key
+                logger.warning(
+                    f"运行预算超限({self.scope}): {key} 用量 {used:.0f} / 限制 {limit}"
+                )
+                return key
+
+        if self.parent and self.parent.check():
+            self.exceeded_limit = self.parent.exceeded_limit
+            return self.exceeded_limit
+
+        return None
+
+    def is_exceeded(self) -> bool:
+        return self.check() is not None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """预算用量快照（可直接写入数据库）"""
+        return {
+            "scope": self.scope,
+            "limits": dict(self.limits),
+            "usage": {
+                "total_tokens": self.total_tokens,
+                "llm_calls": self.llm_calls,
+                "tool_calls": self.tool_calls,
+                "wall_time_seconds": round(self.elapsed_seconds, 3),
+            },
+            "exceeded_limit": self.exceeded_limit,
+        }
+
+    def exceeded_message(self) -> str:
+        label = _LIMIT_LABELS.get(self.exceeded_limit, self.exceeded_limit)
+        limit, scope, budget = None, self.scope, self
+        while budget is not None and limit is None:
+            limit, scope = budget.limits.get(self.exceeded_limit), budget.scope
+            budget = budget.parent
+        if scope == "user":
+            return f"运行已超出用户预算限制（当日累计{label}上限: {limit}），已提前终止"
+        return f"运行已超出预算限制（{label}上限: {limit}），已提前终止"
+
+    def termination_info(self) -> Dict[str, Any]:
+        """构建持久化用的终止状态"""
+        return {
+            "reason": TERMINATION_BUDGET_EXCEEDED,
+            "message": self.exceeded_message(),
+            "budget": self.snapshot(),
+            "terminated_at": datetime.now().isoformat(),
+        }
+
+    def activate(self):
+        """将预算设置为当前上下文预算，返回用于恢复的 token"""
+        return _current_run_budget.set(self)
+
+    @staticmethod
+    def deactivate(token) -> None:
+        """恢复之前的上下文预算"""
+        try:
+            _current_run_budget.reset(token)
+        except ValueError:
+            # 生成器在其他上下文中被关闭时无法恢复，忽略即可
+            pass
+
+
+class UserBudget(RunBudget):
+    """
+    用户级预算计量器
+
+    用量按预算周期持久化到用户文档：每次模型调用或工具调用后原子累加，
+    并用数据库返回的累计用量（包含其他进程中运行的用量）更新本地计量，检查时与单次运行预算一样同步进行。
+    """
+
+    def __init__(self, user_id: str, limits: Optional[Dict[str, Any]], window: str,
+                 usage: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            user_id: 用户 ID
+            limits: 用户每日限制
+            window: 预算周期标识
+            usage: 周期内已持久化的用量
+        """
+        super().__init__(limits, scope="user")
+        self.user_id = user_id
+        self.window = window
+        usage = usage or {}
+        self.total_tokens = usage.get("total_tokens", 0)
+        self.llm_calls = usage.get("llm_calls", 0)
+        self.tool_calls = usage.get("tool_calls", 0)
+
+    def record_llm_call(self, total_tokens: int = 0) -> None:
+        super().record_llm_call(total_tokens)
+        self._persist({"total_tokens": max(int(total_tokens or 0), 0), "llm_calls": 1})
+
+    def record_tool_calls(self, count: int) -> None:
+        super().record_tool_calls(count)
+        self._persist({"tool_calls": count})
+
+    def _persist(self, increments: Dict[str, int]) -> None:
+        """异步累加持久化用量（不阻塞执行循环）"""
+        try:
+            task = asyncio.get_running_loop().create_task(self._write_usage(increments))
+        except RuntimeError:
+            return
+        _pending_usage_writes.add(task)
+        task.add_done_callback(_pending_usage_writes.discard)
+
+    async def _write_usage(self, increments: Dict[str, int]) -> None:
+        from app.infrastructure.database.mongodb import mongodb_client
+
+        usage = await mongodb_client.user_repository.increment_budget_usage(self.user_id, self.window, increments)
+        if not usage:
+            return
+        # 数据库累计用量包含其他进程中的运行，只向上更新本地计量
+        self.total_tokens = max(self.total_tokens, usage["total_tokens"])
+        self.llm_calls = max(self.llm_calls, usage["llm_calls"])
+        self.tool_calls = max(self.tool_calls, usage["tool_calls"])
@@ -101,6 +101,8 @@ class BackgroundExecutor:
         """后台执行图的核心任务"""
         try:
             logger.info(f"开始后台执行图: {conversation_id}")
+            await self.conversation_manager.start_run_budget(conversation_id, user_id)
+            await self.conversation_manager.start_config_snapshot(conversation_id, user_id)
 
             # 执行图的所有层级
             await self._execute_graph_by_level_background(conversation_id, model_service, user_id)
@@ -112,15 +114,19 @@ class BackgroundExecutor:
             # 保存最终状态
             await self.conversation_manager.update_conversation_file(conversation_id)
 
-            logger.info(f"后台执行图完成: {conversation_id}")
+            self._log_run_end(conversation, "后台执行图完成")
 
         except Exception as e:
             logger.error(f"后台执行图失败 {conversation_id}: {str(e)}")
+        finally:
+            self.conversation_manager.finish_run_budget(conversation_id)
 
     async def _continue_conversation_background_task(self, conversation_id: str, model_service, user_id: str = "default_user"):
         """后台继续现有会话的执行任务"""
         try:
             logger.info(f"开始后台继续执行: {conversation_id}")
+            await self.conversation_manager.start_run_budget(conversation_id, user_id)
+            await self.conversation_manager.start_config_snapshot(conversation_id, user_id)
 
             # 检查恢复点并继续执行
             resumption_info = await self.conversation_manager.check_execution_resumption_point(conversation_id)
@@ -147,10 +153,12 @@ class BackgroundExecutor:
             # 保存最终状态
             await self.conversation_manager.update_conversation_file(conversation_id)
 
-            logger.info(f"后台继续执行完成: {conversation_id}")
+            self._log_run_end(conversation, "后台继续执行完成")
 
         except Exception as e:
             logger.error(f"后台继续执行失败 {conversation_id}: {str(e)}")
+        finally:
+            self.conversation_manager.finish_run_budget(conversation_id)
 
     async def _execute_graph_by_level_background(self, conversation_id: str, model_service=None,
                                                  user_id: str = "default_user"):
@@ -172,6 +180,9 @@ class BackgroundExecutor:
                     await self._execute_node_background(node, conversation_id, model_service, user_id)
 
                     conversation = await self.conversation_manager.get_conversation(conversation_id)
+                    if self.conversation_manager.is_run_terminated(conversation):
+                        logger.warning(f"会话 {conversation_id} 运行预算已超限，停止执行后续节点")
+                        return
                     last_round = conversation["rounds"][-1] if conversation["rounds"] else {}
 
                     if HandoffsManager.check_handoffs_in_round(last_round, node):
@@ -189,8 +200,21 @@ class BackgroundExecutor:
             logger.error(f"后台执行图层级时出错: {str(e)}")
             raise
 
+    @staticmethod
+    def _log_run_end(conversation: Dict[str, Any], message: str):
+        """记录后台运行结束（区分预算超限终止）"""
+        termination = conversation.get("termination")
+        if termination:
+            logger.warning(f"{message}（预算超限提前终止）: {conversation.get('conversation_id')}, {termination['message']}")
+        else:
+            logger.info(f"{message}: {conversation.get('conversation_id')}")
+
     async def _execute_node_background(self, node: Dict[str, Any], conversation_id: str, model_service, user_id: str = "default_user"):
         """执行单个节点（后台模式）"""
+        conversation = await self.conversation_manager.get_conversation(conversation_id)
+        if self.conversation_manager.is_run_terminated(conversation):
+            return None
+
         result = None
         async for item in self.node_executor_core.execute_node(
             node=node,
@@ -233,6 +257,9 @@ class BackgroundExecutor:
             await self._execute_node_background(current_node_obj, conversation_id, model_service, user_id)
 
             conversation = await self.conversation_manager.get_conversation(conversation_id)
+            if self.conversation_manager.is_run_terminated(conversation):
+                logger.warning(f"会话 {conversation_id} 运行预算已超限，停止执行后续节点")
+                return
             last_round = conversation["rounds"][-1] if conversation["rounds"] else {}
 
             if HandoffsManager.check_handoffs_in_round(last_round, current_node_obj):
@@ -268,6 +295,9 @@ class BackgroundExecutor:
                     await self._execute_node_background(restart_node_obj, conversation_id, model_service, user_id)
 
                     conversation = await self.conversation_manager.get_conversation(conversation_id)
+                    if self.conversation_manager.is_run_terminated(conversation):
+                        logger.warning(f"会话 {conversation_id} 运行预算已超限，停止执行后续节点")
+                        return
                     last_round = conversation["rounds"][-1] if conversation["rounds"] else {}
 
                     if HandoffsManager.check_handoffs_in_round(last_round, restart_node_obj):
@@ -287,6 +317,9 @@ class BackgroundExecutor:
                     await self._execute_node_background(node, conversation_id, model_service, user_id)
 
                     conversation = await self.conversation_manager.get_conversation(conversation_id)
+                    if self.conversation_manager.is_run_terminated(conversation):
+                        logger.warning(f"会话 {conversation_id} 运行预算已超限，停止执行后续节点")
+                        return
                     last_round = conversation["rounds"][-1] if conversation["rounds"] else {}
 
                     if HandoffsManager.check_handoffs_in_round(last_round, node):
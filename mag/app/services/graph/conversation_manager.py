@@ -8,6 +8,10 @@ from typing import Dict, List, Any, Optional
 
 logger = logging.getLogger(__name__)
 
+# 仅存在于内存中的运行时状态，不写入数据库
+RUNTIME_ONLY_KEYS = ("_run_budget", "_user_budget", "_config_snapshot", "_compiled_templates",
+                     "_execution_chain_state")
+
 
 class ConversationManager:
     """会话管理服务 - 处理会话状态和结果处理（图运行专用，使用MongoDB存储）"""
@@ -126,8 +130,92 @@ class ConversationManager:
             logger.error(f"更新会话到MongoDB {conversation_id} 时出错: {str(e)}")
             return False
 
-    async def _add_global_output(self, conversation_id: str, node_name: str, output: str) -> None:
-        """添加全局输出内容"""
+    async def start_run_budget(self, conversation_id: str, user_id: str = "default_user"):
+        """为本次图运行创建共享预算（单次运行限制与图预算取最严格者，用量同时累计到用户每日预算），并清除上次的终止状态"""
+        from app.services.agent.run_budget import RunBudget, load_user_budget, merge_budget_limits
+
+        conversation = await self.get_conversation(conversation_id)
+        if not conversation:
+            return None
+
+        # 释放上次运行未释放的用户预算
+        self.finish_run_budget(conversation_id)
+
+        run_limits, user_budget = await load_user_budget(user_id)
+        limits = merge_budget_limits(run_limits, conversation.get("graph_config", {}).get("budget"))
+        run_budget = RunBudget(limits, parent=user_budget, scope="graph")
+        conversation["_run_budget"] = run_budget
+        conversation["_user_budget"] = (user_id, user_budget)
+        conversation["termination"] = None
+
+        if limits:
+            logger.info(f"会话 {conversation_id} 启用运行预算: {limits}")
+        return run_budget
+
+    async def start_config_snapshot(self, conversation_id: str, user_id: str = "default_user"):
+        """为本次图运行批量加载 Agent 配置快照，运行内所有节点共享，不受运行中途编辑 Agent 影响"""
+        from app.services.agent.agent_config_snapshot import AgentConfigSnapshot
+
+        conversation = await self.get_conversation(conversation_id)
+        if not conversation:
+            return None
+
+        snapshot = await AgentConfigSnapshot.load(conversation.get("graph_config", {}), user_id)
+        conversation["_config_snapshot"] = snapshot
+        return snapshot
+
+    def get_config_snapshot(self, conversation: Dict[str, Any]):
+        """获取会话当前运行的 Agent 配置快照"""
+        return conversation.get("_config_snapshot")
+
+    def get_compiled_template(self, conversation: Dict[str, Any], template: str):
+        """获取编译后的提示词模板（同一会话的图配置不变，每个模板只编译一次）"""
+        compiled_templates = conversation.setdefault("_compiled_templates", {})
+        compiled = compiled_templates.get(template)
+        if compiled is None:
+            from app.utils.output_tools import GraphPromptTemplate
+            compiled = GraphPromptTemplate().compile(template)
+            compiled_templates[template] = compiled
+        return compiled
+
+    def get_run_budget(self, conversation: Dict[str, Any]):
+        """获取会话当前运行的预算"""
+        return conversation.get("_run_budget")
+
+    def finish_run_budget(self, conversation_id: str) -> None:
+        """运行结束时释放本次运行占用的用户预算计量器"""
+        from app.services.agent.run_budget import release_user_budget
+
+        conversation = self.active_conversations.get(conversation_id)
+        if not conversation:
+            return
+        user_budget = conversation.pop("_user_budget", None)
+        if user_budget:
+            release_user_budget(*user_budget)
+
+    def discard_conversation_state(self, conversation_id: str) -> None:
+        """丢弃内存中的会话状态（持久化失败后与数据库不一致时使用），下次访问时从MongoDB重新加载"""
+        self.finish_run_budget(conversation_id)
+        self.active_conversations.pop(conversation_id, None)
+
+    def is_run_terminated(self, conversation: Optional[Dict[str, Any]]) -> bool:
+        """本次运行是否已因预算超限终止（超限时记录终止状态）"""
+        if not conversation:
+            return False
+        self.record_budget_termination(conversation)
+        return bool(conversation.get("termination"))
+
+    def record_budget_termination(self, conversation: Dict[str, Any]) -> None:
+        """预算超限时记录会话终止状态（随会话一并持久化）"""
+        run_budget = self.get_run_budget(conversation)
+        if run_budget and run_budget.is_exceeded() and not conversation.get("termination"):
+            conversation["termination"] = run_budget.termination_info()
+            logger.warning(f"会话 {conversation.get('conversation_id')} 因预算超限终止: "
+                           f"{conversation['termination']['message']}")
+
+    async def _add_global_output(self, conversation_id: str, node_name: str, output: str,
+                                 persist: bool = True) -> None:
+        """添加全局输出内容（persist=False 时只更新内存，由调用方随节点结果一并写入）"""
         conversation = await self.get_conversation(conversation_id)
         if not conversation:
             logger.error(f"尝试添加全局输出到不存在的会话: {conversation_id}")
@@ -142,8 +230,9 @@ class ConversationManager:
         conversation["global_outputs"][node_name].append(output)
         logger.info(f"已添加节点 '{node_name}' 的全局输出，当前共 {len(conversation['global_outputs'][node_name])} 条")
 
-        from app.infrastructure.database.mongodb import mongodb_client
-        await mongodb_client.update_graph_run_global_outputs(conversation_id, node_name, output)
+        if persist:
+            from app.infrastructure.database.mongodb import mongodb_client
+            await mongodb_client.update_graph_run_global_outputs(conversation_id, node_name, output)
 
     async def _get_global_outputs(self, conversation_id: str, node_name: str, mode: str = "all") -> List[str]:
         """全局输出获取函数"""
@@ -175,11 +264,12 @@ class ConversationManager:
                 return []
 
     async def update_handoffs_status(self, conversation_id: str, node_name: str,
-                                     total_limit: int, used_count: int, last_selection: str = None) -> None:
-        """更新handoffs状态"""
+                                     total_limit: int, used_count: int, last_selection: str = None,
+                                     persist: bool = True) -> Dict[str, Any]:
+        """更新handoffs状态（persist=False 时只更新内存，由调用方随节点结果一并写入）"""
         conversation = await self.get_conversation(conversation_id)
         if not conversation:
-            return
+            return {}
 
         if "handoffs_status" not in conversation:
             conversation["handoffs_status"] = {}
@@ -194,8 +284,10 @@ class ConversationManager:
 
         logger.info(f"更新节点 '{node_name}' 的handoffs状态: {used_count}/{total_limit}")
 
-        from app.infrastructure.database.mongodb import mongodb_client
-        await mongodb_client.update_graph_run_handoffs_status(conversation_id, node_name, handoffs_data)
+        if persist:
+            from app.infrastructure.database.mongodb import mongodb_client
+            await mongodb_client.update_graph_run_handoffs_status(conversation_id, node_name, handoffs_data)
+        return handoffs_data
 
     async def get_handoffs_status(self, conversation_id: str, node_name: str) -> Dict[str, Any]:
         """获取handoffs状态"""
@@ -267,14 +359,11 @@ class ConversationManager:
         end_template = graph_config.get("end_template")
 
         if end_template:
-            from app.utils.output_tools import GraphPromptTemplate
-            template_processor = GraphPromptTemplate()
-
             # 获取全局输出历史
             global_outputs = conversation.get("global_outputs", {})
 
             # 渲染end_template
-            output = template_processor.render_template(end_template, global_outputs)
+            output = self.get_compiled_template(conversation, end_template).render(global_outputs)
 
             conversation["final_result"] = output
 
@@ -375,8 +464,10 @@ class ConversationManager:
             return None
 
     def _prepare_mongodb_data(self, conversation: Dict[str, Any]) -> Dict[str, Any]:
-        """准备用于MongoDB更新的数据"""
-        update_data = copy.deepcopy(conversation)
+        """准备用于MongoDB更新的数据（rounds 已逐个追加写入，不随整体同步）"""
+        update_data = copy.deepcopy({
+            k: v for k, v in conversation.items() if k not in RUNTIME_ONLY_KEYS and k != "rounds"
+        })
 
         update_data.pop("_current_round", None)
         update_data.pop("_id", None)
@@ -1,63 +1,93 @@
 """执行链管理类 - 处理图执行链的生成和更新"""
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List, Set
 
 logger = logging.getLogger(__name__)
 
 
 class ExecutionChainManager:
-    """执行链管理类 - 负责维护和更新图的执行链"""
+    """执行链管理类 - 负责维护和更新图的执行链
+
+    执行链在内存中随节点完成增量维护，随节点结果一并写入变化的分组；
+    仅在会话恢复或执行状态被重置时才从全部rounds重建。
+    """
 
     @staticmethod
-    async def update_execution_chain(conversation: Dict[str, Any]):
+    def update_execution_chain(conversation: Dict[str, Any]) -> Dict[str, Any]:
         """更新execution_chain - 按level合并相邻节点
-        
-        根据会话中的rounds数据，按层级分组生成执行链。
+
+        根据会话中新增的rounds数据，按层级分组更新执行链。
         同一层级的节点会被合并到同一个列表中。
-        
+
         Args:
-            conversation: 会话数据，需包含 rounds 和 conversation_id
+            conversation: 会话数据，需包含 rounds
+
+        Returns:
+            需要写入数据库的字段：重建时为完整执行链，否则只包含变化的分组
         """
         rounds = conversation.get("rounds", [])
-        
-        if not rounds:
-            conversation["execution_chain"] = []
-            return
+        execution_chain = conversation.get("execution_chain")
+        state = conversation.get("_execution_chain_state")
 
-        execution_chain = []
-        current_level_group = []
-        current_level = None
+        if not ExecutionChainManager._is_state_valid(state, rounds, execution_chain):
+            # 会话恢复或执行状态被重置：从全部rounds重建并整体写入
+            state = ExecutionChainManager._new_state(rounds)
+            conversation["_execution_chain_state"] = state
+            conversation["execution_chain"] = state["chain"]
+            ExecutionChainManager._apply_rounds(state, rounds)
+            return {"execution_chain": state["chain"]}
 
-        # 遍历所有rounds，按level分组
-        for round_data in rounds:
+        # 只处理新增的rounds，并只写入变化的分组
+        changed = ExecutionChainManager._apply_rounds(state, rounds)
+        return {f"execution_chain.{index}": state["chain"][index] for index in sorted(changed)}
+
+    @staticmethod
+    def _new_state(rounds: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "rounds": rounds,
+            "processed": 0,
+            "chain": [],
+            "level": None,
+            "names": set()
+        }
+
+    @staticmethod
+    def _is_state_valid(state: Dict[str, Any], rounds: List[Dict[str, Any]], execution_chain: List[List[str]]) -> bool:
+        """增量状态仍对应当前的rounds和执行链（未被替换或截断）"""
+        return (
+            state is not None
+            and state["rounds"] is rounds
+            and state["chain"] is execution_chain
+            and state["processed"] <= len(rounds)
+        )
+
+    @staticmethod
+    def _apply_rounds(state: Dict[str, Any], rounds: List[Dict[str, Any]]) -> Set[int]:
+        """将未处理的rounds追加到执行链
+
+        Returns:
+            发生变化的分组下标
+        """
+        chain = state["chain"]
+        changed = set()
+
+        for round_data in rounds[state["processed"]:]:
             node_name = round_data.get("node_name", "")
             level = round_data.get("level", 0)
 
-            if current_level is None:
-                # 第一个节点
-                current_level = level
-                current_level_group = [node_name]
-            elif level == current_level:
+            if not chain or level != state["level"]:
+                # 新的层级，开始新组
+                chain.append([node_name])
+                state["level"] = level
+                state["names"] = {node_name}
+            elif node_name not in state["names"]:
                 # 同一层级，添加到当前组（避免重复）
-                if node_name not in current_level_group:
-                    current_level_group.append(node_name)
+                chain[-1].append(node_name)
+                state["names"].add(node_name)
             else:
-                # 新的层级，保存当前组并开始新组
-                if current_level_group:
-                    execution_chain.append(current_level_group)
-                current_level = level
-                current_level_group = [node_name]
-
-        # 添加最后一组
-        if current_level_group:
-            execution_chain.append(current_level_group)
-
-        # 更新到conversation
-        conversation["execution_chain"] = execution_chain
-
-        # 同步到数据库
-        from app.infrastructure.database.mongodb import mongodb_client
-        await mongodb_client.update_graph_run_execution_chain(
-            conversation["conversation_id"], 
-            execution_chain
-        )
\ No newline at end of file
+                continue
+
+            changed.add(len(chain) - 1)
+
+        state["processed"] = len(rounds)
+        return changed
@@ -28,6 +28,7 @@ class GraphExecutor:
                                    model_service=None,
                                    user_id: str = "default_user") -> AsyncGenerator[str, None]:
         """执行整个图并返回流式结果"""
+        conversation_id = None
         try:
             conversation_id = await self.conversation_manager.create_conversation_with_config(
                 graph_name, flattened_config, user_id
@@ -41,6 +42,8 @@ class GraphExecutor:
 
             conversation = await self.conversation_manager.get_conversation(conversation_id)
             conversation["graph_name"] = graph_name
+            await self.conversation_manager.start_run_budget(conversation_id, user_id)
+            await self.conversation_manager.start_config_snapshot(conversation_id, user_id)
 
             # 发送start节点开始事件
             yield SSEHelper.send_node_start("start", 0)
@@ -59,11 +62,14 @@ class GraphExecutor:
 
             await self.conversation_manager.update_conversation_file(conversation_id)
 
-            yield SSEHelper.send_graph_complete(final_output, execution_chain)
+            yield self._build_run_end_event(conversation, final_output, execution_chain)
 
         except Exception as e:
             logger.error(f"执行图流式处理时出错: {str(e)}")
             yield SSEHelper.send_error(f"执行图时出错: {str(e)}")
+        finally:
+            if conversation_id:
+                self.conversation_manager.finish_run_budget(conversation_id)
 
     async def continue_conversation_stream(self,
                                            conversation_id: str,
@@ -79,6 +85,8 @@ class GraphExecutor:
 
             # Get user_id from conversation
             user_id = conversation.get("user_id", "default_user")
+            await self.conversation_manager.start_run_budget(conversation_id, user_id)
+            await self.conversation_manager.start_config_snapshot(conversation_id, user_id)
 
             if continue_from_checkpoint or not input_text:
                 resumption_info = await self.conversation_manager.check_execution_resumption_point(conversation_id)
@@ -122,11 +130,21 @@ class GraphExecutor:
 
             await self.conversation_manager.update_conversation_file(conversation_id)
 
-            yield SSEHelper.send_graph_complete(final_output, execution_chain)
+            yield self._build_run_end_event(conversation, final_output, execution_chain)
 
         except Exception as e:
             logger.error(f"继续会话流式处理时出错: {str(e)}")
             yield SSEHelper.send_error(f"继续会话时出错: {str(e)}")
+        finally:
+            self.conversation_manager.finish_run_budget(conversation_id)
+
+    @staticmethod
+    def _build_run_end_event(conversation: Dict[str, Any], final_output: str, execution_chain: list) -> str:
+        """构建运行结束事件：预算超限终止时发送 budget_exceeded，否则发送 graph_complete"""
+        termination = conversation.get("termination")
+        if termination:
+            return SSEHelper.send_budget_exceeded(termination, final_output, execution_chain)
+        return SSEHelper.send_graph_complete(final_output, execution_chain)
 
     async def _execute_graph_by_level_sequential_stream(self, conversation_id: str, model_service=None,
                                                         user_id: str = "default_user") -> AsyncGenerator[str, None]:
@@ -148,6 +166,9 @@ class GraphExecutor:
                         yield sse_data
 
                     conversation = await self.conversation_manager.get_conversation(conversation_id)
+                    if self.conversation_manager.is_run_terminated(conversation):
+                        logger.warning(f"会话 {conversation_id} 运行预算已超限，停止执行后续节点")
+                        return
                     last_round = conversation["rounds"][-1] if conversation["rounds"] else {}
 
                     if HandoffsManager.check_handoffs_in_round(last_round, node):
@@ -194,6 +215,9 @@ class GraphExecutor:
                         yield sse_data
 
                     conversation = await self.conversation_manager.get_conversation(conversation_id)
+                    if self.conversation_manager.is_run_terminated(conversation):
+                        logger.warning(f"会话 {conversation_id} 运行预算已超限，停止执行后续节点")
+                        return
                     last_round = conversation["rounds"][-1] if conversation["rounds"] else {}
 
                     if HandoffsManager.check_handoffs_in_round(last_round, restart_node_obj):
@@ -219,6 +243,9 @@ class GraphExecutor:
                         yield sse_data
 
                     conversation = await self.conversation_manager.get_conversation(conversation_id)
+                    if self.conversation_manager.is_run_terminated(conversation):
+                        logger.warning(f"会话 {conversation_id} 运行预算已超限，停止执行后续节点")
+                        return
                     last_round = conversation["rounds"][-1] if conversation["rounds"] else {}
 
                     if HandoffsManager.check_handoffs_in_round(last_round, node):
@@ -293,6 +320,9 @@ class GraphExecutor:
                 yield sse_data
 
             conversation = await self.conversation_manager.get_conversation(conversation_id)
+            if self.conversation_manager.is_run_terminated(conversation):
+                logger.warning(f"会话 {conversation_id} 运行预算已超限，停止执行后续节点")
+                return
             last_round = conversation["rounds"][-1] if conversation["rounds"] else {}
 
             if HandoffsManager.check_handoffs_in_round(last_round, current_node_obj):
@@ -332,6 +362,11 @@ class GraphExecutor:
         node_name = node["name"]
         node_level = node.get("level", 0)
 
+        # 运行已因预算超限终止时不再执行节点，也不发送节点事件
+        conversation = await self.conversation_manager.get_conversation(conversation_id)
+        if self.conversation_manager.is_run_terminated(conversation):
+            return
+
         # 发送节点开始事件
         yield SSEHelper.send_node_start(node_name, node_level)
 
@@ -1,12 +1,13 @@
 """图结构查询辅助类 - 提供图结构相关的查询功能"""
 import logging
 from typing import Dict, List, Any, Optional
+from app.services.graph.graph_index import GraphIndex
 
 logger = logging.getLogger(__name__)
 
 
 class GraphHelper:
-    """图结构查询辅助类 - 提供静态方法用于图结构查询"""
+    """图结构查询辅助类 - 提供静态方法用于图结构查询（基于缓存的图索引）"""
 
     @staticmethod
     def get_max_level(graph_config: Dict[str, Any]) -> int:
@@ -18,11 +19,7 @@ class GraphHelper:
         Returns:
             最大层级数
         """
-        max_level = 0
-        for node in graph_config.get("nodes", []):
-            level = node.get("level", 0)
-            max_level = max(max_level, level)
-        return max_level
+        return GraphIndex.of(graph_config).max_level()
 
     @staticmethod
     def get_nodes_at_level(graph_config: Dict[str, Any], level: int) -> List[Dict[str, Any]]:
@@ -35,8 +32,7 @@ class GraphHelper:
         Returns:
             该层级的所有节点列表
         """
-        return [node for node in graph_config.get("nodes", []) 
-                if node.get("level", 0) == level]
+        return GraphIndex.of(graph_config).nodes_at_level(level)
 
     @staticmethod
     def find_node_by_name(graph_config: Dict[str, Any], node_name: str) -> Optional[Dict[str, Any]]:
@@ -49,7 +45,4 @@ class GraphHelper:
         Returns:
             找到的节点字典，未找到返回None
         """
-        for node in graph_config.get("nodes", []):
-            if node["name"] == node_name:
-                return node
-        return None
\ No newline at end of file
+        return GraphIndex.of(graph_config).find_node(node_name)
\ No newline at end of file
@@ -0,0 +1,140 @@
+"""图结构索引 - 基于邻接表的节点查询、依赖关系和环检测"""
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class GraphIndex:
+    """图结构索引
+
+    一次遍历（O(V+E)）建立节点名称映射和依赖邻接表，层级分组在首次查询时建立，
+    之后的节点查找、层级查询均为 O(1)，避免执行器在循环中反复扫描整个节点列表。
+    """
+
+    # 按图配置对象缓存的索引（执行期间图配置不再修改）
+    _cache: "OrderedDict[int, tuple]" = OrderedDict()
+    _cache_lock = threading.Lock()
+    _CACHE_SIZE = 128
+
+    def __init__(self, graph_config: Dict[str, Any]):
+        """建立索引
+
+        Args:
+            graph_config: 图配置字典
+        """
+        self.nodes: List[Dict[str, Any]] = graph_config.get("nodes", [])
+        self.node_map: Dict[str, Dict[str, Any]] = {}
+        for node in self.nodes:
+            self.node_map.setdefault(node["name"], node)
+
+        # 依赖关系：depends_on[B] 包含 A 表示 B 依赖 A；dependents 为其反向邻接表
+        self.depends_on: Dict[str, Set[str]] = {name: set() for name in self.node_map}
+        self.dependents: Dict[str, Set[str]] = {name: set() for name in self.node_map}
+        self._build_dependencies()
+
+        self._levels: Optional[Dict[int, List[Dict[str, Any]]]] = None
+        self._max_level = 0
+
+    @classmethod
+    def of(cls, graph_config: Dict[str, Any]) -> "GraphIndex":
+        """获取图配置的索引（同一图配置对象只建立一次）"""
+        key = id(graph_config)
+        nodes = graph_config.get("nodes", [])
+        with cls._cache_lock:
+            cached = cls._cache.get(key)
+            # 缓存条目持有图配置引用，确保 id 不会被复用；节点列表被替换或增删时重建
+            if cached and cached[0] is graph_config and cached[1] is nodes and cached[2] == len(nodes):
+                cls._cache.move_to_end(key)
+                return cached[3]
+
+        index = cls(graph_config)
+        with cls._cache_lock:
+            cls._cache[key] = (graph_config, nodes, len(nodes), index)
+            cls._cache.move_to_end(key)
+            while len(cls._cache) > cls._CACHE_SIZE:
+                cls._cache.popitem(last=False)
+        return index
+
+    def _build_dependencies(self) -> None:
+        """建立依赖邻接表
+
+        - 输入依赖：B 的 input_nodes 包含 A，则 B 依赖 A
+        - 输出依赖：A 的 output_nodes 包含 B，则 B 依赖 A；
+          有 handoffs 参数的节点以及互为输出的节点不建立输出依赖，避免 handoffs 循环影响层级计算
+        """
+        output_sets = {name: set(node.get("output_nodes", [])) for name, node in self.node_map.items()}
+
+        for node in self.nodes:
+            node_name = node["name"]
+
+            for input_name in node.get("input_nodes", []):
+                if input_name != "start" and input_name in self.node_map:
+                    self._add_dependency(node_name, input_name)
+
+            if node.get("handoffs") is not None:
+                continue
+
+            for output_name in node.get("output_nodes", []):
+                if output_name != "end" and output_name in self.node_map:
+                    if node_name not in output_sets[output_name]:
+                        self._add_dependency(output_name, node_name)
+
+    def _add_dependency(self, node_name: str, dependency: str) -> None:
+        self.depends_on[node_name].add(dependency)
+        self.dependents[dependency].add(node_name)
+
+    def find_node(self, node_name: str) -> Optional[Dict[str, Any]]:
+        return self.node_map.get(node_name)
+
+    def _build_levels(self) -> None:
+        levels: Dict[int, List[Dict[str, Any]]] = {}
+        for node in self.nodes:
+            levels.setdefault(node.get("level", 0), []).append(node)
+        self._levels = levels
+        self._max_level = max([0, *levels])
+
+    def nodes_at_level(self, level: int) -> List[Dict[str, Any]]:
+        if self._levels is None:
+            self._build_levels()
+        return list(self._levels.get(level, []))
+
+    def max_level(self) -> int:
+        if self._levels is None:
+            self._build_levels()
+        return self._max_level
+
+    def find_cycle(self) -> Optional[List[str]]:
+        """检测依赖关系中的环（迭代 DFS，O(V+E)）
+
+        Returns:
+            环上的节点路径（首尾相同），无环时返回 None
+        """
+        # 0=未访问，1=访问中，2=已完成
+        state = {name: 0 for name in self.node_map}
+
+        for root in self.node_map:
+            if state[root]:
+                continue
+
+            path = [root]
+            stack = [iter(self.dependents[root])]
+            state[root] = 1
+
+            while stack:
+                next_name = next(stack[-1], None)
+                if next_name is None:
+                    state[path.pop()] = 2
+                    stack.pop()
+                    continue
+
+                if state[next_name] == 1:
+                    return path[path.index(next_name):] + [next_name]
+                if state[next_name] == 0:
+                    state[next_name] = 1
+                    path.append(next_name)
+                    stack.append(iter(self.dependents[next_name]))
+
+        return None
@@ -1,23 +1,51 @@
 import copy
 import logging
-from typing import Dict, List, Any, Optional, Tuple
+from collections import deque, OrderedDict
+from typing import Dict, List, Any, Optional, Tuple, NamedTuple
+
+from app.services.graph.graph_index import GraphIndex
 
 logger = logging.getLogger(__name__)
 
 
+class SubgraphExpansion(NamedTuple):
+    """子图的展开结果（缓存中的节点记录只读，使用时按父图的连接关系复制）"""
+    nodes: Tuple[Dict[str, Any], ...]
+    output_nodes: Tuple[str, ...]
+    # 子图及其所有嵌套子图的版本 {图名称: updated_at}
+    versions: Dict[str, Any]
+
+
+def _copy_node(node: Dict[str, Any]) -> Dict[str, Any]:
+    """复制节点记录：只复制列表字段，其余字段共享"""
+    return {key: list(value) if isinstance(value, list) else value for key, value in node.items()}
+
+
 class GraphProcessor:
     """图处理服务 - 处理图的展开、层级计算等核心功能"""
 
-    def __init__(self, get_graph_func):
+    # 子图展开结果缓存的最大条目数
+    EXPANSION_CACHE_SIZE = 256
+
+    def __init__(self, get_graph_func, get_update_times_func=None):
         """
         初始化图处理器
+
+        Args:
+            get_graph_func: 获取图配置的函数
+            get_update_times_func: 批量获取图配置更新时间的函数（用于校验子图展开缓存，为空时不缓存）
         """
         self.get_graph = get_graph_func
-
+        self.get_update_times = get_update_times_func
+        # (user_id, 子图名称) -> 子图展开结果
+        self._expansion_cache: "OrderedDict[Tuple[str, str], SubgraphExpansion]" = OrderedDict()
 
     async def _flatten_all_subgraphs(self, graph_config: Dict[str, Any], user_id: str = "default_user") -> Dict[str, Any]:
         """将图中所有子图完全展开为扁平结构，并更新节点引用关系
 
+        每个子图的展开结果按子图名称和版本（更新时间）缓存，子图未变更时直接复用，
+        某个子图变更后只重新展开它及引用它的子图。
+
         Args:
             graph_config: 图配置
             user_id: 用户ID，用于获取子图配置
@@ -25,43 +53,126 @@ class GraphProcessor:
         Returns:
             展开后的图配置
         """
-        flattened_config = copy.deepcopy(graph_config)
+        nodes = graph_config.get("nodes", [])
+        expansions = await self._get_subgraph_expansions(self._subgraph_names(nodes), user_id, ())
+
+        flattened_config = dict(graph_config)
+        flattened_nodes = self._flatten_nodes(nodes, expansions)
+        flattened_config["nodes"] = flattened_nodes
+
+        # 确保展开后的图仍然有起始和结束节点
+        if not any("start" in node.get("input_nodes", []) for node in flattened_nodes):
+            logger.warning("展开后的图没有起始节点")
+        if not any("end" in node.get("output_nodes", []) for node in flattened_nodes):
+            logger.warning("展开后的图没有结束节点")
+
+        return flattened_config
+
+    @staticmethod
+    def _subgraph_names(nodes: List[Dict[str, Any]]) -> List[str]:
+        """获取节点列表中引用的子图名称（去重，保持顺序）"""
+        return list(dict.fromkeys(
+            node["subgraph_name"] for node in nodes
+            if node.get("is_subgraph", False) and node.get("subgraph_name")
+        ))
+
+    async def _get_subgraph_expansions(self, subgraph_names: List[str], user_id: str,
+                                       stack: Tuple[str, ...]) -> Dict[str, SubgraphExpansion]:
+        """获取子图的展开结果，缓存的结果通过一次查询校验版本，过期或未缓存的重新展开"""
+        if not subgraph_names:
+            return {}
+
+        cached = {name: self._expansion_cache.get((user_id, name)) for name in subgraph_names}
+        version_names = {name for entry in cached.values() if entry for name in entry.versions}
+        current_versions = None
+        if version_names and self.get_update_times:
+            current_versions = await self.get_update_times(list(version_names), user_id)
+
+        expansions = {}
+        for name in subgraph_names:
+            entry = cached[name]
+            if entry and current_versions is not None and all(
+                    current_versions.get(dep) == version for dep, version in entry.versions.items()):
+                self._expansion_cache.move_to_end((user_id, name))
+            else:
+                # 同一子图可能已在展开前面的子图时（作为嵌套子图）重新展开过
+                refreshed = self._expansion_cache.get((user_id, name))
+                entry = refreshed if refreshed is not None and refreshed is not entry \
+                    else await self._expand_subgraph(name, user_id, stack)
+            if entry:
+                expansions[name] = entry
+        return expansions
+
+    async def _expand_subgraph(self, subgraph_name: str, user_id: str,
+                               stack: Tuple[str, ...]) -> Optional[SubgraphExpansion]:
+        """获取子图配置并展开（嵌套子图复用各自的展开缓存）"""
+        if subgraph_name in stack:
+            logger.warning(f"子图循环引用，跳过展开: {' -> '.join(stack + (subgraph_name,))}")
+            return None
+
+        graph_doc = await self.get_graph(subgraph_name, user_id)
+        if not graph_doc:
+            return None
+        subgraph_config = graph_doc.get("config", graph_doc)
+
+        nodes = subgraph_config.get("nodes", [])
+        child_names = self._subgraph_names(nodes)
+        children = await self._get_subgraph_expansions(child_names, user_id, stack + (subgraph_name,))
+        flattened_nodes = self._flatten_nodes(nodes, children)
+
+        # 版本包含所有嵌套子图（不存在的子图记为 None，创建后同样使缓存失效）
+        versions = {subgraph_name: graph_doc.get("updated_at")}
+        for child_name in child_names:
+            child = children.get(child_name)
+            if child:
+                versions.update(child.versions)
+            else:
+                versions[child_name] = None
+
+        expansion = SubgraphExpansion(
+            nodes=tuple(flattened_nodes),
+            output_nodes=tuple(
+                node["name"] for node in flattened_nodes
+                if "end" in node.get("output_nodes", []) or node.get("is_end", False)
+            ),
+            versions=versions
+        )
+
+        if self.get_update_times and graph_doc.get("updated_at") is not None:
+            self._expansion_cache[(user_id, subgraph_name)] = expansion
+            self._expansion_cache.move_to_end((user_id, subgraph_name))
+            while len(self._expansion_cache) > self.EXPANSION_CACHE_SIZE:
+                self._expansion_cache.popitem(last=False)
+        return expansion
+
+    @staticmethod
+    def _flatten_nodes(nodes: List[Dict[str, Any]],
+                       expansions: Dict[str, SubgraphExpansion]) -> List[Dict[str, Any]]:
+        """用子图展开结果替换子图节点，并更新节点引用关系
+
+        节点只做一层复制（列表字段复制，其余字段共享），缓存中的节点记录不会被修改。
+        """
         flattened_nodes = []
 
-        # 子图名称到输出节点的映射
+        # 子图节点名称到子图输出节点的映射
         subgraph_outputs = {}
 
         # 第一阶段：展开所有子图节点
-        for node in graph_config.get("nodes", []):
+        for node in nodes:
             if node.get("is_subgraph", False):
-                # 获取子图配置
                 subgraph_name = node.get("subgraph_name")
-                if not subgraph_name:
-                    continue
-
-                subgraph_config = await self.get_graph(subgraph_name, user_id)
-                if not subgraph_config:
+                expansion = expansions.get(subgraph_name) if subgraph_name else None
+                if not expansion:
                     continue
 
                 # 记录子图的输入输出连接
                 node_name = node["name"]
                 parent_inputs = node.get("input_nodes", [])
                 parent_outputs = node.get("output_nodes", [])
+                subgraph_outputs[node_name] = list(expansion.output_nodes)
 
-                # 递归展开子图（处理嵌套子图）
-                subgraph_flattened = await self._flatten_all_subgraphs(subgraph_config, user_id)
-
-                # 找出子图中的输出节点
-                subgraph_output_nodes = []
-                for sub_node in subgraph_flattened.get("nodes", []):
-                    if "end" in sub_node.get("output_nodes", []) or sub_node.get("is_end", False):
-                        subgraph_output_nodes.append(sub_node["name"])
-
-                subgraph_outputs[node_name] = subgraph_output_nodes
-
-                # 展开子图内的节点
-                for sub_node in subgraph_flattened.get("nodes", []):
-                    sub_node_copy = copy.deepcopy(sub_node)
+                for sub_node in expansion.nodes:
+                    sub_node_copy = _copy_node(sub_node)
 
                     # 处理与外部图的连接
                     if "input_nodes" in sub_node_copy and "start" in sub_node_copy["input_nodes"]:
@@ -80,223 +191,109 @@ class GraphProcessor:
                     flattened_nodes.append(sub_node_copy)
             else:
                 # 普通节点直接添加
-                flattened_nodes.append(copy.deepcopy(node))
+                flattened_nodes.append(_copy_node(node))
 
         # 第二阶段：更新节点的输入引用，将引用子图的改为引用子图的输出节点
-        for node in flattened_nodes:
-            if "input_nodes" in node:
-                updated_inputs = []
-                for input_node in node["input_nodes"]:
-                    if input_node in subgraph_outputs:
-                        updated_inputs.extend(subgraph_outputs[input_node])
-                    else:
-                        updated_inputs.append(input_node)
-                node["input_nodes"] = updated_inputs
-
-        flattened_config["nodes"] = flattened_nodes
-
-        # 第三阶段：确保展开后的图仍然有起始和结束节点
-        has_start = False
-        has_end = False
-        for node in flattened_nodes:
-            if "start" in node.get("input_nodes", []):
-                has_start = True
-            if "end" in node.get("output_nodes", []):
-                has_end = True
-
-        if not has_start:
-            print("警告：展开后的图没有起始节点")
-        if not has_end:
-            print("警告：展开后的图没有结束节点")
+        if subgraph_outputs:
+            for node in flattened_nodes:
+                if "input_nodes" in node:
+                    updated_inputs = []
+                    for input_node in node["input_nodes"]:
+                        if input_node in subgraph_outputs:
+                            updated_inputs.extend(subgraph_outputs[input_node])
+                        else:
+                            updated_inputs.append(input_node)
+                    node["input_nodes"] = updated_inputs
 
-        return flattened_config
+        return flattened_nodes
 
     def _calculate_node_levels(self, graph_config: Dict[str, Any]) -> Dict[str, Any]:
-        """重新设计的层级计算算法，正确处理所有依赖关系，包括handoffs引起的循环"""
-        try:
-            graph_copy = copy.deepcopy(graph_config)
-            nodes = graph_copy.get("nodes", [])
-
-            print(f"开始计算层级，共 {len(nodes)} 个节点")
-
-            # 创建节点名称到节点对象的映射
-            node_map = {node["name"]: node for node in nodes}
-
-            # 构建依赖关系图（谁依赖谁）
-            depends_on = {}
-            for node in nodes:
-                node_name = node["name"]
-                depends_on[node_name] = set()
-
-            # 处理输入依赖：如果B的input_nodes包含A，则B依赖A
-            for node in nodes:
-                node_name = node["name"]
+        """计算节点层级，正确处理所有依赖关系，包括handoffs引起的循环
 
-                for input_name in node.get("input_nodes", []):
-                    if input_name != "start" and input_name in node_map:
-                        depends_on[node_name].add(input_name)
-                        print(f"节点 {node_name} 依赖输入节点 {input_name}")
+        基于依赖邻接表按拓扑顺序计算层级（O(V+E)）：节点层级为其所有依赖的最大层级+1，
+        因循环依赖无法确定层级的节点再根据已知层级的依赖/被依赖节点推断。
+        """
+        try:
+            # 只修改节点的 level 字段，浅拷贝节点即可保持原始配置不变
+            graph_copy = dict(graph_config)
+            nodes = [dict(node) for node in graph_config.get("nodes", [])]
+            graph_copy["nodes"] = nodes
 
-            # 处理输出依赖：如果A的output_nodes包含B，则B依赖A
-            # 但忽略handoffs节点产生的循环依赖
-            for node in nodes:
-                node_name = node["name"]
-                handoffs = node.get("handoffs")
-
-                # 如果节点有handoffs参数，不建立从output_nodes到该节点的依赖
-                # 这样可以避免handoffs引起的循环依赖影响层级计算
-                if handoffs is None:
-                    for output_name in node.get("output_nodes", []):
-                        if output_name != "end" and output_name in node_map:
-                            # 检查目标节点是否有指向当前节点的依赖（循环依赖）
-                            target_node = node_map[output_name]
-                            if node_name not in target_node.get("output_nodes", []):
-                                depends_on[output_name].add(node_name)
-                                print(f"节点 {output_name} 依赖输出源 {node_name}")
-                else:
-                    print(f"节点 {node_name} 有handoffs参数 ({handoffs})，忽略其输出节点依赖以避免循环")
+            index = GraphIndex(graph_copy)
+            depends_on = index.depends_on
+            dependents = index.dependents
 
-            # 找出起始节点（直接连接到start且没有其他依赖，或者没有任何依赖的节点）
-            start_nodes = []
-            for node in nodes:
-                node_name = node["name"]
+            # 找出起始节点（直接连接到start且没有其他依赖的节点）
+            start_nodes = [
+                node["name"] for node in nodes
+                if "start" in node.get("input_nodes", []) and not depends_on[node["name"]]
+            ]
 
-                # 如果节点直接连接到start且没有其他实际依赖（排除start）
-                if "start" in node.get("input_nodes", []):
-                    # 检查是否只依赖"start"
-                    if not depends_on[node_name]:
-                        start_nodes.append(node_name)
-                        print(f"节点 {node_name} 是纯起始节点，仅依赖start")
-
-            # 如果没有找到纯起始节点，寻找拓扑排序的起点
             if not start_nodes:
-                # 找出没有入边的节点（没有被其他节点依赖的节点）
-                no_incoming = set()
-                for node_name in node_map:
-                    if not any(node_name in deps for deps in depends_on.values()):
-                        no_incoming.add(node_name)
-
-                if no_incoming:
-                    start_nodes = list(no_incoming)
-                    print(f"使用拓扑排序找到的起始节点: {start_nodes}")
-                else:
-                    # 如果所有节点都有依赖关系（可能存在循环），使用所有直接连接到start的节点
-                    for node in nodes:
-                        if "start" in node.get("input_nodes", []):
-                            start_nodes.append(node["name"])
-                            print(f"图可能存在循环依赖，使用连接到start的节点 {node['name']} 作为起始节点")
-
-            # 如果仍然没有找到起始节点，使用任意节点作为起点
+                # 没有纯起始节点时，使用未被其他节点依赖的节点
+                start_nodes = [name for name in index.node_map if not dependents[name]]
+                if not start_nodes:
+                    # 所有节点都有依赖关系（可能存在循环），使用所有直接连接到start的节点
+                    start_nodes = [node["name"] for node in nodes if "start" in node.get("input_nodes", [])]
+                    if start_nodes:
+                        logger.debug(f"图可能存在循环依赖，使用连接到start的节点作为起始节点: {start_nodes}")
+
+            # 如果仍然没有找到起始节点，使用第一个节点作为起点
             if not start_nodes and nodes:
                 start_nodes = [nodes[0]["name"]]
-                print(f"未找到合适的起始节点，使用第一个节点 {start_nodes[0]} 作为起始点")
-
-            # 初始化所有节点的层级
-            levels = {node_name: -1 for node_name in node_map}
-
-            # 所有起始节点的层级为0
-            for node_name in start_nodes:
-                levels[node_name] = 0
-                print(f"起始节点 {node_name} 的层级设为0")
-
-            # 反复迭代，直到所有节点的层级都稳定
-            changed = True
-            max_iterations = len(nodes) * 2  # 防止无限循环
-            iteration = 0
-
-            while changed and iteration < max_iterations:
-                changed = False
-                iteration += 1
-                print(f"\n开始第 {iteration} 次迭代")
-
-                for node_name, deps in depends_on.items():
-                    old_level = levels[node_name]
 
-                    # 如果是起始节点，不更新层级
-                    if node_name in start_nodes:
+            # 按拓扑顺序计算层级：起始节点和无依赖节点层级为0，其余节点在所有依赖确定后计算
+            levels = {name: -1 for name in index.node_map}
+            start_set = set(start_nodes)
+            pending = {name: len(deps) for name, deps in depends_on.items()}
+            queue = deque()
+
+            for name, deps in depends_on.items():
+                if name in start_set or not deps:
+                    levels[name] = 0
+                    queue.append(name)
+
+            while queue:
+                name = queue.popleft()
+                for dependent in dependents[name]:
+                    if dependent in start_set:
                         continue
+                    pending[dependent] -= 1
+                    if pending[dependent] == 0:
+                        levels[dependent] = max(levels[dep] for dep in depends_on[dependent]) + 1
+                        queue.append(dependent)
+
+            # 处理因循环依赖而未被赋值的节点
+            unresolved = [name for name in levels if levels[name] < 0]
+            if unresolved:
+                cycle = index.find_cycle()
+                logger.debug(f"{len(unresolved)} 个节点未能确定层级，存在循环依赖: "
+                             f"{' -> '.join(cycle) if cycle else unresolved}")
+
+            for node_name in unresolved:
+                max_dep_level = max((levels[dep] for dep in depends_on[node_name] if levels[dep] >= 0), default=-1)
+                min_dependent_level = min(
+                    (levels[other] for other in dependents[node_name] if levels[other] >= 0), default=None
+                )
 
-                    # 计算所有依赖的最大层级
-                    max_dep_level = -1
-                    all_deps_have_level = True
-
-                    for dep in deps:
-                        if levels[dep] >= 0:
-                            max_dep_level = max(max_dep_level, levels[dep])
-                        else:
-                            all_deps_have_level = False
-
-                    # 如果所有依赖都有层级
-                    if all_deps_have_level and deps:
-                        new_level = max_dep_level + 1
-
-                        if old_level != new_level:
-                            levels[node_name] = new_level
-                            changed = True
-                            print(f"  节点 {node_name} 的层级从 {old_level} 更新为 {new_level}")
-                    elif not deps:
-                        # 如果节点没有依赖，设置为0
-                        if old_level != 0:
-                            levels[node_name] = 0
-                            changed = True
-                            print(f"  节点 {node_name} 没有依赖，层级设为0")
-
-                print(f"第 {iteration} 次迭代完成，是否有变化: {changed}")
-
-            # 处理可能因循环依赖而未被赋值的节点
-            for node_name in levels:
-                if levels[node_name] < 0:
-                    print(f"节点 {node_name} 未能确定层级，可能存在循环依赖")
-
-                    # 找出所有依赖节点的最大层级和所有被依赖节点的最小层级
-                    max_dep_level = -1
-                    min_dependent_level = float('inf')
-
-                    # 检查依赖
-                    for dep in depends_on[node_name]:
-                        if levels[dep] >= 0:
-                            max_dep_level = max(max_dep_level, levels[dep])
-
-                    # 检查被依赖
-                    for other_name, deps in depends_on.items():
-                        if node_name in deps and levels[other_name] >= 0:
-                            min_dependent_level = min(min_dependent_level, levels[other_name])
-
-                    if max_dep_level >= 0:
-                        # 如果有已知层级的依赖，层级为最大依赖层级+1
-                        levels[node_name] = max_dep_level + 1
-                        print(f"  基于依赖设置循环节点 {node_name} 的层级为 {levels[node_name]}")
-                    elif min_dependent_level < float('inf'):
-                        # 如果有已知层级的被依赖节点，层级为最小被依赖层级-1
-                        levels[node_name] = max(0, min_dependent_level - 1)
-                        print(f"  基于被依赖设置循环节点 {node_name} 的层级为 {levels[node_name]}")
-                    else:
-                        # 如果都未知，检查节点是否有handoffs参数
-                        node = node_map[node_name]
-                        if node.get("handoffs") is not None:
-                            # handoffs节点尽量放在较低层级，让它的输出节点先执行
-                            levels[node_name] = 1
-                            print(f"  节点 {node_name} 有handoffs参数，设置层级为1")
-                        else:
-                            # 其他情况设为1
-                            levels[node_name] = 1
-                            print(f"  无法确定依赖关系，设置节点 {node_name} 的层级为1")
+                if max_dep_level >= 0:
+                    # 如果有已知层级的依赖，层级为最大依赖层级+1
+                    levels[node_name] = max_dep_level + 1
+                elif min_dependent_level is not None:
+                    # 如果有已知层级的被依赖节点，层级为最小被依赖层级-1
+                    levels[node_name] = max(0, min_dependent_level - 1)
+                else:
+                    # 都未知时设为1（handoffs节点尽量放在较低层级，让它的输出节点先执行）
+                    levels[node_name] = 1
 
             # 更新节点层级
             for node in nodes:
-                node_name = node["name"]
-                node["level"] = levels[node_name]
-
-            # 打印最终层级
-            print("\n最终节点层级:")
-            for node in nodes:
-                print(f"  节点 {node['name']}: 层级 {node['level']}")
+                node["level"] = levels[node["name"]]
 
+            logger.debug(f"节点层级计算完成，共 {len(nodes)} 个节点，最大层级 {max(levels.values(), default=0)}")
             return graph_copy
         except Exception as e:
-            import traceback
-            print(f"计算节点层级时出错: {str(e)}")
-            print(traceback.format_exc())
+            logger.error(f"计算节点层级时出错: {str(e)}", exc_info=True)
 
             # 出错时，为所有节点设置默认层级
             for node in graph_config.get("nodes", []):
@@ -23,7 +23,7 @@ class GraphService:
     """图执行服务"""
 
     def __init__(self):
-        self.processor = GraphProcessor(self.get_graph)
+        self.processor = GraphProcessor(self.get_graph, mongodb_client.get_graph_config_update_times)
         self.conversation_manager = ConversationManager()
         self.executor = GraphExecutor(self.conversation_manager, mcp_service)
         self.background_executor = BackgroundExecutor(self.conversation_manager, mcp_service)
@@ -173,21 +173,11 @@ class GraphService:
 
         logger.info(f"发现提示词引用: {list(all_prompt_refs)}")
 
-        # 批量获取所有提示词内容
-        prompt_contents = {}
-        for prompt_name in all_prompt_refs:
-            try:
-                # 使用 prompt_service 获取提示词
-                result = await prompt_service.get_prompt_content_only(prompt_name, user_id)
-                if result["success"] and result.get("data"):
-                    prompt_contents[prompt_name] = result["data"]["content"]
-                    logger.info(f"成功获取提示词: {prompt_name}")
-                else:
-                    prompt_contents[prompt_name] = ""
-                    logger.warning(f"提示词不存在，使用空内容: {prompt_name}")
-            except Exception as e:
-                prompt_contents[prompt_name] = ""
-                logger.error(f"获取提示词失败，使用空内容: {prompt_name}, 错误: {str(e)}")
+        # 批量获取所有提示词内容（优先使用缓存，未命中的提示词一次查询获取）
+        prompt_contents = await prompt_service.get_prompt_contents(list(all_prompt_refs), user_id)
+        missing_prompts = all_prompt_refs - prompt_contents.keys()
+        if missing_prompts:
+            logger.warning(f"提示词不存在，使用空内容: {sorted(missing_prompts)}")
 
         # 定义替换函数
         def replace_prompt_refs(text: str) -> str:
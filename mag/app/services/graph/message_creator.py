@@ -35,26 +35,22 @@ class MessageCreator:
         if conversation_id:
             conversation = await self.conversation_manager.get_conversation(conversation_id)
 
-        # 导入模板处理器
-        from app.utils.output_tools import GraphPromptTemplate
-        template_processor = GraphPromptTemplate()
-
         # 获取全局输出历史
         global_outputs = {}
         if conversation:
             global_outputs = conversation.get("global_outputs", {})
 
-        # 处理 system prompt
-        system_prompt = node.get("system_prompt", "")
-        if system_prompt:
-            system_prompt = template_processor.render_template(system_prompt, global_outputs)
-            messages.append({"role": "system", "content": system_prompt})
-
-        # 处理 user prompt
-        user_prompt = node.get("user_prompt", "")
-        if user_prompt:
-            user_prompt = template_processor.render_template(user_prompt, global_outputs)
-            messages.append({"role": "user", "content": user_prompt})
+        # 处理 system prompt 和 user prompt（模板按会话缓存编译结果）
+        for role, key in (("system", "system_prompt"), ("user", "user_prompt")):
+            prompt = node.get(key, "")
+            if not prompt:
+                continue
+            if conversation:
+                compiled = self.conversation_manager.get_compiled_template(conversation, prompt)
+            else:
+                from app.utils.output_tools import GraphPromptTemplate
+                compiled = GraphPromptTemplate().compile(prompt)
+            messages.append({"role": role, "content": compiled.render(global_outputs)})
 
         return messages
 
@@ -86,23 +82,22 @@ class MessageCreator:
                     "role": "user",
                     "content": input_text
                 }
-            ]
+            ],
+            "tools": []
         }
+        kept_count = len(conversation["rounds"])
         conversation["rounds"].append(start_round)
 
-        # 保存到数据库
-        from app.infrastructure.database.mongodb import mongodb_client
-        await mongodb_client.add_round_to_graph_run(
-            conversation_id=conversation_id,
-            round_data=start_round,
-            tools_schema=[]
-        )
-        await mongodb_client.update_graph_run_global_outputs(conversation_id, "start", input_text)
-
         # 更新全局输出
         if "global_outputs" not in conversation:
             conversation["global_outputs"] = {}
         if "start" not in conversation["global_outputs"]:
             conversation["global_outputs"]["start"] = []
 
-        conversation["global_outputs"]["start"].append(input_text)
\ No newline at end of file
+        conversation["global_outputs"]["start"].append(input_text)
+
+        # 保存到数据库：删除被重置的轮次并追加 start 轮次，再整体同步运行起始状态（执行链等），之后每个节点只写入增量
+        from app.infrastructure.database.mongodb import mongodb_client
+        await mongodb_client.truncate_graph_run_rounds(conversation_id, kept_count)
+        await mongodb_client.add_round_to_graph_run(conversation_id, start_round, [], seq=kept_count + 1)
+        await self.conversation_manager.update_conversation_file(conversation_id)
@@ -1,7 +1,6 @@
 """节点执行核心类 - 提供图节点执行的核心逻辑"""
 import json
 import logging
-import copy
 from typing import Dict, List, Any, AsyncGenerator
 from app.services.model.model_service import model_service
 from app.services.graph.handoffs_manager import HandoffsManager
@@ -54,22 +53,45 @@ class NodeExecutorCore:
 
             node_name = node["name"]
             node_level = node.get("level", 0)
-            
+
+            # 检查图运行预算，超限后跳过后续节点
+            run_budget = self.conversation_manager.get_run_budget(conversation)
+            if run_budget is None:
+                run_budget = await self.conversation_manager.start_run_budget(conversation_id, actual_user_id)
+            if run_budget.is_exceeded():
+                logger.warning(f"运行预算已超限，跳过节点 '{node_name}'")
+                self.conversation_manager.record_budget_termination(conversation)
+                yield {
+                    "success": False,
+                    "budget_exceeded": True,
+                    "has_handoffs": False,
+                    "selected_node": None,
+                    "final_output": ""
+                }
+                return
+
             conversation["_current_round"] += 1
             current_round = conversation["_current_round"]
 
             output_enabled = node.get("output_enabled", True)
 
-            # 2. 加载有效配置（智能合并 Agent 配置和 Node 配置）
-            effective_config = await self.agent_stream_executor._load_effective_config(
-                agent_name=node.get("agent_name"),
-                user_id=actual_user_id,
-                model_name=node.get("model_name"),
-                system_prompt=node.get("system_prompt"),
-                mcp_servers=node.get("mcp_servers"),
-                system_tools=node.get("system_tools"),
-                max_iterations=node.get("max_iterations")
-            )
+            # 2. 加载有效配置（优先使用运行开始时加载的配置快照，避免每个节点查询一次数据库）
+            config_snapshot = self.conversation_manager.get_config_snapshot(conversation)
+            if config_snapshot is None:
+                config_snapshot = await self.conversation_manager.start_config_snapshot(conversation_id, actual_user_id)
+            agent_name = node.get("agent_name")
+            if config_snapshot and (not agent_name or config_snapshot.contains(agent_name)):
+                effective_config = config_snapshot.resolve(node)
+            else:
+                effective_config = await self.agent_stream_executor._load_effective_config(
+                    agent_name=agent_name,
+                    user_id=actual_user_id,
+                    model_name=node.get("model_name"),
+                    system_prompt=node.get("system_prompt"),
+                    mcp_servers=node.get("mcp_servers"),
+                    system_tools=node.get("system_tools"),
+                    max_iterations=node.get("max_iterations")
+                )
 
             if not effective_config:
                 raise Exception(f"无法加载节点 '{node_name}' 的有效配置")
@@ -80,10 +102,11 @@ class NodeExecutorCore:
             mcp_servers = effective_config["mcp_servers"]
             system_tools = effective_config["system_tools"]
             max_iterations = effective_config["max_iterations"]
+            agent_budget = effective_config.get("budget")
 
             # 3. 创建消息列表
-            node_copy = copy.deepcopy(node)
-            node_copy["_conversation_id"] = conversation_id
+            # 消息创建只读取节点配置，浅拷贝即可
+            node_copy = {**node, "_conversation_id": conversation_id}
             conversation_messages = await self.message_creator.create_agent_messages(node_copy)
 
             # 4. 准备工具列表
@@ -111,6 +134,9 @@ class NodeExecutorCore:
             selected_node = None
             assistant_final_output = ""
             tool_results_content = []
+            termination = None
+            # 随节点结果一并写入数据库的字段
+            persist_fields = {}
 
             # 调用 Agent 执行器
             async for item in self.agent_stream_executor.run_agent_loop(
@@ -123,7 +149,9 @@ class NodeExecutorCore:
                 user_id=actual_user_id,
                 conversation_id=conversation_id,
                 task_id=None,
-                is_graph_node=True
+                is_graph_node=True,
+                budget_limits=agent_budget,
+                parent_budget=run_budget
             ):
                 if isinstance(item, str):
                     # SSE 事件，直接转发
@@ -133,9 +161,10 @@ class NodeExecutorCore:
                     # 结果字典
                     round_messages = item.get("round_messages", [])
                     node_token_usage = item.get("round_token_usage", {})
+                    termination = item.get("termination")
 
-            # 6. 检查是否有 handoffs 选择
-            for msg in round_messages:
+            # 6. 检查是否有 handoffs 选择（预算超限提前终止时，未执行的 handoffs 调用不生效）
+            for msg in ([] if termination else round_messages):
                 if msg.get("role") == "assistant" and msg.get("tool_calls"):
                     for tool_call in msg["tool_calls"]:
                         tool_name = tool_call["function"]["name"]
@@ -152,10 +181,11 @@ class NodeExecutorCore:
                                         conversation_id, node_name
                                     )
                                     current_count = handoffs_status.get("used_count", 0)
-                                    await self.conversation_manager.update_handoffs_status(
-                                        conversation_id, node_name, handoffs_limit, 
-                                        current_count + 1, selected_node
+                                    handoffs_data = await self.conversation_manager.update_handoffs_status(
+                                        conversation_id, node_name, handoffs_limit,
+                                        current_count + 1, selected_node, persist=False
                                     )
+                                    persist_fields[f"handoffs_status.{node_name}"] = handoffs_data
                                 break
                     if has_handoffs:
                         break
@@ -189,49 +219,57 @@ class NodeExecutorCore:
             }
             if mcp_servers:
                 round_data["mcp_servers"] = mcp_servers
+            if termination:
+                round_data["termination"] = termination
 
             conversation["rounds"].append(round_data)
+            round_seq = len(conversation["rounds"])
 
-            from app.infrastructure.database.mongodb import mongodb_client
-            await mongodb_client.add_round_to_graph_run(
-                conversation_id=conversation_id,
-                round_data=round_data,
-                tools_schema=all_tools
-            )
-
-            # 10. 更新token使用量
-            if node_token_usage["total_tokens"] > 0:
-                await mongodb_client.conversation_repository.update_conversation_token_usage(
-                    conversation_id=conversation_id,
-                    prompt_tokens=node_token_usage["prompt_tokens"],
-                    completion_tokens=node_token_usage["completion_tokens"]
-                )
-                logger.info(f"节点 '{node_name}' token使用量: {node_token_usage}")
-
-            # 11. 保存全局输出
+            # 10. 保存全局输出（仅内存，随节点结果一并写入）
+            global_output = None
             if output_enabled and final_output:
-                await self.conversation_manager._add_global_output(
-                    conversation_id, node_name, final_output
-                )
+                global_output = (node_name, final_output)
             elif not output_enabled and tool_results_content:
-                tool_output = "\n".join(tool_results_content)
+                global_output = (node_name, "\n".join(tool_results_content))
+            if global_output:
                 await self.conversation_manager._add_global_output(
-                    conversation_id, node_name, tool_output
+                    conversation_id, node_name, global_output[1], persist=False
                 )
 
+            # 11. 记录图运行预算超限的终止状态
+            self.conversation_manager.record_budget_termination(conversation)
+            if conversation.get("termination"):
+                persist_fields["termination"] = conversation["termination"]
+
             # 12. 更新执行链
             from app.services.graph.execution_chain_manager import ExecutionChainManager
-            await ExecutionChainManager.update_execution_chain(conversation)
+            persist_fields.update(ExecutionChainManager.update_execution_chain(conversation))
 
-            # 13. 保存会话文件
-            await self.conversation_manager.update_conversation_file(conversation_id)
+            # 13. 一次写入本节点的轮次、全局输出、执行链、handoffs状态和token使用量
+            from app.infrastructure.database.mongodb import mongodb_client
+            saved = await mongodb_client.save_graph_run_node_completion(
+                conversation_id=conversation_id,
+                round_data=round_data,
+                seq=round_seq,
+                tools_schema=all_tools,
+                global_output=global_output,
+                set_fields=persist_fields,
+                token_usage=node_token_usage
+            )
+            if not saved:
+                # 内存中的会话状态已领先于数据库，丢弃后由下次访问从数据库重新加载
+                self.conversation_manager.discard_conversation_state(conversation_id)
+                raise RuntimeError(f"保存节点 '{node_name}' 的执行结果失败，已停止执行")
+            if node_token_usage["total_tokens"] > 0:
+                logger.info(f"节点 '{node_name}' token使用量: {node_token_usage}")
 
             # 返回执行结果
             yield {
                 "success": True,
                 "has_handoffs": has_handoffs,
                 "selected_node": selected_node,
-                "final_output": final_output
+                "final_output": final_output,
+                "budget_exceeded": run_budget.is_exceeded()
             }
 
         except Exception as e:
@@ -0,0 +1,206 @@
+import asyncio
+import itertools
+import json
+import logging
+import time
+import aiohttp
+from typing import Dict, Any, Optional, Callable, List, Awaitable
+
+logger = logging.getLogger(__name__)
+
+
+class MCPChannelError(Exception):
+    """通道请求返回的错误（对应原 HTTP 接口的错误状态码）"""
+
+    def __init__(self, status: int, detail: Any):
+        self.status = status
+        self.detail = detail
+        super().__init__(f"{status} {detail}")
+
+
+class MCPChannelUnavailable(ConnectionError):
+    """通道不可用且请求尚未发出（调用方可安全地改用HTTP重试）"""
+
+
+class MCPClientChannel:
+    """与MCP Client进程之间的长连接多路复用通道
+
+    基于单条 WebSocket 长连接：每个请求携带自增 id，多个请求可同时在途，
+    响应按 id 匹配；客户端主动推送的状态事件（如 server_status）会更新本地缓存并通知订阅者。
+    连接断开后下一次请求时自动重连。
+    """
+
+    def __init__(self, client_url: str = "http://127.0.0.1:8765", request_timeout: float = 300,
+                 reconnect_interval: float = 5):
+        self.client_url = client_url
+        self.channel_url = client_url.replace("http://", "ws://").replace("https://", "wss://") + "/channel"
+        self.request_timeout = request_timeout
+        self.reconnect_interval = reconnect_interval
+        self._next_connect_at = 0.0
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._connect_lock = asyncio.Lock()
+        self._send_lock = asyncio.Lock()
+        self._request_ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._progress_handlers: Dict[int, Callable[[Dict[str, Any]], None]] = {}
+        self._listeners: List[Callable[[str, Any], Awaitable[None] | None]] = []
+
+        # 最近一次推送的服务器状态（通道断开时失效）
+        self.server_status: Optional[Dict[str, Dict[str, Any]]] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._ws is not None and not self._ws.closed
+
+    def add_listener(self, callback: Callable[[str, Any], Awaitable[None] | None]):
+        """订阅客户端推送的事件，回调参数为 (event, data)"""
+        self._listeners.append(callback)
+
+    async def connect(self) -> bool:
+        """建立通道连接（已连接时直接返回）"""
+        if self.connected:
+            return True
+
+        async with self._connect_lock:
+            if self.connected:
+                return True
+            # 连接失败后短时间内不再重试，避免每个请求都付出一次握手失败的开销
+            if time.monotonic() < self._next_connect_at:
+                return False
+            try:
+                if self._session is None or self._session.closed:
+                    self._session = aiohttp.ClientSession()
+                self._ws = await self._session.ws_connect(
+                    self.channel_url,
+                    heartbeat=30,
+                    max_msg_size=0
+                )
+                self._reader_task = asyncio.create_task(self._read_loop(self._ws))
+                logger.info(f"已建立MCP Client多路复用通道: {self.channel_url}")
+                return True
+            except Exception as e:
+                logger.warning(f"建立MCP Client通道失败: {str(e)}")
+                self._ws = None
+                self._next_connect_at = time.monotonic() + self.reconnect_interval
+                return False
+
+    async def request(self, method: str, params: Optional[Dict[str, Any]] = None,
+                      timeout: Optional[float] = None,
+                      on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Any:
+        """发送请求并等待对应 id 的响应
+
+        Args:
+            on_progress: 中间进度回调（客户端在响应之前推送的 progress 消息）
+
+        Raises:
+            MCPChannelUnavailable: 通道不可用，请求未发出
+            ConnectionError: 请求已发出但通道在等待期间断开
+            MCPChannelError: 客户端返回错误
+            asyncio.TimeoutError: 等待超时
+        """
+        if not await self.connect():
+            raise MCPChannelUnavailable("MCP Client通道不可用")
+
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        if on_progress:
+            self._progress_handlers[request_id] = on_progress
+
+        try:
+            try:
+                async with self._send_lock:
+                    await self._ws.send_str(json.dumps(
+                        {"id": request_id, "method": method, "params": params or {}},
+                        ensure_ascii=False
+                    ))
+            except (aiohttp.ClientError, ConnectionError, RuntimeError, AttributeError) as e:
+                raise MCPChannelUnavailable(f"MCP Client通道发送失败: {str(e)}")
+            return await asyncio.wait_for(future, timeout or self.request_timeout)
+        finally:
+            self._pending.pop(request_id, None)
+            self._progress_handlers.pop(request_id, None)
+
+    async def _read_loop(self, ws: aiohttp.ClientWebSocketResponse):
+        """读取响应与推送事件"""
+        try:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    if msg.type == aiohttp.WSMsgType.ERROR:
+                        logger.warning(f"MCP Client通道错误: {ws.exception()}")
+                    continue
+
+                try:
+                    message = json.loads(msg.data)
+                except json.JSONDecodeError:
+                    logger.warning("忽略无法解析的通道消息")
+                    continue
+
+                if "event" in message:
+                    await self._handle_event(message["event"], message.get("data"))
+                    continue
+
+                if "progress" in message:
+                    handler = self._progress_handlers.get(message.get("id"))
+                    if handler:
+                        try:
+                            handler(message["progress"])
+                        except Exception as e:
+                            logger.warning(f"处理进度消息时出错: {str(e)}")
+                    continue
+
+                future = self._pending.get(message.get("id"))
+                if future is None or future.done():
+                    continue
+                if "error" in message:
+                    error = message["error"] or {}
+                    future.set_exception(MCPChannelError(error.get("status", 500), error.get("detail")))
+                else:
+                    future.set_result(message.get("result"))
+
+        except Exception as e:
+            logger.warning(f"MCP Client通道读取中断: {str(e)}")
+        finally:
+            self._on_disconnected(ws)
+
+    async def _handle_event(self, event: str, data: Any):
+        if event == "server_status":
+            self.server_status = data
+
+        for callback in list(self._listeners):
+            try:
+                result = callback(event, data)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.error(f"处理通道事件 '{event}' 时出错: {str(e)}")
+
+    def _on_disconnected(self, ws: aiohttp.ClientWebSocketResponse):
+        """连接断开：失效缓存并让所有在途请求失败"""
+        if self._ws is ws:
+            self._ws = None
+        self.server_status = None
+
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("MCP Client通道已断开"))
+        logger.info("MCP Client多路复用通道已断开")
+
+    async def close(self):
+        """关闭通道"""
+        if self._ws is not None and not self._ws.closed:
+            await self._ws.close()
+        if self._reader_task:
+            try:
+                await asyncio.wait_for(self._reader_task, 5)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+            self._reader_task = None
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._ws = None
+        self.server_status = None
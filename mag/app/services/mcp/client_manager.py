@@ -5,34 +5,83 @@ import platform
 import signal
 import subprocess
 import sys
+import time
 import aiohttp
 from app.core.config import settings
 from app.infrastructure.database.mongodb import mongodb_client
-from typing import Dict, Any
+from app.services.mcp.shard_router import MCPShardRouter
+from typing import Dict, Any, List, Optional
 
 logger = logging.getLogger(__name__)
 
 
 class MCPClientManager:
-    """MCP客户端管理器 - 专门负责客户端进程的生命周期管理"""
-
-    def __init__(self):
-        self.client_process = None
-        self.client_url = "http://127.0.0.1:8765"
+    """MCP客户端管理器 - 专门负责客户端进程的生命周期管理
+
+    可按 MCP_CLIENT_WORKERS 启动多个 MCP Client 工作进程（端口从 MCP_CLIENT_BASE_PORT 递增），
+    每个进程只加载一致性哈希分配给它的服务器配置。
+    """
+
+    def __init__(self, worker_count: Optional[int] = None, base_port: Optional[int] = None):
+        self.worker_count = max(int(worker_count or settings.MCP_CLIENT_WORKERS or 1), 1)
+        base_port = base_port or settings.MCP_CLIENT_BASE_PORT
+        self.client_urls: List[str] = [f"http://127.0.0.1:{base_port + i}" for i in range(self.worker_count)]
+        self.client_url = self.client_urls[0]
+        self.client_processes: List[Optional[subprocess.Popen]] = [None] * self.worker_count
+        self.router = MCPShardRouter(self.worker_count)
         self.client_started = False
         self.startup_retries = 5
         self.retry_delay = 1
+        self._session = None
+        # 启动就绪探测：从 50ms 开始指数增长，最长间隔 1 秒，总等待上限 30 秒
+        self.startup_probe_initial_delay = 0.05
+        self.startup_probe_max_delay = 1.0
+        self.startup_timeout = 30
+        # 各工作进程最近一次从启动进程到可以响应请求的耗时
+        self.startup_seconds: List[Optional[float]] = [None] * self.worker_count
+
+    @property
+    def client_process(self) -> Optional[subprocess.Popen]:
+        """第一个工作进程（兼容单进程用法）"""
+        return self.client_processes[0]
+
+    @client_process.setter
+    def client_process(self, process: Optional[subprocess.Popen]):
+        self.client_processes[0] = process
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """获取复用的aiohttp会话（keep-alive，避免每次检查/通知都重新建立连接）"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        return self._session
 
     async def initialize(self, config: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
-        """初始化MCP客户端进程"""
+        """初始化MCP客户端进程（多个工作进程并发启动）"""
         try:
-            if await self._check_existing_client():
-                self.client_started = True
-                logger.info("发现现有MCP Client已在运行")
-                await self._notify_config_change(config)
-                return {"status": {"message": "MCP Client已连接"}}
+            results = await asyncio.gather(
+                *(self._initialize_worker(index) for index in range(self.worker_count)),
+                return_exceptions=True
+            )
+
+            failed_workers = []
+            for index, result in enumerate(results):
+                if isinstance(result, Exception):
+                    logger.error(f"启动MCP Client工作进程 {index} 时出错: {str(result)}")
+                    failed_workers.append(index)
+                elif not result:
+                    failed_workers.append(index)
+
+            if len(failed_workers) == self.worker_count:
+                return {"status": {"error": "MCP Client启动失败，请检查日志文件"}}
 
-            return await self._start_new_client(config)
+            # 部分工作进程启动失败时，仅分配到这些进程的服务器不可用
+            self.client_started = True
+            await self._notify_config_change(config)
+
+            if failed_workers:
+                return {"status": {"warning": f"MCP Client工作进程 {failed_workers} 启动失败，请检查日志文件"}}
+            return {"status": {"message": f"MCP Client已启动（{self.worker_count} 个工作进程）"
+                               if self.worker_count > 1 else "MCP Client已启动"}}
 
         except Exception as e:
             logger.error(f"启动MCP Client进程时出错: {str(e)}")
@@ -40,99 +89,118 @@ class MCPClientManager:
             traceback.print_exc()
             return {"status": {"error": f"启动失败: {str(e)}"}}
 
-    async def _check_existing_client(self) -> bool:
+    async def _initialize_worker(self, index: int) -> bool:
+        """连接已在运行的工作进程，或启动新的工作进程"""
+        if await self._check_existing_client(index):
+            logger.info(f"发现现有MCP Client已在运行: {self.client_urls[index]}")
+            return True
+        return await self._start_new_client(index)
+
+    async def _check_existing_client(self, index: int = 0) -> bool:
         """检查是否已有客户端进程在运行"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.client_url}/") as response:
-                    if response.status == 200:
-                        return True
-        except (aiohttp.ClientError, ConnectionError):
+            session = await self._get_session()
+            async with session.get(f"{self.client_urls[index]}/") as response:
+                if response.status == 200:
+                    return True
+        except (aiohttp.ClientError, ConnectionError, asyncio.TimeoutError):
             pass
         return False
 
-    async def _start_new_client(self, config: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    async def _start_new_client(self, index: int = 0) -> bool:
         """启动新的客户端进程"""
         script_dir = os.path.dirname(os.path.abspath(__file__))
         project_root = os.path.dirname(os.path.dirname(os.path.dirname(script_dir)))
         client_script = os.path.join(project_root, "mcp_client.py")
 
         if not os.path.exists(client_script):
-            error_msg = f"找不到MCP Client脚本: {client_script}"
-            logger.error(error_msg)
-            return {"status": {"error": error_msg}}
+            logger.error(f"找不到MCP Client脚本: {client_script}")
+            return False
 
+        port = self.client_urls[index].rsplit(":", 1)[1]
         python_executable = sys.executable
-        full_command = [python_executable, client_script]
+        full_command = [python_executable, client_script, "--port", port]
         logger.info(f"启动MCP Client，完整命令: {' '.join(full_command)}")
 
-        stdout_file = os.path.join(str(settings.MAG_DIR), "mcp_client_stdout.log")
-        stderr_file = os.path.join(str(settings.MAG_DIR), "mcp_client_stderr.log")
+        suffix = "" if index == 0 else f".{index}"
+        stdout_file = os.path.join(str(settings.MAG_DIR), f"mcp_client_stdout{suffix}.log")
+        stderr_file = os.path.join(str(settings.MAG_DIR), f"mcp_client_stderr{suffix}.log")
 
         try:
+            spawned_at = time.monotonic()
             with open(stdout_file, 'w') as stdout, open(stderr_file, 'w') as stderr:
                 system = platform.system()
                 if system == "Windows":
-                    self.client_process = subprocess.Popen(
+                    process = subprocess.Popen(
                         full_command,
                         creationflags=subprocess.CREATE_NEW_PROCESS_GROUP,
                         stdout=stdout,
                         stderr=stderr,
                     )
                 else:
-                    self.client_process = subprocess.Popen(
+                    process = subprocess.Popen(
                         full_command,
                         stdout=stdout,
                         stderr=stderr,
                         start_new_session=True
                     )
+            self.client_processes[index] = process
 
-            logger.info(f"MCP Client进程已启动，PID: {self.client_process.pid}")
-
-            if await self._wait_for_client_startup(stderr_file):
-                await self._notify_config_change(config)
-                return {"status": {"message": "MCP Client已启动"}}
-            else:
-                return {"status": {"error": "MCP Client启动失败，请检查日志文件"}}
+            logger.info(f"MCP Client进程已启动，PID: {process.pid}，端口: {port}")
+            return await self._wait_for_client_startup(index, stderr_file, spawned_at)
 
         except Exception as e:
             logger.error(f"启动客户端进程时出错: {str(e)}")
-            return {"status": {"error": f"启动失败: {str(e)}"}}
+            return False
+
+    async def _wait_for_client_startup(self, index: int, stderr_file: str, spawned_at: float) -> bool:
+        """等待客户端启动完成
 
-    async def _wait_for_client_startup(self, stderr_file: str) -> bool:
-        """等待客户端启动完成"""
-        for i in range(10):
+        以指数增长的间隔探测客户端，进程就绪后立即返回，而不是固定等待
+        """
+        process = self.client_processes[index]
+        client_url = self.client_urls[index]
+        delay = self.startup_probe_initial_delay
+        attempts = 0
+        deadline = spawned_at + self.startup_timeout
+
+        while time.monotonic() < deadline:
+            attempts += 1
             try:
-                await asyncio.sleep(2)
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(f"{self.client_url}/") as response:
-                        if response.status == 200:
-                            self.client_started = True
-                            logger.info("MCP Client进程已启动并响应")
-                            return True
-            except (aiohttp.ClientError, ConnectionError) as e:
-                logger.warning(f"尝试连接MCP Client (尝试 {i + 1}/10): {str(e)}")
-
-                # 检查进程是否仍在运行
-                if self.client_process.poll() is not None:
-                    exit_code = self.client_process.poll()
-                    logger.error(f"MCP Client进程已退出，退出代码: {exit_code}")
-
-                    # 读取错误日志
-                    try:
-                        with open(stderr_file, 'r') as f:
-                            stderr_content = f.read()
-                            if stderr_content:
-                                logger.error(f"MCP Client错误输出:\n{stderr_content}")
-                    except:
-                        pass
-                    return False
+                session = await self._get_session()
+                async with session.get(f"{client_url}/",
+                                       timeout=aiohttp.ClientTimeout(total=2)) as response:
+                    if response.status == 200:
+                        self.startup_seconds[index] = round(time.monotonic() - spawned_at, 3)
+                        logger.info(f"MCP Client进程已启动并响应（{client_url}），"
+                                    f"启动耗时 {self.startup_seconds[index]:.3f} 秒（探测 {attempts} 次）")
+                        return True
+            except (aiohttp.ClientError, ConnectionError, asyncio.TimeoutError) as e:
+                logger.debug(f"MCP Client尚未就绪 (探测 {attempts}): {str(e)}")
 
-        logger.error("无法连接到MCP Client，超过最大重试次数")
+            # 检查进程是否仍在运行
+            if process.poll() is not None:
+                exit_code = process.poll()
+                logger.error(f"MCP Client进程已退出，退出代码: {exit_code}")
+
+                # 读取错误日志
+                try:
+                    with open(stderr_file, 'r') as f:
+                        stderr_content = f.read()
+                        if stderr_content:
+                            logger.error(f"MCP Client错误输出:\n{stderr_content}")
+                except:
+                    pass
+                return False
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.startup_probe_max_delay)
+
+        logger.error(f"无法连接到MCP Client（{client_url}），{self.startup_timeout} 秒内未就绪（探测 {attempts} 次）")
         return False
 
     async def _notify_config_change(self, config: Dict[str, Any]) -> bool:
-        """通知客户端配置已更改"""
+        """通知客户端配置已更改（每个工作进程只接收分配给它的服务器）"""
         try:
             if not self.client_started:
                 logger.warning("MCP Client未启动，无法通知配置变更")
@@ -140,24 +208,38 @@ class MCPClientManager:
 
             # 只发送 mcpServers 配置，过滤掉 version 和 updated_at 等字段
             clean_config = config.get("mcpServers", config.get("config", {}).get("mcpServers", {}))
+            shards = self.router.split_servers(clean_config)
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                        f"{self.client_url}/load_config",
-                        json={"config": {"mcpServers": clean_config}}
-                ) as response:
-                    if response.status == 200:
-                        logger.info("已通知MCP Client加载新配置")
-                        return True
-                    else:
-                        text = await response.text()
-                        logger.error(f"通知MCP Client失败: {response.status} {text}")
-                        return False
+            results = await asyncio.gather(
+                *(self._notify_worker_config(index, shard) for index, shard in enumerate(shards)),
+                return_exceptions=True
+            )
+            return all(result is True for result in results)
 
         except Exception as e:
             logger.error(f"通知MCP Client时出错: {str(e)}")
             return False
 
+    async def _notify_worker_config(self, index: int, servers: Dict[str, Any]) -> bool:
+        """向单个工作进程发送配置"""
+        try:
+            session = await self._get_session()
+            async with session.post(
+                    f"{self.client_urls[index]}/load_config",
+                    json={"config": {"mcpServers": servers}}
+            ) as response:
+                if response.status == 200:
+                    logger.info(f"已通知MCP Client加载新配置（{self.client_urls[index]}，{len(servers)} 个服务器）")
+                    return True
+                else:
+                    text = await response.text()
+                    logger.error(f"通知MCP Client失败: {response.status} {text}")
+                    return False
+
+        except Exception as e:
+            logger.error(f"通知MCP Client时出错（{self.client_urls[index]}）: {str(e)}")
+            return False
+
     async def update_config(self, config: Dict[str, Any], expected_version: int) -> Dict[str, Dict[str, Any]]:
         """更新团队MCP配置并通知客户端"""
         try:
@@ -207,74 +289,99 @@ class MCPClientManager:
         if not self.client_started:
             return False
 
+        results = await asyncio.gather(
+            *(self._notify_worker_shutdown(index) for index in range(self.worker_count)),
+            return_exceptions=True
+        )
+        if all(result is True for result in results):
+            self.client_started = False
+            return True
+        return False
+
+    async def _notify_worker_shutdown(self, index: int) -> bool:
+        """通知单个工作进程优雅关闭，返回进程是否已自行退出"""
         try:
             logger.info("尝试通过HTTP API通知Client优雅关闭...")
-            async with aiohttp.ClientSession() as session:
-                async with session.post(f"{self.client_url}/shutdown", timeout=5) as response:
-                    if response.status == 200:
-                        logger.info("已成功通知Client开始关闭流程")
-                        await asyncio.sleep(3)
-
-                        # 检查进程是否已经自行退出
-                        if self.client_process and self.client_process.poll() is not None:
-                            logger.info("验证Client进程已自行退出")
-                            self.client_process = None
-                            self.client_started = False
-                            return True
-
-                        logger.info("Client进程仍在运行，将使用强制方式关闭")
-                        return False
-                    else:
-                        logger.warning(f"通知Client关闭返回异常状态码: {response.status}")
-                        return False
+            session = await self._get_session()
+            async with session.post(f"{self.client_urls[index]}/shutdown", timeout=aiohttp.ClientTimeout(total=5)) as response:
+                if response.status == 200:
+                    logger.info("已成功通知Client开始关闭流程")
+
+                    # 最多等待3秒，进程退出后立即返回
+                    process = self.client_processes[index]
+                    deadline = time.monotonic() + 3
+                    while process and process.poll() is None and time.monotonic() < deadline:
+                        await asyncio.sleep(0.1)
+
+                    # 检查进程是否已经自行退出
+                    if process and process.poll() is not None:
+                        logger.info("验证Client进程已自行退出")
+                        self.client_processes[index] = None
+                        return True
+
+                    logger.info("Client进程仍在运行，将使用强制方式关闭")
+                    return False
+                else:
+                    logger.warning(f"通知Client关闭返回异常状态码: {response.status}")
+                    return False
         except Exception as e:
             logger.error(f"通知Client关闭时出错: {str(e)}")
             return False
 
     async def cleanup(self, force=True):
         """清理客户端进程"""
-        if not self.client_process:
+        if self._session and not self._session.closed:
+            await self._session.close()
+            self._session = None
+
+        for index in range(self.worker_count):
+            self._cleanup_worker(index, force)
+
+        # 重置状态
+        self.client_started = False
+
+    def _cleanup_worker(self, index: int, force: bool):
+        """清理单个工作进程"""
+        process = self.client_processes[index]
+        if not process:
             logger.info("无需清理：Client进程不存在或已关闭")
-            self.client_started = False
             return
 
         if force:
             try:
-                logger.info(f"正在强制关闭MCP Client进程 (PID: {self.client_process.pid})...")
+                logger.info(f"正在强制关闭MCP Client进程 (PID: {process.pid})...")
                 system = platform.system()
                 if system == "Windows":
-                    os.kill(self.client_process.pid, signal.CTRL_BREAK_EVENT)
+                    os.kill(process.pid, signal.CTRL_BREAK_EVENT)
                 else:
-                    os.killpg(os.getpgid(self.client_process.pid), signal.SIGTERM)
+                    os.killpg(os.getpgid(process.pid), signal.SIGTERM)
 
                 # 等待进程终止
                 try:
-                    self.client_process.wait(timeout=5)
+                    process.wait(timeout=5)
                     logger.info("MCP Client进程已正常关闭")
                 except subprocess.TimeoutExpired:
                     logger.warning("MCP Client进程未响应，强制终止")
                     if system == "Windows":
-                        self.client_process.kill()
+                        process.kill()
                     else:
-                        os.killpg(os.getpgid(self.client_process.pid), signal.SIGKILL)
-                    self.client_process.wait()
+                        os.killpg(os.getpgid(process.pid), signal.SIGKILL)
+                    process.wait()
 
             except Exception as e:
                 logger.error(f"关闭MCP Client进程时出错: {str(e)}")
                 try:
-                    self.client_process.kill()
+                    process.kill()
                 except:
                     pass
         else:
             logger.info("跳过强制终止进程，仅重置客户端状态")
 
-        # 重置状态
-        self.client_process = None
-        self.client_started = False
+        self.client_processes[index] = None
 
     def is_client_running(self) -> bool:
         """检查客户端是否运行"""
-        return self.client_started and self.client_process is not None
+        return self.client_started and any(process is not None for process in self.client_processes)
 
     def get_client_url(self) -> str:
         """获取客户端URL"""
@@ -0,0 +1,239 @@
+"""
+MCP Client 工具调用指标
+
+MCP Client 进程内按 服务器 / 工具 统计调用次数、错误与超时次数、在途调用数，
+以及调用耗时和等待会话并发槽位的耗时直方图。快照为纯 JSON 结构，
+主应用从各工作进程抓取后可用 merge_snapshots 合并。
+"""
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+# 直方图桶上界（秒），最后一个桶为 +Inf
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120
+)
+
+
+class Histogram:
+    """固定桶直方图（非累计计数，最后一个桶为 +Inf）"""
+
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        index = len(LATENCY_BUCKETS)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "buckets": list(LATENCY_BUCKETS),
+            "counts": list(self.counts),
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "max": round(self.max, 6)
+        }
+
+
+def histogram_quantile(histogram: Dict[str, Any], quantile: float) -> Optional[float]:
+    """根据直方图快照估算分位数（取所在桶的上界，落在 +Inf 桶时返回最大值）"""
+    count = histogram.get("count", 0)
+    if not count:
+        return None
+
+    target = quantile * count
+    seen = 0
+    for bound, bucket_count in zip(histogram["buckets"], histogram["counts"]):
+        seen += bucket_count
+        if seen >= target:
+            return min(bound, histogram.get("max", bound))
+    return histogram.get("max")
+
+
+class CallMetrics:
+    """单个工具的调用指标"""
+
+    __slots__ = ("calls", "errors", "timeouts", "in_flight", "latency", "lock_wait")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self.latency = Histogram()
+        self.lock_wait = Histogram()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "in_flight": self.in_flight,
+            "latency": self.latency.snapshot(),
+            "lock_wait": self.lock_wait.snapshot()
+        }
+
+
+class CallTracker:
+    """一次工具调用的计时器
+
+    用法:
+        tracker = metrics.track(server_name, tool_name)
+        async with semaphore:
+            tracker.acquired()
+            ...
+        tracker.finish(error=..., timeout=...)
+    """
+
+    __slots__ = ("_metrics", "_started", "_acquired", "_finished")
+
+    def __init__(self, metrics: CallMetrics):
+        self._metrics = metrics
+        self._started = time.perf_counter()
+        self._acquired: Optional[float] = None
+        self._finished = False
+        metrics.in_flight += 1
+
+    def acquired(self):
+        """已获得会话并发槽位，记录等待耗时"""
+        self._acquired = time.perf_counter()
+        self._metrics.lock_wait.observe(self._acquired - self._started)
+
+    def finish(self, error: bool = False, timeout: bool = False):
+        """调用结束（重复调用无效）"""
+        if self._finished:
+            return
+        self._finished = True
+
+        metrics = self._metrics
+        metrics.in_flight -= 1
+        metrics.calls += 1
+        if error:
+            metrics.errors += 1
+        if timeout:
+            metrics.timeouts += 1
+        # 调用耗时从获得槽位开始计算，未获得槽位（如连接失败）时计入总耗时
+        metrics.latency.observe(time.perf_counter() - (self._acquired or self._started))
+
+
+class MCPMetricsRegistry:
+    """MCP Client 进程内的指标注册表"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._tools: Dict[str, Dict[str, CallMetrics]] = {}
+
+    def track(self, server_name: str, tool_name: str) -> CallTracker:
+        """开始跟踪一次工具调用"""
+        server_tools = self._tools.setdefault(server_name, {})
+        metrics = server_tools.get(tool_name)
+        if metrics is None:
+            metrics = server_tools[tool_name] = CallMetrics()
+        return CallTracker(metrics)
+
+    def remove_server(self, server_name: str):
+        """服务器从配置中删除时清除其指标"""
+        self._tools.pop(server_name, None)
+
+    def reset(self):
+        self._tools.clear()
+        self.started_at = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        导出指标快照
+
+        Returns:
+            {"started_at": ..., "servers": {server: {"totals": {...}, "tools": {tool: {...}}}}}
+        """
+        servers = {}
+        for server_name, tools in self._tools.items():
+            tool_snapshots = {tool_name: metrics.snapshot() for tool_name, metrics in tools.items()}
+            servers[server_name] = {
+                "totals": _sum_call_snapshots(tool_snapshots.values()),
+                "tools": tool_snapshots
+            }
+        return {"started_at": self.started_at, "servers": servers}
+
+
+def _sum_histograms(histograms) -> Dict[str, Any]:
+    merged = Histogram().snapshot()
+    for histogram in histograms:
+        merged["counts"] = [a + b for a, b in zip(merged["counts"], histogram["counts"])]
+        merged["count"] += histogram["count"]
+        merged["sum"] = round(merged["sum"] + histogram["sum"], 6)
+        merged["max"] = max(merged["max"], histogram["max"])
+    return merged
+
+
+def _sum_call_snapshots(snapshots) -> Dict[str, Any]:
+    snapshots = list(snapshots)
+    return {
+        "calls": sum(s["calls"] for s in snapshots),
+        "errors": sum(s["errors"] for s in snapshots),
+        "timeouts": sum(s["timeouts"] for s in snapshots),
+        "in_flight": sum(s["in_flight"] for s in snapshots),
+        "latency": _sum_histograms(s["latency"] for s in snapshots),
+        "lock_wait": _sum_histograms(s["lock_wait"] for s in snapshots)
+    }
+
+
+def merge_snapshots(snapshots: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """合并多个工作进程的指标快照（同名服务器/工具的计数与直方图相加）"""
+    tools_by_server: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+    pools: Dict[str, Any] = {}
+    for snapshot in snapshots:
+        for server_name, server in snapshot.get("servers", {}).items():
+            for tool_name, tool in server.get("tools", {}).items():
+                tools_by_server.setdefault(server_name, {}).setdefault(tool_name, []).append(tool)
+            # 每个服务器只运行在一个工作进程中，会话池状态直接保留
+            if server.get("pool") is not None:
+                pools[server_name] = server["pool"]
+
+    servers = {}
+    for server_name, tools in tools_by_server.items():
+        merged_tools = {tool_name: _sum_call_snapshots(parts) for tool_name, parts in tools.items()}
+        servers[server_name] = {
+            "totals": _sum_call_snapshots(merged_tools.values()),
+            "tools": merged_tools,
+            "pool": pools.get(server_name)
+        }
+    return {"workers": len(snapshots), "servers": servers}
+
+
+def summarize(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    """为快照中的每个服务器与工具补充错误率、平均耗时与 p50/p95 分位数"""
+    def _summary(metrics: Dict[str, Any]) -> Dict[str, Any]:
+        calls = metrics["calls"]
+        latency = metrics["latency"]
+        lock_wait = metrics["lock_wait"]
+        return {
+            **metrics,
+            "error_rate": round(metrics["errors"] / calls, 4) if calls else 0.0,
+            "latency_avg": round(latency["sum"] / latency["count"], 6) if latency["count"] else None,
+            "latency_p50": histogram_quantile(latency, 0.5),
+            "latency_p95": histogram_quantile(latency, 0.95),
+            "lock_wait_avg": round(lock_wait["sum"] / lock_wait["count"], 6) if lock_wait["count"] else None,
+            "lock_wait_p95": histogram_quantile(lock_wait, 0.95)
+        }
+
+    servers = {}
+    for server_name, server in snapshot.get("servers", {}).items():
+        servers[server_name] = {
+            **server,
+            "totals": _summary(server["totals"]),
+            "tools": {tool_name: _summary(tool) for tool_name, tool in server["tools"].items()}
+        }
+    return {**snapshot, "servers": servers}
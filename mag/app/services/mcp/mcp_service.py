@@ -20,7 +20,7 @@ class MCPService:
         if self.client_manager is None:
             self.client_manager = MCPClientManager()
         if self.server_manager is None:
-            self.server_manager = MCPServerManager(self.client_manager.client_url)
+            self.server_manager = MCPServerManager(self.client_manager.client_urls)
 
     async def initialize(self) -> Dict[str, Dict[str, Any]]:
         """初始化团队MCP服务，启动客户端进程
@@ -39,9 +39,27 @@ class MCPService:
         self._ensure_managers()
         result = await self.client_manager.initialize(config)
 
+        # 预先建立多路复用通道以接收服务器状态推送（失败时后续请求自动回退到HTTP）
+        if self.client_manager.client_started:
+            await self.server_manager.connect_channels()
+
+        # 上次运行中未准备完成的AI生成工具环境在后台继续准备
+        self._resume_tool_env_provisioning(config)
+
         logger.info("团队MCP服务初始化成功")
         return result
 
+    def _resume_tool_env_provisioning(self, config: Dict[str, Any]):
+        """为已注册但运行环境未就绪的AI生成工具重新准备环境"""
+        from app.infrastructure.storage.file_storage import FileManager
+        from app.services.mcp.tool_env_provisioner import tool_env_provisioner
+
+        for server_name in config.get("mcpServers", {}):
+            if not FileManager.get_mcp_tool_env_ref(server_name):
+                continue
+            if FileManager.get_mcp_tool_env_status(server_name).get("status") != "ready":
+                tool_env_provisioner.provision(server_name, on_ready=self.connect_server)
+
     async def _get_session(self):
         """获取或创建aiohttp会话"""
         self._ensure_managers()
@@ -157,6 +175,18 @@ class MCPService:
             return {"status": "error", "error": "MCP Client未启动"}
         return await self.server_manager.disconnect_server(server_name)
 
+    async def get_metrics(self) -> Dict[str, Any]:
+        """获取MCP工具调用指标（按服务器/工具汇总所有工作进程）
+
+        Returns:
+            Dict[str, Any]: {"workers": n, "servers": {server: {"totals", "tools", "pool"}}}
+        """
+        self._ensure_managers()
+        if not self.client_manager.client_started:
+            return {"workers": 0, "servers": {}}
+
+        return await self.server_manager.get_metrics()
+
     async def get_all_tools(self) -> Dict[str, List[Dict[str, Any]]]:
         """获取所有可用工具的信息
 
@@ -221,8 +251,8 @@ class MCPService:
                     current_config = current_config_data.get("config", {"mcpServers": {}})
                     current_version = current_config_data.get("version", 1)
 
-                    # 获取虚拟环境Python解释器和主脚本路径
-                    venv_python = FileManager.get_mcp_tool_venv_python(tool_name)
+                    # 获取虚拟环境Python解释器和主脚本路径（共享环境可能仍在后台准备）
+                    venv_python = FileManager.get_mcp_tool_venv_python(tool_name, must_exist=False)
                     main_script = FileManager.get_mcp_tool_main_script(tool_name)
 
                     if not venv_python or not main_script:
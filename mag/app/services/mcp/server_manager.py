@@ -1,18 +1,38 @@
 import asyncio
 import logging
 import aiohttp
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Set, Union, Callable
+from app.services.mcp.client_channel import MCPClientChannel, MCPChannelError, MCPChannelUnavailable
+from app.services.mcp.shard_router import MCPShardRouter
+from app.services.mcp.client_metrics import merge_snapshots, summarize
 
 logger = logging.getLogger(__name__)
 
+# 批量连接时，在服务器自身握手超时之外额外等待的时间（覆盖进程启动与会话池初始化）
+CONNECT_WAIT_GRACE_SECONDS = 5
+
 
 class MCPServerManager:
-    """MCP服务器管理器 - 专门负责服务器连接管理"""
+    """MCP服务器管理器 - 专门负责服务器连接管理
+
+    存在多个 MCP Client 工作进程时，针对单个服务器的请求按一致性哈希路由到其所在进程，
+    状态与工具列表等全局请求汇总所有进程的结果。
+    """
 
-    def __init__(self, client_url: str = "http://127.0.0.1:8765"):
-        self.client_url = client_url
+    def __init__(self, client_url: Union[str, List[str]] = "http://127.0.0.1:8765"):
+        self.client_urls = [client_url] if isinstance(client_url, str) else list(client_url)
+        self.client_url = self.client_urls[0]
+        self.router = MCPShardRouter(len(self.client_urls))
         self._session = None
         self._connection_locks: Dict[str, asyncio.Lock] = {}
+        self._connect_tasks: Set[asyncio.Task] = set()
+
+        # 与每个MCP Client工作进程之间的多路复用通道，不可用时回退到HTTP
+        self.channels = [MCPClientChannel(url) for url in self.client_urls]
+        for channel in self.channels:
+            channel.add_listener(self._on_channel_event)
+        self.channel = self.channels[0]
+        self._tools_cache: Optional[Dict[str, List[Dict[str, Any]]]] = None
 
     async def _get_session(self):
         """获取或创建aiohttp会话"""
@@ -20,6 +40,62 @@ class MCPServerManager:
             self._session = aiohttp.ClientSession()
         return self._session
 
+    def _on_channel_event(self, event: str, data: Any):
+        """服务器状态变化时失效工具缓存"""
+        if event == "server_status":
+            self._tools_cache = None
+
+    def _all_channels_connected(self) -> bool:
+        return all(channel.connected for channel in self.channels)
+
+    async def connect_channels(self):
+        """建立到所有工作进程的多路复用通道"""
+        await asyncio.gather(*(channel.connect() for channel in self.channels), return_exceptions=True)
+
+    async def _request(self, method: str, http_method: str, path: str,
+                       payload: Optional[Dict[str, Any]] = None, worker: int = 0,
+                       on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Any:
+        """向MCP Client发送请求：优先使用多路复用通道，通道不可用时回退到HTTP
+
+        Args:
+            worker: 目标工作进程序号
+            on_progress: 中间进度回调（仅通道支持，HTTP回退时不推送进度）
+
+        Raises:
+            MCPChannelError: MCP Client返回错误状态
+        """
+        try:
+            return await self.channels[worker].request(method, payload, on_progress=on_progress)
+        except MCPChannelUnavailable:
+            pass
+
+        session = await self._get_session()
+        async with session.request(http_method, f"{self.client_urls[worker]}{path}", json=payload) as response:
+            if response.status == 200:
+                return await response.json()
+            raise MCPChannelError(response.status, await response.text())
+
+    async def _request_server(self, server_name: str, method: str, http_method: str, path: str,
+                              payload: Optional[Dict[str, Any]] = None,
+                              on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Any:
+        """向服务器所在的工作进程发送请求"""
+        return await self._request(method, http_method, path, payload,
+                                   worker=self.router.get_worker(server_name), on_progress=on_progress)
+
+    async def _request_all(self, method: str, http_method: str, path: str) -> List[Any]:
+        """向所有工作进程发送请求，返回成功的结果（单个进程异常不影响其他分片）"""
+        results = await asyncio.gather(
+            *(self._request(method, http_method, path, worker=index) for index in range(len(self.channels))),
+            return_exceptions=True
+        )
+        succeeded = []
+        for index, result in enumerate(results):
+            if isinstance(result, Exception):
+                logger.error(f"请求MCP Client工作进程 {self.client_urls[index]} 失败: {str(result)}")
+            else:
+                succeeded.append(result)
+        return succeeded
+
     def _get_connection_lock(self, server_name: str) -> asyncio.Lock:
         """获取服务器连接锁"""
         if server_name not in self._connection_locks:
@@ -28,15 +104,22 @@ class MCPServerManager:
 
     async def get_server_status(self) -> Dict[str, Dict[str, Any]]:
         """获取所有服务器的状态"""
+        # 通道在线时使用客户端推送的最新状态，无需往返
+        if self._all_channels_connected() and all(c.server_status is not None for c in self.channels):
+            merged = {}
+            for channel in self.channels:
+                merged.update(channel.server_status)
+            return merged
+
         try:
-            session = await self._get_session()
-            async with session.get(f"{self.client_url}/servers") as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    logger.error(f"获取服务器状态失败: {response.status} {await response.text()}")
-                    return {}
+            merged = {}
+            for status in await self._request_all("servers", "GET", "/servers"):
+                merged.update(status)
+            return merged
 
+        except MCPChannelError as e:
+            logger.error(f"获取服务器状态失败: {e.status} {e.detail}")
+            return {}
         except Exception as e:
             logger.error(f"获取服务器状态时出错: {str(e)}")
             return {}
@@ -45,12 +128,14 @@ class MCPServerManager:
         """获取所有服务器的状态"""
         try:
             import requests
-            response = requests.get(f"{self.client_url}/servers")
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logger.error(f"获取服务器状态失败: {response.status_code} {response.text}")
-                return {}
+            merged = {}
+            for client_url in self.client_urls:
+                response = requests.get(f"{client_url}/servers")
+                if response.status_code == 200:
+                    merged.update(response.json())
+                else:
+                    logger.error(f"获取服务器状态失败: {response.status_code} {response.text}")
+            return merged
 
         except Exception as e:
             logger.error(f"获取服务器状态时出错: {str(e)}")
@@ -59,19 +144,14 @@ class MCPServerManager:
     async def _connect_server_internal(self, server_name: str) -> Dict[str, Any]:
         """内部连接方法"""
         try:
-            session = await self._get_session()
-            async with session.post(
-                    f"{self.client_url}/connect_server",
-                    json={"server_name": server_name}
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    logger.info(f"服务器 '{server_name}' 连接成功")
-                    return result
-                else:
-                    error_text = await response.text()
-                    logger.error(f"连接服务器失败: {response.status} {error_text}")
-                    return {"status": "error", "error": error_text}
+            result = await self._request_server(
+                server_name, "connect_server", "POST", "/connect_server", {"server_name": server_name}
+            )
+            logger.info(f"服务器 '{server_name}' 连接成功")
+            return result
+        except MCPChannelError as e:
+            logger.error(f"连接服务器失败: {e.status} {e.detail}")
+            return {"status": "error", "error": str(e.detail)}
         except Exception as e:
             logger.error(f"连接服务器时出错: {str(e)}")
             return {"status": "error", "error": str(e)}
@@ -95,27 +175,69 @@ class MCPServerManager:
     async def disconnect_server(self, server_name: str) -> Dict[str, Any]:
         """断开指定服务器的连接"""
         try:
-            session = await self._get_session()
-            async with session.post(
-                f"{self.client_url}/disconnect_server",
-                json={"server_name": server_name}
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    logger.info(f"服务器 '{server_name}' 断开连接: {result}")
-                    return result
-                else:
-                    error_text = await response.text()
-                    logger.error(f"断开服务器连接请求失败: {response.status} {error_text}")
-                    return {"status": "error", "error": error_text}
-
+            result = await self._request_server(
+                server_name, "disconnect_server", "POST", "/disconnect_server", {"server_name": server_name}
+            )
+            logger.info(f"服务器 '{server_name}' 断开连接: {result}")
+            return result
+
+        except MCPChannelError as e:
+            logger.error(f"断开服务器连接请求失败: {e.status} {e.detail}")
+            return {"status": "error", "error": str(e.detail)}
         except Exception as e:
             error_msg = f"断开服务器连接时出错: {str(e)}"
             logger.error(error_msg)
             return {"status": "error", "error": error_msg}
 
+    @staticmethod
+    def _connect_wait_timeout(server_config: Dict[str, Any]) -> float:
+        """单个服务器的连接等待时间（服务器握手超时 + 进程启动余量）"""
+        try:
+            timeout = float(server_config.get("timeout") or 10)
+        except (TypeError, ValueError):
+            timeout = 10.0
+        return timeout + CONNECT_WAIT_GRACE_SECONDS
+
+    def _start_background_connect(self, server_name: str) -> asyncio.Task:
+        """在后台发起连接（等待超时后任务继续运行，连接完成时通过状态推送生效）"""
+        task = asyncio.create_task(self.connect_server(server_name))
+        self._connect_tasks.add(task)
+        task.add_done_callback(self._connect_tasks.discard)
+        return task
+
+    async def _wait_for_connect(self, server_name: str, server_config: Dict[str, Any]) -> Dict[str, Any]:
+        """等待单个服务器连接完成，超时后返回 connecting 状态而不阻塞其他服务器"""
+        task = self._start_background_connect(server_name)
+        timeout = self._connect_wait_timeout(server_config)
+        done, _ = await asyncio.wait({task}, timeout=timeout)
+
+        if not done:
+            logger.warning(f"服务器 '{server_name}' 在 {timeout:.0f} 秒内未完成连接，继续在后台连接")
+            return {
+                "status": "connecting",
+                "error": f"连接未在 {timeout:.0f} 秒内完成，仍在后台进行",
+                "tools": []
+            }
+
+        try:
+            result = task.result()
+        except Exception as e:
+            return {"status": "error", "error": str(e), "tools": []}
+
+        if result.get("status") == "connected":
+            return {"status": "connected", "tools": result.get("tools", [])}
+        return {
+            "status": "failed",
+            "error": result.get("error", "连接失败"),
+            "tools": []
+        }
+
     async def connect_all_servers(self, server_configs: Dict[str, Any]) -> Dict[str, Any]:
-        """连接所有已配置的MCP服务器"""
+        """并发连接所有已配置的MCP服务器
+
+        每个服务器有独立的等待超时，超时的服务器在后台继续连接并以 connecting 状态返回，
+        已连接的服务器可立即使用。
+        """
         try:
             all_servers = server_configs.get("mcpServers", {})
 
@@ -130,56 +252,39 @@ class MCPServerManager:
             # 获取当前服务器状态
             server_status = await self.get_server_status()
 
-            # 分别处理每个服务器的连接
             connection_results = {}
-            all_tools = {}
-            successful_connections = 0
-            failed_connections = 0
-            already_connected = 0
-
-            for server_name in all_servers.keys():
-                try:
-                    # 检查服务器是否已连接
-                    if (server_name in server_status and
+            pending = {}
+            for server_name, server_config in all_servers.items():
+                if (server_name in server_status and
                         server_status[server_name].get("connected", False)):
-                        connection_results[server_name] = {
-                            "status": "already_connected",
-                            "tools": server_status[server_name].get("tools", [])
-                        }
-                        all_tools[server_name] = server_status[server_name].get("tools", [])
-                        already_connected += 1
-                    else:
-                        # 尝试连接服务器
-                        result = await self.connect_server(server_name)
-                        if result.get("status") == "connected":
-                            connection_results[server_name] = {
-                                "status": "connected",
-                                "tools": result.get("tools", [])
-                            }
-                            all_tools[server_name] = result.get("tools", [])
-                            successful_connections += 1
-                        else:
-                            connection_results[server_name] = {
-                                "status": "failed",
-                                "error": result.get("error", "连接失败"),
-                                "tools": []
-                            }
-                            failed_connections += 1
-                except Exception as e:
                     connection_results[server_name] = {
-                        "status": "error",
-                        "error": str(e),
-                        "tools": []
+                        "status": "already_connected",
+                        "tools": server_status[server_name].get("tools", [])
                     }
-                    failed_connections += 1
+                else:
+                    pending[server_name] = self._wait_for_connect(server_name, server_config or {})
+
+            results = await asyncio.gather(*pending.values(), return_exceptions=True)
+            for server_name, result in zip(pending.keys(), results):
+                if isinstance(result, Exception):
+                    result = {"status": "error", "error": str(result), "tools": []}
+                connection_results[server_name] = result
+
+            all_tools = {
+                server_name: result.get("tools", [])
+                for server_name, result in connection_results.items()
+                if result["status"] in ("connected", "already_connected")
+            }
+            statuses = [result["status"] for result in connection_results.values()]
 
             return {
                 "status": "completed",
                 "summary": {
                     "total_servers": len(all_servers),
-                    "successful_connections": successful_connections,
-                    "failed_connections": failed_connections,
-                    "already_connected": already_connected
+                    "successful_connections": statuses.count("connected"),
+                    "failed_connections": statuses.count("failed") + statuses.count("error"),
+                    "already_connected": statuses.count("already_connected"),
+                    "still_connecting": statuses.count("connecting")
                 },
                 "servers": connection_results,
                 "tools": all_tools
@@ -194,55 +299,114 @@ class MCPServerManager:
                 "tools": {}
             }
 
-    async def get_all_tools(self) -> Dict[str, List[Dict[str, Any]]]:
-        """获取所有可用工具的信息"""
+    async def get_metrics(self) -> Dict[str, Any]:
+        """抓取所有工作进程的工具调用指标并合并（附带错误率与耗时分位数）"""
         try:
-            session = await self._get_session()
-            async with session.get(f"{self.client_url}/tools") as response:
-                if response.status == 200:
-                    tools_data = await response.json()
-                    tools_by_server = {}
-                    for tool in tools_data:
-                        server_name = tool["server_name"]
-                        if server_name not in tools_by_server:
-                            tools_by_server[server_name] = []
-
-                        tools_by_server[server_name].append({
-                            "name": tool["name"],
-                            "description": tool["description"],
-                            "input_schema": tool["input_schema"]
-                        })
+            snapshots = await self._request_all("metrics", "GET", "/metrics")
+            return summarize(merge_snapshots(snapshots))
+        except Exception as e:
+            logger.error(f"获取MCP工具调用指标时出错: {str(e)}")
+            return {"workers": 0, "servers": {}}
 
-                    return tools_by_server
-                else:
-                    logger.error(f"获取工具列表失败: {response.status} {await response.text()}")
-                    return {}
+    async def get_all_tools(self) -> Dict[str, List[Dict[str, Any]]]:
+        """获取所有可用工具的信息"""
+        # 通道在线时工具列表可缓存，直到客户端推送新的服务器状态
+        if self._all_channels_connected() and self._tools_cache is not None:
+            return self._tools_cache
 
+        try:
+            tools_data = [tool for worker_tools in await self._request_all("tools", "GET", "/tools")
+                          for tool in worker_tools]
+            tools_by_server = {}
+            for tool in tools_data:
+                server_name = tool["server_name"]
+                if server_name not in tools_by_server:
+                    tools_by_server[server_name] = []
+
+                tools_by_server[server_name].append({
+                    "name": tool["name"],
+                    "description": tool["description"],
+                    "input_schema": tool["input_schema"]
+                })
+
+            if self._all_channels_connected():
+                self._tools_cache = tools_by_server
+            return tools_by_server
+
+        except MCPChannelError as e:
+            logger.error(f"获取工具列表失败: {e.status} {e.detail}")
+            return {}
         except Exception as e:
             logger.error(f"获取工具列表时出错: {str(e)}")
             return {}
 
-    async def ensure_servers_connected(self, server_names: List[str]) -> Dict[str, bool]:
-        """异步锁确保指定的服务器已连接"""
-        connection_status = {}
+    async def call_tool(self, server_name: str, tool_name: str, params: Dict[str, Any],
+                        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """通过MCP Client调用工具
+
+        Args:
+            on_progress: 工具进度回调，提供时请求MCP Client转发服务器的进度通知
+        """
+        payload = {
+            "server_name": server_name,
+            "tool_name": tool_name,
+            "params": params
+        }
+        if on_progress:
+            payload["stream_progress"] = True
+
+        try:
+            return await self._request_server(server_name, "tool_call", "POST", "/tool_call", payload,
+                                              on_progress=on_progress)
+        except MCPChannelError as e:
+            error_msg = f"调用工具失败: {e.status} {e.detail}"
+            logger.error(error_msg)
+            return {
+                "tool_name": tool_name,
+                "server_name": server_name,
+                "error": error_msg
+            }
+        except Exception as e:
+            error_msg = f"调用工具时出错: {str(e) or type(e).__name__}"
+            logger.error(error_msg)
+            return {
+                "tool_name": tool_name,
+                "server_name": server_name,
+                "error": error_msg
+            }
 
-        for server_name in server_names:
-            lock = self._get_connection_lock(server_name)
+    async def _ensure_server_connected(self, server_name: str) -> bool:
+        """异步锁确保单个服务器已连接"""
+        lock = self._get_connection_lock(server_name)
 
-            async with lock:
-                server_status = await self.get_server_status()
+        async with lock:
+            server_status = await self.get_server_status()
 
-                if server_name in server_status and server_status[server_name].get("connected", False):
-                    connection_status[server_name] = True
-                    logger.info(f"服务器 '{server_name}' 已连接")
-                else:
-                    logger.info(f"服务器 '{server_name}' 未连接，开始连接...")
-                    connect_result = await self._connect_server_internal(server_name)
-                    connection_status[server_name] = connect_result.get("status") == "connected"
+            if server_name in server_status and server_status[server_name].get("connected", False):
+                logger.info(f"服务器 '{server_name}' 已连接")
+                return True
+
+            logger.info(f"服务器 '{server_name}' 未连接，开始连接...")
+            connect_result = await self._connect_server_internal(server_name)
+            connected = connect_result.get("status") == "connected"
 
-                    if not connection_status[server_name]:
-                        logger.error(f"连接服务器 '{server_name}' 失败: {connect_result.get('error', '未知错误')}")
+            if not connected:
+                logger.error(f"连接服务器 '{server_name}' 失败: {connect_result.get('error', '未知错误')}")
+            return connected
 
+    async def ensure_servers_connected(self, server_names: List[str]) -> Dict[str, bool]:
+        """确保指定的服务器已连接（各服务器并发连接）"""
+        results = await asyncio.gather(
+            *(self._ensure_server_connected(server_name) for server_name in server_names),
+            return_exceptions=True
+        )
+
+        connection_status = {}
+        for server_name, result in zip(server_names, results):
+            if isinstance(result, Exception):
+                logger.error(f"连接服务器 '{server_name}' 时出错: {str(result)}")
+                result = False
+            connection_status[server_name] = result
         return connection_status
 
     async def prepare_chat_tools(self, mcp_servers: List[str]) -> List[Dict[str, Any]]:
@@ -286,6 +450,8 @@ class MCPServerManager:
 
     async def cleanup(self):
         """清理资源"""
+        await asyncio.gather(*(channel.close() for channel in self.channels), return_exceptions=True)
+        self._tools_cache = None
         if self._session and not self._session.closed:
             await self._session.close()
             self._session = None
\ No newline at end of file
@@ -0,0 +1,68 @@
+"""
+MCP Client 分片路由
+
+主应用可以启动多个 MCP Client 工作进程，每个 MCP 服务器通过一致性哈希固定分配到其中一个进程。
+增减工作进程时只有少量服务器需要迁移；某个服务器异常只影响其所在分片。
+"""
+import bisect
+import hashlib
+from typing import Dict, Any, List
+
+
+class ConsistentHashRing:
+    """一致性哈希环（带虚拟节点）"""
+
+    def __init__(self, nodes: List[int], replicas: int = 64):
+        """
+        Args:
+            nodes: 节点（工作进程序号）列表
+            replicas: 每个节点的虚拟节点数
+        """
+        self.nodes = list(nodes)
+        self._ring: List[int] = []
+        self._owners: Dict[int, int] = {}
+
+        for node in self.nodes:
+            for replica in range(replicas):
+                point = self._hash(f"worker-{node}#{replica}")
+                self._owners[point] = node
+                self._ring.append(point)
+        self._ring.sort()
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+    def get_node(self, key: str) -> int:
+        """获取 key 所属的节点"""
+        if len(self.nodes) == 1:
+            return self.nodes[0]
+        index = bisect.bisect(self._ring, self._hash(key)) % len(self._ring)
+        return self._owners[self._ring[index]]
+
+
+class MCPShardRouter:
+    """将 MCP 服务器路由到工作进程"""
+
+    def __init__(self, worker_count: int):
+        self.worker_count = max(int(worker_count), 1)
+        self._ring = ConsistentHashRing(list(range(self.worker_count)))
+
+    def get_worker(self, server_name: str) -> int:
+        """获取服务器所在的工作进程序号"""
+        return self._ring.get_node(server_name)
+
+    def split_servers(self, servers: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        按工作进程拆分服务器配置
+
+        Args:
+            servers: mcpServers 配置
+
+        Returns:
+            每个工作进程负责的 mcpServers 配置列表（下标即工作进程序号）
+        """
+        shards: List[Dict[str, Any]] = [{} for _ in range(self.worker_count)]
+        for server_name, server_config in servers.items():
+            shards[self.get_worker(server_name)][server_name] = server_config
+        return shards
@@ -0,0 +1,144 @@
+"""
+AI生成MCP工具的运行环境准备
+
+工具注册时只写入脚本与依赖声明，虚拟环境在后台异步准备，不阻塞事件循环：
+- 依赖集合相同的工具共用一个环境（环境ID为规范化依赖列表的哈希），同一环境同时只准备一次
+- 所有环境通过 uv 安装依赖，共享同一个包缓存；缓存与环境位于同一文件系统时 uv 以硬链接安装，
+  重复的包不会额外占用磁盘
+- 环境状态写入环境目录下的状态文件，MCP Client 进程据此判断工具是否可以启动
+"""
+import asyncio
+import logging
+import os
+import shutil
+import time
+from typing import Dict, Any, Optional, Callable, Awaitable, List
+
+from app.core.config import settings
+from app.infrastructure.storage.file_storage import FileManager
+
+logger = logging.getLogger(__name__)
+
+
+class ToolEnvProvisioner:
+    """AI生成MCP工具的共享虚拟环境准备器"""
+
+    def __init__(self):
+        # env_id -> 正在进行的准备任务
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def provision(self, tool_name: str,
+                  on_ready: Optional[Callable[[str], Awaitable[Any]]] = None) -> Dict[str, Any]:
+        """
+        在后台准备工具的运行环境（已就绪或正在准备时不会重复执行）
+
+        Args:
+            tool_name: 工具名称
+            on_ready: 环境就绪后调用的回调，参数为工具名称（如连接对应的MCP服务器）
+
+        Returns:
+            当前环境状态
+        """
+        env_ref = FileManager.get_mcp_tool_env_ref(tool_name)
+        if not env_ref:
+            return FileManager.get_mcp_tool_env_status(tool_name)
+
+        env_id = env_ref["env_id"]
+        task = self._tasks.get(env_id)
+        if task is None and FileManager.get_mcp_tool_env_status_by_id(env_id).get("status") != "ready":
+            FileManager.set_mcp_tool_env_status(env_id, "provisioning")
+            task = asyncio.create_task(self._provision_env(env_id, env_ref.get("dependencies", [])))
+            self._tasks[env_id] = task
+            task.add_done_callback(lambda _: self._tasks.pop(env_id, None))
+            logger.info(f"开始准备MCP工具 '{tool_name}' 的运行环境: {env_id}")
+        elif task is not None:
+            logger.info(f"MCP工具 '{tool_name}' 复用正在准备的运行环境: {env_id}")
+
+        if on_ready:
+            asyncio.create_task(self._notify_when_ready(tool_name, task, on_ready))
+
+        return FileManager.get_mcp_tool_env_status(tool_name)
+
+    async def wait(self, tool_name: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """等待工具的运行环境准备完成，返回最终（或超时时的当前）状态"""
+        env_ref = FileManager.get_mcp_tool_env_ref(tool_name)
+        task = self._tasks.get(env_ref["env_id"]) if env_ref else None
+        if task is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(task), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.get_status(tool_name)
+
+    def get_status(self, tool_name: str) -> Dict[str, Any]:
+        """获取工具运行环境状态（状态文件为 provisioning 但本进程没有对应任务时视为中断）"""
+        status = FileManager.get_mcp_tool_env_status(tool_name)
+        env_id = status.get("env_id")
+        if env_id and status.get("status") == "provisioning" and env_id not in self._tasks:
+            status = {**status, "status": "failed", "error": "环境准备已中断，请重新准备"}
+        return status
+
+    async def _notify_when_ready(self, tool_name: str, task: Optional[asyncio.Task],
+                                 on_ready: Callable[[str], Awaitable[Any]]):
+        try:
+            if task is not None and not await asyncio.shield(task):
+                return
+            await on_ready(tool_name)
+        except Exception as e:
+            logger.error(f"MCP工具 '{tool_name}' 环境就绪回调出错: {str(e)}")
+
+    async def _provision_env(self, env_id: str, deps: List[str]) -> bool:
+        """创建共享虚拟环境并安装依赖"""
+        env_dir = FileManager.get_mcp_tool_env_dir(env_id)
+        venv_dir = env_dir / ".venv"
+        started_at = time.monotonic()
+
+        try:
+            env_dir.mkdir(parents=True, exist_ok=True)
+            # 上次准备中断时残留的环境不可信，重新创建
+            if venv_dir.exists():
+                await asyncio.to_thread(shutil.rmtree, venv_dir, True)
+
+            # 1. 创建虚拟环境
+            returncode, stderr = await self._run_uv(["venv", str(venv_dir)], env_dir)
+            if returncode != 0:
+                raise RuntimeError(f"创建虚拟环境失败: {stderr}")
+
+            # 2. 安装依赖
+            python_path = FileManager.get_venv_python(venv_dir)
+            returncode, stderr = await self._run_uv(
+                ["pip", "install", "--python", str(python_path)] + deps, env_dir
+            )
+            if returncode != 0:
+                raise RuntimeError(f"安装依赖失败: {stderr}")
+
+            elapsed = time.monotonic() - started_at
+            FileManager.set_mcp_tool_env_status(env_id, "ready", dependencies=deps,
+                                                provision_seconds=round(elapsed, 2))
+            logger.info(f"MCP工具运行环境已就绪: {env_id}，耗时 {elapsed:.1f} 秒")
+            return True
+
+        except Exception as e:
+            logger.error(f"准备MCP工具运行环境 {env_id} 失败: {str(e)}")
+            FileManager.set_mcp_tool_env_status(env_id, "failed", error=str(e), dependencies=deps)
+            return False
+
+    @staticmethod
+    async def _run_uv(args: List[str], cwd) -> tuple:
+        """异步执行 uv 命令，返回 (returncode, stderr)"""
+        env = os.environ.copy()
+        if settings.MCP_TOOL_UV_CACHE_DIR:
+            env["UV_CACHE_DIR"] = settings.MCP_TOOL_UV_CACHE_DIR
+
+        process = await asyncio.create_subprocess_exec(
+            "uv", *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=str(cwd),
+            env=env
+        )
+        _, stderr = await process.communicate()
+        return process.returncode, stderr.decode("utf-8", errors="replace").strip()
+
+
+tool_env_provisioner = ToolEnvProvisioner()
@@ -36,26 +36,16 @@ class MemoryService:
             Dict[str, Any]: 记忆元数据列表
         """
         try:
-            # 查询所有记忆文档
-            cursor = self.mongodb_client.memories_collection.find({"user_id": user_id})
-            docs = await cursor.to_list(length=None)
+            # 查询所有 owner 的记忆统计
+            summaries = await self.mongodb_client.memory_repository.get_owner_summaries(user_id)
 
             # 格式化返回元数据
             result = []
-            for doc in docs:
-                memories = doc.get("memories", {})
-
-                # 计算统计信息
-                categories_count = len(memories)
-                total_items = sum(len(category_data.get("items", [])) for category_data in memories.values())
-
+            for summary in summaries:
                 metadata = {
-                    "owner_type": doc.get("owner_type"),
-                    "owner_id": doc.get("owner_id"),
-                    "categories_count": categories_count,
-                    "total_items": total_items,
-                    "created_at": doc.get("created_at").isoformat() if doc.get("created_at") else None,
-                    "updated_at": doc.get("updated_at").isoformat() if doc.get("updated_at") else None
+                    **summary,
+                    "created_at": summary["created_at"].isoformat() if summary.get("created_at") else None,
+                    "updated_at": summary["updated_at"].isoformat() if summary.get("updated_at") else None
                 }
                 result.append(metadata)
 
@@ -99,11 +89,7 @@ class MemoryService:
                 }
 
             # 查询文档
-            doc = await self.mongodb_client.memories_collection.find_one({
-                "user_id": user_id,
-                "owner_type": owner_type,
-                "owner_id": owner_id
-            })
+            doc = await self.mongodb_client.memory_repository.get_owner_memories(user_id, owner_type, owner_id)
 
             if not doc:
                 return {
@@ -398,28 +384,12 @@ class MemoryService:
                     "error_code": "MISSING_CATEGORIES"
                 }
 
-            # 删除分类
-            deleted_count = 0
-            failed_categories = []
-
-            for category in categories:
-                # 使用 $unset 删除分类
-                result = await self.mongodb_client.memories_collection.update_one(
-                    {
-                        "user_id": user_id,
-                        "owner_type": owner_type,
-                        "owner_id": owner_id
-                    },
-                    {
-                        "$unset": {f"memories.{category}": ""},
-                        "$set": {"updated_at": datetime.now()}
-                    }
-                )
-
-                if result.modified_count > 0:
-                    deleted_count += 1
-                else:
-                    failed_categories.append({"category": category, "error": "分类不存在"})
+            # 删除分类及其所有记忆条目
+            result = await self.mongodb_client.memory_repository.delete_categories(
+                user_id, owner_type, owner_id, categories
+            )
+            deleted_count = len(result["deleted"])
+            failed_categories = [{"category": category, "error": "分类不存在"} for category in result["not_found"]]
 
             if deleted_count > 0 and not failed_categories:
                 return {
@@ -481,11 +451,7 @@ class MemoryService:
                 return False, "不支持的导出格式", None, None
 
             # 查询记忆数据
-            memory_doc = await self.mongodb_client.memories_collection.find_one({
-                "user_id": user_id,
-                "owner_type": owner_type,
-                "owner_id": owner_id
-            })
+            memory_doc = await self.mongodb_client.memory_repository.get_owner_memories(user_id, owner_type, owner_id)
 
             if not memory_doc or not memory_doc.get("memories"):
                 return False, "未找到记忆数据", None, None
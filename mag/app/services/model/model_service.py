@@ -1,9 +1,11 @@
+import asyncio
 import logging
 from typing import Dict, List, Any, Optional, AsyncGenerator
 from openai import AsyncOpenAI
 from app.services.model.param_builder import ParamBuilder
 from app.services.model.stream_handler import StreamHandler
 from app.services.model.response_parser import ResponseParser
+from app.services.model.token_estimator import token_estimator, context_budget
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +18,7 @@ class ModelService:
         self.clients: Dict[str, AsyncOpenAI] = {}
         self.param_builder = ParamBuilder()
         self.response_parser = ResponseParser()
+        self._encoder_load_task: Optional[asyncio.Task] = None
 
     async def initialize(self, mongodb_client) -> None:
         """初始化模型服务
@@ -25,6 +28,8 @@ class ModelService:
         """
         self.model_config_repository = mongodb_client.model_config_repository
         await self._initialize_clients()
+        # 后台加载分词器，加载完成前使用启发式估算
+        self._encoder_load_task = asyncio.create_task(token_estimator.load_encoder())
 
     async def _initialize_clients(self, user_id: str = "default_user") -> None:
         """初始化指定用户的所有模型的异步客户端
@@ -209,6 +214,11 @@ class ModelService:
         """准备完整的API调用参数"""
         return self.param_builder.prepare_api_params(base_params, model_config)
 
+    @staticmethod
+    def get_token_estimation_stats() -> Dict[str, Dict[str, Any]]:
+        """获取各模型token估算准确度统计"""
+        return token_estimator.get_accuracy_stats()
+
     @staticmethod
     def filter_reasoning_content(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """过滤消息中的reasoning_content字段"""
@@ -243,7 +253,8 @@ class ModelService:
                 "accumulated_content": str,
                 "accumulated_reasoning": str,
                 "tool_calls": List[Dict],
-                "api_usage": Dict
+                "api_usage": Dict,
+                "estimated_prompt_tokens": int
             }
         """
         client_key = f"{user_id}:{model_name}"
@@ -260,6 +271,10 @@ class ModelService:
             raise ValueError(f"找不到模型 '{model_name}' 的配置 (user: {user_id})")
 
         try:
+            # 按模型上下文窗口进行预算，超出时确定性裁剪历史消息
+            messages, budget_info = context_budget.fit_messages(messages, tools, model_config)
+            estimated_prompt_tokens = budget_info["estimated_prompt_tokens"]
+
             # 准备基本调用参数
             base_params = {
                 "model": model_config["model"],
@@ -279,6 +294,13 @@ class ModelService:
 
             # 使用流处理器处理流式响应
             async for item in StreamHandler.stream_and_accumulate(stream, yield_chunks):
+                if isinstance(item, dict):
+                    # 记录估算值与实际值，用于跟踪估算准确度
+                    api_usage = item.get("api_usage") or {}
+                    token_estimator.record_usage(
+                        model_config["model"], estimated_prompt_tokens, api_usage.get("prompt_tokens")
+                    )
+                    item["estimated_prompt_tokens"] = estimated_prompt_tokens
                 yield item
 
         except Exception as e:
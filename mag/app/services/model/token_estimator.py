@@ -0,0 +1,414 @@
+"""Token估算器 - 在请求发送前本地估算token数量并按上下文窗口裁剪消息"""
+import asyncio
+import json
+import logging
+import re
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 需要精确匹配的模型标识（同前缀的其他变体窗口不同，不能按前缀匹配）
+MODEL_CONTEXT_WINDOWS_EXACT: Dict[str, int] = {
+    "gpt-4": 8192,
+    "gpt-4-0314": 8192,
+    "gpt-4-0613": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-32k-0314": 32768,
+    "gpt-4-32k-0613": 32768,
+}
+
+# 常见模型的上下文窗口（按去除服务商前缀后的模型名前缀匹配，越具体的前缀越靠前）
+MODEL_CONTEXT_WINDOWS: List[Tuple[str, int]] = [
+    ("gpt-5", 400000),
+    ("gpt-4.1", 1047576),
+    ("gpt-4.5", 128000),
+    ("gpt-4o", 128000),
+    ("gpt-4-turbo", 128000),
+    ("gpt-4-1106", 128000),
+    ("gpt-4-0125", 128000),
+    ("gpt-3.5-turbo", 16385),
+    ("o1", 200000),
+    ("o3", 200000),
+    ("o4", 200000),
+    ("claude", 200000),
+    ("gemini-2.5", 1048576),
+    ("gemini", 1048576),
+    ("deepseek", 128000),
+    ("kimi-k2", 256000),
+    ("moonshot", 128000),
+    ("qwen3", 131072),
+    ("qwen", 131072),
+    ("minimax", 204800),
+    ("glm", 128000),
+]
+
+DEFAULT_CONTEXT_WINDOW = 128000
+DEFAULT_OUTPUT_RESERVE = 4096
+
+# 每条消息的固定开销（role、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+# 每张图片的估算token数（按高分辨率图片的常见开销估算）
+IMAGE_TOKENS = 765
+
+_CJK_PATTERN = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯]')
+_WORD_PATTERN = re.compile(r'[A-Za-z0-9_]+')
+_PUNCT_PATTERN = re.compile(r'[^\w\s]')
+
+
+class TokenEstimator:
+    """本地Token估算器
+
+    使用 tiktoken 进行分词，编码器在服务启动时于后台线程加载（首次加载需要下载编码文件，
+    离线部署时可通过 TIKTOKEN_CACHE_DIR 环境变量指定预先缓存的编码文件目录）。
+    编码器加载完成前或加载失败时，退化为中英文混合的启发式估算。
+    同时记录估算值与API实际返回值，用于跟踪估算准确度。
+    """
+
+    def __init__(self):
+        self._encoder = None
+        self._encoder_loaded = False
+        self._stats_lock = threading.Lock()
+        self._accuracy_stats: Dict[str, Dict[str, Any]] = {}
+
+    # ========== 分词 ==========
+
+    def _load_encoder(self):
+        """加载 tiktoken 编码器（可能下载编码文件，需在线程中执行）"""
+        try:
+            import tiktoken
+            encoder = tiktoken.get_encoding("o200k_base")
+            logger.info("Token估算器使用 tiktoken(o200k_base) 分词")
+            return encoder
+        except Exception as e:
+            logger.info(f"tiktoken 不可用，Token估算器使用启发式估算: {str(e)}")
+            return None
+
+    async def load_encoder(self) -> None:
+        """在后台线程中加载编码器，避免下载编码文件时阻塞事件循环"""
+        if self._encoder_loaded:
+            return
+        self._encoder_loaded = True
+        self._encoder = await asyncio.to_thread(self._load_encoder)
+
+    def _get_encoder(self):
+        """获取已加载的编码器（未加载完成时返回None，不在调用方线程中加载）"""
+        return self._encoder
+
+    def count_text(self, text: Optional[str]) -> int:
+        """估算文本的token数量"""
+        if not text:
+            return 0
+
+        encoder = self._get_encoder()
+        if encoder is not None:
+            try:
+                return len(encoder.encode(text, disallowed_special=()))
+            except Exception:
+                pass
+
+        # 启发式：CJK字符约1 token/字，英文单词约1.3 token/词，标点1 token
+        cjk_count = len(_CJK_PATTERN.findall(text))
+        word_count = len(_WORD_PATTERN.findall(text))
+        punct_count = len(_PUNCT_PATTERN.findall(text)) - cjk_count
+        return cjk_count + int(word_count * 1.3) + max(punct_count, 0)
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        """估算单条消息的token数量（支持多模态和工具调用）"""
+        tokens = MESSAGE_OVERHEAD_TOKENS
+        content = message.get("content")
+
+        if isinstance(content, str):
+            tokens += self.count_text(content)
+        elif isinstance(content, list):
+            for part in content:
+                if not isinstance(part, dict):
+                    continue
+                if part.get("type") == "text":
+                    tokens += self.count_text(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    tokens += IMAGE_TOKENS
+
+        if message.get("reasoning_content"):
+            tokens += self.count_text(message["reasoning_content"])
+
+        for tool_call in message.get("tool_calls") or []:
+            function = tool_call.get("function", {})
+            tokens += self.count_text(function.get("name", ""))
+            tokens += self.count_text(function.get("arguments", ""))
+            tokens += MESSAGE_OVERHEAD_TOKENS
+
+        return tokens
+
+    def count_messages(self, messages: List[Dict[str, Any]]) -> int:
+        """估算消息列表的token数量"""
+        return sum(self.count_message(msg) for msg in messages) + 3
+
+    def count_tools(self, tools: Optional[List[Dict[str, Any]]]) -> int:
+        """估算工具schema的token数量"""
+        if not tools:
+            return 0
+        return sum(
+            self.count_text(json.dumps(tool, ensure_ascii=False, separators=(",", ":")))
+            for tool in tools
+        )
+
+    # ========== 上下文窗口 ==========
+
+    @staticmethod
+    def get_context_window(model_config: Dict[str, Any]) -> int:
+        """获取模型上下文窗口大小，优先使用模型配置中的 context_window"""
+        configured = model_config.get("context_window")
+        if configured:
+            return int(configured)
+
+        # 去除服务商前缀（如 openai/gpt-4o、deepseek-ai/deepseek-v3）
+        model_name = str(model_config.get("model", "")).lower().rsplit("/", 1)[-1]
+        if model_name in MODEL_CONTEXT_WINDOWS_EXACT:
+            return MODEL_CONTEXT_WINDOWS_EXACT[model_name]
+        for prefix, window in MODEL_CONTEXT_WINDOWS:
+            if model_name.startswith(prefix):
+                return window
+        return DEFAULT_CONTEXT_WINDOW
+
+    @staticmethod
+    def get_output_reserve(model_config: Dict[str, Any]) -> int:
+        """获取需要为模型输出预留的token数量"""
+        for key in ("max_completion_tokens", "max_tokens"):
+            if model_config.get(key):
+                return int(model_config[key])
+        return DEFAULT_OUTPUT_RESERVE
+
+    # ========== 准确度跟踪 ==========
+
+    def record_usage(self, model_name: str, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """记录估算token数与API实际prompt_tokens的对比"""
+        if not actual_tokens or estimated_tokens <= 0:
+            return
+
+        error_ratio = (estimated_tokens - actual_tokens) / actual_tokens
+
+        with self._stats_lock:
+            stats = self._accuracy_stats.setdefault(model_name, {
+                "samples": 0,
+                "estimated_tokens": 0,
+                "actual_tokens": 0,
+                "abs_error_ratio_sum": 0.0,
+                "max_abs_error_ratio": 0.0,
+                "last_error_ratio": 0.0
+            })
+            stats["samples"] += 1
+            stats["estimated_tokens"] += estimated_tokens
+            stats["actual_tokens"] += actual_tokens
+            stats["abs_error_ratio_sum"] += abs(error_ratio)
+            stats["max_abs_error_ratio"] = max(stats["max_abs_error_ratio"], abs(error_ratio))
+            stats["last_error_ratio"] = error_ratio
+
+        logger.debug(
+            f"Token估算对比 model={model_name}: 估算={estimated_tokens}, 实际={actual_tokens}, "
+            f"误差={error_ratio:+.1%}"
+        )
+
+    def get_accuracy_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各模型的估算准确度统计"""
+        with self._stats_lock:
+            result = {}
+            for model_name, stats in self._accuracy_stats.items():
+                samples = stats["samples"]
+                result[model_name] = {
+                    "samples": samples,
+                    "estimated_tokens": stats["estimated_tokens"],
+                    "actual_tokens": stats["actual_tokens"],
+                    "mean_abs_error_ratio": round(stats["abs_error_ratio_sum"] / samples, 4) if samples else 0.0,
+                    "max_abs_error_ratio": round(stats["max_abs_error_ratio"], 4),
+                    "last_error_ratio": round(stats["last_error_ratio"], 4)
+                }
+            return result
+
+
+class ContextBudget:
+    """上下文预算管理器 - 按模型上下文窗口对消息进行确定性裁剪
+
+    预算划分：
+    - 固定部分：system 提示词（含项目指令）、工具schema、当前用户消息、输出预留
+    - 可裁剪部分：历史消息，按轮次（以 user 消息为起点）从最早开始整轮丢弃，
+      丢弃的轮次以一段固定格式的说明追加到 system 提示词中（不产生额外的 user 消息）；
+      若仍超出预算，再截断剩余历史中最长的工具结果；
+    - 最后一轮中的工具结果：历史处理后仍超出预算时，从最早开始截断，最新一次工具调用的结果保持不变
+    """
+
+    TRUNCATED_TOOL_CONTENT_CHARS = 2000
+
+    def __init__(self, estimator: TokenEstimator):
+        self.estimator = estimator
+
+    def fit_messages(self,
+                     messages: List[Dict[str, Any]],
+                     tools: Optional[List[Dict[str, Any]]],
+                     model_config: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """将消息列表裁剪到模型上下文预算内
+
+        Args:
+            messages: 原始消息列表
+            tools: 工具schema列表
+            model_config: 模型配置
+
+        Returns:
+            (messages, budget_info): 裁剪后的消息列表（未超出时为原列表）和预算信息
+        """
+        context_window = self.estimator.get_context_window(model_config)
+        output_reserve = self.estimator.get_output_reserve(model_config)
+        available = max(context_window - output_reserve, 0)
+
+        tools_tokens = self.estimator.count_tools(tools)
+        message_tokens = [self.estimator.count_message(msg) for msg in messages]
+        estimated_total = tools_tokens + sum(message_tokens) + 3
+
+        budget_info = {
+            "context_window": context_window,
+            "output_reserve": output_reserve,
+            "tools_tokens": tools_tokens,
+            "estimated_prompt_tokens": estimated_total,
+            "trimmed_messages": 0,
+            "truncated_tool_results": 0
+        }
+
+        if estimated_total <= available:
+            return messages, budget_info
+
+        # 拆分：开头的 system 消息 / 历史 / 最后一轮（最后一条 user 消息及其之后的消息）
+        head_end = 0
+        while head_end < len(messages) and messages[head_end].get("role") == "system":
+            head_end += 1
+
+        tail_start = len(messages)
+        for i in range(len(messages) - 1, head_end - 1, -1):
+            if messages[i].get("role") == "user":
+                tail_start = i
+                break
+
+        head = messages[:head_end]
+        history = messages[head_end:tail_start]
+        tail = messages[tail_start:]
+
+        fixed_tokens = (tools_tokens + sum(message_tokens[:head_end])
+                        + sum(message_tokens[tail_start:]) + 3)
+        history_budget = available - fixed_tokens
+
+        # 按轮次分组（每组以 user 消息开始，保证 tool 消息不会与其 assistant 消息分离）
+        groups: List[List[int]] = []
+        for offset, msg in enumerate(history):
+            if msg.get("role") == "user" or not groups:
+                groups.append([])
+            groups[-1].append(offset)
+
+        group_tokens = [sum(message_tokens[head_end + i] for i in group) for group in groups]
+        # 说明文字的token数按最大可能的丢弃数量估算；无法合并到 system 提示词时需要单独一条消息的开销
+        notice_tokens = self.estimator.count_text("\n\n" + self._build_trim_notice(len(history)))
+        if not self._can_merge_notice(head):
+            notice_tokens += MESSAGE_OVERHEAD_TOKENS
+
+        # 从最早的轮次开始整轮丢弃
+        kept_total = sum(group_tokens)
+        first_kept = 0
+        while first_kept < len(groups) and kept_total + (notice_tokens if first_kept else 0) > history_budget:
+            kept_total -= group_tokens[first_kept]
+            first_kept += 1
+
+        kept_history = [history[i] for group in groups[first_kept:] for i in group]
+        dropped_count = len(history) - len(kept_history)
+
+        # 仍超出预算时，从最长的工具结果开始截断（目标包含丢弃说明的token数）
+        truncated = 0
+        required_tokens = kept_total + (notice_tokens if dropped_count else 0)
+        if required_tokens > history_budget:
+            kept_history, truncated = self._truncate_tool_results(
+                kept_history, required_tokens - max(history_budget, 0)
+            )
+
+        fitted = self._attach_trim_notice(head, dropped_count) if dropped_count else list(head)
+        fitted.extend(kept_history)
+
+        # 仍超出预算时（通常是当前轮次的工具结果过大），从最早开始截断最后一轮中的工具结果，
+        # 保留最新一次 assistant 工具调用及其工具结果不变
+        overflow = tools_tokens + self.estimator.count_messages(fitted + tail) - available
+        protected_start = self._latest_tool_group_start(tail)
+        if overflow > 0 and protected_start > 0:
+            truncatable, tail_truncated = self._truncate_tool_results(
+                tail[:protected_start], overflow, oldest_first=True
+            )
+            tail = truncatable + tail[protected_start:]
+            truncated += tail_truncated
+        fitted.extend(tail)
+
+        budget_info["trimmed_messages"] = dropped_count
+        budget_info["truncated_tool_results"] = truncated
+        budget_info["estimated_prompt_tokens"] = tools_tokens + self.estimator.count_messages(fitted)
+
+        logger.warning(
+            f"上下文超出预算（估算 {estimated_total} > 可用 {available}），"
+            f"已丢弃 {dropped_count} 条历史消息，截断 {truncated} 条工具结果，"
+            f"裁剪后估算 {budget_info['estimated_prompt_tokens']} tokens"
+        )
+        if budget_info["estimated_prompt_tokens"] > available:
+            logger.warning(f"裁剪后仍超出上下文预算 {available} tokens，最新的工具调用结果未被截断")
+
+        return fitted, budget_info
+
+    @staticmethod
+    def _build_trim_notice(dropped_count: int) -> str:
+        """构建被丢弃历史的说明（固定格式，保证结果确定）"""
+        return f"[系统提示] 为适应模型上下文窗口，已省略 {dropped_count} 条较早的历史消息。"
+
+    @staticmethod
+    def _can_merge_notice(head: List[Dict[str, Any]]) -> bool:
+        """丢弃说明能否追加到最后一条 system 消息（仅支持纯文本内容）"""
+        return bool(head) and isinstance(head[-1].get("content"), str)
+
+    def _attach_trim_notice(self, head: List[Dict[str, Any]], dropped_count: int) -> List[Dict[str, Any]]:
+        """将丢弃说明追加到 system 提示词末尾，没有可合并的 system 消息时新增一条 system 消息"""
+        notice = self._build_trim_notice(dropped_count)
+        if self._can_merge_notice(head):
+            last = head[-1]
+            return head[:-1] + [{**last, "content": f"{last['content']}\n\n{notice}"}]
+        return list(head) + [{"role": "system", "content": notice}]
+
+    @staticmethod
+    def _latest_tool_group_start(messages: List[Dict[str, Any]]) -> int:
+        """最新一次带工具调用的 assistant 消息的位置（没有时返回消息数量）"""
+        for i in range(len(messages) - 1, -1, -1):
+            if messages[i].get("role") == "assistant" and messages[i].get("tool_calls"):
+                return i
+        return len(messages)
+
+    def _truncate_tool_results(self,
+                               history: List[Dict[str, Any]],
+                               tokens_to_free: int,
+                               oldest_first: bool = False) -> Tuple[List[Dict[str, Any]], int]:
+        """截断工具结果直到释放足够的token（默认按长度从大到小，oldest_first 时按消息顺序）"""
+        candidates = [
+            i for i, msg in enumerate(history)
+            if msg.get("role") == "tool" and isinstance(msg.get("content"), str)
+            and len(msg["content"]) > self.TRUNCATED_TOOL_CONTENT_CHARS
+        ]
+        if not oldest_first:
+            candidates.sort(key=lambda i: (-len(history[i]["content"]), i))
+
+        result = list(history)
+        truncated = 0
+        for i in candidates:
+            if tokens_to_free <= 0:
+                break
+            original = result[i]["content"]
+            shortened = (f"{original[:self.TRUNCATED_TOOL_CONTENT_CHARS]}"
+                         f"\n...[已截断，原始长度 {len(original)} 字符]")
+            tokens_to_free -= self.estimator.count_text(original) - self.estimator.count_text(shortened)
+            result[i] = {**result[i], "content": shortened}
+            truncated += 1
+
+        return result, truncated
+
+
+# 全局实例
+token_estimator = TokenEstimator()
+context_budget = ContextBudget(token_estimator)
@@ -19,7 +19,8 @@ class PromptService:
     """提示词服务类"""
 
     def __init__(self):
-        pass
+        # 提示词内容缓存：{user_id: {提示词名称: 内容}}，用户的提示词发生变更时整体失效
+        self._content_cache: Dict[str, Dict[str, str]] = {}
 
     @property
     def prompt_repository(self):
@@ -27,6 +28,10 @@ class PromptService:
             raise RuntimeError("prompt_repository 不可用")
         return mongodb_client.prompt_repository
 
+    def invalidate_cache(self, user_id: str) -> None:
+        """清除用户的提示词内容缓存"""
+        self._content_cache.pop(user_id, None)
+
     async def create_prompt(self, prompt_data: PromptCreate, user_id: str = "default_user") -> Dict[str, Any]:
         """
         创建新的提示词
@@ -39,7 +44,9 @@ class PromptService:
             Dict[str, Any]: 创建结果
         """
         try:
-            return await self.prompt_repository.create_prompt(prompt_data, user_id)
+            result = await self.prompt_repository.create_prompt(prompt_data, user_id)
+            self.invalidate_cache(user_id)
+            return result
         except Exception as e:
             logger.error(f"提示词服务：创建提示词失败 (user: {user_id}): {e}")
             return {
@@ -60,7 +67,9 @@ class PromptService:
             Dict[str, Any]: 更新结果
         """
         try:
-            return await self.prompt_repository.update_prompt(name, update_data, user_id)
+            result = await self.prompt_repository.update_prompt(name, update_data, user_id)
+            self.invalidate_cache(user_id)
+            return result
         except Exception as e:
             logger.error(f"提示词服务：更新提示词失败 {name} (user: {user_id}): {e}")
             return {
@@ -80,7 +89,9 @@ class PromptService:
             Dict[str, Any]: 删除结果
         """
         try:
-            return await self.prompt_repository.delete_prompt(name, user_id)
+            result = await self.prompt_repository.delete_prompt(name, user_id)
+            self.invalidate_cache(user_id)
+            return result
         except Exception as e:
             logger.error(f"提示词服务：删除提示词失败 {name} (user: {user_id}): {e}")
             return {
@@ -125,7 +136,9 @@ class PromptService:
             Dict[str, Any]: 批量删除结果
         """
         try:
-            return await self.prompt_repository.batch_delete_prompts(delete_request.names, user_id)
+            result = await self.prompt_repository.batch_delete_prompts(delete_request.names, user_id)
+            self.invalidate_cache(user_id)
+            return result
         except Exception as e:
             logger.error(f"提示词服务：批量删除提示词失败 (user: {user_id}): {e}")
             return {
@@ -168,6 +181,36 @@ class PromptService:
                 "message": f"获取提示词内容失败: {str(e)}"
             }
 
+    async def get_prompt_contents(self, names: List[str], user_id: str = "default_user") -> Dict[str, str]:
+        """
+        批量获取提示词内容，优先使用缓存，未命中的提示词通过一次查询获取
+
+        Args:
+            names: 提示词名称列表
+            user_id: 用户ID
+
+        Returns:
+            Dict[str, str]: {提示词名称: 内容}，不存在或获取失败的提示词不包含在结果中
+        """
+        user_cache = self._content_cache.setdefault(user_id, {})
+        contents = {name: user_cache[name] for name in names if name in user_cache}
+        missing = [name for name in set(names) if name not in contents]
+
+        if missing:
+            try:
+                fetched = await self.prompt_repository.get_prompt_contents(missing, user_id)
+            except Exception as e:
+                logger.error(f"提示词服务：批量获取提示词内容失败 (user: {user_id}): {e}")
+                fetched = None
+
+            if fetched:
+                contents.update(fetched)
+                # 查询期间缓存被清除（提示词已变更）时不回填，避免缓存过期内容
+                if self._content_cache.get(user_id) is user_cache:
+                    user_cache.update(fetched)
+
+        return contents
+
     async def import_prompt_by_file(self, file: UploadFile, import_request: PromptImportByFileRequest,
                                    user_id: str = "default_user") -> Dict[str, Any]:
         """
@@ -182,7 +225,9 @@ class PromptService:
             Dict[str, Any]: 导入结果
         """
         try:
-            return await self.prompt_repository.import_prompt_by_file(file, import_request, user_id)
+            result = await self.prompt_repository.import_prompt_by_file(file, import_request, user_id)
+            self.invalidate_cache(user_id)
+            return result
         except Exception as e:
             logger.error(f"提示词服务：通过文件导入失败 (user: {user_id}): {e}")
             return {
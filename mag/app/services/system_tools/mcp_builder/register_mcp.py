@@ -198,14 +198,24 @@ async def handler(user_id: str, **kwargs) -> Dict[str, Any]:
 
         logger.info(f"成功创建并注册MCP工具: {folder_name}")
 
+        # 7. 后台准备运行环境，就绪后自动连接
+        from app.services.mcp.mcp_service import mcp_service
+        from app.services.mcp.tool_env_provisioner import tool_env_provisioner
+        env_status = tool_env_provisioner.provision(folder_name, on_ready=mcp_service.connect_server)
+
         if language == "en":
             message = f"MCP tool '{folder_name}' registered successfully"
+            if env_status.get("status") != "ready":
+                message += "; its environment is being prepared in the background and the tool will connect automatically when ready"
         else:
             message = f"MCP工具 '{folder_name}' 注册成功"
+            if env_status.get("status") != "ready":
+                message += "，运行环境正在后台准备，就绪后将自动连接"
 
         return {
             "success": True,
             "tool_name": folder_name,
+            "env_status": env_status.get("status"),
             "message": message
         }
 
@@ -250,8 +260,8 @@ async def _register_mcp_to_config(tool_name: str, user_id: str) -> bool:
                 current_config = current_config_data.get("config", {"mcpServers": {}})
                 current_version = current_config_data.get("version", 1)
 
-                # 获取虚拟环境Python解释器和主脚本路径
-                venv_python = FileManager.get_mcp_tool_venv_python(tool_name)
+                # 获取虚拟环境Python解释器和主脚本路径（共享环境可能仍在后台准备）
+                venv_python = FileManager.get_mcp_tool_venv_python(tool_name, must_exist=False)
                 main_script = FileManager.get_mcp_tool_main_script(tool_name)
 
                 if not venv_python or not main_script:
@@ -31,6 +31,11 @@ TOOL_SCHEMA = {
                                     "type": "array",
                                     "items": {"type": "string"},
                                     "description": "要检索的分类名称"
+                                },
+                                "limit": {
+                                    "type": "integer",
+                                    "minimum": 1,
+                                    "description": "每个分类最多返回的条目数（可选，默认返回全部，总数见 total）"
                                 }
                             },
                             "required": ["owner", "categories"]
@@ -64,6 +69,11 @@ TOOL_SCHEMA = {
                                     "type": "array",
                                     "items": {"type": "string"},
                                     "description": "Category names to retrieve"
+                                },
+                                "limit": {
+                                    "type": "integer",
+                                    "minimum": 1,
+                                    "description": "Maximum number of most recent items to return per category (optional, defaults to all; see total for the full count)"
                                 }
                             },
                             "required": ["owner", "categories"]
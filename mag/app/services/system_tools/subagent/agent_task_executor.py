@@ -285,7 +285,8 @@ async def execute_agent_task_stream(
             max_iterations=max_iterations,
             user_id=user_id,
             conversation_id=conversation_id,
-            task_id=task_id  # 传递 task_id，标识为 Sub Agent
+            task_id=task_id,  # 传递 task_id，标识为 Sub Agent
+            budget_limits=agent_config.get("budget")  # Sub Agent 预算，同时受上层运行预算约束
         ):
             if isinstance(item, str):
                 # SSE 字符串，转发
@@ -5,8 +5,9 @@ MCP 工具执行器
 """
 import json
 import logging
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable
 from app.services.tool_execution.base_executor import BaseToolExecutor
+from app.services.tool_execution.tool_result_cache import tool_result_cache
 
 logger = logging.getLogger(__name__)
 
@@ -55,7 +56,7 @@ class MCPToolExecutor(BaseToolExecutor):
             tool_name: 工具名称
             arguments: 工具参数
             tool_call_id: 工具调用ID
-            **context: 上下文参数（mcp_servers 必需）
+            **context: 上下文参数（mcp_servers 必需；progress_callback 可选，用于接收工具进度）
             
         Returns:
             工具执行结果
@@ -72,7 +73,12 @@ class MCPToolExecutor(BaseToolExecutor):
                 )
 
             # 执行工具
-            result = await self._execute_single_tool(server_name, tool_name, arguments)
+            result = await self._execute_single_tool(
+                server_name, tool_name, arguments,
+                user_id=context.get("user_id"),
+                conversation_id=context.get("conversation_id"),
+                progress_callback=context.get("progress_callback")
+            )
             
             # 格式化结果
             if result.get("error"):
@@ -84,7 +90,10 @@ class MCPToolExecutor(BaseToolExecutor):
                 else:
                     content = f"工具 {tool_name} 执行成功：{str(result_content)}"
             
-            return self._format_result(tool_call_id, content)
+            formatted = self._format_result(tool_call_id, content)
+            if result.get("cached"):
+                formatted["cached"] = True
+            return formatted
             
         except Exception as e:
             logger.error(f"MCP 工具 {tool_name} 执行失败: {str(e)}")
@@ -107,17 +116,22 @@ class MCPToolExecutor(BaseToolExecutor):
         """
         return await self._execute_single_tool(server_name, tool_name, params)
 
-    async def _execute_single_tool(self, server_name: str, tool_name: str, 
-                                   params: Dict[str, Any]) -> Dict[str, Any]:
+    async def _execute_single_tool(self, server_name: str, tool_name: str,
+                                   params: Dict[str, Any], user_id: Optional[str] = None,
+                                   conversation_id: Optional[str] = None,
+                                   progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
         """执行单个 MCP 工具的内部实现
         
         Args:
             server_name: MCP 服务器名称
             tool_name: 工具名称
             params: 工具参数
+            user_id: 用户ID（用于 user 范围的结果缓存）
+            conversation_id: 会话ID（用于 run 范围的结果缓存）
+            progress_callback: 工具进度回调
             
         Returns:
-            工具执行结果
+            工具执行结果，命中缓存时包含 "cached": True
         """
         if not self.mcp_service:
             return {"error": "MCP服务未初始化"}
@@ -131,9 +145,22 @@ class MCPToolExecutor(BaseToolExecutor):
                 if connect_result.get("status") != "connected":
                     error_msg = f"无法连接服务器 '{server_name}': {connect_result.get('error', '未知错误')}"
                     return {"error": error_msg}
+
+            # 服务器声明了可缓存的幂等工具时，先查询结果缓存
+            cache_config = server_status.get(server_name, {}).get("cache")
+            cached = tool_result_cache.get(
+                server_name, tool_name, params, cache_config, user_id, conversation_id
+            )
+            if cached is not None:
+                cached["cached"] = True
+                return cached
             
             # 调用底层 MCP 客户端
-            return await self._call_mcp_client_tool(server_name, tool_name, params)
+            result = await self._call_mcp_client_tool(server_name, tool_name, params, progress_callback)
+            tool_result_cache.set(
+                server_name, tool_name, params, result, cache_config, user_id, conversation_id
+            )
+            return result
             
         except Exception as e:
             error_msg = f"调用工具时出错: {str(e)}"
@@ -185,14 +212,16 @@ class MCPToolExecutor(BaseToolExecutor):
             logger.error(f"查找工具 '{tool_name}' 服务器时出错: {str(e)}", exc_info=True)
             return None
 
-    async def _call_mcp_client_tool(self, server_name: str, tool_name: str, 
-                                   params: Dict[str, Any]) -> Dict[str, Any]:
+    async def _call_mcp_client_tool(self, server_name: str, tool_name: str,
+                                   params: Dict[str, Any],
+                                   progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
         """调用 MCP 客户端工具
         
         Args:
             server_name: MCP 服务器名称
             tool_name: 工具名称
             params: 工具参数
+            progress_callback: 工具进度回调
             
         Returns:
             工具执行结果
@@ -200,32 +229,8 @@ class MCPToolExecutor(BaseToolExecutor):
         if not self.mcp_service:
             return {"error": "MCP服务未初始化"}
         
-        try:
-            session = await self.mcp_service._get_session()
-            async with session.post(
-                f"{self.mcp_service.client_manager.client_url}/tool_call",
-                json={
-                    "server_name": server_name,
-                    "tool_name": tool_name,
-                    "params": params
-                }
-            ) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    error_text = await response.text()
-                    error_msg = f"调用工具失败: {response.status} {error_text}"
-                    logger.error(error_msg)
-                    return {
-                        "tool_name": tool_name,
-                        "server_name": server_name,
-                        "error": error_msg
-                    }
-        except Exception as e:
-            error_msg = f"调用工具时出错: {str(e)}"
-            logger.error(error_msg)
-            return {
-                "tool_name": tool_name,
-                "server_name": server_name,
-                "error": error_msg
-            }
+        # 通过服务器管理器的多路复用通道调用（通道不可用时自动回退到HTTP）
+        self.mcp_service._ensure_managers()
+        return await self.mcp_service.server_manager.call_tool(
+            server_name, tool_name, params, on_progress=progress_callback
+        )
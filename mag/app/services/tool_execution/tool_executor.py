@@ -6,8 +6,10 @@
 import asyncio
 import json
 import logging
-from typing import Dict, List, Any, Optional
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, AsyncGenerator, Iterable
 
+from app.core.config import settings
 from app.services.tool_execution.mcp_tool_executor import MCPToolExecutor
 from app.services.tool_execution.system_tool_executor import SystemToolExecutor
 from app.services.tool_execution.handoffs_tool_executor import HandoffsToolExecutor
@@ -15,6 +17,54 @@ from app.services.tool_execution.handoffs_tool_executor import HandoffsToolExecu
 logger = logging.getLogger(__name__)
 
 
+class ToolProgressRelay:
+    """工具进度中转
+
+    每个工具调用只保留最新一条未发送的进度，内存占用与同时执行的工具数成正比，
+    与进度通知的频率和数量无关。
+    """
+
+    def __init__(self):
+        self._latest: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._updated = asyncio.Event()
+
+    def callback_for(self, tool_call_id: str, tool_name: str):
+        """创建单个工具调用的进度回调"""
+        def on_progress(data: Dict[str, Any]):
+            self._latest[tool_call_id] = {
+                "type": "tool_progress",
+                "tool_call_id": tool_call_id,
+                "tool_name": tool_name,
+                "progress": data.get("progress"),
+                "total": data.get("total"),
+                "message": data.get("message")
+            }
+            self._latest.move_to_end(tool_call_id)
+            self._updated.set()
+
+        return on_progress
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """取出所有待发送的进度事件"""
+        events = list(self._latest.values())
+        self._latest.clear()
+        self._updated.clear()
+        return events
+
+    async def relay(self, tasks: Iterable[asyncio.Task]) -> AsyncGenerator[str, None]:
+        """等待任务完成，期间以 SSE 事件转发进度"""
+        pending = set(tasks)
+        while pending:
+            waiter = asyncio.create_task(self._updated.wait())
+            done, _ = await asyncio.wait(pending | {waiter}, return_when=asyncio.FIRST_COMPLETED)
+            if waiter not in done:
+                waiter.cancel()
+            pending -= done
+
+            for event in self.drain():
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
 class ToolExecutor:
     """工具执行器协调器
     
@@ -53,6 +103,32 @@ class ToolExecutor:
         Returns:
             工具执行结果列表
         """
+        tool_results, tasks = self._start_tools_batch(
+            tool_calls, mcp_servers, user_id, conversation_id, agent_id
+        )
+        return await self._collect_tools_batch(tool_results, tasks)
+
+    async def execute_tools_batch_with_progress(self, tool_calls: List[Dict[str, Any]], mcp_servers: List[str],
+                                                user_id: str = None, conversation_id: str = None,
+                                                agent_id: str = None):
+        """批量并发执行工具调用，执行期间转发 MCP 工具的进度
+
+        Yields:
+            str: tool_progress SSE 事件
+            List[Dict]: 最后一项为工具执行结果列表
+        """
+        relay = ToolProgressRelay()
+        tool_results, tasks = self._start_tools_batch(
+            tool_calls, mcp_servers, user_id, conversation_id, agent_id, relay
+        )
+        async for event in relay.relay(tasks):
+            yield event
+        yield await self._collect_tools_batch(tool_results, tasks)
+
+    def _start_tools_batch(self, tool_calls: List[Dict[str, Any]], mcp_servers: List[str],
+                           user_id: str = None, conversation_id: str = None, agent_id: str = None,
+                           relay: Optional[ToolProgressRelay] = None):
+        """为每个工具调用创建执行任务，返回 (参数解析失败的结果列表, 任务列表)"""
         tool_results = []
         tasks = []
 
@@ -83,23 +159,30 @@ class ToolExecutor:
             if self.handoffs_executor.can_handle(tool_name):
                 logger.info(f"使用 HandoffsToolExecutor 执行: {tool_name}")
                 task = asyncio.create_task(
-                    self.handoffs_executor.execute(tool_name, arguments, tool_id, **context)
+                    self._execute_tool(self.handoffs_executor, tool_name, arguments, tool_id, **context)
                 )
                 tasks.append(task)
             elif self.system_executor.can_handle(tool_name):
                 logger.info(f"使用 SystemToolExecutor 执行: {tool_name}")
                 task = asyncio.create_task(
-                    self.system_executor.execute(tool_name, arguments, tool_id, **context)
+                    self._execute_tool(self.system_executor, tool_name, arguments, tool_id, **context)
                 )
                 tasks.append(task)
             else:
                 logger.info(f"使用 MCPToolExecutor 执行: {tool_name}")
+                if relay:
+                    context["progress_callback"] = relay.callback_for(tool_id, tool_name)
                 task = asyncio.create_task(
-                    self.mcp_executor.execute(tool_name, arguments, tool_id, **context)
+                    self._execute_tool(self.mcp_executor, tool_name, arguments, tool_id, **context)
                 )
                 tasks.append(task)
 
-        # 等待所有工具执行完成
+        return tool_results, tasks
+
+    @staticmethod
+    async def _collect_tools_batch(tool_results: List[Dict[str, Any]],
+                                   tasks: List[asyncio.Task]) -> List[Dict[str, Any]]:
+        """等待所有工具执行完成并汇总结果"""
         if tasks:
             results = await asyncio.gather(*tasks, return_exceptions=True)
             for result in results:
@@ -119,6 +202,7 @@ class ToolExecutor:
         """批量执行工具调用（流式版本）
 
         对于流式系统工具（如 agent_task_executor, search_memory_with_agent），会 yield SSE 事件
+        对于 MCP 工具，执行期间 yield tool_progress 事件
         对于其他工具，直接执行并返回结果
         
         Args:
@@ -158,7 +242,7 @@ class ToolExecutor:
             # 根据工具类型选择执行器
             if self.handoffs_executor.can_handle(tool_name):
                 logger.info(f"使用 HandoffsToolExecutor 执行: {tool_name}")
-                result = await self.handoffs_executor.execute(tool_name, arguments, tool_id, **context)
+                result = await self._execute_tool(self.handoffs_executor, tool_name, arguments, tool_id, **context)
                 yield result
             elif self.system_executor.can_handle(tool_name):
                 # 检查是否为流式系统工具
@@ -167,16 +251,63 @@ class ToolExecutor:
                     # 流式系统工具
                     logger.info(f"使用 SystemToolExecutor 执行（流式）: {tool_name}")
                     async for item in self.system_executor.execute_stream(tool_name, arguments, tool_id, **context):
+                        if isinstance(item, dict):
+                            item = await self._spill_large_output(
+                                item, context.get("user_id"), context.get("conversation_id")
+                            )
                         yield item
                 else:
                     # 普通系统工具
                     logger.info(f"使用 SystemToolExecutor 执行: {tool_name}")
-                    result = await self.system_executor.execute(tool_name, arguments, tool_id, **context)
+                    result = await self._execute_tool(self.system_executor, tool_name, arguments, tool_id, **context)
                     yield result
             else:
                 logger.info(f"使用 MCPToolExecutor 执行: {tool_name}")
-                result = await self.mcp_executor.execute(tool_name, arguments, tool_id, **context)
-                yield result
+                relay = ToolProgressRelay()
+                context["progress_callback"] = relay.callback_for(tool_id, tool_name)
+                task = asyncio.create_task(
+                    self._execute_tool(self.mcp_executor, tool_name, arguments, tool_id, **context)
+                )
+                async for event in relay.relay([task]):
+                    yield event
+                yield task.result()
+
+    async def _execute_tool(self, executor, tool_name: str, arguments: Dict[str, Any],
+                            tool_call_id: str, **context) -> Dict[str, Any]:
+        """使用指定执行器执行工具，输出超过阈值时转存到对象存储"""
+        result = await executor.execute(tool_name, arguments, tool_call_id, **context)
+        return await self._spill_large_output(result, context.get("user_id"), context.get("conversation_id"))
+
+    @staticmethod
+    async def _spill_large_output(result: Dict[str, Any], user_id: Optional[str],
+                                  conversation_id: Optional[str]) -> Dict[str, Any]:
+        """将过大的工具输出转存到对象存储，消息中替换为预览 + 引用
+
+        转存成功时结果中增加 "spilled": {"ref", "total_chars"}；
+        缺少会话上下文或转存失败时保留完整输出。
+        """
+        threshold = settings.TOOL_OUTPUT_SPILL_THRESHOLD
+        content = result.get("content")
+        if threshold <= 0 or not isinstance(content, str) or len(content) <= threshold:
+            return result
+        tool_call_id = result.get("tool_call_id")
+        if not user_id or not conversation_id or not tool_call_id:
+            return result
+
+        from app.infrastructure.storage.object_storage.tool_output_manager import tool_output_manager
+        if not await tool_output_manager.save_output(user_id, conversation_id, tool_call_id, content):
+            logger.warning(f"工具输出转存失败，保留完整输出: {tool_call_id} ({len(content)} 字符)")
+            return result
+
+        ref = f"tool_output://{tool_call_id}"
+        preview = content[:settings.TOOL_OUTPUT_PREVIEW_CHARS]
+        result["content"] = (
+            f"{preview}\n\n[输出过长已截断：仅保留前 {len(preview)} 个字符（共 {len(content)} 个字符），"
+            f"完整内容已保存至 {ref}]"
+        )
+        result["spilled"] = {"ref": ref, "total_chars": len(content)}
+        logger.info(f"工具输出已转存: {ref} ({len(content)} 字符)")
+        return result
 
     async def execute_single_tool(self, server_name: str, tool_name: str, params: Dict[str, Any]) -> Dict[str, Any]:
         """执行单个 MCP 工具
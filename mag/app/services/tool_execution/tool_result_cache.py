@@ -0,0 +1,162 @@
+"""
+MCP 工具结果缓存
+
+对在 MCP 服务器配置中声明为可缓存（幂等）的工具，按 工具名 + 规范化参数 缓存执行结果。
+每个服务器一个独立的 LRU 缓存，条目超过 ttl 失效、超过 maxEntries 时淘汰最久未使用的条目。
+
+服务器配置示例:
+    "cache": {"tools": ["search", "read_file"], "ttl": 300, "maxEntries": 256, "scope": "run"}
+
+scope 取值:
+    run    - 仅在同一会话内共享
+    user   - 在同一用户的所有会话间共享
+    global - 所有用户共享
+"""
+import copy
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_SCOPES = ("run", "user", "global")
+
+
+def canonicalize_arguments(arguments: Dict[str, Any]) -> str:
+    """将工具参数规范化为稳定的字符串（键排序、去除多余空白）"""
+    return json.dumps(arguments or {}, sort_keys=True, ensure_ascii=False,
+                      separators=(",", ":"), default=str)
+
+
+class _ServerCache:
+    """单个服务器的 LRU + TTL 缓存"""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.tools = set(config.get("tools") or [])
+        self.ttl = float(config.get("ttl") or 300)
+        self.max_entries = int(config.get("maxEntries") or 256)
+        self.scope = config.get("scope") or "run"
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def is_cacheable(self, tool_name: str) -> bool:
+        return "*" in self.tools or tool_name in self.tools
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, result = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(result)
+
+    def set(self, key: Tuple[str, str, str], result: Dict[str, Any]):
+        self._entries[key] = (time.monotonic() + self.ttl, copy.deepcopy(result))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "scope": self.scope,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+class ToolResultCache:
+    """MCP 工具结果缓存（按服务器隔离）"""
+
+    def __init__(self):
+        self._caches: Dict[str, _ServerCache] = {}
+
+    def _get_server_cache(self, server_name: str, cache_config: Optional[Dict[str, Any]]) -> Optional[_ServerCache]:
+        """获取服务器缓存，配置变化时重建（旧结果随之丢弃）"""
+        if not cache_config or not cache_config.get("tools"):
+            self._caches.pop(server_name, None)
+            return None
+
+        cache = self._caches.get(server_name)
+        if cache is None or cache.config != cache_config:
+            cache = _ServerCache(cache_config)
+            self._caches[server_name] = cache
+        return cache
+
+    @staticmethod
+    def _scope_key(scope: str, user_id: Optional[str], conversation_id: Optional[str]) -> Optional[str]:
+        """缓存范围键，缺少所需上下文时返回 None（不缓存）"""
+        if scope == "global":
+            return "global"
+        if scope == "user":
+            return f"user:{user_id}" if user_id else None
+        return f"run:{conversation_id}" if conversation_id else None
+
+    def _resolve(self, server_name: str, tool_name: str, arguments: Dict[str, Any],
+                 cache_config: Optional[Dict[str, Any]], user_id: Optional[str],
+                 conversation_id: Optional[str]) -> Tuple[Optional[_ServerCache], Optional[Tuple[str, str, str]]]:
+        cache = self._get_server_cache(server_name, cache_config)
+        if cache is None or not cache.is_cacheable(tool_name):
+            return None, None
+
+        scope_key = self._scope_key(cache.scope, user_id, conversation_id)
+        if scope_key is None:
+            return None, None
+        return cache, (scope_key, tool_name, canonicalize_arguments(arguments))
+
+    def get(self, server_name: str, tool_name: str, arguments: Dict[str, Any],
+            cache_config: Optional[Dict[str, Any]], user_id: Optional[str] = None,
+            conversation_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存
+
+        Returns:
+            命中时返回缓存的工具结果副本，否则返回 None
+        """
+        cache, key = self._resolve(server_name, tool_name, arguments, cache_config, user_id, conversation_id)
+        if cache is None:
+            return None
+
+        result = cache.get(key)
+        if result is not None:
+            logger.info(f"工具结果缓存命中: {server_name}/{tool_name}")
+        return result
+
+    def set(self, server_name: str, tool_name: str, arguments: Dict[str, Any], result: Dict[str, Any],
+            cache_config: Optional[Dict[str, Any]], user_id: Optional[str] = None,
+            conversation_id: Optional[str] = None):
+        """写入缓存（出错的结果不缓存，包括工具自身返回 isError 的结果）"""
+        if result.get("error") or result.get("is_error"):
+            return
+
+        cache, key = self._resolve(server_name, tool_name, arguments, cache_config, user_id, conversation_id)
+        if cache is not None:
+            cache.set(key, result)
+
+    def clear(self, server_name: Optional[str] = None):
+        """清空指定服务器或全部缓存"""
+        if server_name is None:
+            self._caches.clear()
+        else:
+            self._caches.pop(server_name, None)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各服务器的缓存统计"""
+        return {server_name: cache.stats() for server_name, cache in self._caches.items()}
+
+
+tool_result_cache = ToolResultCache()
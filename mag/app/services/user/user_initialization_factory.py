@@ -338,6 +338,10 @@ class UserInitializationFactory:
                     logger.info(f"插入conversations文档: {conversation_id}")
 
                     await self.mongodb_client.agent_run_collection.insert_one(data_doc)
+                    # 演示数据为内嵌 rounds 格式，插入后迁移到 run_rounds 集合
+                    await self.mongodb_client.run_round_repository.migrate_embedded_rounds(
+                        self.mongodb_client.agent_run_collection, data_doc, counter_field="round_count"
+                    )
                     logger.info(f"插入agent_run文档: {conversation_id}")
 
                     created_conversations.append(metadata_doc.get("title", conversation_id))
@@ -1,5 +1,92 @@
 import re
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple, Union
+
+# 预解析的节点引用：(节点名称, 数量)，数量为 None 表示全部输出
+NodeRef = Tuple[str, Optional[int]]
+
+
+class CompiledTemplate:
+    """
+    编译后的模板
+
+    模板只解析一次，拆分为文本片段与预解析的占位符（节点名称和数量已解析），
+    渲染时直接按 token 列表拼接，不再重复执行正则匹配和占位符解析。
+    """
+
+    __slots__ = ("source", "tokens", "required_nodes")
+
+    def __init__(self, source: str, tokens: List[Union[str, Tuple[str, Tuple[NodeRef, ...]]]]):
+        """
+        Args:
+            source: 原始模板字符串
+            tokens: token 列表，文本片段为 str，占位符为 ("single"|"joint", 节点引用元组)
+        """
+        self.source = source
+        self.tokens = tokens
+        # 模板依赖的节点输出（按首次出现顺序）
+        self.required_nodes: Tuple[str, ...] = tuple(dict.fromkeys(
+            name for token in tokens if not isinstance(token, str) for name, _ in token[1]
+        ))
+
+    @property
+    def has_placeholders(self) -> bool:
+        return bool(self.required_nodes)
+
+    def render(self, node_outputs: Dict[str, List[str]]) -> str:
+        """
+        使用节点输出历史渲染模板
+
+        Args:
+            node_outputs: 节点输出历史 {node_name: [output1, output2, ...]}
+
+        Returns:
+            渲染后的字符串
+        """
+        parts = []
+        for token in self.tokens:
+            if isinstance(token, str):
+                parts.append(token)
+                continue
+
+            placeholder_type, refs = token
+            if placeholder_type == "single":
+                name, count = refs[0]
+                parts.append(_format_outputs(_select_outputs(node_outputs, name, count)))
+            else:
+                parts.append(_render_joint(refs, node_outputs))
+
+        return "".join(parts)
+
+
+def _select_outputs(node_outputs: Dict[str, List[str]], name: str, count: Optional[int]) -> List[str]:
+    """按数量选取节点的最新输出（count 为 None 表示全部）"""
+    outputs = node_outputs.get(name)
+    if not outputs:
+        return []
+    return outputs[:] if count is None else outputs[-count:]
+
+
+def _format_outputs(outputs: List[str]) -> str:
+    """格式化输出列表：单条直接返回，多条用分隔符连接"""
+    if not outputs:
+        return ""
+    if len(outputs) == 1:
+        return outputs[0]
+    return "\n\n---\n\n".join(outputs)
+
+
+def _render_joint(refs: Tuple[NodeRef, ...], node_outputs: Dict[str, List[str]]) -> str:
+    """按轮次交错渲染联合输出"""
+    selected = [(name, _select_outputs(node_outputs, name, count)) for name, count in refs]
+    max_rounds = max((len(outputs) for _, outputs in selected), default=0)
+
+    formatted_parts = []
+    for round_idx in range(max_rounds):
+        for name, outputs in selected:
+            if round_idx < len(outputs):
+                formatted_parts.append(f"{name}-round{round_idx + 1}output：\n{outputs[round_idx]}")
+
+    return "\n".join(formatted_parts)
 
 
 class GraphPromptTemplate:
@@ -89,124 +176,34 @@ class GraphPromptTemplate:
             "nodes": [{"name": node_name, "count": count_str}]
         }
 
-    def get_node_outputs(self, node_name: str, count_mode: str,
-                         all_outputs: Dict[str, List[str]]) -> List[str]:
+    def compile(self, template: str) -> CompiledTemplate:
         """
-        获取节点的指定数量输出
+        将模板编译为 token 列表（占位符预解析为节点引用）
 
         Args:
-            node_name: 节点名称
-            count_mode: 数量模式 ("1", "3", "all"等)
-            all_outputs: 所有节点的输出历史 {node_name: [output1, output2, ...]}
-
-        Returns:
-            符合条件的输出列表，按时间顺序（最新在最后）
-        """
-        # 节点不存在时返回空列表
-        if node_name not in all_outputs:
-            return []
-
-        node_outputs = all_outputs[node_name]
-
-        # 节点无输出时返回空列表
-        if not node_outputs:
-            return []
-
-        if count_mode == "all":
-            return node_outputs.copy()  # 返回所有历史输出
-        else:
-            try:
-                count = int(count_mode)
-                return node_outputs[-count:] if count > 0 else []  # 返回最新count条
-            except ValueError:
-                return node_outputs[-1:] if node_outputs else []  # fallback到最新1条
-
-    def render_joint_output(self, joint_config: List[Dict[str, str]],
-                            all_outputs: Dict[str, List[str]]) -> str:
-        """
-        渲染联合输出，实现交错逻辑
-
-        Args:
-            joint_config: 联合配置列表 [{"name": "node1", "count": "3"}, ...]
-            all_outputs: 所有节点的输出历史
-
-        Returns:
-            格式化的交错输出字符串
-        """
-        # 收集每个节点需要的输出
-        node_outputs_map = {}
-        max_rounds = 0
-
-        for config in joint_config:
-            node_name = config["name"]
-            count_mode = config["count"]
-
-            outputs = self.get_node_outputs(node_name, count_mode, all_outputs)
-            node_outputs_map[node_name] = outputs
-            max_rounds = max(max_rounds, len(outputs))
-
-        # 按轮次交错生成输出
-        joint_results = []
-
-        for round_idx in range(max_rounds):
-            for config in joint_config:
-                node_name = config["name"]
-                node_outputs = node_outputs_map[node_name]
-
-                # 如果该节点在当前轮次有输出
-                if round_idx < len(node_outputs):
-                    content = node_outputs[round_idx]
-                    joint_results.append({
-                        "node": node_name,
-                        "round": round_idx + 1,
-                        "content": content
-                    })
-
-        return self.format_joint_outputs(joint_results)
-
-    def format_joint_outputs(self, joint_results: List[Dict[str, Any]]) -> str:
-        """
-        格式化联合输出
-
-        Args:
-            joint_results: [
-                {"node": "node1", "round": 1, "content": "..."},
-                {"node": "node2", "round": 1, "content": "..."},
-                ...
-            ]
+            template: 包含节点占位符的模板字符串（提示词引用已预处理）
 
         Returns:
-            格式化后的字符串
+            编译后的模板
         """
-        if not joint_results:
-            return ""
+        tokens = []
+        position = 0
+        for match in re.finditer(self.PLACEHOLDER_PATTERN, template or ""):
+            if match.start() > position:
+                tokens.append(template[position:match.start()])
 
-        formatted_parts = []
-        for item in joint_results:
-            header = f"{item['node']}-round{item['round']}output："
-            formatted_parts.append(f"{header}\n{item['content']}")
+            parsed = self.parse_placeholder(match.group(1))
+            refs = tuple(
+                (node["name"], None if node["count"] == "all" else int(node["count"]))
+                for node in parsed["nodes"]
+            )
+            tokens.append((parsed["type"], refs))
+            position = match.end()
 
-        return "\n".join(formatted_parts)
+        if template and position < len(template):
+            tokens.append(template[position:])
 
-    def format_outputs(self, outputs: List[str]) -> str:
-        """
-        格式化输出内容列表
-
-        Args:
-            outputs: 输出内容列表
-
-        Returns:
-            格式化后的字符串
-        """
-        if not outputs:
-            return ""
-
-        # 单条输出直接返回
-        if len(outputs) == 1:
-            return outputs[0]
-
-        # 多条输出使用分隔符连接
-        return "\n\n---\n\n".join(outputs)
+        return CompiledTemplate(template or "", tokens)
 
     def render_template(self, template: str, node_outputs: Dict[str, List[str]]) -> str:
         """
@@ -219,30 +216,4 @@ class GraphPromptTemplate:
         Returns:
             渲染后的字符串，所有节点占位符被替换为对应内容
         """
-
-        def replace_placeholder(match):
-            placeholder_content = match.group(1)  # 获取括号内的内容
-
-            # 解析占位符类型和参数
-            parsed = self.parse_placeholder(placeholder_content)
-            placeholder_type = parsed["type"]
-
-            if placeholder_type == "joint":
-                # 联合输出引用
-                joint_config = parsed["nodes"]
-                return self.render_joint_output(joint_config, node_outputs)
-
-            elif placeholder_type == "single":
-                # 单节点引用
-                node_config = parsed["nodes"][0]
-                node_name = node_config["name"]
-                count_mode = node_config["count"]
-
-                outputs = self.get_node_outputs(node_name, count_mode, node_outputs)
-                return self.format_outputs(outputs)
-
-            # 未知类型，返回原占位符
-            return match.group(0)
-
-        # 使用正则表达式替换所有节点占位符
-        return re.sub(self.PLACEHOLDER_PATTERN, replace_placeholder, template)
\ No newline at end of file
+        return self.compile(template).render(node_outputs)
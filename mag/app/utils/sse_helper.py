@@ -49,6 +49,18 @@ class SSEHelper:
             "execution_chain": execution_chain
         })
 
+    @staticmethod
+    def send_budget_exceeded(termination: Dict[str, Any], final_result: str = "",
+                             execution_chain: list = None) -> str:
+        """发送预算超限终止事件 - 自定义事件（图运行因预算超限提前结束时代替 graph_complete）"""
+        return SSEHelper.format_sse_data({
+            "type": "budget_exceeded",
+            "message": termination.get("message"),
+            "budget": termination.get("budget"),
+            "final_result": final_result,
+            "execution_chain": execution_chain or []
+        })
+
     @staticmethod
     def send_error(message: str) -> str:
         """发送错误事件"""
@@ -1,18 +1,24 @@
 import asyncio
+import json
 import logging
 import os
+import random
+import time
 import traceback
-import subprocess
+import uuid
 from contextlib import AsyncExitStack
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Set, List, Callable
 import uvicorn
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
+import mcp.types as mcp_types
 from mcp import ClientSession
 from mcp.client.stdio import StdioServerParameters, stdio_client
 from mcp.client.sse import sse_client
 from mcp.client.streamable_http import streamablehttp_client
 from app.core.config import settings
+from app.services.mcp.client_metrics import MCPMetricsRegistry
 
 # 配置日志
 logging.basicConfig(
@@ -27,6 +33,47 @@ app = FastAPI(title="MCP Client", description="MCP Client for MAG")
 SERVERS = {}
 CONFIG = {}
 
+# 已建立的多路复用通道（用于推送状态事件）
+CHANNELS: Set["ChannelConnection"] = set()
+
+# 每个服务器的连接锁（保证同一服务器的连接、重建与删除互斥，不同服务器之间并发）
+CONNECT_LOCKS: Dict[str, asyncio.Lock] = {}
+
+# 后台连接任务（保持引用，避免任务被回收）
+BACKGROUND_TASKS: Set[asyncio.Task] = set()
+
+# 工具进度事件的最小推送间隔（秒）与消息长度上限，避免高频进度通知占用通道与内存
+PROGRESS_MIN_INTERVAL = 0.1
+PROGRESS_MESSAGE_MAX_CHARS = 2000
+
+# 服务器状态
+STATE_DISCONNECTED = "disconnected"   # 未连接（尚未连接或已手动断开）
+STATE_CONNECTING = "connecting"       # 正在连接
+STATE_CONNECTED = "connected"         # 已连接且健康
+STATE_RECONNECTING = "reconnecting"   # 健康检查失败，等待退避重连
+STATE_IDLE = "idle"                   # 空闲已关闭进程，下次调用时冷启动
+STATE_FAILED = "failed"               # 连接失败或重连次数耗尽
+STATE_DISABLED = "disabled"           # 配置中已禁用
+
+HEALTH_MONITOR_TASK: Optional[asyncio.Task] = None
+
+# 工具调用指标（GET /metrics 导出，由主应用抓取并跨工作进程合并）
+METRICS = MCPMetricsRegistry()
+
+
+class SessionSlot:
+    """会话池中的单个会话"""
+
+    def __init__(self, index: int, session: ClientSession, exit_stack: Optional[AsyncExitStack],
+                 concurrency: int = 1):
+        self.index = index
+        self.session = session
+        # 主会话的资源由 MCPServer.exit_stack 管理，此处为 None
+        self.exit_stack = exit_stack
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.in_flight = 0
+        self.total_calls = 0
+
 
 class MCPServer:
     """表示单个MCP服务器的类"""
@@ -41,12 +88,65 @@ class MCPServer:
         self.tools = []
         self.error = None
         self.init_attempted = False
-        self._call_lock = asyncio.Lock()
-        self.ai_process = None  # AI生成工具的进程
+        self.state = STATE_DISCONNECTED
+        # 健康检查与重连
+        self.last_used_at = time.monotonic()
+        self.last_health_check: Optional[float] = None
+        self.reconnect_attempts = 0
+        self.next_reconnect_at: Optional[float] = None
+        # 会话池：slots[0] 为主会话（即 self.session），其余为按 poolSize 额外建立的会话
+        self.pool_size = max(int(config.get('poolSize') or 1), 1)
+        self.session_concurrency = max(int(config.get('sessionConcurrency') or 1), 1)
+        self.slots: List[SessionSlot] = []
+        self._rr_index = 0
+        self.ai_errlog = None  # AI生成工具进程的错误日志文件
+        self.startup_seconds: Optional[float] = None  # 最近一次从启动到可调用的耗时
+        # 进行中的工具调用的进度回调，键为 progressToken
+        self._progress_callbacks: Dict[str, Callable[[Dict[str, Any]], None]] = {}
         self.is_ai_generated = config.get("ai_generated", False)
 
+    @property
+    def connecting(self) -> bool:
+        return self.state in (STATE_CONNECTING, STATE_RECONNECTING)
+
+    @property
+    def idle_timeout(self) -> int:
+        """空闲关闭时间（秒），仅 stdio 服务器生效，0 表示不关闭"""
+        if self.config.get('transportType', 'stdio') != 'stdio':
+            return 0
+        idle_timeout = self.config.get('idleTimeout')
+        if idle_timeout is None:
+            idle_timeout = settings.MCP_IDLE_SHUTDOWN_SECONDS
+        return max(int(idle_timeout), 0)
+
     async def connect(self) -> bool:
         """连接到服务器，返回是否成功"""
+        previous_state = self.state
+        self.state = STATE_CONNECTING
+        connected = False
+        started = time.monotonic()
+        try:
+            connected = await self._connect()
+            return connected
+        finally:
+            if connected:
+                # 从启动进程/建立连接到握手完成、可以调用工具的耗时
+                self.startup_seconds = round(time.monotonic() - started, 3)
+                logger.info(f"服务器 '{self.name}' 已就绪，启动耗时 {self.startup_seconds:.3f} 秒")
+                self.state = STATE_CONNECTED
+                self.error = None
+                self.last_used_at = time.monotonic()
+                self.reconnect_attempts = 0
+                self.next_reconnect_at = None
+                self.last_health_check = time.monotonic()
+            elif self.config.get('disabled', False):
+                self.state = STATE_DISABLED
+            elif previous_state == STATE_RECONNECTING:
+                self.state = STATE_RECONNECTING
+            else:
+                self.state = STATE_FAILED
+
+    async def _connect(self) -> bool:
         if self.config.get('disabled', False):
             logger.info(f"服务器 '{self.name}' 已禁用，跳过连接")
             self.error = "服务器已禁用"
@@ -54,13 +154,11 @@ class MCPServer:
             return False
 
         try:
-            # 如果是AI生成的工具，先启动进程
+            # 如果是AI生成的工具，先校验脚本与虚拟环境
             if self.is_ai_generated:
-                if not await self._start_ai_process():
+                if not await self._prepare_ai_process():
+                    self.init_attempted = True
                     return False
-                
-                # 等待AI进程启动
-                await asyncio.sleep(3)
 
             # 获取传输类型
             transport_type = self.config.get('transportType', 'stdio')
@@ -72,11 +170,11 @@ class MCPServer:
             try:
                 async with asyncio.timeout(timeout):
                     if transport_type == 'stdio':
-                        return await self._connect_stdio()
+                        connected = await self._connect_stdio()
                     elif transport_type == 'sse':
-                        return await self._connect_sse()
+                        connected = await self._connect_sse()
                     elif transport_type == 'streamable_http':
-                        return await self._connect_streamable_http()
+                        connected = await self._connect_streamable_http()
                     else:
                         self.error = f"使用了不支持的传输类型: {transport_type}"
                         logger.error(f"错误: 服务器 '{self.name}' {self.error}")
@@ -92,6 +190,10 @@ class MCPServer:
                 self.init_attempted = True
                 return False
 
+            if connected:
+                await self._init_session_pool(timeout)
+            return connected
+
         except Exception as e:
             self.error = f"连接时出错: {str(e)}"
             logger.error(f"错误: 服务器 '{self.name}' {self.error}")
@@ -100,62 +202,128 @@ class MCPServer:
             self.init_attempted = True
             return False
 
-    async def _start_ai_process(self) -> bool:
-        """启动AI生成的MCP工具进程"""
+    async def _prepare_ai_process(self) -> bool:
+        """准备AI生成的MCP工具：校验脚本与虚拟环境，并打开错误日志
+
+        AI生成的工具是 stdio 服务器，进程由 stdio 连接直接启动，
+        MCP initialize 握手完成即表示工具已就绪，无需预先启动进程并固定等待。
+        """
         try:
             from app.infrastructure.storage.file_storage import FileManager
-            
+
             # 获取脚本路径和虚拟环境Python路径
             script_path = FileManager.get_mcp_tool_main_script(self.name)
             python_path = FileManager.get_mcp_tool_venv_python(self.name)
-            
+
             if not script_path or not python_path:
-                self.error = f"找不到AI生成工具 '{self.name}' 的脚本或虚拟环境"
+                env_status = FileManager.get_mcp_tool_env_status(self.name)
+                if env_status.get("status") in ("pending", "provisioning"):
+                    self.error = f"AI生成工具 '{self.name}' 的运行环境仍在准备中"
+                elif env_status.get("status") == "failed":
+                    self.error = f"AI生成工具 '{self.name}' 的运行环境准备失败: {env_status.get('error')}"
+                else:
+                    self.error = f"找不到AI生成工具 '{self.name}' 的脚本或虚拟环境"
                 logger.error(self.error)
                 return False
-            
-            # 启动进程
-            logger.info(f"启动AI生成的MCP工具: {python_path} {script_path}")
-            
-            # 创建日志文件
+
+            # 工具进程的 stderr 写入工具目录下的日志文件
+            await self._cleanup_ai_process()
             log_dir = settings.get_mcp_tool_dir(self.name)
-            stdout_file = log_dir / "mcp_stdout.log"
-            stderr_file = log_dir / "mcp_stderr.log"
-            
-            with open(stdout_file, 'w') as stdout, open(stderr_file, 'w') as stderr:
-                self.ai_process = subprocess.Popen(
-                    [str(python_path), str(script_path)],
-                    stdout=stdout,
-                    stderr=stderr,
-                    cwd=str(script_path.parent)
-                )
-            
-            logger.info(f"AI工具进程已启动，PID: {self.ai_process.pid}")
+            self.ai_errlog = open(log_dir / "mcp_stderr.log", 'w')
             return True
-            
+
         except Exception as e:
-            self.error = f"启动AI工具进程时出错: {str(e)}"
+            self.error = f"准备AI工具进程时出错: {str(e)}"
             logger.error(self.error)
             return False
 
     async def _cleanup_ai_process(self):
-        """清理AI生成的MCP工具进程"""
-        if self.ai_process:
+        """关闭AI生成工具的日志文件（进程随 stdio 连接一起关闭）"""
+        if self.ai_errlog:
             try:
-                # 优雅关闭
-                self.ai_process.terminate()
-                try:
-                    self.ai_process.wait(timeout=5)
-                    logger.info(f"AI工具进程 {self.ai_process.pid} 已正常关闭")
-                except subprocess.TimeoutExpired:
-                    # 强制关闭
-                    self.ai_process.kill()
-                    self.ai_process.wait()
-                    logger.info(f"AI工具进程 {self.ai_process.pid} 已强制关闭")
+                self.ai_errlog.close()
             except Exception as e:
-                logger.error(f"关闭AI工具进程时出错: {str(e)}")
+                logger.error(f"关闭AI工具日志文件时出错: {str(e)}")
             finally:
-                self.ai_process = None
+                self.ai_errlog = None
+
+    async def _init_session_pool(self, timeout: float):
+        """按 poolSize 在主会话之外建立额外会话（建立失败时以较小的池继续）"""
+        self.slots = [SessionSlot(0, self.session, None, self.session_concurrency)]
+
+        for index in range(1, self.pool_size):
+            exit_stack = AsyncExitStack()
+            try:
+                async with asyncio.timeout(timeout):
+                    session = await self._open_session(exit_stack)
+                self.slots.append(SessionSlot(index, session, exit_stack, self.session_concurrency))
+            except Exception as e:
+                logger.warning(f"服务器 '{self.name}' 额外会话 {index} 建立失败，会话池大小降为 {len(self.slots)}: {str(e)}")
+                try:
+                    await exit_stack.aclose()
+                except Exception:
+                    pass
+                break
+
+        if self.pool_size > 1:
+            logger.info(f"服务器 '{self.name}' 会话池已就绪: {len(self.slots)} 个会话，"
+                        f"每个会话并发 {self.session_concurrency}")
+
+    async def _open_session(self, exit_stack: AsyncExitStack) -> ClientSession:
+        """按传输类型建立一个新的会话（用于会话池中的额外会话）"""
+        transport_type = self.config.get('transportType', 'stdio')
+
+        if transport_type == 'stdio':
+            read, write = await exit_stack.enter_async_context(self._stdio_client())
+        elif transport_type == 'sse':
+            read, write = await exit_stack.enter_async_context(sse_client(url=self.config.get('url')))
+        else:
+            transport = await exit_stack.enter_async_context(streamablehttp_client(url=self.config.get('url')))
+            read, write = transport[0], transport[1]
+
+        session = await exit_stack.enter_async_context(ClientSession(read, write, message_handler=self._handle_session_message))
+        await session.initialize()
+        return session
+
+    def _stdio_client(self, server_params: Optional[StdioServerParameters] = None):
+        """创建 stdio 客户端（AI生成工具的 stderr 写入其日志文件）"""
+        server_params = server_params or self._build_stdio_params()
+        if self.ai_errlog:
+            return stdio_client(server_params, errlog=self.ai_errlog)
+        return stdio_client(server_params)
+
+    def _build_stdio_params(self) -> StdioServerParameters:
+        """构建 stdio 服务器启动参数（合并自定义环境变量）"""
+        env = os.environ.copy()
+        config_env = self.config.get('env', {})
+        if config_env:
+            env.update(config_env)
+
+        return StdioServerParameters(
+            command=self.config.get('command'),
+            args=self.config.get('args', []),
+            env=env
+        )
+
+    def _select_slot(self) -> SessionSlot:
+        """选择在途调用最少的会话，负载相同时轮询"""
+        if not self.slots:
+            self.slots = [SessionSlot(0, self.session, None, self.session_concurrency)]
+
+        start = self._rr_index % len(self.slots)
+        self._rr_index += 1
+        ordered = self.slots[start:] + self.slots[:start]
+        return min(ordered, key=lambda slot: slot.in_flight)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """会话池状态"""
+        return {
+            "pool_size": len(self.slots),
+            "configured_pool_size": self.pool_size,
+            "session_concurrency": self.session_concurrency,
+            "in_flight": sum(slot.in_flight for slot in self.slots),
+            "calls_per_session": [slot.total_calls for slot in self.slots]
+        }
 
     async def _connect_stdio(self) -> bool:
         """连接 stdio 类型的服务器"""
@@ -172,28 +340,20 @@ class MCPServer:
             # 打印命令和参数，便于调试
             logger.info(f"启动 stdio 服务器 '{self.name}' 使用命令: {command} {' '.join(args)}")
 
-            # 获取环境变量
-            env = os.environ.copy()
-            
             # 如果配置中有环境变量设置，则合并到环境变量中
             config_env = self.config.get('env', {})
             if config_env:
                 logger.info(f"服务器 '{self.name}' 使用自定义环境变量: {list(config_env.keys())}")
-                env.update(config_env)
 
             # 创建服务器参数
-            server_params = StdioServerParameters(
-                command=command,
-                args=args,
-                env=env
-            )
+            server_params = self._build_stdio_params()
 
             # 连接到服务器
-            stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
+            stdio_transport = await self.exit_stack.enter_async_context(self._stdio_client(server_params))
             self.stdio, self.write = stdio_transport
 
             # 创建会话并初始化
-            self.session = await self.exit_stack.enter_async_context(ClientSession(self.stdio, self.write))
+            self.session = await self.exit_stack.enter_async_context(ClientSession(self.stdio, self.write, message_handler=self._handle_session_message))
             await self.session.initialize()
 
             # 获取工具列表
@@ -250,7 +410,7 @@ class MCPServer:
             streams = await self.exit_stack.enter_async_context(sse_client(url=url))
             
             # 创建会话并使用 exit_stack 管理
-            self.session = await self.exit_stack.enter_async_context(ClientSession(*streams))
+            self.session = await self.exit_stack.enter_async_context(ClientSession(*streams, message_handler=self._handle_session_message))
             await self.session.initialize()
 
             # 获取工具列表
@@ -294,7 +454,7 @@ class MCPServer:
                 read, write = transport_context, None
                 get_session_id = None
             
-            self.session = await self.exit_stack.enter_async_context(ClientSession(read, write))
+            self.session = await self.exit_stack.enter_async_context(ClientSession(read, write, message_handler=self._handle_session_message))
             
             logger.info(f"ClientSession 创建成功，开始初始化...")
             
@@ -332,10 +492,14 @@ class MCPServer:
         try:
             # 先清空工具列表，避免断开连接后仍能获取工具
             self.tools = []
-            
-            # 清理AI进程
-            if self.is_ai_generated:
-                await self._cleanup_ai_process()
+
+            # 关闭会话池中的额外会话
+            for slot in self.slots[1:]:
+                try:
+                    await slot.exit_stack.aclose()
+                except Exception as e:
+                    logger.error(f"关闭服务器 '{self.name}' 额外会话 {slot.index} 时出错: {str(e)}")
+            self.slots = []
             
             # 使用更安全的方式关闭连接
             if self.exit_stack:
@@ -351,6 +515,10 @@ class MCPServer:
             self.session = None
             self.stdio = None
             self.write = None
+
+            # 进程已随连接关闭，最后关闭AI工具的日志文件
+            if self.is_ai_generated:
+                await self._cleanup_ai_process()
             
             logger.info(f"服务器 '{self.name}' 连接已成功清理")
         except Exception as e:
@@ -361,33 +529,173 @@ class MCPServer:
             self.write = None
             self.tools = []
 
+    async def _handle_session_message(self, message):
+        """处理服务器主动发送的消息，将进度通知转交给对应工具调用的回调"""
+        if not isinstance(message, mcp_types.ServerNotification):
+            return
+        notification = message.root
+        if not isinstance(notification, mcp_types.ProgressNotification):
+            return
+
+        params = notification.params
+        callback = self._progress_callbacks.get(str(params.progressToken))
+        if callback is None:
+            return
+
+        progress_message = getattr(params, "message", None)
+        if progress_message and len(progress_message) > PROGRESS_MESSAGE_MAX_CHARS:
+            progress_message = progress_message[:PROGRESS_MESSAGE_MAX_CHARS] + "..."
+        try:
+            callback({
+                "progress": params.progress,
+                "total": params.total,
+                "message": progress_message
+            })
+        except Exception as e:
+            logger.warning(f"处理服务器 '{self.name}' 进度通知时出错: {str(e)}")
+
+    @staticmethod
+    async def _call_tool_with_progress(session: ClientSession, tool_name: str, params: Dict[str, Any],
+                                       progress_token: str) -> mcp_types.CallToolResult:
+        """携带 progressToken 调用工具，服务器据此发送进度通知"""
+        request = mcp_types.ClientRequest(mcp_types.CallToolRequest(
+            method="tools/call",
+            params=mcp_types.CallToolRequestParams(
+                name=tool_name,
+                arguments=params,
+                _meta={"progressToken": progress_token}
+            )
+        ))
+        return await session.send_request(request, mcp_types.CallToolResult)
+
     def is_connected(self) -> bool:
         """检查服务器是否已连接"""
         return self.session is not None
 
-    async def call_tool(self, tool_name: str, params: Dict[str, Any]) -> Dict[str, Any]:
-        """调用工具，返回工具结果"""
+    def is_available(self) -> bool:
+        """服务器是否可接受调用（已连接，或空闲关闭后可冷启动）"""
+        return self.is_connected() or self.state == STATE_IDLE
+
+    def is_busy(self) -> bool:
+        return any(slot.in_flight > 0 for slot in self.slots)
+
+    async def check_health(self) -> bool:
+        """对所有会话发送 ping，任一会话无响应即视为不健康"""
+        self.last_health_check = time.monotonic()
+        try:
+            async with asyncio.timeout(settings.MCP_HEALTH_CHECK_TIMEOUT):
+                for slot in self.slots or [SessionSlot(0, self.session, None)]:
+                    await slot.session.send_ping()
+            return True
+        except Exception as e:
+            self.error = f"健康检查失败: {str(e) or type(e).__name__}"
+            logger.warning(f"服务器 '{self.name}' {self.error}")
+            return False
+
+    def schedule_reconnect(self):
+        """按指数退避安排下一次重连，超过最大次数后放弃"""
+        if self.reconnect_attempts >= settings.MCP_RECONNECT_MAX_ATTEMPTS:
+            self.state = STATE_FAILED
+            self.next_reconnect_at = None
+            logger.error(f"服务器 '{self.name}' 重连 {self.reconnect_attempts} 次均失败，停止自动重连")
+            return
+
+        delay = min(settings.MCP_RECONNECT_BASE_DELAY * (2 ** self.reconnect_attempts),
+                    settings.MCP_RECONNECT_MAX_DELAY)
+        # 加入抖动，避免多个服务器同时重连
+        delay *= random.uniform(0.8, 1.2)
+        self.state = STATE_RECONNECTING
+        self.next_reconnect_at = time.monotonic() + delay
+        logger.info(f"服务器 '{self.name}' 将在 {delay:.1f} 秒后第 {self.reconnect_attempts + 1} 次重连")
+
+    async def reconnect(self) -> bool:
+        """清理现有连接后重新连接（保留服务器实例及其统计信息）"""
+        self.reconnect_attempts += 1
+        await self.cleanup()
+        connected = await self.connect()
+        if connected:
+            logger.info(f"服务器 '{self.name}' 重连成功")
+        else:
+            self.schedule_reconnect()
+        return connected
+
+    async def stop_idle(self):
+        """关闭空闲的 stdio 服务器进程，保留工具列表以便按需冷启动"""
+        # 先切换状态，关闭期间到达的调用会等待连接锁并冷启动
+        self.state = STATE_IDLE
+        tools = self.tools
+        await self.cleanup()
+        self.tools = tools
+        logger.info(f"服务器 '{self.name}' 空闲超过 {self.idle_timeout} 秒，已关闭进程")
+
+    async def ensure_started(self) -> bool:
+        """空闲关闭的服务器在调用前冷启动"""
+        if self.is_connected() and self.state != STATE_IDLE:
+            return True
+
+        async with _get_connect_lock(self.name):
+            if self.is_connected() and self.state != STATE_IDLE:
+                return True
+            if self.state != STATE_IDLE:
+                return False
+            started = time.monotonic()
+            logger.info(f"冷启动空闲服务器 '{self.name}'")
+            await self.cleanup()
+            connected = await self.connect()
+            if connected:
+                logger.info(f"服务器 '{self.name}' 冷启动完成，耗时 {time.monotonic() - started:.2f} 秒")
+            return connected
+
+    async def call_tool(self, tool_name: str, params: Dict[str, Any],
+                        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """调用工具，返回工具结果
+
+        Args:
+            progress_callback: 进度回调，提供时请求服务器发送进度通知
+        """
         tool_call_timeout = self.config.get('timeout', 60)
         logger.info(f"开始调用工具 '{tool_name}', 超时: {tool_call_timeout} 秒")
 
-        if not self.is_connected():
+        tracker = METRICS.track(self.name, tool_name)
+        self.last_used_at = time.monotonic()
+        if (not self.is_connected() or self.state == STATE_IDLE) and not await self.ensure_started():
+            tracker.finish(error=True)
             raise RuntimeError(f"服务器 '{self.name}' 未连接")
 
         if not any(tool.name == tool_name for tool in self.tools):
+            tracker.finish(error=True)
             raise ValueError(f"服务器 '{self.name}' 没有提供工具 '{tool_name}'")
 
+        slot = self._select_slot()
+        slot.in_flight += 1
+        progress_token = None
+        if progress_callback:
+            progress_token = uuid.uuid4().hex
+            self._progress_callbacks[progress_token] = progress_callback
         try:
-            # 使用锁来保护会话调用，防止并发访问造成问题
-            async with self._call_lock:
+            # 每个会话的并发调用数受 sessionConcurrency 限制（默认1，即单会话串行）
+            async with slot.semaphore:
+                tracker.acquired()
+                slot.total_calls += 1
                 try:
                     async with asyncio.timeout(tool_call_timeout):
-                        result = await self.session.call_tool(tool_name, params)
+                        if progress_token:
+                            result = await self._call_tool_with_progress(
+                                slot.session, tool_name, params, progress_token
+                            )
+                        else:
+                            result = await slot.session.call_tool(tool_name, params)
+                    self.last_used_at = time.monotonic()
+                    is_error = bool(getattr(result, "isError", False))
+                    tracker.finish(error=is_error)
                     return {
                         "tool_name": tool_name,
                         "server_name": self.name,
-                        "content": result.content
+                        "content": result.content,
+                        "is_error": is_error
                     }
                 except asyncio.TimeoutError:
+                    tracker.finish(error=True, timeout=True)
                     error_message = f"Tool execution timed out after {tool_call_timeout} seconds. The operation was canceled."
                     logger.error(f"调用工具 '{tool_name}' 超时 (超过 {tool_call_timeout} 秒)")
                     return {
@@ -397,6 +705,7 @@ class MCPServer:
                         "content": f"ERROR: {error_message}"
                     }
         except Exception as e:
+            tracker.finish(error=True)
             error_message = str(e)
             logger.error(f"调用工具 '{tool_name}' 时出错: {error_message}")
             traceback.print_exc()
@@ -406,6 +715,12 @@ class MCPServer:
                 "error": error_message,
                 "content": f"ERROR: {error_message}"
             }
+        finally:
+            # 调用被取消时也要结束计时，保证在途计数准确
+            tracker.finish(error=True)
+            slot.in_flight -= 1
+            if progress_token:
+                self._progress_callbacks.pop(progress_token, None)
 
 
 # 工具调用数据模型
@@ -455,11 +770,18 @@ async def get_servers():
     servers_status = {}
     for name, server in SERVERS.items():
         servers_status[name] = {
-            "connected": server.is_connected(),
+            # 空闲关闭的服务器可按需冷启动，对调用方而言仍视为已连接
+            "connected": server.is_available(),
+            "state": server.state,
             "init_attempted": server.init_attempted,
-            "tools": [tool.name for tool in server.tools] if server.is_connected() else [],
+            "tools": [tool.name for tool in server.tools] if server.is_available() else [],
+            "connecting": server.connecting,
+            "reconnect_attempts": server.reconnect_attempts,
             "error": server.error,
-            "transport_type": server.config.get('transportType', 'stdio')
+            "transport_type": server.config.get('transportType', 'stdio'),
+            "pool": server.pool_stats() if server.is_connected() else None,
+            "startup_seconds": server.startup_seconds,
+            "cache": server.config.get('cache')
         }
     return servers_status
 
@@ -472,8 +794,8 @@ async def connect_server(request: ServerConnectRequest):
     if not CONFIG or 'mcpServers' not in CONFIG or server_name not in CONFIG['mcpServers']:
         raise HTTPException(status_code=404, detail=f"找不到服务器配置: {server_name}")
 
-    # 如果服务器已连接，直接返回成功
-    if server_name in SERVERS and SERVERS[server_name].is_connected():
+    # 如果服务器已连接（或空闲可冷启动），直接返回成功
+    if server_name in SERVERS and SERVERS[server_name].is_available():
         return {
             "status": "connected",
             "server": server_name,
@@ -485,6 +807,7 @@ async def connect_server(request: ServerConnectRequest):
 
     # 调用连接函数
     success = await connect_single_server(server_name)
+    await broadcast_server_status()
 
     if success:
         # 连接成功，返回工具列表
@@ -505,6 +828,11 @@ async def connect_server(request: ServerConnectRequest):
 @app.post("/tool_call")
 async def call_tool(tool_data: ToolCallData):
     """直接调用指定的工具"""
+    return await _call_tool(tool_data)
+
+
+async def _call_tool(tool_data: ToolCallData,
+                     progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None):
     server_name = tool_data.server_name
     tool_name = tool_data.tool_name
     params = tool_data.params
@@ -513,11 +841,11 @@ async def call_tool(tool_data: ToolCallData):
         raise HTTPException(status_code=404, detail=f"找不到服务器: {server_name}")
 
     server = SERVERS[server_name]
-    if not server.is_connected():
+    if not server.is_available():
         raise HTTPException(status_code=400, detail=f"服务器 '{server_name}' 未连接")
 
     try:
-        result = await server.call_tool(tool_name, params)
+        result = await server.call_tool(tool_name, params, progress_callback)
         return result
     except Exception as e:
         logger.error(f"调用工具时出错: {str(e)}")
@@ -525,12 +853,22 @@ async def call_tool(tool_data: ToolCallData):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """工具调用指标快照（按服务器/工具的调用数、错误数、在途数、耗时与等待直方图）"""
+    snapshot = METRICS.snapshot()
+    for server_name, server in SERVERS.items():
+        if server_name in snapshot["servers"]:
+            snapshot["servers"][server_name]["pool"] = server.pool_stats() if server.is_connected() else None
+    return snapshot
+
+
 @app.get("/tools")
 async def get_tools():
     """获取所有可用工具的列表"""
     all_tools = []
     for server_name, server in SERVERS.items():
-        if server.is_connected():
+        if server.is_available():
             for tool in server.tools:
                 all_tools.append({
                     "server_name": server_name,
@@ -550,6 +888,8 @@ async def disconnect_server(request: ServerConnectRequest):
 
     # 如果服务器未连接，直接返回
     if not SERVERS[server_name].is_connected():
+        SERVERS[server_name].state = STATE_DISCONNECTED
+        SERVERS[server_name].tools = []
         return {
             "status": "not_connected",
             "server": server_name,
@@ -559,7 +899,9 @@ async def disconnect_server(request: ServerConnectRequest):
     # 执行清理操作
     logger.info(f"开始断开服务器连接: {server_name}")
     try:
-        await SERVERS[server_name].cleanup()
+        async with _get_connect_lock(server_name):
+            await SERVERS[server_name].cleanup()
+            SERVERS[server_name].state = STATE_DISCONNECTED
         
         # 验证断开连接后的状态
         if SERVERS[server_name].is_connected():
@@ -567,7 +909,9 @@ async def disconnect_server(request: ServerConnectRequest):
             # 强制重置状态
             SERVERS[server_name].session = None
             SERVERS[server_name].tools = []
-        
+
+        await broadcast_server_status()
+
         return {
             "status": "disconnected",
             "server": server_name,
@@ -584,8 +928,292 @@ async def disconnect_server(request: ServerConnectRequest):
         }
 
 
+# ==================== 多路复用通道 ====================
+# 主应用通过一条长连接 WebSocket 与客户端通信：
+#   请求: {"id": 1, "method": "tool_call", "params": {...}}
+#   响应: {"id": 1, "result": {...}} 或 {"id": 1, "error": {"status": 404, "detail": "..."}}
+#   推送: {"event": "server_status", "data": {...}}
+#   进度: {"id": 1, "progress": {...}}（仅 tool_call 且 params 带 stream_progress 时，在响应之前推送）
+# 同一连接上的请求并发处理，响应按完成顺序返回，由 id 关联
+
+class ChannelConnection:
+    """单条多路复用通道连接"""
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self._send_lock = asyncio.Lock()
+        self._tasks: Set[asyncio.Task] = set()
+        self._last_progress_at: Dict[Any, float] = {}
+
+    async def send(self, message: Dict[str, Any]) -> bool:
+        """发送消息（WebSocket 不支持并发写，需串行化）"""
+        try:
+            data = json.dumps(jsonable_encoder(message), ensure_ascii=False)
+            async with self._send_lock:
+                await self.websocket.send_text(data)
+            return True
+        except Exception as e:
+            logger.warning(f"通道消息发送失败: {str(e)}")
+            return False
+
+    def send_progress(self, request_id: Any, data: Dict[str, Any]):
+        """推送请求的中间进度（按 PROGRESS_MIN_INTERVAL 限流，完成时的进度总会推送）"""
+        now = time.monotonic()
+        finished = data.get("total") is not None and data.get("progress") is not None \
+            and data["progress"] >= data["total"]
+        if not finished and now - self._last_progress_at.get(request_id, 0) < PROGRESS_MIN_INTERVAL:
+            return
+        self._last_progress_at[request_id] = now
+
+        task = asyncio.create_task(self.send({"id": request_id, "progress": data}))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def dispatch(self, message: Dict[str, Any]):
+        """为每个请求创建独立任务，使多个请求可同时在途"""
+        task = asyncio.create_task(self._handle_request(message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle_request(self, message: Dict[str, Any]):
+        request_id = message.get("id")
+        method = message.get("method")
+        handler = CHANNEL_METHODS.get(method)
+
+        if handler is None:
+            await self.send({"id": request_id, "error": {"status": 404, "detail": f"未知的通道方法: {method}"}})
+            return
+
+        params = message.get("params") or {}
+        try:
+            if method in STREAMING_CHANNEL_METHODS and params.get("stream_progress"):
+                result = await STREAMING_CHANNEL_METHODS[method](
+                    params, lambda data: self.send_progress(request_id, data)
+                )
+            else:
+                result = await handler(params)
+            await self.send({"id": request_id, "result": result})
+        except HTTPException as e:
+            await self.send({"id": request_id, "error": {"status": e.status_code, "detail": e.detail}})
+        except Exception as e:
+            logger.error(f"处理通道请求 '{method}' 时出错: {str(e)}")
+            logger.error(traceback.format_exc())
+            await self.send({"id": request_id, "error": {"status": 500, "detail": str(e)}})
+        finally:
+            self._last_progress_at.pop(request_id, None)
+
+    def cancel_pending(self):
+        """连接断开时取消未完成的请求"""
+        for task in list(self._tasks):
+            task.cancel()
+
+
+async def _channel_load_config(params: Dict[str, Any]) -> Dict[str, Any]:
+    notification = ConfigUpdateNotification(**params)
+    logger.info("收到配置更新通知（通道）")
+    asyncio.create_task(process_config_update(notification.config))
+    return {"status": "accepted", "message": "配置加载请求已接受"}
+
+
+async def _channel_ping(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {"pong": True}
+
+
+# 支持中间进度推送的方法：请求参数带 "stream_progress": true 时，
+# 在最终响应之前推送 {"id": 1, "progress": {"progress": 3, "total": 10, "message": "..."}}
+STREAMING_CHANNEL_METHODS = {
+    "tool_call": lambda params, progress: _call_tool(ToolCallData(**params), progress),
+}
+
+CHANNEL_METHODS = {
+    "ping": _channel_ping,
+    "status": lambda params: root(),
+    "servers": lambda params: get_servers(),
+    "tools": lambda params: get_tools(),
+    "metrics": lambda params: get_metrics(),
+    "load_config": _channel_load_config,
+    "connect_server": lambda params: connect_server(ServerConnectRequest(**params)),
+    "disconnect_server": lambda params: disconnect_server(ServerConnectRequest(**params)),
+    "tool_call": lambda params: call_tool(ToolCallData(**params)),
+}
+
+
+@app.websocket("/channel")
+async def channel_endpoint(websocket: WebSocket):
+    """多路复用通道"""
+    await websocket.accept()
+    connection = ChannelConnection(websocket)
+    CHANNELS.add(connection)
+    logger.info(f"多路复用通道已建立，当前通道数: {len(CHANNELS)}")
+
+    try:
+        # 建立连接后先推送一次完整状态
+        await connection.send({"event": "server_status", "data": await get_servers()})
+
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                message = json.loads(raw)
+            except json.JSONDecodeError:
+                logger.warning(f"忽略无法解析的通道消息: {raw[:200]}")
+                continue
+            connection.dispatch(message)
+
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"多路复用通道异常: {str(e)}")
+    finally:
+        CHANNELS.discard(connection)
+        connection.cancel_pending()
+        logger.info(f"多路复用通道已关闭，当前通道数: {len(CHANNELS)}")
+
+
+async def broadcast_event(event: str, data: Any):
+    """向所有通道推送事件"""
+    if not CHANNELS:
+        return
+    message = {"event": event, "data": data}
+    await asyncio.gather(*(connection.send(message) for connection in list(CHANNELS)),
+                         return_exceptions=True)
+
+
+async def broadcast_server_status():
+    """推送最新的服务器状态"""
+    await broadcast_event("server_status", await get_servers())
+
+
+# ==================== 健康检查 ====================
+# 后台循环每秒巡检一次：
+#   - 已连接的服务器按 MCP_HEALTH_CHECK_INTERVAL 发送 ping，失败后断开并按指数退避重连
+#   - 空闲超过 idleTimeout 的 stdio 服务器关闭进程，下次调用时冷启动
+# 状态变化后推送 server_status
+
+async def _monitor_server(server: MCPServer) -> bool:
+    """巡检单个服务器，返回状态是否发生变化"""
+    now = time.monotonic()
+
+    if server.state == STATE_CONNECTED and server.is_connected():
+        if server.is_busy():
+            return False
+
+        idle_timeout = server.idle_timeout
+        if idle_timeout and now - server.last_used_at >= idle_timeout:
+            async with _get_connect_lock(server.name):
+                # 加锁后复查，期间可能有新的调用或配置变更
+                if (SERVERS.get(server.name) is server and server.state == STATE_CONNECTED
+                        and not server.is_busy()
+                        and time.monotonic() - server.last_used_at >= idle_timeout):
+                    await server.stop_idle()
+                    return True
+            return False
+
+        if (server.last_health_check is not None
+                and now - server.last_health_check < settings.MCP_HEALTH_CHECK_INTERVAL):
+            return False
+
+        if await server.check_health():
+            return False
+
+        async with _get_connect_lock(server.name):
+            if SERVERS.get(server.name) is not server or server.state != STATE_CONNECTED:
+                return False
+            server.state = STATE_RECONNECTING
+            error = server.error
+            await server.cleanup()
+            server.error = error
+            server.schedule_reconnect()
+        return True
+
+    if (server.state == STATE_RECONNECTING and server.next_reconnect_at is not None
+            and now >= server.next_reconnect_at):
+        async with _get_connect_lock(server.name):
+            if SERVERS.get(server.name) is not server or server.state != STATE_RECONNECTING:
+                return False
+            logger.info(f"尝试重连服务器 '{server.name}' (第 {server.reconnect_attempts + 1} 次)")
+            await server.reconnect()
+        return True
+
+    return False
+
+
+async def health_monitor_loop():
+    """服务器健康检查循环"""
+    logger.info(f"MCP服务器健康检查已启动，检查间隔 {settings.MCP_HEALTH_CHECK_INTERVAL} 秒")
+    while True:
+        try:
+            await asyncio.sleep(1)
+            servers = list(SERVERS.values())
+            if not servers:
+                continue
+
+            results = await asyncio.gather(*(_monitor_server(server) for server in servers),
+                                           return_exceptions=True)
+            changed = False
+            for server, result in zip(servers, results):
+                if isinstance(result, Exception):
+                    logger.error(f"巡检服务器 '{server.name}' 时出错: {str(result)}")
+                elif result:
+                    changed = True
+
+            if changed:
+                await broadcast_server_status()
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"健康检查循环出错: {str(e)}")
+
+
+def _get_connect_lock(server_name: str) -> asyncio.Lock:
+    """获取服务器连接锁"""
+    if server_name not in CONNECT_LOCKS:
+        CONNECT_LOCKS[server_name] = asyncio.Lock()
+    return CONNECT_LOCKS[server_name]
+
+
+def _run_in_background(coro):
+    """创建后台任务并保持引用"""
+    task = asyncio.create_task(coro)
+    BACKGROUND_TASKS.add(task)
+    task.add_done_callback(BACKGROUND_TASKS.discard)
+    return task
+
+
+async def _remove_server(server_name: str):
+    """断开并删除服务器"""
+    async with _get_connect_lock(server_name):
+        server = SERVERS.pop(server_name, None)
+        METRICS.remove_server(server_name)
+        if server:
+            await server.cleanup()
+
+
+async def _replace_server(server_name: str, server_config: Dict[str, Any]) -> bool:
+    """用新配置重建服务器实例，返回旧实例是否处于连接状态"""
+    async with _get_connect_lock(server_name):
+        old_server = SERVERS.get(server_name)
+        was_connected = old_server is not None and old_server.is_connected()
+        if old_server:
+            await old_server.cleanup()
+        SERVERS[server_name] = MCPServer(server_name, server_config)
+        return was_connected
+
+
+async def _connect_and_broadcast(server_name: str) -> bool:
+    """连接单个服务器，完成后立即推送状态（其余服务器仍在连接时，已就绪的服务器即可使用）"""
+    try:
+        return await connect_single_server(server_name)
+    finally:
+        await broadcast_server_status()
+
+
 async def process_config_update(new_config: Dict[str, Any]):
-    """处理配置更新"""
+    """处理配置更新
+
+    删除与重建并发执行；更新前处于连接状态的服务器在后台并发重连，
+    每个服务器连接完成后单独推送状态，不会被其他服务器拖慢。
+    """
     global CONFIG
 
     try:
@@ -609,16 +1237,22 @@ async def process_config_update(new_config: Dict[str, Any]):
 
         for server_name in servers_to_remove:
             logger.info(f"删除服务器: {server_name}")
-            await SERVERS[server_name].cleanup()
-            del SERVERS[server_name]
-
         for server_name in servers_to_update:
             logger.info(f"更新服务器: {server_name}")
-            await SERVERS[server_name].cleanup()
-            del SERVERS[server_name]
 
-            server = MCPServer(server_name, new_config['mcpServers'][server_name])
-            SERVERS[server_name] = server
+        results = await asyncio.gather(
+            *(_remove_server(name) for name in servers_to_remove),
+            *(_replace_server(name, new_config['mcpServers'][name]) for name in servers_to_update),
+            return_exceptions=True
+        )
+        update_results = results[len(servers_to_remove):]
+
+        servers_to_reconnect = []
+        for server_name, result in zip(servers_to_update, update_results):
+            if isinstance(result, Exception):
+                logger.error(f"更新服务器 '{server_name}' 时出错: {str(result)}")
+            elif result and not new_config['mcpServers'][server_name].get('disabled', False):
+                servers_to_reconnect.append(server_name)
 
         for server_name in servers_to_add:
             logger.info(f"添加服务器: {server_name}")
@@ -626,6 +1260,11 @@ async def process_config_update(new_config: Dict[str, Any]):
             SERVERS[server_name] = server
 
         logger.info(f"配置更新完成，当前已有 {len(SERVERS)} 个服务器配置")
+        await broadcast_server_status()
+
+        for server_name in servers_to_reconnect:
+            logger.info(f"后台重连已更新的服务器: {server_name}")
+            _run_in_background(_connect_and_broadcast(server_name))
         return True
 
     except Exception as e:
@@ -635,7 +1274,12 @@ async def process_config_update(new_config: Dict[str, Any]):
 
 
 async def connect_single_server(server_name: str) -> bool:
-    """连接单个服务器"""
+    """连接单个服务器（同一服务器的并发连接请求会排队复用结果，不同服务器互不阻塞）"""
+    async with _get_connect_lock(server_name):
+        return await _connect_single_server(server_name)
+
+
+async def _connect_single_server(server_name: str) -> bool:
     global SERVERS, CONFIG
 
     logger.info(f"开始连接服务器: {server_name}")
@@ -720,14 +1364,21 @@ async def _perform_client_shutdown():
 @app.on_event("startup")
 async def startup_event():
     """启动事件"""
+    global HEALTH_MONITOR_TASK
     logger.info("MCP客户端启动...")
 
+    if settings.MCP_HEALTH_CHECK_INTERVAL > 0:
+        HEALTH_MONITOR_TASK = asyncio.create_task(health_monitor_loop())
+
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """关闭事件"""
     logger.info("MCP客户端关闭...")
 
+    if HEALTH_MONITOR_TASK:
+        HEALTH_MONITOR_TASK.cancel()
+
     cleanup_tasks = []
     for server in SERVERS.values():
         cleanup_tasks.append(server.cleanup())
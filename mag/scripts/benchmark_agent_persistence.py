@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Agent 运行结果持久化基准测试
+测量模型流结束到发送完成事件之间的持久化耗时（尾延迟），对比：
+  1. sequential: 原实现，先读取对话/agent_run/轮次数量，再依次写入 round、轮次计数和 token 使用量
+  2. atomic:     一次原子追加 round（计数器生成轮次编号）并发一次对话统计 upsert，无预先读取
+
+每次测试写入 --rounds 轮对话到 --conversations 个对话中，测试数据写入独立的数据库，结束后删除。
+
+示例:
+    python mag/scripts/benchmark_agent_persistence.py --conversations 50 --rounds 10 --concurrency 20
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.config import settings  # noqa: E402
+from app.infrastructure.database.mongodb.repositories import (  # noqa: E402
+    AgentRunRepository,
+    ConversationRepository
+)
+
+
+def build_messages(size: int):
+    """构造一轮对话消息（用户输入 + 助手回复）"""
+    return [
+        {"role": "user", "content": "请总结以下内容"},
+        {"role": "assistant", "content": "x" * size}
+    ]
+
+
+async def save_sequential(conversations, agent_runs, conversation_id, messages):
+    """原实现：读取后依次写入"""
+    if not await conversations.get_conversation(conversation_id):
+        await conversations.create_conversation(
+            conversation_id=conversation_id, conversation_type="agent",
+            user_id="bench_user", title="bench 对话", tags=[]
+        )
+    if not await agent_runs.get_agent_run(conversation_id):
+        await agent_runs.create_agent_run(conversation_id)
+
+    round_number = await agent_runs.get_round_count(conversation_id) + 1
+    await agent_runs.add_round_to_main(
+        conversation_id=conversation_id, round_number=round_number, agent_name="bench",
+        messages=messages, model="bench-model", prompt_tokens=100, completion_tokens=50
+    )
+    await conversations.update_conversation_round_count(conversation_id=conversation_id, increment=1)
+    await conversations.update_conversation_token_usage(
+        conversation_id=conversation_id, prompt_tokens=100, completion_tokens=50
+    )
+
+
+async def save_atomic(conversations, agent_runs, conversation_id, messages):
+    """新实现：两次原子更新并发执行"""
+    await asyncio.gather(
+        agent_runs.append_main_round(
+            conversation_id=conversation_id, agent_name="bench", messages=messages,
+            model="bench-model", prompt_tokens=100, completion_tokens=50
+        ),
+        conversations.update_conversation_round_stats(
+            conversation_id=conversation_id, round_increment=1,
+            prompt_tokens=100, completion_tokens=50,
+            create_if_missing={
+                "conversation_type": "agent", "user_id": "bench_user",
+                "title": "bench 对话", "tags": []
+            }
+        )
+    )
+
+
+async def run(save, db, args):
+    """同一对话内按顺序写入各轮，不同对话之间并发；返回每次保存耗时和总耗时"""
+    conversations = ConversationRepository(db, db.conversations)
+    agent_runs = AgentRunRepository(db, db.agent_run)
+    messages = build_messages(args.message_size)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def one_conversation():
+        conversation_id = f"bench_{uuid.uuid4().hex}"
+        async with semaphore:
+            for _ in range(args.rounds):
+                started = time.perf_counter()
+                await save(conversations, agent_runs, conversation_id, messages)
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_conversation() for _ in range(args.conversations)))
+    return latencies, time.perf_counter() - started
+
+
+def report(name, latencies, elapsed):
+    latencies_ms = sorted(x * 1000 for x in latencies)
+    p95 = latencies_ms[max(int(len(latencies_ms) * 0.95) - 1, 0)]
+    p99 = latencies_ms[max(int(len(latencies_ms) * 0.99) - 1, 0)]
+    print(f"{name:<12} total={elapsed:7.3f}s  "
+          f"p50={statistics.median(latencies_ms):8.3f}ms  "
+          f"p95={p95:8.3f}ms  "
+          f"p99={p99:8.3f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Agent 运行结果持久化基准测试")
+    parser.add_argument("--mongo-url", default=settings.MONGODB_URL, help="MongoDB 连接地址")
+    parser.add_argument("--conversations", type=int, default=50, help="对话数量")
+    parser.add_argument("--rounds", type=int, default=10, help="每个对话的轮次数量")
+    parser.add_argument("--concurrency", type=int, default=20, help="并发对话数量")
+    parser.add_argument("--message-size", type=int, default=2000, help="助手回复长度（字符）")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(args.mongo_url)
+    db_name = f"bench_agent_persistence_{uuid.uuid4().hex[:8]}"
+    db = client[db_name]
+    try:
+        for name, save in (("sequential", save_sequential), ("atomic", save_atomic)):
+            latencies, elapsed = await run(save, db, args)
+            report(name, latencies, elapsed)
+    finally:
+        await client.drop_database(db_name)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
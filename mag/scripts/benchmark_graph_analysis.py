@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+大规模扁平图分析基准测试
+在合成的分层图（默认 1000 个节点）上测量：
+  1. levels:  节点层级计算（GraphProcessor._calculate_node_levels）
+  2. cycle:   依赖环检测（GraphIndex.find_cycle）
+  3. lookups: 执行器式的逐层遍历 + 按名称查找节点，对比线性扫描与 GraphHelper（索引）
+
+示例:
+    python mag/scripts/benchmark_graph_analysis.py --nodes 1000 --width 20 --fan-in 3
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.graph.graph_processor import GraphProcessor  # noqa: E402
+from app.services.graph.graph_helper import GraphHelper  # noqa: E402
+from app.services.graph.graph_index import GraphIndex  # noqa: E402
+
+
+def build_graph(args):
+    """生成分层图：每层 width 个节点，每个节点从上一层选取 fan_in 个输入，部分节点带 handoffs 回边"""
+    rng = random.Random(args.seed)
+    names = [f"node_{i}" for i in range(args.nodes)]
+    nodes = []
+    for i, name in enumerate(names):
+        layer = i // args.width
+        if layer == 0:
+            input_nodes = ["start"]
+        else:
+            previous = names[(layer - 1) * args.width:layer * args.width]
+            input_nodes = rng.sample(previous, min(args.fan_in, len(previous)))
+        node = {"name": name, "input_nodes": input_nodes, "output_nodes": []}
+        if layer > 1 and rng.random() < args.handoffs_ratio:
+            node["handoffs"] = 2
+            node["output_nodes"].append(names[rng.randrange(0, (layer - 1) * args.width)])
+        nodes.append(node)
+
+    for node in nodes:
+        for input_name in node["input_nodes"]:
+            if input_name != "start":
+                nodes[int(input_name.split("_")[1])]["output_nodes"].append(node["name"])
+    for node in nodes[-args.width:]:
+        node["output_nodes"].append("end")
+    return {"name": "bench", "nodes": nodes}
+
+
+def scan_max_level(graph_config):
+    return max([0, *(node.get("level", 0) for node in graph_config["nodes"])])
+
+
+def scan_nodes_at_level(graph_config, level):
+    return [node for node in graph_config["nodes"] if node.get("level", 0) == level]
+
+
+def scan_find_node(graph_config, node_name):
+    for node in graph_config["nodes"]:
+        if node["name"] == node_name:
+            return node
+    return None
+
+
+def walk(graph_config, max_level, nodes_at_level, find_node):
+    """模拟执行器：逐层获取节点，并为每个节点查找一次其输出节点"""
+    for level in range(max_level(graph_config) + 1):
+        for node in nodes_at_level(graph_config, level):
+            for output_name in node["output_nodes"]:
+                find_node(graph_config, output_name)
+
+
+def measure(func, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def report(name, timings):
+    timings_ms = [x * 1000 for x in timings]
+    print(f"{name:<14} p50={statistics.median(timings_ms):9.3f}ms  min={min(timings_ms):9.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="大规模扁平图分析基准测试")
+    parser.add_argument("--nodes", type=int, default=1000, help="节点数量")
+    parser.add_argument("--width", type=int, default=20, help="每层节点数量")
+    parser.add_argument("--fan-in", type=int, default=3, help="每个节点的输入节点数量")
+    parser.add_argument("--handoffs-ratio", type=float, default=0.05, help="带 handoffs 回边的节点比例")
+    parser.add_argument("--repeat", type=int, default=5, help="每项测试的重复次数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args()
+
+    graph_config = build_graph(args)
+    edges = sum(len(node["input_nodes"]) + len(node["output_nodes"]) for node in graph_config["nodes"])
+    processor = GraphProcessor(None)
+    leveled = processor._calculate_node_levels(graph_config)
+
+    print(f"节点: {args.nodes}  边: {edges}  最大层级: {GraphHelper.get_max_level(leveled)}")
+    report("levels", measure(lambda: processor._calculate_node_levels(graph_config), args.repeat))
+    report("cycle", measure(lambda: GraphIndex(leveled).find_cycle(), args.repeat))
+    report("lookups_scan", measure(
+        lambda: walk(leveled, scan_max_level, scan_nodes_at_level, scan_find_node), args.repeat))
+    report("lookups_index", measure(
+        lambda: walk(leveled, GraphHelper.get_max_level, GraphHelper.get_nodes_at_level,
+                     GraphHelper.find_node_by_name), args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+MCP Client 通信开销基准测试
+对比主应用与 MCP Client 进程之间三种通信方式的单次调用开销：
+  1. http_new_session: 每次请求新建 aiohttp 会话（原 MCPClientManager 的检查/通知方式）
+  2. http_pooled:      复用 keep-alive 连接的 HTTP 请求
+  3. channel:          长连接多路复用通道（WebSocket + 请求ID）
+
+使用前需先启动 MCP Client（python mag/mcp_client.py）。默认请求 /servers，
+指定 --server/--tool 时测试真实工具调用。
+
+示例:
+    python mag/scripts/benchmark_mcp_channel.py --requests 500 --concurrency 20
+    python mag/scripts/benchmark_mcp_channel.py --server fetch --tool fetch --params '{"url": "https://example.com"}'
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.mcp.client_channel import MCPClientChannel  # noqa: E402
+
+
+def build_request(args):
+    """根据参数构建 (通道方法, HTTP方法, 路径, 请求体)"""
+    if args.server and args.tool:
+        payload = {
+            "server_name": args.server,
+            "tool_name": args.tool,
+            "params": json.loads(args.params)
+        }
+        return "tool_call", "POST", "/tool_call", payload
+    return "servers", "GET", "/servers", None
+
+
+async def run_concurrently(call, total: int, concurrency: int):
+    """以固定并发度执行 total 次调用，返回 (每次耗时列表, 总耗时)"""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return latencies, time.perf_counter() - started
+
+
+async def bench_http_new_session(url, request, total, concurrency):
+    _, http_method, path, payload = request
+
+    async def call():
+        async with aiohttp.ClientSession() as session:
+            async with session.request(http_method, f"{url}{path}", json=payload) as response:
+                await response.read()
+
+    return await run_concurrently(call, total, concurrency)
+
+
+async def bench_http_pooled(url, request, total, concurrency):
+    _, http_method, path, payload = request
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def call():
+            async with session.request(http_method, f"{url}{path}", json=payload) as response:
+                await response.read()
+
+        # 预热连接池
+        await call()
+        return await run_concurrently(call, total, concurrency)
+
+
+async def bench_channel(url, request, total, concurrency):
+    method, _, _, payload = request
+    channel = MCPClientChannel(url)
+    if not await channel.connect():
+        raise RuntimeError("无法建立多路复用通道，请确认 MCP Client 已更新并在运行")
+
+    try:
+        async def call():
+            await channel.request(method, payload)
+
+        await call()
+        return await run_concurrently(call, total, concurrency)
+    finally:
+        await channel.close()
+
+
+def report(name, latencies, elapsed):
+    latencies_ms = sorted(x * 1000 for x in latencies)
+    p95 = latencies_ms[max(int(len(latencies_ms) * 0.95) - 1, 0)]
+    print(f"{name:<18} total={elapsed:7.3f}s  "
+          f"mean={statistics.mean(latencies_ms):8.3f}ms  "
+          f"p50={statistics.median(latencies_ms):8.3f}ms  "
+          f"p95={p95:8.3f}ms  "
+          f"throughput={len(latencies) / elapsed:9.1f} req/s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="MCP Client 通信开销基准测试")
+    parser.add_argument("--url", default="http://127.0.0.1:8765", help="MCP Client 地址")
+    parser.add_argument("--requests", type=int, default=200, help="每种方式的请求次数")
+    parser.add_argument("--concurrency", type=int, default=10, help="并发请求数")
+    parser.add_argument("--server", help="测试工具调用时的服务器名称")
+    parser.add_argument("--tool", help="测试工具调用时的工具名称")
+    parser.add_argument("--params", default="{}", help="工具参数（JSON）")
+    parser.add_argument("--modes", default="http_new_session,http_pooled,channel",
+                        help="要测试的方式，逗号分隔")
+    args = parser.parse_args()
+
+    request = build_request(args)
+    benches = {
+        "http_new_session": bench_http_new_session,
+        "http_pooled": bench_http_pooled,
+        "channel": bench_channel,
+    }
+
+    print(f"目标: {args.url}  请求: {request[0]}  次数: {args.requests}  并发: {args.concurrency}")
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        bench = benches.get(mode)
+        if not bench:
+            print(f"未知的测试方式: {mode}")
+            continue
+        try:
+            latencies, elapsed = await bench(args.url, request, args.requests, args.concurrency)
+            report(mode, latencies, elapsed)
+        except Exception as e:
+            print(f"{mode:<18} 失败: {str(e)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+MCP Client 分片吞吐基准测试
+分别以 1、2、4 ... 个 MCP Client 工作进程运行同一组 stdio MCP 服务器，
+通过 MCPServerManager 的一致性哈希路由并发调用工具，对比工具调用吞吐量。
+
+测试使用的 MCP 服务器为临时生成的 FastMCP 脚本，工具 payload 返回指定大小的文本，
+用于模拟 MCP Client 事件循环上的 stdio 读写与 JSON 解析开销。
+
+示例:
+    python mag/scripts/benchmark_mcp_shards.py --workers 1,2,4 --servers 8 --requests 2000 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+
+MAG_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(MAG_DIR))
+
+from app.services.mcp.server_manager import MCPServerManager  # noqa: E402
+
+SERVER_SCRIPT = '''
+from mcp.server.fastmcp import FastMCP
+
+mcp = FastMCP(name="shard-bench")
+
+
+@mcp.tool()
+def payload(size: int = 1024) -> str:
+    """返回指定大小的文本"""
+    return "x" * size
+
+
+if __name__ == "__main__":
+    mcp.run()
+'''
+
+
+def start_workers(count: int, base_port: int, log_dir: str):
+    """启动 MCP Client 工作进程"""
+    processes = []
+    for index in range(count):
+        log = open(os.path.join(log_dir, f"worker_{index}.log"), "w")
+        processes.append(subprocess.Popen(
+            [sys.executable, str(MAG_DIR / "mcp_client.py"), "--port", str(base_port + index)],
+            stdout=log, stderr=subprocess.STDOUT, cwd=str(MAG_DIR)
+        ))
+    return processes
+
+
+def stop_workers(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def wait_ready(urls, timeout: float = 30):
+    """等待所有工作进程就绪"""
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        for url in urls:
+            while True:
+                try:
+                    async with session.get(f"{url}/") as response:
+                        if response.status == 200:
+                            break
+                except aiohttp.ClientError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"工作进程未就绪: {url}")
+                await asyncio.sleep(0.05)
+
+
+async def load_config(manager: MCPServerManager, servers):
+    """按分片向每个工作进程下发配置"""
+    shards = manager.router.split_servers(servers)
+    async with aiohttp.ClientSession() as session:
+        for url, shard in zip(manager.client_urls, shards):
+            async with session.post(f"{url}/load_config", json={"config": {"mcpServers": shard}}) as response:
+                response.raise_for_status()
+        # 配置在工作进程中异步处理，等待每个分片的服务器都已登记
+        for url, shard in zip(manager.client_urls, shards):
+            while True:
+                async with session.get(f"{url}/servers") as response:
+                    if set(shard) <= set(await response.json()):
+                        break
+                await asyncio.sleep(0.05)
+    return shards
+
+
+async def run_case(workers: int, args, server_script: str, log_dir: str):
+    urls = [f"http://127.0.0.1:{args.base_port + i}" for i in range(workers)]
+    processes = start_workers(workers, args.base_port, log_dir)
+    manager = MCPServerManager(urls)
+
+    try:
+        await wait_ready(urls)
+        servers = {
+            f"bench-{i}": {
+                "command": sys.executable,
+                "args": [server_script],
+                "transportType": "stdio",
+                "timeout": 60,
+                "sessionConcurrency": args.session_concurrency,
+            }
+            for i in range(args.servers)
+        }
+        shards = await load_config(manager, servers)
+        await manager.connect_channels()
+
+        result = await manager.connect_all_servers({"mcpServers": servers})
+        connected = [name for name, info in result["servers"].items()
+                     if info["status"] in ("connected", "already_connected")]
+        if len(connected) != len(servers):
+            raise RuntimeError(f"部分服务器连接失败: {result['summary']}")
+
+        server_names = list(servers.keys())
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies = []
+        errors = 0
+
+        async def one(i: int):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await manager.call_tool(server_names[i % len(server_names)], "payload",
+                                                   {"size": args.payload_size})
+                latencies.append(time.perf_counter() - started)
+                if response.get("error"):
+                    errors += 1
+
+        # 预热
+        await asyncio.gather(*(one(i) for i in range(len(server_names))))
+        latencies.clear()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+        latencies_ms = sorted(x * 1000 for x in latencies)
+        p95 = latencies_ms[max(int(len(latencies_ms) * 0.95) - 1, 0)]
+        distribution = "/".join(str(len(shard)) for shard in shards)
+        print(f"workers={workers:<3} servers/worker={distribution:<12} "
+              f"throughput={args.requests / elapsed:9.1f} calls/s  "
+              f"p50={statistics.median(latencies_ms):8.2f}ms  p95={p95:8.2f}ms  errors={errors}")
+
+    finally:
+        await manager.cleanup()
+        stop_workers(processes)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="MCP Client 分片吞吐基准测试")
+    parser.add_argument("--workers", default="1,2,4", help="要测试的工作进程数，逗号分隔")
+    parser.add_argument("--servers", type=int, default=8, help="MCP 服务器数量")
+    parser.add_argument("--requests", type=int, default=2000, help="每轮工具调用次数")
+    parser.add_argument("--concurrency", type=int, default=64, help="并发调用数")
+    parser.add_argument("--payload-size", type=int, default=64 * 1024, help="每次调用返回的文本大小（字节）")
+    parser.add_argument("--session-concurrency", type=int, default=8, help="每个服务器会话的并发调用数")
+    parser.add_argument("--base-port", type=int, default=18765, help="工作进程起始端口（避免与运行中的服务冲突）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        server_script = os.path.join(temp_dir, "bench_server.py")
+        with open(server_script, "w", encoding="utf-8") as f:
+            f.write(SERVER_SCRIPT)
+
+        print(f"服务器: {args.servers}  调用: {args.requests}  并发: {args.concurrency}  "
+              f"payload: {args.payload_size} 字节")
+        for workers in [int(w) for w in args.workers.split(",") if w.strip()]:
+            try:
+                await run_case(workers, args, server_script, temp_dir)
+            except Exception as e:
+                print(f"workers={workers:<3} 失败: {str(e)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())